@@ -0,0 +1,336 @@
+"""
+Hot path benchmarks
+
+Measures the client's hot paths against a seeded `fl33t.fake_api` server on
+localhost: paginating through devices one page at a time and with concurrent
+page requests, building each model from a record, serializing models, hashing
+a large file, generating IDs, device check in latency under concurrency and
+the command line's cold start. Results are saved as JSON and compared with a
+stored baseline, failing if any got worse by more than the tolerance.
+
+    python benchmarks/hot_paths.py --output results.json
+    python benchmarks/hot_paths.py --save-baseline
+
+Baselines depend on the machine, so compare against one saved on the same
+machine, before the change being measured.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+# pylint: disable=wrong-import-position
+from fl33t import Fl33tClient  # noqa: E402
+from fl33t.fake_api import FakeApi, FakeServer  # noqa: E402
+from fl33t.utils import concurrent_map, md5  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(HERE, 'baseline.json')
+
+MODELS = ['Session', 'Train', 'Build', 'Fleet', 'Device']
+
+TEAM_ID = 'bench'
+TOKEN = 'bench-token'
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """Register a benchmark, run in the order they are registered"""
+
+    BENCHMARKS.append(func)
+    return func
+
+
+def metric(value, unit, higher_is_better=False):
+    """A measurement, as saved in the results"""
+
+    return {'value': value, 'unit': unit,
+            'higher_is_better': higher_is_better}
+
+
+def best_of(repeat, func):
+    """The shortest of `repeat` timings of `func`, in seconds"""
+
+    timings = []
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+@benchmark
+def paginate(context):
+    """Every device, one page after another, and with concurrent pages"""
+
+    client = context['client']
+    page_size = context['args'].page_size
+
+    def sequential():
+        for _ in client.list_devices(page_size=page_size, raw=True):
+            pass
+
+    def concurrent():
+        count = client.count('devices')
+
+        def page(offset):
+            return list(client.list_devices(offset=offset, limit=page_size,
+                                            raw=True))
+
+        for _, _, exc in concurrent_map(page, range(0, count, page_size),
+                                        workers=context['args'].workers):
+            if exc:
+                raise exc
+
+    devices = context['devices']
+    repeat = context['args'].repeat
+    return {
+        'paginate_sequential': metric(
+            devices / best_of(repeat, sequential), 'records/s', True),
+        'paginate_concurrent': metric(
+            devices / best_of(repeat, concurrent), 'records/s', True),
+    }
+
+
+@benchmark
+def models(context):
+    """Building each model from a record, and serializing it"""
+
+    client = context['client']
+    records = context['records']
+    rounds = context['args'].rounds
+    results = {}
+
+    for name in MODELS:
+        record = records[name]
+        model = getattr(client, name)
+
+        def hydrate(model=model, record=record):
+            for _ in range(rounds):
+                model(**record)
+
+        instance = model(**record)
+
+        def serialize(instance=instance):
+            for _ in range(rounds):
+                instance.to_json()
+
+        repeat = context['args'].repeat
+        results['hydrate_{}'.format(name.lower())] = metric(
+            best_of(repeat, hydrate) / rounds * 1e6, 'us/record')
+        results['to_json_{}'.format(name.lower())] = metric(
+            best_of(repeat, serialize) / rounds * 1e6, 'us/record')
+
+    return results
+
+
+@benchmark
+def hashing(context):
+    """Hashing a large build file"""
+
+    size = context['args'].md5_mb * 1024 * 1024
+    with tempfile.NamedTemporaryFile(suffix='.bin') as build_file:
+        chunk = os.urandom(1024 * 1024)
+        for _ in range(context['args'].md5_mb):
+            build_file.write(chunk)
+        build_file.flush()
+
+        elapsed = best_of(context['args'].repeat,
+                          lambda: md5(build_file.name))
+
+    return {'md5': metric(size / elapsed / 1024 / 1024, 'MB/s', True)}
+
+
+@benchmark
+def generate_ids(context):
+    """Generating random IDs"""
+
+    client = context['client']
+    rounds = context['args'].rounds
+
+    def generate():
+        for _ in range(rounds):
+            client.generate_id_string()
+
+    return {'generate_id_string': metric(
+        best_of(context['args'].repeat, generate) / rounds * 1e6,
+        'us/id')}
+
+
+@benchmark
+def checkin(context):
+    """Device check ins, `workers` at a time"""
+
+    client = context['client']
+    count = min(context['devices'], context['args'].checkins)
+    device_ids = ['device-{:08d}'.format(index) for index in range(count)]
+    latencies = []
+
+    def check_in(device_id):
+        started = time.perf_counter()
+        client.device_checkin(device_id)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _, _, exc in concurrent_map(check_in, device_ids,
+                                    workers=context['args'].workers):
+        if exc:
+            raise exc
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'checkin_p50': metric(statistics.median(latencies) * 1000, 'ms'),
+        'checkin_p95': metric(
+            latencies[int(len(latencies) * 0.95) - 1] * 1000, 'ms'),
+        'checkin_throughput': metric(count / elapsed, 'requests/s', True),
+    }
+
+
+@benchmark
+def cold_start(context):
+    """Running `fl33t --help` in a fresh interpreter"""
+
+    timings = []
+    for _ in range(max(1, context['args'].repeat)):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'fl33t.cli', '--help'],
+                       stdout=subprocess.DEVNULL,
+                       check=True,
+                       cwd=os.path.dirname(HERE))
+        timings.append(time.perf_counter() - started)
+
+    return {'cli_cold_start': metric(statistics.median(timings) * 1000,
+                                     'ms')}
+
+
+def run(args):
+    """Run every benchmark, or those named in `args.only`"""
+
+    api = FakeApi(TEAM_ID, TOKEN, latency=args.latency, seed=0).seed_data(
+        trains=2, builds=5, fleets=20, devices=args.devices)
+    records = {
+        'Session': api.tables['session'][TOKEN],
+        'Train': next(iter(api.tables['train'].values())),
+        'Build': next(iter(api.tables['build'].values())),
+        'Fleet': next(iter(api.tables['fleet'].values())),
+        'Device': api.devices.get('device-00000000'),
+    }
+
+    results = {}
+    with FakeServer(api) as server:
+        client = Fl33tClient(TEAM_ID, TOKEN, base_uri=server.url,
+                             pool_size=args.workers)
+        context = {'args': args, 'client': client, 'records': records,
+                   'devices': args.devices}
+        for func in BENCHMARKS:
+            if args.only and func.__name__ not in args.only:
+                continue
+            print('Running {}: {}'.format(func.__name__, func.__doc__),
+                  file=sys.stderr)
+            results.update(func(context))
+        client.close()
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'devices': args.devices, 'page_size': args.page_size,
+                     'workers': args.workers, 'latency': args.latency},
+        'benchmarks': results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline
+
+    :returns: list of tuples of each benchmark's name, value, baseline value,
+        relative change, and whether it regressed by more than `tolerance`
+    """
+
+    rows = []
+    for name, result in sorted(results['benchmarks'].items()):
+        base = baseline.get('benchmarks', {}).get(name)
+        if not base or not base['value']:
+            rows.append((name, result, None, None, False))
+            continue
+
+        change = (result['value'] - base['value']) / base['value']
+        worse = -change if result['higher_is_better'] else change
+        rows.append((name, result, base['value'], change,
+                     worse > tolerance))
+
+    return rows
+
+
+def main():
+    """Run the benchmarks from the command line"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--devices', type=int, default=20000,
+                        help='The number of devices to seed')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds the server delays each request by')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Keep the best of this many runs')
+    parser.add_argument('--rounds', type=int, default=2000,
+                        help='Calls per run of the micro benchmarks')
+    parser.add_argument('--checkins', type=int, default=2000)
+    parser.add_argument('--md5-mb', type=int, default=64)
+    parser.add_argument('--only', action='append',
+                        choices=[func.__name__ for func in BENCHMARKS],
+                        help='Only run this benchmark. May be repeated')
+    parser.add_argument('--output', help='Save the results to this file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Save the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='The fraction a result may get worse by')
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        print('Saved the baseline to {}'.format(args.baseline))
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    regressed = []
+    for name, result, base, change, worse in compare(results, baseline,
+                                                     args.tolerance):
+        print('{:<24} {:>12.2f} {:<12} {}'.format(
+            name, result['value'], result['unit'],
+            'baseline {:.2f} ({:+.0%}){}'.format(
+                base, change, '  REGRESSED' if worse else '')
+            if base is not None else ''))
+        if worse:
+            regressed.append(name)
+
+    if regressed:
+        print('FAIL: regressed by more than {:.0%}: {}'.format(
+            args.tolerance, ', '.join(regressed)), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
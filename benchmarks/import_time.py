@@ -0,0 +1,111 @@
+"""
+Import time benchmark
+
+Measures how long it takes to import a module, by default the command line
+entry point, using `python -X importtime`, and fails if it is too slow or
+pulls in dependencies that should only be loaded lazily.
+
+    python benchmarks/import_time.py --runs 10 --max-ms 50
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Dependencies that must not be imported just to start the command line
+LAZY_MODULES = ['requests', 'urllib3', 'dateutil', 'fl33t.client']
+
+
+def measure(module):
+    """
+    Import `module` in a fresh interpreter
+
+    :param str module: The module to import
+    :returns: tuple of `(total_ms, timings)`, where `timings` maps every
+        imported module name to its cumulative import time in ms
+    """
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'))
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.strip() == 'site' and not name[1:].startswith(' '):
+            # Everything imported at interpreter startup comes before the
+            # top level `site` import has finished
+            timings = {}
+            continue
+        timings[name.strip()] = int(cumulative) / 1000.0
+
+    return timings.get(module, 0.0), timings
+
+
+def main():
+    """Run the benchmark from the command line"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--module', default='fl33t.cli')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='Fail if the median import time exceeds this')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Show this many of the slowest imports')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON')
+    args = parser.parse_args()
+
+    totals = []
+    timings = {}
+    for _ in range(max(1, args.runs)):
+        total, timings = measure(args.module)
+        totals.append(total)
+
+    eager = [name for name in LAZY_MODULES if name in timings]
+    results = {
+        'module': args.module,
+        'runs': len(totals),
+        'min_ms': min(totals),
+        'median_ms': statistics.median(totals),
+        'eager_imports': eager,
+        'slowest': sorted(
+            ((name, ms) for name, ms in timings.items()
+             if name != args.module),
+            key=lambda item: item[1],
+            reverse=True)[:args.top],
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print('import {}: median {:.1f}ms, min {:.1f}ms over {} runs'.format(
+            args.module, results['median_ms'], results['min_ms'],
+            results['runs']))
+        for name, ms in results['slowest']:
+            print('    {:>8.1f}ms  {}'.format(ms, name))
+
+    failed = False
+    if eager:
+        print('FAIL: imported eagerly: {}'.format(', '.join(eager)),
+              file=sys.stderr)
+        failed = True
+    if args.max_ms is not None and results['median_ms'] > args.max_ms:
+        print('FAIL: median import time exceeds {:.1f}ms'.format(args.max_ms),
+              file=sys.stderr)
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
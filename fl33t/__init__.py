@@ -4,4 +4,22 @@ Fl33t
 The fl33t client main entry module
 """
 
-from fl33t.client import Fl33tClient # noqa
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # pragma: no cover
+    # Only for linters and type checkers, the client is loaded lazily below
+    from fl33t.client import Fl33tClient
+
+__all__ = ['Fl33tClient']
+
+
+def __getattr__(name):
+    # The client, and with it `requests`, is only imported when first used,
+    # so that importing `fl33t.cli` stays fast
+    if name == 'Fl33tClient':
+        # pylint: disable=import-outside-toplevel
+        from fl33t.client import Fl33tClient
+        return Fl33tClient
+
+    raise AttributeError('module {} has no attribute {}'.format(
+        __name__, name))
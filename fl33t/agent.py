@@ -0,0 +1,216 @@
+"""
+Agent
+
+Runs command line invocations through a long running `fl33t agent`, when one
+is listening, so they reuse its warm client, connections and cache.
+
+This module is imported by every invocation of the command line, so it only
+uses the standard library modules that the interpreter has already loaded.
+"""
+
+import json
+import os
+import socket
+import sys
+
+# Root command line options that take a value, which must be skipped to find
+# the name of the command being run
+ROOT_VALUE_OPTIONS = ['-T', '--team-id', '-S', '--session-token',
+                      '--max-transfer-rate', '--transfer-retries', '--profile']
+
+# Commands that always run in-process
+LOCAL_COMMANDS = ['agent', 'shell']
+
+# Commands that can prompt for their options or read from stdin by default,
+# neither of which the agent can do, so they always run in-process
+INPUT_COMMANDS = [
+    ('builds', 'create'),
+    ('builds', 'update'),
+    ('devices', 'batch'),
+    ('devices', 'create'),
+    ('fleets', 'create'),
+    ('sessions', 'create'),
+    ('sessions', 'update'),
+]
+
+
+def socket_path():
+    """
+    The path of the agent's UNIX socket
+
+    Taken from the `FL33T_AGENT_SOCKET` environment variable, if it is set,
+    and otherwise a per user socket in `XDG_RUNTIME_DIR` or the temporary
+    directory.
+
+    :returns: str
+    """
+
+    if os.environ.get('FL33T_AGENT_SOCKET'):
+        return os.environ['FL33T_AGENT_SOCKET']
+
+    directory = (os.environ.get('XDG_RUNTIME_DIR')
+                 or os.environ.get('TMPDIR')
+                 or '/tmp')
+    return os.path.join(directory, 'fl33t-agent-{}.sock'.format(os.getuid()))
+
+
+def command_path(argv):
+    """
+    The names of the command, and of its subcommand if it is a group, in a
+    list of command line arguments
+
+    :param list argv: The command line arguments, without the program name
+    :returns: tuple of up to two str
+    """
+
+    names = []
+    args = iter(argv)
+    for arg in args:
+        if arg in ROOT_VALUE_OPTIONS and not names:
+            next(args, None)
+        elif not arg.startswith('-'):
+            names.append(arg)
+            if len(names) == 2:
+                break
+
+    return tuple(names)
+
+
+def command_name(argv):
+    """
+    The name of the command in a list of command line arguments
+
+    :param list argv: The command line arguments, without the program name
+    :returns: str or None
+    """
+
+    names = command_path(argv)
+    return names[0] if names else None
+
+
+def forwardable(argv):
+    """
+    Whether a command line invocation can be run by the agent
+
+    Commands that read from stdin or can prompt for input, the agent's own
+    commands and the shell always run in-process, as does everything when
+    `FL33T_NO_AGENT` is set.
+
+    :param list argv: The command line arguments, without the program name
+    :returns: bool
+    """
+
+    if os.environ.get('FL33T_NO_AGENT') or not hasattr(socket, 'AF_UNIX'):
+        return False
+
+    if '-' in argv or '--help' in argv or not argv:
+        return False
+
+    names = command_path(argv)
+    if not names or names[0] in LOCAL_COMMANDS:
+        return False
+
+    return names not in INPUT_COMMANDS
+
+
+def connect(path=None):
+    """
+    Connect to a running agent
+
+    :param str path: The agent's socket. Defaults to :func:`socket_path`
+    :returns: A connected :class:`socket.socket`, or None if no agent is
+        listening
+    """
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path or socket_path())
+    except OSError:
+        sock.close()
+        return None
+
+    return sock
+
+
+def request(sock, message):
+    """
+    Send a message to the agent, and yield each message it replies with
+
+    Messages are single line JSON objects.
+
+    :param sock: A socket connected to the agent
+    :param dict message: The message to send
+    :yields: dict
+    """
+
+    sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+    with sock.makefile('rb') as replies:
+        for line in replies:
+            yield json.loads(line.decode('utf-8'))
+
+
+def run(argv, path=None, stdout=None, stderr=None):
+    """
+    Run a command line invocation through the agent
+
+    The command's output is written to `stdout` and `stderr` as the agent
+    produces it.
+
+    :param list argv: The command line arguments, without the program name
+    :param str path: The agent's socket. Defaults to :func:`socket_path`
+    :param stdout: The text stream to write output to. Defaults to stdout
+    :param stderr: The text stream to write errors to. Defaults to stderr
+    :returns: The command's exit code, or None if no agent is listening
+    """
+
+    sock = connect(path)
+    if sock is None:
+        return None
+
+    streams = {
+        'out': stdout or sys.stdout,
+        'err': stderr or sys.stderr,
+    }
+    message = {
+        'argv': list(argv),
+        'cwd': os.getcwd(),
+        'env': {name: value for name, value in os.environ.items()
+                if name.startswith('FL33T_')},
+    }
+
+    exit_code = 1
+    with sock:
+        for reply in request(sock, message):
+            if 'exit' in reply:
+                exit_code = reply['exit']
+                break
+            stream = streams[reply['stream']]
+            stream.write(reply['data'])
+            stream.flush()
+
+    return exit_code
+
+
+def main(argv=None):
+    """
+    The `fl33t` command line entry point
+
+    Runs the command through the agent when one is listening, and otherwise
+    in this process.
+
+    :param list argv: The command line arguments, without the program name.
+        Defaults to `sys.argv[1:]`
+    """
+
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if forwardable(argv):
+        exit_code = run(argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    # pylint: disable=import-outside-toplevel
+    from fl33t.cli import cli
+
+    cli.main(args=argv, prog_name='fl33t')
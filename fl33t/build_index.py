@@ -0,0 +1,119 @@
+"""
+Build Index
+
+A per-train lookup of builds by their MD5 hash, used to detect builds that
+have already been uploaded to fl33t
+"""
+
+import time
+
+
+class BuildIndex:
+    """
+    Maps the `md5sum` of every build in a train to its
+    :py:class:`fl33t.models.Build`
+
+    :param str train_id: The train ID that this index covers
+    :param builds: The builds to populate the index with
+    :type builds: iterable of :py:class:`fl33t.models.Build`
+    :param ttl: If provided, the number of seconds after which this index
+        is considered stale and should be rebuilt
+    :type ttl: int, float or None
+    """
+
+    def __init__(self, train_id, builds=(), *, ttl=None):
+        self.train_id = train_id
+        self.ttl = ttl
+        self.created = time.monotonic()
+        self._by_md5 = {}
+
+        for build in builds:
+            self.add(build)
+
+    @classmethod
+    def from_client(cls, client, train_id, *, ttl=None):
+        """
+        Build an index from all builds in a train
+
+        :param client: The API client to list the builds with
+        :type client: :py:class:`fl33t.Fl33tClient`
+        :param str train_id: The train ID to index
+        :param ttl: If provided, the number of seconds this index is valid for
+        :type ttl: int, float or None
+        :returns: :py:class:`BuildIndex`
+        """
+
+        return cls(train_id, client.list_builds(train_id=train_id), ttl=ttl)
+
+    @property
+    def expired(self):
+        """
+        Has this index outlived its TTL?
+
+        :returns: bool
+        """
+
+        if self.ttl is None:
+            return False
+
+        return time.monotonic() - self.created > self.ttl
+
+    def add(self, build):
+        """
+        Add a build to the index
+
+        Builds that are `available` take precedence over builds sharing the
+        same hash that never completed their upload.
+
+        :param build: The build to add
+        :type build: :py:class:`fl33t.models.Build`
+        """
+
+        if not build.md5sum or build.train_id != self.train_id:
+            return
+
+        existing = self._by_md5.get(build.md5sum)
+        if existing and existing.status == 'available' \
+                and build.status != 'available':
+            return
+
+        self._by_md5[build.md5sum] = build
+
+    def remove(self, build_id):
+        """
+        Remove a build from the index
+
+        :param str build_id: The build ID to remove
+        """
+
+        for md5sum, build in list(self._by_md5.items()):
+            if build.build_id == build_id:
+                del self._by_md5[md5sum]
+
+    def get(self, md5sum, *, pending=False):
+        """
+        Return the available build matching a hash, if there is one
+
+        :param str md5sum: The MD5 hash of the build file
+        :param bool pending: If True, also return a build that is not yet
+            available, such as one whose upload fl33t is still processing
+        :returns: :py:class:`fl33t.models.Build` or None
+        """
+
+        build = self._by_md5.get(md5sum)
+        if build and (pending or build.status == 'available'):
+            return build
+
+        return None
+
+    def __contains__(self, md5sum):
+        return self.get(md5sum) is not None
+
+    def __len__(self):
+        return len(self._by_md5)
+
+    def __repr__(self):
+        return '<BuildIndex train_id={} builds={}>'.format(
+            self.train_id,
+            len(self)
+        )
@@ -0,0 +1,142 @@
+"""
+Cache
+
+A shared cache for fl33t lookups
+"""
+
+import threading
+import time
+
+
+class ModelCache:
+    """
+    A thread-safe cache of fl33t objects and listings
+
+    When several threads ask for the same missing key at once, only one of
+    them fetches it and the others wait for its result.
+
+    :param ttl: If provided, the number of seconds an entry is kept for
+    :type ttl: int, float or None
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, entry):
+        return self.ttl is None or time.monotonic() - entry[0] <= self.ttl
+
+    def get(self, key, default=None):
+        """
+        Return a cached value, without fetching it if it is missing
+
+        :param key: The cache key
+        :param default: The value to return if the key is not cached
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and self._fresh(entry):
+                return entry[1]
+
+        return default
+
+    def get_or_fetch(self, key, fetch):
+        """
+        Return a cached value, fetching and caching it if it is missing
+
+        Exceptions raised by `fetch` are not cached, and are raised to every
+        caller waiting on the key.
+
+        :param key: The cache key
+        :param fetch: A callable returning the value to cache
+        """
+
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and self._fresh(entry):
+                    self.hits += 1
+                    return entry[1]
+
+                event = self._inflight.get(key)
+                if event is None:
+                    self.misses += 1
+                    event = self._inflight[key] = threading.Event()
+                    break
+
+            # Another thread is already fetching this key
+            event.wait()
+
+        try:
+            value = fetch()
+            with self._lock:
+                self._entries[key] = (time.monotonic(), value)
+            return value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    def set(self, key, value):
+        """
+        Cache a value
+
+        :param key: The cache key
+        :param value: The value to cache
+        """
+
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+
+    def invalidate(self, key):
+        """
+        Remove a value from the cache
+
+        :param key: The cache key
+        """
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every value from the cache"""
+
+        with self._lock:
+            self._entries.clear()
+
+    def keys(self):
+        """
+        The keys of every fresh entry in the cache
+
+        :returns: list
+        """
+
+        with self._lock:
+            return [key for key, entry in self._entries.items()
+                    if self._fresh(entry)]
+
+    @property
+    def hit_rate(self):
+        """
+        The fraction of lookups served from the cache
+
+        :returns: float
+        """
+
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return '<ModelCache entries={} hits={} misses={}>'.format(
+            len(self),
+            self.hits,
+            self.misses
+        )
@@ -0,0 +1,395 @@
+"""
+Cassette
+
+Records the API requests and build uploads a client makes, with their
+responses and timings, into a compact cassette file with tokens and URL
+signatures redacted, and replays cassettes without any network, either at
+the recorded timing or as fast as possible
+"""
+
+import base64
+import collections
+import gzip
+import io
+import json
+import re
+import threading
+import time
+
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+from fl33t.exceptions import TransportError
+from fl33t.protocol import Response, full_url
+from fl33t.transports import RequestsTransport, Transport
+
+CASSETTE_VERSION = 1
+
+REDACTED = '<redacted>'
+
+# Response headers kept in cassettes, the others are dropped to keep them
+# small
+KEPT_HEADERS = ['content-type']
+
+# Fields of JSON bodies whose values are always redacted, as they hold the
+# tokens of other sessions than the recording client's
+REDACTED_FIELDS = ['session_token']
+
+# Session tokens are also the IDs in the URLs of sessions
+SESSION_PATH = re.compile(r'(/session/)[^/?#]+')
+
+
+def strip_query(url):
+    """
+    A URL without its query string, which holds the credentials of
+    pre-signed URLs
+
+    :param str url: The URL
+    :returns: str
+    """
+
+    scheme, netloc, path, _, _ = urlsplit(url)
+    return urlunsplit((scheme, netloc, path, '', ''))
+
+
+class Redactor:
+    """
+    Replaces secrets in URLs and bodies, along with session tokens in JSON
+    fields and session URLs, and removes the query strings of URLs in bodies
+
+    :param secrets: The strings to redact, such as session tokens
+    :type secrets: list of str
+    """
+
+    def __init__(self, secrets=()):
+        self.secrets = [secret for secret in secrets if secret]
+
+    def text(self, value):
+        """Redact a string"""
+
+        for secret in self.secrets:
+            value = value.replace(secret, REDACTED)
+        return SESSION_PATH.sub(r'\1' + REDACTED, value)
+
+    def value(self, value):
+        """Redact a decoded JSON value"""
+
+        if isinstance(value, dict):
+            return {key: (REDACTED if key in REDACTED_FIELDS and item
+                          else self.value(item))
+                    for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.value(item) for item in value]
+        if isinstance(value, str):
+            if value.startswith(('http://', 'https://')):
+                value = strip_query(value)
+            return self.text(value)
+        return value
+
+    def body(self, content, content_type):
+        """Redact a response body, returning the fields it is stored in"""
+
+        if not content:
+            return {}
+        if 'json' in (content_type or ''):
+            try:
+                return {'json': self.value(json.loads(content.decode(
+                    'utf-8')))}
+            except ValueError:
+                pass
+        try:
+            return {'text': self.text(content.decode('utf-8'))}
+        except UnicodeDecodeError:
+            return {'base64': base64.b64encode(content).decode('ascii')}
+
+
+def _content(entry):
+    """The body stored in a cassette entry, as bytes"""
+
+    if 'json' in entry:
+        return json.dumps(entry['json']).encode('utf-8')
+    if 'text' in entry:
+        return entry['text'].encode('utf-8')
+    if 'base64' in entry:
+        return base64.b64decode(entry['base64'])
+    return b''
+
+
+def load(path):
+    """
+    Read a cassette
+
+    :param str path: The cassette file
+    :returns: tuple of the header `dict` and the `list` of entries
+    :raises ValueError: if the file is not a cassette
+    """
+
+    with gzip.open(path, 'rt', encoding='utf-8') as cassette:
+        lines = [json.loads(line) for line in cassette if line.strip()]
+
+    if not lines or lines[0].get('cassette') != CASSETTE_VERSION:
+        raise ValueError('{} is not a fl33t cassette'.format(path))
+
+    return lines[0], lines[1:]
+
+
+class RecordingTransport(Transport):
+    """
+    Sends requests through another transport, recording each request and its
+    response into a cassette
+
+    Once attached to a client, the client's session token is redacted, and
+    its build uploads are recorded too, without their content. The tokens of
+    other sessions, in `session_token` fields and session URLs, are always
+    redacted. Cassettes are
+    gzipped JSON lines, written as requests finish, and complete once the
+    transport is closed.
+
+    :param str path: The cassette file to write
+    :param transport: If provided, the transport to send requests with.
+        Defaults to :py:class:`fl33t.transports.RequestsTransport`
+    :type transport: :py:class:`fl33t.transports.Transport` or None
+    :param secrets: If provided, more strings to redact
+    :type secrets: list of str or None
+    """
+
+    def __init__(self, path, transport=None, *, secrets=None):
+        if transport is None:
+            transport = RequestsTransport()
+
+        self.path = path
+        self.transport = transport
+        self.redactor = Redactor(secrets or [])
+        self.started = time.monotonic()
+        self.entries = 0
+
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, 'wt', encoding='utf-8')
+        self._write({'cassette': CASSETTE_VERSION,
+                     'recorded': datetime.now(timezone.utc).isoformat()})
+
+    def _write(self, entry):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            if 'cassette' not in entry:
+                self.entries += 1
+
+    # pylint: disable=too-many-arguments
+    def record(self, kind, method, url, status_code, *, headers=None,
+               content=b'', sent=0, started):
+        """
+        Add a request to the cassette
+
+        :param str kind: `api` or `upload`
+        :param str method: The request method
+        :param str url: The requested URL, with its query string
+        :param int status_code: The status code of the response
+        :param headers: If provided, the response headers
+        :type headers: dict or None
+        :param bytes content: The response body
+        :param int sent: The number of bytes in the request body
+        :param float started: The :py:func:`time.monotonic` time the request
+            was sent at
+        """
+
+        elapsed = time.monotonic() - started
+        headers = {key.lower(): value
+                   for key, value in (headers or {}).items()
+                   if key.lower() in KEPT_HEADERS}
+
+        entry = {
+            'kind': kind,
+            'method': method,
+            'url': self.redactor.text(url if kind == 'api'
+                                      else strip_query(url)),
+            'status': status_code,
+            'offset': round(started - self.started, 6),
+            'elapsed': round(elapsed, 6),
+            'sent': sent,
+        }
+        if headers:
+            entry['headers'] = headers
+        entry.update(self.redactor.body(content, headers.get('content-type')))
+        self._write(entry)
+
+    def send(self, request):
+        started = time.monotonic()
+        response = self.transport.send(request)
+        self.record('api', request.method, full_url(request),
+                    response.status_code, headers=response.headers,
+                    content=response.content,
+                    sent=len(request.body or b''), started=started)
+        return response
+
+    async def send_async(self, request):
+        started = time.monotonic()
+        response = await self.transport.send_async(request)
+        self.record('api', request.method, full_url(request),
+                    response.status_code, headers=response.headers,
+                    content=response.content,
+                    sent=len(request.body or b''), started=started)
+        return response
+
+    def attach(self, client):
+        self.redactor.secrets.append(client.token)
+        _mount(client.http, TransferAdapter(self))
+
+    def close(self):
+        self.transport.close()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ReplayTransport(Transport):
+    """
+    Answers requests from a cassette, without any network
+
+    Each request is answered by the first unused recorded response to the
+    same method and URL, after redaction, so a recorded workload can be run
+    again, including from several threads. Build uploads are answered too,
+    once attached to a client.
+
+    :param str path: The cassette file to replay
+    :param bool realtime: If True, each response is delayed by as long as it
+        took when recorded. Otherwise, responses are immediate
+    :param secrets: If provided, more strings to redact from requests before
+        they are matched
+    :type secrets: list of str or None
+    """
+
+    def __init__(self, path, *, realtime=False, secrets=None):
+        self.header, entries = load(path)
+        self.realtime = realtime
+        self.redactor = Redactor(secrets or [])
+        self.remaining = collections.defaultdict(collections.deque)
+        for entry in entries:
+            self.remaining[(entry['kind'], entry['method'],
+                            entry['url'])].append(entry)
+        self._lock = threading.Lock()
+
+    def _take(self, kind, method, url):
+        url = self.redactor.text(url if kind == 'api' else strip_query(url))
+        with self._lock:
+            recorded = self.remaining.get((kind, method, url))
+            if not recorded:
+                raise TransportError('No recorded response to {} {}'.format(
+                    method, url))
+            return recorded.popleft()
+
+    def match(self, kind, method, url):
+        """
+        Take the next recorded response to a request, after the recorded
+        delay when replaying in real time
+
+        :param str kind: `api` or `upload`
+        :param str method: The request method
+        :param str url: The requested URL, with its query string
+        :returns: dict, the cassette entry
+        :raises TransportError: if the cassette has no response left for it
+        """
+
+        entry = self._take(kind, method, url)
+        if self.realtime and entry['elapsed']:
+            time.sleep(entry['elapsed'])
+        return entry
+
+    def _response(self, entry, url):
+        return Response(entry['status'], dict(entry.get('headers', {})),
+                        _content(entry), url)
+
+    def send(self, request):
+        url = full_url(request)
+        return self._response(self.match('api', request.method, url), url)
+
+    async def send_async(self, request):
+        # The recorded delay is awaited, rather than slept through
+        # pylint: disable=import-outside-toplevel
+        import asyncio
+
+        url = full_url(request)
+        entry = self._take('api', request.method, url)
+        if self.realtime and entry['elapsed']:
+            await asyncio.sleep(entry['elapsed'])
+        return self._response(entry, url)
+
+    def attach(self, client):
+        self.redactor.secrets.append(client.token)
+        _mount(client.http, TransferAdapter(self))
+
+
+def _mount(session, adapter):
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+class TransferAdapter(requests.adapters.HTTPAdapter):
+    """
+    Records the build uploads sent through a `requests` session, or answers
+    them from a cassette
+
+    Other requests are sent as usual while recording, and fail while
+    replaying.
+
+    :param cassette: The transport recording or replaying
+    :type cassette: :py:class:`RecordingTransport` or
+        :py:class:`ReplayTransport`
+    """
+
+    def __init__(self, cassette):
+        super().__init__()
+        self.cassette = cassette
+        self.replaying = isinstance(cassette, ReplayTransport)
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        if request.method != 'PUT':
+            if self.replaying:
+                raise requests.exceptions.ConnectionError(
+                    'Only build uploads are replayed, not {} {}'.format(
+                        request.method, strip_query(request.url)))
+            return super().send(request, **kwargs)
+
+        if self.replaying:
+            return self._replay(request)
+
+        started = time.monotonic()
+        response = super().send(request, **kwargs)
+        self.cassette.record('upload', request.method, request.url,
+                             response.status_code, headers=response.headers,
+                             content=response.content,
+                             sent=_size(request.body), started=started)
+        return response
+
+    def _replay(self, request):
+        # The body is read as it would have been sent, so that rate limits
+        # and byte counts still apply
+        if request.body is not None \
+                and not isinstance(request.body, (bytes, str)):
+            for _ in request.body:
+                pass
+
+        try:
+            entry = self.cassette.match('upload', request.method,
+                                        request.url)
+        except TransportError as exc:
+            raise requests.exceptions.ConnectionError(str(exc))
+
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers.update(entry.get('headers', {}))
+        response.raw = io.BytesIO(_content(entry))
+        response.url = request.url
+        response.request = request
+        return response
+
+
+def _size(body):
+    try:
+        return len(body or b'')
+    except TypeError:
+        return 0
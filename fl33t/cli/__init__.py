@@ -4,24 +4,55 @@ fl33t.cli.click
 Command line interaction helpers for apps using Click
 """
 
+import importlib
 import os
 import sys
 
 import click
 
-from fl33t import Fl33tClient
-from fl33t.cli.commands.builds import cli as builds_cmds
-from fl33t.cli.commands.devices import cli as devices_cmds
-from fl33t.cli.commands.fleets import cli as fleets_cmds
-from fl33t.cli.commands.sessions import cli as sessions_cmds
-from fl33t.cli.commands.trains import cli as trains_cmds
+from fl33t.transfer import parse_rate
 
 
 CLIENTS = {}
 
+# Enough connections for the most concurrent lookups a command can make
+POOL_SIZE = 64
 
-def create_client(team_id, session_token):
-    """Creates a Fl33t API client, or returns an already instantiated one"""
+
+class LazyGroup(click.Group):
+    """
+    A click group whose subcommands are only imported when they are used
+
+    :param dict lazy_commands: A mapping of command names to the
+        `module:attribute` import path of the command
+    """
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = dict(lazy_commands or {})
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx))
+                      | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_commands and cmd_name not in self.commands:
+            module_name, attribute = self.lazy_commands[cmd_name].split(':')
+            module = importlib.import_module(module_name)
+            self.add_command(getattr(module, attribute), name=cmd_name)
+
+        return super().get_command(ctx, cmd_name)
+
+
+def create_client(team_id, session_token, cache_ttl=None, **client_options):
+    """
+    Creates a Fl33t API client, or returns an already instantiated one with
+    the same options
+
+    Clients outlive a single command in the agent and the shell, so every
+    option is part of the key a client is kept under, rather than only
+    applying to the first command run with a team and token.
+    """
 
     if not team_id:
         team_id = os.environ.get('FL33T_TEAM_ID')
@@ -29,9 +60,18 @@ def create_client(team_id, session_token):
         session_token = os.environ.get('FL33T_SESSION_TOKEN')
 
     try:
-        key = '--'.join((team_id, session_token))
+        key = ('--'.join((team_id, session_token)), cache_ttl,
+               tuple(sorted(client_options.items())))
         if key not in CLIENTS:
-            CLIENTS[key] = Fl33tClient(team_id, session_token)
+            # pylint: disable=import-outside-toplevel
+            from fl33t.client import Fl33tClient
+
+            CLIENTS[key] = Fl33tClient(team_id,
+                                       session_token,
+                                       **client_options)
+            # Lookups of related objects are shared by every command run
+            # with this client
+            CLIENTS[key].enable_cache(cache_ttl)
         return CLIENTS[key]
 
     except (ValueError, TypeError):
@@ -42,26 +82,89 @@ def create_client(team_id, session_token):
         sys.exit(1)
 
 
-@click.group()
+def _start_profiler(ctx, trace_path):
+    """Profile the clients used by a command, reporting the timings to
+    stderr, and to a Chrome trace file if given, once it has finished"""
+
+    # pylint: disable=import-outside-toplevel
+    from fl33t.profiling import Profiler
+
+    profiler = Profiler()
+
+    def report():
+        profiler.stop()
+        click.echo(profiler.format_summary(), err=True)
+        if trace_path:
+            profiler.write_chrome_trace(
+                trace_path,
+                name=' '.join(('fl33t', ctx.invoked_subcommand or '')))
+
+    ctx.call_on_close(report)
+    return profiler
+
+
+# pylint: disable=too-many-arguments
+@click.group(cls=LazyGroup, lazy_commands={
+    'agent': 'fl33t.cli.agent:cli',
+    'apply': 'fl33t.cli.commands.reconcile:apply',
+    'builds': 'fl33t.cli.commands.builds:cli',
+    'devices': 'fl33t.cli.commands.devices:cli',
+    'exporter': 'fl33t.cli.commands.exporter:exporter',
+    'fleets': 'fl33t.cli.commands.fleets:cli',
+    'mirror': 'fl33t.cli.commands.mirror:cli',
+    'sessions': 'fl33t.cli.commands.sessions:cli',
+    'shell': 'fl33t.cli.shell:shell',
+    'snapshot': 'fl33t.cli.commands.snapshot:cli',
+    'trains': 'fl33t.cli.commands.trains:cli',
+})
 @click.option('-T', '--team-id', type=str,
               help=("Taken from environment variable 'FL33T_TEAM_ID',"
                     " if not provided."))
 @click.option('-S', '--session-token', type=str,
               help=("Taken from environment variable 'FL33T_SESSION_TOKEN',"
                     " if not provided."))
+@click.option('--max-transfer-rate', type=str, default=None,
+              envvar='FL33T_MAX_TRANSFER_RATE',
+              help=('Limit build uploads and downloads to this many bytes'
+                    ' per second, e.g. 512K or 2M.'))
+@click.option('--transfer-retries', type=click.IntRange(0, 10), default=0,
+              help='Retry failed build uploads and downloads this many times.')
+@click.option('--timings', is_flag=True, default=False,
+              help=('Print the time taken by each API request, by building '
+                    'models and in total when the command finishes.'))
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True),
+              default=None,
+              help=('Print timings, and write them to this file as a Chrome '
+                    'trace.'))
 @click.pass_context
-def cli(ctx, team_id=None, session_token=None):
+def cli(ctx, team_id=None, session_token=None, max_transfer_rate=None,
+        transfer_retries=0, timings=False, profile=None):
     """Commands to interact with the Fl33t API directly"""
 
-    ctx.ensure_object(dict)
-    ctx.obj['get_fl33t_client'] = lambda: create_client(team_id, session_token)
+    try:
+        transfer_rate_limit = (parse_rate(max_transfer_rate)
+                               if max_transfer_rate else None)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint='--max-transfer-rate')
 
+    ctx.ensure_object(dict)
+    cache_ttl = ctx.obj.get('cache_ttl')
+    profiler = _start_profiler(ctx, profile) if timings or profile else None
+
+    def get_fl33t_client():
+        client = create_client(
+            team_id,
+            session_token,
+            cache_ttl=cache_ttl,
+            transfer_rate_limit=transfer_rate_limit,
+            transfer_retries=transfer_retries,
+            pool_size=POOL_SIZE)
+        if profiler:
+            profiler.attach(client)
+        return client
+
+    ctx.obj['get_fl33t_client'] = get_fl33t_client
 
-cli.add_command(builds_cmds, name='builds')
-cli.add_command(devices_cmds, name='devices')
-cli.add_command(fleets_cmds, name='fleets')
-cli.add_command(sessions_cmds, name='sessions')
-cli.add_command(trains_cmds, name='trains')
 
 if __name__ == "__main__":
     cli()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,10 @@
+"""
+fl33t.cli.__main__
+
+Allows the command line to be run with `python -m fl33t.cli`
+"""
+
+from fl33t.cli import cli
+
+
+cli()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,326 @@
+"""
+fl33t.cli.agent
+
+A background agent that runs command line invocations with a warm client
+"""
+
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+import click
+
+from fl33t import agent
+from fl33t.cli import CLIENTS
+
+
+class _StreamWriter(io.TextIOBase):
+    """A text stream that forwards what is written to it to the agent's
+    client, one line or buffer full at a time"""
+
+    encoding = 'utf-8'
+
+    def __init__(self, send, stream, buffer_size=8192):
+        super().__init__()
+        self._send = send
+        self._stream = stream
+        self._buffer_size = buffer_size
+        self._pending = []
+        self._pending_size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if not isinstance(text, str):
+            raise TypeError('write() argument must be str, not {}'.format(
+                type(text).__name__))
+
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if '\n' in text or self._pending_size >= self._buffer_size:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._pending:
+            data = ''.join(self._pending)
+            self._pending = []
+            self._pending_size = 0
+            self._send({'stream': self._stream, 'data': data})
+
+
+@contextlib.contextmanager
+def _environment(env, cwd):
+    """Temporarily replace the `FL33T_` environment variables and working
+    directory with those of the agent's client"""
+
+    saved_env = {name: value for name, value in os.environ.items()
+                 if name.startswith('FL33T_')}
+    saved_cwd = os.getcwd()
+
+    for name in saved_env:
+        del os.environ[name]
+    os.environ.update(env)
+    os.chdir(cwd)
+    try:
+        yield
+    finally:
+        os.chdir(saved_cwd)
+        for name in env:
+            os.environ.pop(name, None)
+        os.environ.update(saved_env)
+
+
+class AgentHandler(socketserver.StreamRequestHandler):
+    """Handles a single connection to the agent"""
+
+    def send(self, message):
+        """Send a message to the client"""
+
+        self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+    def trusted(self):
+        """Whether the client is run by the same user as the agent"""
+
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return True
+
+        credentials = self.request.getsockopt(socket.SOL_SOCKET,
+                                              socket.SO_PEERCRED,
+                                              struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', credentials)
+        return uid == os.getuid()
+
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline().decode('utf-8'))
+            if not self.trusted():
+                self.send({'stream': 'err',
+                           'data': 'ERROR: Permission denied.\n'})
+                self.send({'exit': 1})
+            elif message.get('control') == 'status':
+                self.send({'status': self.server.status()})
+            elif message.get('control') == 'stop':
+                self.send({'status': self.server.status()})
+                threading.Thread(target=self.server.shutdown).start()
+            else:
+                self.send({'exit': self.run(message)})
+
+        except (OSError, ValueError):
+            # The client went away, or did not send a valid message
+            pass
+
+    def run(self, message):
+        """
+        Run a command line invocation
+
+        :param dict message: The invocation's `argv`, `cwd` and `env`
+        :returns: int, the exit code
+        """
+
+        self.server.invocations += 1
+        stdout = _StreamWriter(self.send, 'out')
+        stderr = _StreamWriter(self.send, 'err')
+
+        exit_code = 0
+        with _environment(message.get('env', {}), message['cwd']), \
+                contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            stdin, sys.stdin = sys.stdin, io.StringIO()
+            try:
+                self.server.root.main(args=message['argv'],
+                                      prog_name='fl33t',
+                                      obj={'cache_ttl': self.server.cache_ttl})
+            except SystemExit as exc:
+                if isinstance(exc.code, int):
+                    exit_code = exc.code
+                elif exc.code is not None:
+                    click.echo(exc.code, err=True)
+                    exit_code = 1
+            except Exception:  # pylint: disable=broad-except
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                sys.stdin = stdin
+
+        stdout.flush()
+        stderr.flush()
+        return exit_code
+
+
+class AgentServer(socketserver.UnixStreamServer):
+    """
+    The agent, which runs the command line invocations sent to its socket one
+    at a time, sharing clients between them
+
+    :param str path: The path of the socket to listen on
+    :param root: The click group to run invocations with
+    :param cache_ttl: The number of seconds objects are cached for
+    :type cache_ttl: int, float or None
+    """
+
+    def __init__(self, path, root, cache_ttl=None):
+        self.path = path
+        self.root = root
+        self.cache_ttl = cache_ttl
+        self.invocations = 0
+        self.started = time.time()
+
+        # Only the user running the agent can connect to its socket
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, AgentHandler)
+        finally:
+            os.umask(umask)
+
+    def status(self):
+        """
+        Information about the running agent
+
+        :returns: dict
+        """
+
+        caches = [client.cache for client in CLIENTS.values()
+                  if client.cache is not None]
+        return {
+            'pid': os.getpid(),
+            'socket': self.path,
+            'uptime': round(time.time() - self.started, 3),
+            'invocations': self.invocations,
+            'clients': len(CLIENTS),
+            'cached': sum(len(cache) for cache in caches),
+            'cache_hits': sum(cache.hits for cache in caches),
+            'cache_misses': sum(cache.misses for cache in caches),
+        }
+
+    def server_close(self):
+        super().server_close()
+        for client in CLIENTS.values():
+            client.close()
+        with contextlib.suppress(OSError):
+            os.unlink(self.path)
+
+
+def _control(path, action):
+    """Send a control message to the agent, returning its status, or None
+    if it is not running"""
+
+    sock = agent.connect(path)
+    if sock is None:
+        return None
+
+    with sock:
+        for reply in agent.request(sock, {'control': action}):
+            return reply.get('status')
+
+    return None
+
+
+@click.group()
+def cli():
+    """Commands to manage the background fl33t agent"""
+
+
+@cli.command()
+@click.option('--socket', 'path', default=None,
+              help=('The socket to listen on. Defaults to $FL33T_AGENT_SOCKET'
+                    ' or a socket in $XDG_RUNTIME_DIR.'))
+@click.option('--cache-ttl', type=click.FloatRange(min=0), default=30,
+              help='The number of seconds to cache fl33t objects for.')
+@click.option('--foreground', is_flag=True, default=False,
+              help='Run the agent in this process rather than detaching.')
+@click.option('--wait', type=click.FloatRange(min=0), default=5,
+              help='The number of seconds to wait for a detached agent.')
+def start(path, cache_ttl, foreground, wait):
+    """
+    Start the agent
+
+    While it is running, `fl33t` commands are sent to the agent to run, and
+    share its API client, open connections and cache.
+    """
+
+    path = path or agent.socket_path()
+    agent_status = _control(path, 'status')
+    if agent_status:
+        click.echo('Agent is already running (pid {}).'.format(
+            agent_status['pid']))
+        return
+
+    # A socket left behind by an agent that did not exit cleanly
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+
+    if not foreground:
+        # pylint: disable=consider-using-with
+        subprocess.Popen(
+            [sys.executable, '-m', 'fl33t.cli', 'agent', 'start',
+             '--foreground', '--socket', path, '--cache-ttl', str(cache_ttl)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True)
+
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            agent_status = _control(path, 'status')
+            if agent_status:
+                click.echo('Agent started (pid {}), listening on {}'.format(
+                    agent_status['pid'], path))
+                return
+            time.sleep(0.05)
+
+        click.echo('ERROR: The agent did not start.', err=True)
+        sys.exit(1)
+
+    # pylint: disable=import-outside-toplevel
+    from fl33t.cli import cli as root
+
+    server = AgentServer(path, root, cache_ttl=cache_ttl)
+    click.echo('Agent listening on {}'.format(path), err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@cli.command()
+@click.option('--socket', 'path', default=None,
+              help='The socket the agent is listening on.')
+def stop(path):
+    """Stop the agent"""
+
+    agent_status = _control(path or agent.socket_path(), 'stop')
+    if not agent_status:
+        click.echo('Agent is not running.')
+        return
+
+    click.echo('Agent stopped after {} invocations.'.format(
+        agent_status['invocations']))
+
+
+@cli.command()
+@click.option('--socket', 'path', default=None,
+              help='The socket the agent is listening on.')
+def status(path):
+    """Show whether the agent is running, and its statistics"""
+
+    agent_status = _control(path or agent.socket_path(), 'status')
+    if not agent_status:
+        click.echo('Agent is not running.')
+        sys.exit(1)
+
+    for name, value in agent_status.items():
+        click.echo('{}: {}'.format(name, value))
@@ -4,8 +4,23 @@ fl33t.cli.commands.builds
 Command line interaction for Fl33t builds
 """
 
+import csv
+import fnmatch
+import os
+import sys
+
 import click
 
+from fl33t.cli.output import (
+    concurrency_option,
+    echo_related,
+    list_kwargs,
+    listing_options,
+    write_records
+)
+from fl33t.exceptions import BuildDownloadError, DuplicateBuildError
+from fl33t.utils import concurrent_map
+
 
 @click.group()
 def cli():
@@ -13,18 +28,39 @@ def cli():
     pass
 
 
+def _echo(show_train):
+    """Build the function that echoes a build and its train"""
+
+    def echo(build, train):
+        click.echo(build)
+
+        if show_train:
+            click.echo('Train:')
+            click.echo('    - {}'.format(train))
+
+    return echo
+
+
 @cli.command(name='list')
+@listing_options('build')
 @click.option('-t', '--show-train', is_flag=True, default=False)
+@concurrency_option
 @click.pass_context
-def list_(ctx, show_train):
+def list_(ctx, show_train, concurrency, output):
     """Show information about all builds"""
 
-    for build in ctx.obj['get_fl33t_client']().list_builds():
-        click.echo(build)
+    records = ctx.obj['get_fl33t_client']().list_builds(**list_kwargs(output))
+    if output['format'] != 'text':
+        write_records(records, output)
+        return
 
-        if show_train:
-            click.echo('Train:')
-            click.echo('    - {}'.format(build.train))
+    if not show_train:
+        for build in records:
+            click.echo(build)
+        return
+
+    echo_related(records, lambda build: build.train, _echo(show_train),
+                 concurrency)
 
 
 @cli.command()
@@ -35,11 +71,7 @@ def show(ctx, build_id, show_train):
     """Show information about a single build"""
 
     build = ctx.obj['get_fl33t_client']().get_build(build_id)
-    click.echo(build)
-
-    if show_train:
-        click.echo('Train:')
-        click.echo('    - {}'.format(build.train))
+    _echo(show_train)(build, build.train if show_train else None)
 
 
 @cli.command()
@@ -66,8 +98,12 @@ def delete(ctx, build_id):
 @click.option('-t', '--train-id', prompt=True, type=str)
 @click.option('-r/-u', '--released/--unreleased', is_flag=True, default=False)
 @click.option('-s', '--md5sum', default=None)
+@click.option('--skip-duplicate/--allow-duplicate', default=False,
+              help=('Skip the upload if an identical build already exists'
+                    ' in the train, with the same version and release.'))
 @click.pass_context
-def create(ctx, filename, version, train_id, released, md5sum):
+def create(ctx, filename, version, train_id, released, md5sum,
+           skip_duplicate):
     """Add a build to Fl33t"""
 
     build = ctx.obj['get_fl33t_client']().Build(
@@ -78,12 +114,41 @@ def create(ctx, filename, version, train_id, released, md5sum):
         md5sum=md5sum,
     )
 
-    if build.create():
-        click.echo('Build was created.')
+    try:
+        created = build.create(skip_duplicate=skip_duplicate)
+    except DuplicateBuildError as exc:
+        raise click.ClickException(str(exc))
+
+    if created:
+        if build.duplicate:
+            click.echo('Build already exists in Fl33t, skipping upload.')
+            click.echo(build)
+        else:
+            click.echo('Build was created.')
     else:
         click.echo('Build failed to be created.')
 
 
+@cli.command()
+@click.argument('build_id')
+@click.argument('destination', type=click.Path(dir_okay=True), default='.')
+@click.pass_context
+def download(ctx, build_id, destination):
+    """Download a build's file from Fl33t"""
+
+    build = ctx.obj['get_fl33t_client']().get_build(build_id)
+    if os.path.isdir(destination):
+        destination = os.path.join(destination, build.filename)
+
+    try:
+        size = build.download(destination)
+    except BuildDownloadError as exc:
+        click.echo('Build failed to be downloaded: {}'.format(exc))
+        sys.exit(1)
+
+    click.echo('Downloaded {} bytes to {}'.format(size, destination))
+
+
 @cli.command()
 @click.argument('build_id')
 @click.option('-r/-u', '--released/--unreleased', is_flag=True, prompt=True)
@@ -107,3 +172,151 @@ def update(ctx, build_id, released):
 
     else:
         click.echo('Build is already in sync with desired changes.')
+
+
+def _read_manifest(path, version, train_id, released):
+    """
+    Read the list of builds to create from a CSV manifest
+
+    The manifest must have a header row with a `filename` column, and can
+    provide `version`, `train_id` and `released` columns to override the
+    values given on the command line for each file.
+    """
+
+    basedir = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    with open(path, newline='') as manifest:
+        reader = csv.DictReader(manifest)
+        if 'filename' not in (reader.fieldnames or []):
+            raise click.BadParameter(
+                'The manifest must have a header row with a filename column',
+                param_hint='SOURCE')
+
+        for row in reader:
+            released_value = (row.get('released') or '').strip().lower()
+            jobs.append({
+                'filename': os.path.join(basedir, row['filename'].strip()),
+                'version': (row.get('version') or version or '').strip(),
+                'train_id': (row.get('train_id') or train_id or '').strip(),
+                'released': (released_value in ('1', 'true', 'yes', 'y')
+                             if released_value else released),
+            })
+
+    return jobs
+
+
+def _read_directory(path, pattern, version, train_id, released):
+    """Build the list of builds to create from the files in a directory"""
+
+    return [
+        {
+            'filename': os.path.join(path, name),
+            'version': version,
+            'train_id': train_id,
+            'released': released,
+        }
+        for name in sorted(os.listdir(path))
+        if fnmatch.fnmatch(name, pattern)
+        and os.path.isfile(os.path.join(path, name))
+    ]
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+@cli.command(name='create-many')
+@click.argument('source', type=click.Path(exists=True))
+@click.option('-v', '--version', type=str, default=None,
+              help='Version for every build, unless set in the manifest.')
+@click.option('-t', '--train-id', type=str, default=None,
+              help='Train for every build, unless set in the manifest.')
+@click.option('-r/-u', '--released/--unreleased', is_flag=True, default=False)
+@click.option('-p', '--pattern', default='*',
+              help='Only upload matching files, when SOURCE is a directory.')
+@click.option('-j', '--concurrency', type=click.IntRange(1, 64), default=4,
+              help='The number of files to hash and upload at once.')
+@click.option('--skip-duplicate/--allow-duplicate', default=False,
+              help=('Skip the upload if an identical build already exists'
+                    ' in the train, with the same version and release.'))
+@click.pass_context
+def create_many(ctx, source, version, train_id, released, pattern,
+                concurrency, skip_duplicate):
+    """
+    Add many builds to Fl33t
+
+    SOURCE is either a directory, in which case every file in it is uploaded
+    using --version and --train-id, or a CSV manifest with a header row of
+    `filename,version,train_id,released`.
+    """
+
+    if os.path.isdir(source):
+        jobs = _read_directory(source, pattern, version, train_id, released)
+    else:
+        jobs = _read_manifest(source, version, train_id, released)
+
+    incomplete = [job['filename'] for job in jobs
+                  if not job['version'] or not job['train_id']]
+    if incomplete:
+        click.echo('ERROR: No version or train ID provided for: {}'.format(
+            ', '.join(incomplete)), err=True)
+        sys.exit(2)
+
+    if not jobs:
+        click.echo('No files found to upload.')
+        return
+
+    client = ctx.obj['get_fl33t_client']()
+
+    def hash_file(item):
+        return client.Build(**item[1])
+
+    # Results are kept by the job's position, as a manifest may list the
+    # same file more than once
+    builds = []
+    failures = {}
+    for (index, _), build, exc in concurrent_map(hash_file, enumerate(jobs),
+                                                 workers=concurrency):
+        if exc:
+            failures[index] = exc
+        else:
+            builds.append((index, build))
+
+    if skip_duplicate:
+        for build_train_id in {build.train_id for _, build in builds}:
+            client.get_build_index(build_train_id)
+
+    def upload(item):
+        build = item[1]
+        if not build.create(skip_duplicate=skip_duplicate):
+            raise click.ClickException('fl33t did not create the build')
+        return build
+
+    results = {}
+    total_size = sum(build.size for _, build in builds)
+    with click.progressbar(length=total_size,
+                           label='Uploading {} builds'.format(len(builds)),
+                           file=sys.stderr) as progress:
+        for (index, build), _, exc in concurrent_map(upload, builds,
+                                                     workers=concurrency):
+            if exc:
+                failures[index] = exc
+            else:
+                results[index] = build
+            progress.update(build.size)
+
+    for index, job in enumerate(jobs):
+        filename = job['filename']
+        if index in failures:
+            click.echo('FAILED   {}: {}'.format(filename, failures[index]))
+        elif results[index].duplicate:
+            click.echo('SKIPPED  {}: already exists as {}'.format(
+                filename, results[index].build_id))
+        else:
+            click.echo('CREATED  {}: {}'.format(
+                filename, results[index].build_id))
+
+    click.echo('{} created, {} skipped, {} failed'.format(
+        sum(1 for build in results.values() if not build.duplicate),
+        sum(1 for build in results.values() if build.duplicate),
+        len(failures)))
+
+    if failures:
+        sys.exit(1)
@@ -4,8 +4,27 @@ fl33t.cli.commands.devices
 Command line interaction for Fl33t devices
 """
 
+import json
+import os
+import sys
+
 import click
 
+from fl33t.cli.output import (
+    concurrency_option,
+    echo_related,
+    list_kwargs,
+    listing_options,
+    read_records,
+    write_records
+)
+from fl33t.exceptions import DuplicateDeviceIdError, InvalidDeviceIdError
+from fl33t.utils import concurrent_map, gather
+
+BATCH_ACTIONS = ['create', 'update', 'delete']
+BATCH_COLUMNS = ['line', 'action', 'device_id', 'fleet_id', 'name', 'status',
+                 'changes', 'error']
+
 
 @click.group()
 def cli():
@@ -13,23 +32,62 @@ def cli():
     pass
 
 
-@cli.command(name='list')
-@click.option('-t', '--show-train', is_flag=True, default=False)
-@click.option('-b', '--show-build', is_flag=True, default=False)
-@click.pass_context
-def list_(ctx, show_train, show_build):
-    """Show information about all devices"""
+def _relations(show_train, show_build):
+    """Build the function that looks up the objects related to a device"""
+
+    def relations(device):
+        def train():
+            fleet = device.fleet
+            return fleet.train if fleet else None
+
+        return gather({
+            'train': show_train and train,
+            'build': show_build and (lambda: device.build),
+        })
+
+    return relations
+
 
-    for device in ctx.obj['get_fl33t_client']().list_devices():
+def _echo(show_train, show_build):
+    """Build the function that echoes a device and its related objects"""
+
+    def echo(device, related):
         click.echo(device)
 
         if show_train:
             click.echo('Train:')
-            click.echo('    - {}'.format(device.train))
+            click.echo('    - {}'.format(related['train']))
 
         if show_build:
             click.echo('Build:')
-            click.echo('    - {}'.format(device.build))
+            click.echo('    - {}'.format(related['build']))
+
+    return echo
+
+
+@cli.command(name='list')
+@listing_options('device')
+@click.option('-t', '--show-train', is_flag=True, default=False)
+@click.option('-b', '--show-build', is_flag=True, default=False)
+@concurrency_option
+@click.pass_context
+def list_(ctx, show_train, show_build, concurrency, output):
+    """Show information about all devices"""
+
+    records = ctx.obj['get_fl33t_client']().list_devices(**list_kwargs(output))
+    if output['format'] != 'text':
+        write_records(records, output)
+        return
+
+    if not (show_train or show_build):
+        for device in records:
+            click.echo(device)
+        return
+
+    echo_related(records,
+                 _relations(show_train, show_build),
+                 _echo(show_train, show_build),
+                 concurrency)
 
 
 @cli.command()
@@ -41,15 +99,8 @@ def show(ctx, device_id, show_train, show_build):
     """Show information about a single device"""
 
     device = ctx.obj['get_fl33t_client']().get_device(device_id)
-    click.echo(device)
-
-    if show_train:
-        click.echo('Train:')
-        click.echo('    - {}'.format(device.train))
-
-    if show_build:
-        click.echo('Build:')
-        click.echo(device.build)
+    related = _relations(show_train, show_build)(device)
+    _echo(show_train, show_build)(device, related)
 
 
 @cli.command()
@@ -78,20 +129,22 @@ def delete(ctx, device_id):
 def create(ctx, device_id, fleet_id, name):
     """Add a device to Fl33t"""
 
-    device = ctx.obj['get_fl33t_client']().get_device(device_id)
-    if device:
-        click.echo('Device already exists in Fl33t. Cannot proceed with '
-                   'creation.')
-        click.echo(device)
-        return
-
-    device = ctx.obj['get_fl33t_client']().Device(
+    client = ctx.obj['get_fl33t_client']()
+    device = client.Device(
         device_id=device_id,
         fleet_id=fleet_id,
         name=name,
     )
 
-    if device.create():
+    try:
+        created = device.create()
+    except DuplicateDeviceIdError:
+        click.echo('Device already exists in Fl33t. Cannot proceed with '
+                   'creation.')
+        click.echo(client.get_device(device_id))
+        return
+
+    if created:
         click.echo('Device was created.')
     else:
         click.echo('Device failed to be created.')
@@ -128,3 +181,263 @@ def update(ctx, device_id, fleet_id, name):
             click.echo('Device failed to be updated.')
     else:
         click.echo('Device is already in sync with desired changes.')
+
+
+def _get_device(client, device_id):
+    """Return a device, or None if it does not exist"""
+
+    try:
+        return client.get_device(device_id)
+    except InvalidDeviceIdError:
+        return None
+
+
+def _batch_row(client, row, dry_run):
+    """
+    Create, update or delete the device described by a single batch row
+
+    Returns the result row. When `dry_run` is set, the current state of the
+    device is compared against the row, but no changes are made.
+    """
+
+    result = dict(row, status='', changes=None, error=None)
+    action = row['action']
+    device_id = row['device_id']
+
+    if action == 'create':
+        if dry_run:
+            exists = device_id and _get_device(client, device_id)
+            result['status'] = 'exists' if exists else 'would-create'
+            return result
+
+        device = client.Device(device_id=device_id,
+                               fleet_id=row['fleet_id'],
+                               name=row['name'])
+        try:
+            created = device.create()
+        except DuplicateDeviceIdError:
+            result['status'] = 'exists'
+            return result
+
+        result['device_id'] = device.device_id
+        result['status'] = 'created' if created else 'failed'
+        return result
+
+    device = _get_device(client, device_id)
+    if not device:
+        result['status'] = 'missing'
+        return result
+
+    if action == 'delete':
+        if dry_run:
+            result['status'] = 'would-delete'
+        else:
+            result['status'] = 'deleted' if device.delete() else 'failed'
+        return result
+
+    changes = {key: [getattr(device, key), row[key]]
+               for key in ('fleet_id', 'name')
+               if row[key] and getattr(device, key) != row[key]}
+
+    result['changes'] = changes
+    if not changes:
+        result['status'] = 'unchanged'
+    elif dry_run:
+        result['status'] = 'would-update'
+    else:
+        for key, (_, value) in changes.items():
+            setattr(device, key, value)
+        result['status'] = 'updated' if device.update() else 'failed'
+
+    return result
+
+
+# pylint: disable=too-many-arguments
+@cli.command()
+@click.argument('source', type=click.File('r'), default='-')
+@click.option('-i', '--input-format', type=click.Choice(['jsonl', 'csv',
+                                                         'tsv']),
+              default=None,
+              help=('The format of SOURCE. Defaults to jsonl for .jsonl and'
+                    ' .json files, tsv for .tsv files and csv otherwise.'))
+@click.option('-a', '--action', type=click.Choice(BATCH_ACTIONS),
+              default=None,
+              help='The action for rows that do not have an action column.')
+@click.option('-o', '--format', 'format_',
+              type=click.Choice(['jsonl', 'csv', 'tsv']), default='jsonl',
+              help='The output format of the result rows.')
+@click.option('-j', '--concurrency', type=click.IntRange(1, 64), default=8,
+              help='The number of rows to process at once.')
+@click.option('-n', '--dry-run', is_flag=True, default=False,
+              help='Compare against fl33t and report what would change.')
+@click.pass_context
+def batch(ctx, source, input_format, action, format_, concurrency, dry_run):
+    """
+    Create, update or delete many devices
+
+    SOURCE is a CSV, TSV or JSONL file, or - for stdin, with the columns
+    `action`, `device_id`, `fleet_id` and `name`. `action` is one of create,
+    update (which can move the device to another fleet) or delete. A result
+    row is written for every input row, in the same order.
+    """
+
+    if not input_format:
+        extension = os.path.splitext(source.name)[1].lower()
+        input_format = {
+            '.json': 'jsonl',
+            '.jsonl': 'jsonl',
+            '.tsv': 'tsv'
+        }.get(extension, 'csv')
+
+    client = ctx.obj['get_fl33t_client']()
+
+    def rows():
+        for line, record in read_records(source, input_format):
+            row = {
+                'line': line,
+                'action': (record.get('action') or action or '').lower(),
+                'device_id': record.get('device_id') or '',
+                'fleet_id': record.get('fleet_id') or '',
+                'name': record.get('name') or '',
+            }
+            yield row
+
+    def process(row):
+        if row['action'] not in BATCH_ACTIONS:
+            raise click.ClickException('Unknown action: {!r}'.format(
+                row['action']))
+        if not row['device_id'] and row['action'] != 'create':
+            raise click.ClickException('A device_id is required')
+        return _batch_row(client, row, dry_run)
+
+    failures = []
+
+    def results():
+        for row, result, exc in concurrent_map(process, rows(),
+                                               workers=concurrency):
+            if exc:
+                message = exc.format_message() if isinstance(
+                    exc, click.ClickException) else str(exc)
+                result = dict(row, status='failed', changes=None,
+                              error=message or exc.__class__.__name__)
+            if result['status'] == 'failed':
+                failures.append(result)
+            yield result
+
+    count = write_records(results(), {'format': format_,
+                                      'columns': BATCH_COLUMNS})
+
+    click.echo('{} rows processed, {} failed{}'.format(
+        count, len(failures), ' (dry run)' if dry_run else ''), err=True)
+
+    if failures:
+        sys.exit(1)
+
+
+def _parse_duration(ctx, param, value):
+    """Parse a human readable duration option"""
+
+    # pylint: disable=import-outside-toplevel
+    from fl33t.reaper import parse_duration
+
+    try:
+        return parse_duration(value)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc))
+
+
+def _parse_fleet_durations(ctx, param, values):
+    """Parse `FLEET_ID=DURATION` options into a mapping"""
+
+    thresholds = {}
+    for value in values:
+        fleet_id, _, duration = value.partition('=')
+        if not fleet_id or not duration:
+            raise click.BadParameter('must be FLEET_ID=DURATION, e.g. '
+                                     'abc123=30d')
+        thresholds[fleet_id] = _parse_duration(ctx, param, duration)
+    return thresholds
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+@cli.command()
+@click.option('-o', '--older-than', required=True, callback=_parse_duration,
+              help=('Delete devices that have not checked in for this long, '
+                    'e.g. 90d, 12h or 3600.'))
+@click.option('-f', '--fleet-id', 'fleet_ids', multiple=True,
+              help='Only look at the devices in this fleet. Can be repeated.')
+@click.option('--fleet-older-than', 'fleet_thresholds', multiple=True,
+              callback=_parse_fleet_durations,
+              help=('A different threshold for the devices in one fleet, as '
+                    'FLEET_ID=DURATION. Can be repeated.'))
+@click.option('-r', '--rate', type=click.FloatRange(min=0.1), default=None,
+              help='Delete no more than this many devices per second.')
+@click.option('-j', '--concurrency', type=click.IntRange(1, 64), default=8,
+              help='The number of devices to delete at once.')
+@click.option('--journal', type=click.Path(dir_okay=False), default=None,
+              help=('The file recording progress, so that an interrupted '
+                    'run resumes. Kept in the fl33t app directory, if not '
+                    'provided.'))
+@click.option('-n', '--dry-run', is_flag=True, default=False,
+              help='Only report the devices that would be deleted.')
+@click.option('--format', 'format_', default='text',
+              type=click.Choice(['text', 'jsonl']),
+              help='The output format.')
+@click.pass_context
+def reap(ctx, older_than, fleet_ids, fleet_thresholds, rate, concurrency,
+         journal, dry_run, format_):
+    """
+    Delete devices that have not checked in for a long time
+
+    Stale devices are found first, then deleted. If the command is
+    interrupted, running it again resumes the deletions without looking
+    through every device again. Exits with status 1 if any device could not
+    be deleted.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from fl33t.reaper import Reaper
+
+    client = ctx.obj['get_fl33t_client']()
+    if not journal:
+        directory = click.get_app_dir('fl33t')
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        journal = os.path.join(directory,
+                               'reap-{}.jsonl'.format(client.team_id))
+
+    reaper = Reaper(client,
+                    older_than,
+                    fleet_ids=fleet_ids,
+                    fleet_thresholds=fleet_thresholds,
+                    journal=journal,
+                    rate=rate,
+                    workers=concurrency)
+    by_fleet = {}
+
+    def report(stale, deleted):
+        by_fleet[stale.fleet_id] = by_fleet.get(stale.fleet_id, 0) + 1
+        status = {None: 'stale', True: 'deleted', False: 'failed'}[deleted]
+        if format_ == 'jsonl':
+            click.echo(json.dumps(dict(stale._asdict(), status=status)))
+        else:
+            click.echo('{} {} (fleet {}, last checked in {})'.format(
+                status, stale.device_id, stale.fleet_id,
+                stale.checkin_tstamp))
+
+    try:
+        summary = reaper.run(dry_run=dry_run, callback=report)
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+
+    for fleet_id, count in sorted(by_fleet.items(), key=str):
+        click.echo('Fleet {}: {} stale devices'.format(fleet_id, count),
+                   err=True)
+    click.echo('{stale} stale devices, {deleted} deleted, {failed} failed{}{}'
+               .format(', {} kept as they have checked in since'.format(
+                           summary['kept']) if summary['kept'] else '',
+                       ' (dry run)' if dry_run else
+                       ' (resumed)' if summary['resumed'] else '',
+                       **summary), err=True)
+
+    if summary['failed']:
+        sys.exit(1)
@@ -0,0 +1,71 @@
+"""
+fl33t.cli.commands.exporter
+
+Command line interaction for serving Fl33t metrics to Prometheus
+"""
+
+import click
+
+from fl33t.reaper import parse_duration
+
+
+# pylint: disable=too-many-arguments
+@click.command()
+@click.option('-H', '--host', default='127.0.0.1',
+              help='The address to listen on.')
+@click.option('-p', '--port', type=click.IntRange(0, 65535), default=9331,
+              help='The port to listen on.')
+@click.option('-i', '--scan-interval', type=click.FloatRange(min=1),
+              default=300,
+              help='Count the devices of the team every this many seconds.')
+@click.option('--stale-after', default='30d',
+              help=('Count devices that have not checked in for this long as '
+                    'stale, e.g. 90d or 12h.'))
+@click.option('-j', '--concurrency', type=click.IntRange(1, 64), default=8,
+              help='The number of pages of devices to request at once.')
+@click.option('--page-size', type=click.IntRange(min=1), default=None,
+              help='The number of records to fetch per request.')
+@click.option('-m', '--mirror', type=click.Path(dir_okay=False),
+              default=None,
+              help=('Keep this local mirror in sync, and count devices from '
+                    'it, instead of listing every device on each scan.'))
+@click.pass_context
+def exporter(ctx, host, port, scan_interval, stale_after, concurrency,
+             page_size, mirror):
+    """
+    Serve metrics at /metrics for Prometheus to scrape
+
+    Exports the latency, status, errors and retries of the API requests made
+    by the exporter, its cache hit rate, and the number of devices on each
+    build, in each fleet and that are stale, from periodic scans of the
+    team's devices.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from fl33t.exporter import Exporter, FleetScanner
+
+    try:
+        stale_after = parse_duration(stale_after)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint='--stale-after')
+
+    client = ctx.obj['get_fl33t_client']()
+    scanner = FleetScanner(client, interval=scan_interval,
+                           stale_after=stale_after, workers=concurrency,
+                           page_size=page_size, mirror=mirror)
+    try:
+        server = Exporter(client, scanner=scanner).server(host, port)
+    except OSError as exc:
+        raise click.ClickException('Cannot listen on {}:{}: {}'.format(
+            host, port, exc))
+
+    scanner.start()
+    click.echo('Serving metrics at http://{}:{}/metrics'.format(
+        *server.server_address[:2]), err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        scanner.stop()
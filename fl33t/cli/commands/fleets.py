@@ -4,8 +4,21 @@ fl33t.cli.commands.fleets
 Command line interaction for Fl33t fleets
 """
 
+import os
+import sys
+import time
+
 import click
 
+from fl33t.cli.output import (
+    concurrency_option,
+    echo_related,
+    list_kwargs,
+    listing_options,
+    write_records
+)
+from fl33t.utils import gather
+
 
 @click.group()
 def cli():
@@ -13,30 +26,77 @@ def cli():
     pass
 
 
-@cli.command(name='list')
-@click.option('-t', '--show-train', is_flag=True, default=False)
-@click.option('-b', '--list-builds', is_flag=True, default=False)
-@click.option('-d', '--list-devices', is_flag=True, default=False)
-@click.pass_context
-def list_(ctx, show_train, list_builds, list_devices):
-    """Show information about all fleets"""
+def _relations(show_train, list_builds, list_devices):
+    """Build the function that looks up the objects related to a fleet"""
 
-    for fleet in ctx.obj['get_fl33t_client']().list_fleets():
+    def relations(fleet):
+        def train_and_builds():
+            train = fleet.train
+            builds = train.builds() if list_builds and train else []
+            return train, builds
+
+        related = gather({
+            'train': (show_train or list_builds) and train_and_builds,
+            'devices': list_devices and (lambda: list(fleet.devices())),
+        })
+        train, builds = related['train'] or (None, None)
+        return {
+            'train': train,
+            'builds': builds,
+            'devices': related['devices'],
+        }
+
+    return relations
+
+
+def _echo(show_train, list_builds, list_devices):
+    """Build the function that echoes a fleet and its related objects"""
+
+    def echo(fleet, related):
         click.echo(fleet)
         if show_train:
             click.echo('Train:')
-            click.echo('    - {}'.format(fleet.train))
+            click.echo('    - {}'.format(related['train']))
 
         if list_builds:
             click.echo('Builds:')
-            for build in fleet.train.builds():
+            for build in related['builds']:
                 click.echo('    - {}'.format(build))
 
         if list_devices:
             click.echo('Devices:')
-            for device in fleet.devices():
+            for device in related['devices']:
                 click.echo('    - {}'.format(device))
 
+    return echo
+
+
+# pylint: disable=too-many-arguments
+@cli.command(name='list')
+@listing_options('fleet')
+@click.option('-t', '--show-train', is_flag=True, default=False)
+@click.option('-b', '--list-builds', is_flag=True, default=False)
+@click.option('-d', '--list-devices', is_flag=True, default=False)
+@concurrency_option
+@click.pass_context
+def list_(ctx, show_train, list_builds, list_devices, concurrency, output):
+    """Show information about all fleets"""
+
+    records = ctx.obj['get_fl33t_client']().list_fleets(**list_kwargs(output))
+    if output['format'] != 'text':
+        write_records(records, output)
+        return
+
+    if not (show_train or list_builds or list_devices):
+        for fleet in records:
+            click.echo(fleet)
+        return
+
+    echo_related(records,
+                 _relations(show_train, list_builds, list_devices),
+                 _echo(show_train, list_builds, list_devices),
+                 concurrency)
+
 
 @cli.command()
 @click.argument('fleet_id')
@@ -48,20 +108,8 @@ def show(ctx, fleet_id, show_train, list_builds, list_devices):
     """Show information about a single fleet"""
 
     fleet = ctx.obj['get_fl33t_client']().get_fleet(fleet_id)
-    click.echo(fleet)
-    if show_train:
-        click.echo('Train:')
-        click.echo('    - {}'.format(fleet.train))
-
-    if list_builds:
-        click.echo('Builds:')
-        for build in fleet.train.builds():
-            click.echo('    - {}'.format(build))
-
-    if list_devices:
-        click.echo('Devices:')
-        for device in fleet.devices():
-            click.echo('    - {}'.format(device))
+    related = _relations(show_train, list_builds, list_devices)(fleet)
+    _echo(show_train, list_builds, list_devices)(fleet, related)
 
 
 @cli.command()
@@ -145,3 +193,167 @@ def update(ctx, fleet_id, name, train_id, build_id, unreleased):
             click.echo('Fleet failed to be updated.')
     else:
         click.echo('Fleet is already in sync with desired changes.')
+
+
+def _parse_waves(ctx, param, value):
+    """Parse a comma separated list of percentages into fractions"""
+
+    try:
+        return [float(wave) / 100 for wave in value.split(',')]
+    except ValueError:
+        raise click.BadParameter('must be comma separated percentages, '
+                                 'e.g. 1,10,50,100')
+
+
+def _echo_rollout_event(event):
+    """Echo a rollout's progress"""
+
+    label = 'Wave {}: {} devices'.format(event['wave'] + 1, event['size'])
+    if event['event'] == 'moved':
+        click.echo('{}: moved {}, {} failed'.format(
+            label, event['moved'], event['failed']))
+    else:
+        click.echo('{}: {} of {} on the new build ({:.0%}), {} checked in'
+                   .format(label, event['converged'], event['moved'],
+                           event['fraction'], event['checked_in']))
+
+
+# pylint: disable=too-many-arguments
+@cli.command()
+@click.argument('source_fleet_id')
+@click.argument('target_fleet_id')
+@click.option('-w', '--waves', default='1,10,50,100', callback=_parse_waves,
+              help=('The percentage of the devices moved by the end of each '
+                    'wave.'))
+@click.option('--threshold', type=click.FloatRange(0, 100), default=95,
+              help=('The percentage of moved devices that must be on the '
+                    'new build before the next wave.'))
+@click.option('--poll-interval', type=click.FloatRange(min=1), default=60,
+              help='The number of seconds between convergence checks.')
+@click.option('--timeout', type=click.FloatRange(min=0), default=3600,
+              help=('Stop if a wave has not converged after this many '
+                    'seconds.'))
+@click.option('-c', '--checkpoint', type=click.Path(dir_okay=False),
+              default=None,
+              help=('The file the rollout is saved to and resumed from. '
+                    'Kept in the fl33t app directory, if not provided.'))
+@click.option('-j', '--concurrency', type=click.IntRange(1, 64), default=8,
+              help='The number of devices to move at once.')
+@click.pass_context
+def rollout(ctx, source_fleet_id, target_fleet_id, waves, threshold,
+            poll_interval, timeout, checkpoint, concurrency):
+    """
+    Move the devices of SOURCE_FLEET_ID into TARGET_FLEET_ID in waves
+
+    Between waves, waits for the moved devices to check in and converge on
+    the target fleet's build. Running the same rollout again resumes it.
+    Exits with status 1 if the rollout did not finish.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from fl33t.rollout import Rollout
+
+    if not checkpoint:
+        directory = click.get_app_dir('fl33t')
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        checkpoint = os.path.join(directory, 'rollout-{}-{}.json'.format(
+            source_fleet_id, target_fleet_id))
+
+    try:
+        fleet_rollout = Rollout(ctx.obj['get_fl33t_client'](),
+                                source_fleet_id,
+                                target_fleet_id,
+                                checkpoint=checkpoint,
+                                waves=waves,
+                                threshold=threshold / 100,
+                                poll_interval=poll_interval,
+                                timeout=timeout,
+                                workers=concurrency)
+        state = fleet_rollout.load()
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+
+    click.echo('Rolling out build {} to {} devices, checkpointed to {}'
+               .format(state['build_id'], len(state['device_ids']),
+                       checkpoint))
+
+    outcome = fleet_rollout.run(callback=_echo_rollout_event)
+    click.echo('Rollout {}'.format(outcome))
+    if outcome != 'done':
+        sys.exit(1)
+
+
+def _format_duration(seconds):
+    """Format a number of seconds as e.g. `1h 02m` or `3m 20s`"""
+
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '{}h {:02d}m'.format(seconds // 3600, seconds % 3600 // 60)
+    return '{}m {:02d}s'.format(seconds // 60, seconds % 60)
+
+
+def _format_sample(sample, build_id):
+    """Format a convergence sample as a line of text"""
+
+    return '{} {} of {} devices on build {} ({:.1%}), {}, ETA {}'.format(
+        time.strftime('%H:%M:%S', time.localtime(sample.time)),
+        sample.converged,
+        sample.total,
+        build_id,
+        sample.fraction,
+        '{:.2f} devices/s'.format(sample.rate)
+        if sample.rate is not None else 'rate unknown',
+        _format_duration(sample.eta) if sample.eta is not None else 'unknown')
+
+
+# pylint: disable=too-many-arguments
+@cli.command()
+@click.argument('fleet_id')
+@click.option('-b', '--build-id', type=str, default=None,
+              help="The build to converge on. Defaults to the fleet's build.")
+@click.option('-i', '--interval', type=click.FloatRange(min=1), default=30,
+              help='The number of seconds between samples.')
+@click.option('-u', '--until', type=click.FloatRange(0, 100), default=100,
+              help='Stop once this percentage of the fleet has converged.')
+@click.option('--page-size', type=click.IntRange(min=1), default=None,
+              help='The number of records to fetch per request.')
+@click.option('-j', '--concurrency', type=click.IntRange(1, 64), default=4,
+              help='The number of pages to fetch at once.')
+@click.pass_context
+def converge(ctx, fleet_id, build_id, interval, until, page_size,
+             concurrency):
+    """
+    Follow the devices of a fleet converging on its build
+
+    The fleet is sampled every INTERVAL seconds, showing how many of its
+    devices are on the build, how fast they are moving over, and an
+    estimate of when all of them will have.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from fl33t.convergence import ConvergenceTracker
+
+    tracker = ConvergenceTracker(ctx.obj['get_fl33t_client'](),
+                                 fleet_id,
+                                 build_id=build_id,
+                                 workers=concurrency,
+                                 page_size=page_size)
+    live = sys.stdout.isatty()
+
+    def show(sample):
+        line = _format_sample(sample, tracker.build_id)
+        if live:
+            # Redraw the same line, clearing what is left of the last one
+            click.echo('\r{}\x1b[K'.format(line), nl=False)
+        else:
+            click.echo(line)
+
+    try:
+        tracker.run(show, interval=interval, until=until / 100)
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if live:
+            click.echo()
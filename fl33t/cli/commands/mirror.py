@@ -0,0 +1,99 @@
+"""
+fl33t.cli.commands.mirror
+
+Command line interaction for the local mirror of Fl33t objects
+"""
+
+import datetime
+import os
+
+import click
+
+from fl33t.mirror import COLLECTIONS, Mirror
+
+
+def _open_mirror(ctx, path, **kwargs):
+    """Open the mirror for the command's team, at `path` if given"""
+
+    client = ctx.obj['get_fl33t_client']()
+    if not path:
+        directory = click.get_app_dir('fl33t')
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        path = os.path.join(directory,
+                            'mirror-{}.sqlite3'.format(client.team_id))
+
+    return Mirror(client, path, **kwargs)
+
+
+def path_option(func):
+    """Add the `--path` option for the mirror's database file"""
+
+    return click.option(
+        '-p', '--path', type=click.Path(dir_okay=False), default=None,
+        envvar='FL33T_MIRROR_PATH',
+        help=('The mirror database. Taken from environment variable'
+              " 'FL33T_MIRROR_PATH', or kept in the fl33t app directory,"
+              ' if not provided.')
+    )(func)
+
+
+@click.group()
+def cli():
+    """Commands to keep a local mirror of the Fl33t objects"""
+    pass
+
+
+# pylint: disable=too-many-arguments
+@cli.command()
+@path_option
+@click.option('-c', '--collection', 'collections', multiple=True,
+              type=click.Choice(list(COLLECTIONS)),
+              help='Only sync this collection. Can be given more than once.')
+@click.option('-f', '--force', is_flag=True, default=False,
+              help='List every collection again, even if it is unchanged.')
+@click.option('--max-age', type=click.FloatRange(min=0), default=3600,
+              help=('List collections again after this many seconds, even '
+                    'if their count is unchanged.'))
+@click.option('--page-size', type=click.IntRange(min=1), default=None,
+              help='The number of records to fetch per request.')
+@click.pass_context
+def sync(ctx, path, collections, force, max_age, page_size):
+    """Bring the mirror up to date with Fl33t"""
+
+    mirror = _open_mirror(ctx, path, max_age=max_age, page_size=page_size)
+    try:
+        results = mirror.sync(collections, force=force)
+    finally:
+        mirror.close()
+
+    for collection, result in results.items():
+        if result is None:
+            click.echo('{:<10} unchanged'.format(collection))
+        else:
+            click.echo('{:<10} {count} records: {inserted} new, {updated} '
+                       'changed, {deleted} removed'.format(
+                           collection, **result))
+
+
+@cli.command()
+@path_option
+@click.pass_context
+def status(ctx, path):
+    """Show what the mirror holds, and when it was last synced"""
+
+    mirror = _open_mirror(ctx, path)
+    try:
+        click.echo('Mirror: {}'.format(mirror.path))
+        for collection in COLLECTIONS:
+            state = mirror.sync_state(collection)
+            if state is None:
+                click.echo('{:<10} never synced'.format(collection))
+                continue
+
+            click.echo('{:<10} {} records, synced {}'.format(
+                collection,
+                state['count'],
+                datetime.datetime.fromtimestamp(
+                    state['synced_at']).isoformat(' ', 'seconds')))
+    finally:
+        mirror.close()
@@ -0,0 +1,87 @@
+"""
+fl33t.cli.commands.reconcile
+
+Command line interaction for bringing Fl33t in line with a desired state
+"""
+
+import json
+import sys
+
+import click
+
+from fl33t.reconcile import Reconciler, describe, load_state, step_record
+
+
+# pylint: disable=too-many-arguments
+@click.command()
+@click.argument('source', type=click.File('r'))
+@click.option('-p', '--plan-only', is_flag=True, default=False,
+              help=('Only show the plan. Exits with status 1 if anything '
+                    'would change.'))
+@click.option('-o', '--format', 'format_', default='text',
+              type=click.Choice(['text', 'jsonl']),
+              help='The output format.')
+@click.option('-j', '--concurrency', type=click.IntRange(1, 64), default=8,
+              help='The number of changes to make at once.')
+@click.option('--retries', type=click.IntRange(0, 10), default=2,
+              help=('Retry updates and deletes that fail with a server or '
+                    'connection error this many times.'))
+@click.option('--page-size', type=click.IntRange(min=1), default=None,
+              help='The number of records to fetch per request.')
+@click.pass_context
+def apply(ctx, source, plan_only, format_, concurrency, retries, page_size):
+    """
+    Bring Fl33t in line with the desired state in SOURCE
+
+    SOURCE is a JSON or YAML file, or - for stdin, listing the `trains`,
+    `fleets`, `builds` and `devices` wanted. The plan of changes is shown,
+    and then applied.
+    """
+
+    try:
+        reconciler = Reconciler(ctx.obj['get_fl33t_client'](),
+                                load_state(source),
+                                workers=concurrency,
+                                retries=retries,
+                                page_size=page_size)
+        plan = reconciler.plan()
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+
+    if plan_only or format_ == 'text':
+        for step in plan:
+            if format_ == 'jsonl':
+                click.echo(json.dumps(step_record(step)))
+            else:
+                click.echo(describe(step))
+
+    counts = plan.summary()
+    click.echo('Plan: {create} to create, {update} to update, {delete} to '
+               'delete'.format(**counts), err=True)
+
+    if plan_only or not len(plan):  # pylint: disable=len-as-condition
+        sys.exit(1 if plan_only and len(plan) else 0)
+
+    failures = []
+
+    def report(result):
+        if result.status == 'failed':
+            failures.append(result)
+        if format_ == 'jsonl':
+            click.echo(json.dumps(dict(step_record(result.step),
+                                       status=result.status,
+                                       error=result.error)))
+        elif result.status != 'applied':
+            click.echo('{}: {}{}'.format(
+                result.status, describe(result.step),
+                ' ({})'.format(result.error) if result.error else ''),
+                err=True)
+
+    results = reconciler.apply(plan, callback=report)
+
+    click.echo('{} of {} changes applied, {} failed'.format(
+        sum(1 for result in results if result.status == 'applied'),
+        len(results), len(failures)), err=True)
+
+    if failures:
+        sys.exit(1)
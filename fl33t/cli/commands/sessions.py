@@ -6,6 +6,8 @@ Command line interaction for Fl33t sessions
 
 import click
 
+from fl33t.cli.output import list_kwargs, listing_options, write_records
+
 
 TYPES = [
     'account',
@@ -28,11 +30,18 @@ def cli():
 
 
 @cli.command(name='list')
+@listing_options('session')
 @click.pass_context
-def list_(ctx):
+def list_(ctx, output):
     """Show information about all sessions"""
 
-    for session in ctx.obj['get_fl33t_client']().list_sessions():
+    client = ctx.obj['get_fl33t_client']()
+    records = client.list_sessions(**list_kwargs(output))
+    if output['format'] != 'text':
+        write_records(records, output)
+        return
+
+    for session in records:
         click.echo(session)
 
 
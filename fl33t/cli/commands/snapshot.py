@@ -0,0 +1,93 @@
+"""
+fl33t.cli.commands.snapshot
+
+Command line interaction for snapshots of Fl33t objects
+"""
+
+import json
+import sys
+
+import click
+
+from fl33t.snapshot import (
+    COLLECTIONS,
+    diff as diff_snapshots,
+    summarize,
+    write_snapshot
+)
+
+
+@click.group()
+def cli():
+    """Commands to take and compare snapshots of the Fl33t objects"""
+    pass
+
+
+@cli.command()
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('-c', '--collection', 'collections', multiple=True,
+              type=click.Choice(list(COLLECTIONS)),
+              help=('Only include this collection. Can be given more than '
+                    'once.'))
+@click.option('--page-size', type=click.IntRange(min=1), default=None,
+              help='The number of records to fetch per request.')
+@click.pass_context
+def create(ctx, path, collections, page_size):
+    """Write a snapshot of every Fl33t object to PATH"""
+
+    counts = write_snapshot(ctx.obj['get_fl33t_client'](),
+                            path,
+                            collections=collections,
+                            page_size=page_size)
+
+    click.echo('Snapshot written to {}: {}'.format(path, ', '.join(
+        '{} {}'.format(count, collection)
+        for collection, count in counts.items())))
+
+
+@cli.command()
+@click.argument('old', type=click.Path(exists=True, dir_okay=False))
+@click.argument('new', type=click.Path(exists=True, dir_okay=False))
+@click.option('-o', '--format', 'format_', default='text',
+              type=click.Choice(['text', 'jsonl']),
+              help='The output format.')
+@click.option('-s', '--summary', is_flag=True, default=False,
+              help='Only show the number of changes in each collection.')
+def diff(old, new, format_, summary):
+    """
+    Show what changed between the OLD and NEW snapshots
+
+    Exits with status 1 if there are any changes.
+    """
+
+    try:
+        changes = diff_snapshots(old, new)
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+
+    if summary:
+        counts = summarize(changes)
+        for collection, collection_counts in sorted(counts.items()):
+            click.echo('{:<10} {added} added, {removed} removed, {changed} '
+                       'changed'.format(collection, **collection_counts))
+        sys.exit(1 if counts else 0)
+
+    stream = click.get_text_stream('stdout')
+    changed = False
+    for change in changes:
+        changed = True
+        if format_ == 'jsonl':
+            stream.write(json.dumps(change._asdict()) + '\n')
+        elif change.kind == 'changed':
+            stream.write('~ {} {}: {}\n'.format(
+                change.collection, change.id, ', '.join(
+                    '{}: {} -> {}'.format(field, change.old.get(field),
+                                          change.new.get(field))
+                    for field in change.fields)))
+        else:
+            stream.write('{} {} {}\n'.format(
+                '+' if change.kind == 'added' else '-',
+                change.collection, change.id))
+
+    stream.flush()
+    sys.exit(1 if changed else 0)
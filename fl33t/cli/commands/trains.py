@@ -6,6 +6,15 @@ Command line interaction for Fl33t trains
 
 import click
 
+from fl33t.cli.output import (
+    concurrency_option,
+    echo_related,
+    list_kwargs,
+    listing_options,
+    write_records
+)
+from fl33t.utils import gather
+
 
 @click.group()
 def cli():
@@ -13,23 +22,59 @@ def cli():
     pass
 
 
+def _relations(show_fleets, list_builds):
+    """Build the function that looks up the objects related to a train"""
+
+    def relations(train):
+        return gather({
+            'fleets': show_fleets and (lambda: list(train.fleets())),
+            'builds': list_builds and (lambda: list(train.builds())),
+        })
+
+    return relations
+
+
+def _echo(show_fleets, list_builds):
+    """Build the function that echoes a train and its related objects"""
+
+    def echo(train, related):
+        click.echo(train)
+        if show_fleets:
+            click.echo('Fleets:')
+            for fleet in related['fleets']:
+                click.echo('    - {}'.format(fleet))
+
+        if list_builds:
+            click.echo('Builds:')
+            for build in related['builds']:
+                click.echo('    - {}'.format(build))
+
+    return echo
+
+
 @cli.command(name='list')
+@listing_options('train')
 @click.option('-f', '--show-fleet', is_flag=True, default=False)
 @click.option('-b', '--list-builds', is_flag=True, default=False)
+@concurrency_option
 @click.pass_context
-def list_(ctx, show_fleet, list_builds):
+def list_(ctx, show_fleet, list_builds, concurrency, output):
     """Show information about all trains"""
 
-    for train in ctx.obj['get_fl33t_client']().list_trains():
-        click.echo(train)
-        if show_fleet:
-            click.echo('Train:')
-            click.echo('    - {}'.format(train.fleet))
+    records = ctx.obj['get_fl33t_client']().list_trains(**list_kwargs(output))
+    if output['format'] != 'text':
+        write_records(records, output)
+        return
 
-        if list_builds:
-            click.echo('Builds:')
-            for build in train.builds():
-                click.echo('    - {}'.format(build))
+    if not (show_fleet or list_builds):
+        for train in records:
+            click.echo(train)
+        return
+
+    echo_related(records,
+                 _relations(show_fleet, list_builds),
+                 _echo(show_fleet, list_builds),
+                 concurrency)
 
 
 @cli.command()
@@ -41,15 +86,8 @@ def show(ctx, train_id, show_fleet, list_builds):
     """Show information about a single train"""
 
     train = ctx.obj['get_fl33t_client']().get_train(train_id)
-    click.echo(train)
-    if show_fleet:
-        click.echo('Train:')
-        click.echo('    - {}'.format(train.fleet))
-
-    if list_builds:
-        click.echo('Builds:')
-        for build in train.builds():
-            click.echo('    - {}'.format(build))
+    related = _relations(show_fleet, list_builds)(train)
+    _echo(show_fleet, list_builds)(train, related)
 
 
 @cli.command()
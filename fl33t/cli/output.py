@@ -0,0 +1,238 @@
+"""
+fl33t.cli.output
+
+Machine readable input and output for the command line
+"""
+
+import csv
+import functools
+import importlib
+import json
+
+import click
+
+from fl33t.utils import ExtendedEncoder, concurrent_map
+
+FORMATS = ['text', 'jsonl', 'csv', 'tsv']
+
+# Session tokens are left out unless they are specifically asked for
+DEFAULT_COLUMNS = {
+    'build': ['build_id', 'version', 'train_id', 'status', 'released', 'size',
+              'md5sum', 'filename', 'upload_tstamp'],
+    'device': ['device_id', 'name', 'fleet_id', 'build_id', 'checkin_tstamp'],
+    'fleet': ['fleet_id', 'name', 'train_id', 'build_id', 'unreleased',
+              'size'],
+    'session': ['name', 'type', 'admin', 'device', 'provisioning', 'readonly',
+                'upload'],
+    'train': ['train_id', 'name', 'upload_tstamp'],
+}
+
+
+def model_columns(model_name):
+    """
+    All of the columns that can be output for a model
+
+    :param str model_name: The lowercase name of the model
+    :returns: list of str
+    """
+
+    models = importlib.import_module('fl33t.models')
+    return getattr(models, model_name.title()).fields()
+
+
+def listing_options(model_name):
+    """
+    Add the output format and pagination options to a listing command
+
+    The command receives an `output` keyword argument, a `dict` with the
+    `format`, `columns`, `offset`, `limit` and `page_size` to use.
+
+    :param str model_name: The lowercase name of the model being listed
+    """
+
+    def parse_columns(ctx, param, value):  # pylint: disable=unused-argument
+        if not value:
+            return None
+
+        columns = [column.strip() for column in value.split(',')
+                   if column.strip()]
+        unknown = set(columns) - set(model_columns(model_name))
+        if unknown:
+            raise click.BadParameter('Unknown columns: {}. Choose from: {}'
+                                     .format(', '.join(sorted(unknown)),
+                                             ', '.join(model_columns(
+                                                 model_name))))
+        return columns
+
+    def decorator(func):
+        @click.option('-o', '--format', 'format_', default='text',
+                      type=click.Choice(FORMATS),
+                      help='The output format.')
+        @click.option('-c', '--columns', callback=parse_columns,
+                      help=('Comma separated columns to output in the jsonl,'
+                            ' csv and tsv formats. Defaults to: {}'.format(
+                                ','.join(DEFAULT_COLUMNS[model_name]))))
+        @click.option('--offset', type=click.IntRange(min=0), default=None,
+                      help='Only return a single page, from this offset.')
+        @click.option('--limit', type=click.IntRange(min=1), default=None,
+                      help='Only return a single page, of this many records.')
+        @click.option('--page-size', type=click.IntRange(min=1),
+                      default=None,
+                      help='The number of records to fetch per request.')
+        @functools.wraps(func)
+        def wrapper(*args, format_, columns, offset, limit, page_size,
+                    **kwargs):
+            # The text format shows whole objects, so columns would be
+            # silently ignored
+            if columns is not None and format_ == 'text':
+                raise click.BadParameter(
+                    'Columns can only be chosen for the jsonl, csv and tsv '
+                    'formats', param_hint='--columns')
+
+            kwargs['output'] = {
+                'format': format_,
+                'columns': columns or DEFAULT_COLUMNS[model_name],
+                'offset': offset,
+                'limit': limit,
+                'page_size': page_size,
+            }
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def concurrency_option(func):
+    """Add the `--concurrency` option to a command that looks up related
+    objects for each record it shows"""
+
+    return click.option(
+        '-j', '--concurrency', type=click.IntRange(1, 64), default=8,
+        help='The number of records to look up related objects for at once.'
+    )(func)
+
+
+def echo_related(records, relations, echo, concurrency):
+    """
+    Look up related objects for many records concurrently, and echo them in
+    their original order
+
+    :param records: The records to show
+    :param relations: A callable returning the related objects of a record
+    :param echo: A callable, taking a record and its related objects, that
+        echoes them
+    :param int concurrency: The number of records to look up at once
+    """
+
+    for record, related, exc in concurrent_map(relations, records,
+                                               workers=concurrency):
+        if exc:
+            raise exc
+        echo(record, related)
+
+
+def list_kwargs(output):
+    """
+    The keyword arguments to pass to a client `list_*` method
+
+    :param dict output: The `output` options given to the command
+    :returns: dict
+    """
+
+    return {
+        'offset': output['offset'],
+        'limit': output['limit'],
+        'page_size': output['page_size'],
+        'raw': output['format'] != 'text',
+    }
+
+
+def write_records(records, output, stream=None):
+    """
+    Stream raw records to the output in a machine readable format
+
+    Records are written as they arrive rather than being collected first,
+    and the output is only flushed once at the end, rather than per record.
+
+    :param records: The records to write
+    :type records: iterable of dict
+    :param dict output: The `output` options given to the command
+    :param stream: The text stream to write to. Defaults to stdout
+    :returns: int, the number of records written
+    """
+
+    if stream is None:
+        stream = click.get_text_stream('stdout')
+
+    columns = output['columns']
+    count = 0
+
+    if output['format'] == 'jsonl':
+        encoder = ExtendedEncoder(separators=(',', ':'))
+        for record in records:
+            stream.write(encoder.encode(
+                {column: record.get(column) for column in columns}))
+            stream.write('\n')
+            count += 1
+
+    else:
+        writer = csv.writer(
+            stream,
+            dialect='excel-tab' if output['format'] == 'tsv' else 'excel',
+            lineterminator='\n')
+        writer.writerow(columns)
+        for record in records:
+            writer.writerow([_cell(record.get(column)) for column in columns])
+            count += 1
+
+    stream.flush()
+    return count
+
+
+def _cell(value):
+    """Format a single value for csv and tsv output"""
+
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=ExtendedEncoder)
+
+    return value
+
+
+def read_records(stream, format_):
+    """
+    Stream records from machine readable input
+
+    :param stream: The text stream to read from
+    :param str format_: One of `jsonl`, `csv` or `tsv`
+    :yields: tuples of `(line_number, dict)`
+    :raises click.ClickException: if a line of jsonl input is invalid
+    """
+
+    if format_ == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                raise click.ClickException('Line {} is not valid JSON: {}'
+                                           .format(line_number, exc))
+            if not isinstance(record, dict):
+                raise click.ClickException('Line {} is not a JSON object'
+                                           .format(line_number))
+            yield line_number, record
+        return
+
+    reader = csv.DictReader(
+        stream,
+        dialect='excel-tab' if format_ == 'tsv' else 'excel')
+    for record in reader:
+        yield reader.line_num, {
+            key.strip(): value.strip() if isinstance(value, str) else value
+            for key, value in record.items() if key
+        }
@@ -0,0 +1,255 @@
+"""
+fl33t.cli.shell
+
+An interactive shell that runs fl33t commands with a single warm client
+"""
+
+import shlex
+import sys
+import time
+
+import click
+
+BUILTINS = {
+    'exit': 'Leave the shell',
+    'quit': 'Leave the shell',
+    'help': 'Show the available commands',
+    'clear-cache': 'Forget every cached fl33t object',
+}
+
+# Commands that make no sense to run from within the shell
+EXCLUDED = ['agent', 'shell']
+
+# The model whose IDs are offered when completing arguments for each group
+GROUP_MODELS = {
+    'builds': 'build',
+    'devices': 'device',
+    'fleets': 'fleet',
+    'sessions': 'session',
+    'trains': 'train',
+}
+
+
+class ShellCompleter:
+    """
+    Tab completion for the shell, of command names, options and the IDs of
+    objects in the client's cache
+
+    :param root: The click group whose commands are run in the shell
+    :param ctx: The click context of the shell command
+    :param get_client: A callable returning the shell's API client
+    """
+
+    def __init__(self, root, ctx, get_client):
+        self.root = root
+        self.ctx = ctx
+        self.get_client = get_client
+        self._matches = []
+
+    def _commands(self, group):
+        return [name for name in group.list_commands(self.ctx)
+                if name not in EXCLUDED]
+
+    def _cached_ids(self, model_name):
+        cache = self.get_client().cache
+        if cache is None:
+            return []
+
+        return sorted({key[1] for key in cache.keys()
+                       if isinstance(key, tuple) and key[0] == model_name})
+
+    def candidates(self, words, text):
+        """
+        The possible completions for the word being typed
+
+        :param list words: The words before the one being completed
+        :param str text: The partial word being completed
+        :returns: list of str
+        """
+
+        if not words:
+            return sorted(self._commands(self.root) + list(BUILTINS))
+
+        group = self.root.get_command(self.ctx, words[0])
+        if not isinstance(group, click.Group):
+            return []
+
+        if len(words) == 1:
+            return self._commands(group)
+
+        command = group.get_command(self.ctx, words[1])
+        if text.startswith('-') and command:
+            return sorted(option for param in command.params
+                          for option in param.opts + param.secondary_opts
+                          if option.startswith('--'))
+
+        model_name = GROUP_MODELS.get(words[0])
+        previous = words[-1]
+        for name in GROUP_MODELS.values():
+            if previous.startswith('-') and name in previous:
+                model_name = name
+
+        return self._cached_ids(model_name)
+
+    def complete(self, text, state):
+        """The readline completion function"""
+
+        if state == 0:
+            import readline  # pylint: disable=import-outside-toplevel
+
+            line = readline.get_line_buffer()[:readline.get_begidx()]
+            try:
+                words = shlex.split(line)
+            except ValueError:
+                words = []
+            self._matches = [candidate
+                             for candidate in self.candidates(words, text)
+                             if candidate.startswith(text)]
+
+        if state < len(self._matches):
+            return self._matches[state]
+        return None
+
+
+def _setup_readline(completer):
+    """Enable line editing and tab completion, where it is available"""
+
+    try:
+        import readline  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return
+
+    readline.set_completer(completer.complete)
+    readline.set_completer_delims(' \t\n')
+    readline.parse_and_bind('tab: complete')
+
+
+def _show_help(root, ctx):
+    """Print the commands that can be run in the shell"""
+
+    click.echo('Commands:')
+    for name in root.list_commands(ctx):
+        if name not in EXCLUDED:
+            click.echo('  {:<12}{}'.format(
+                name, root.get_command(ctx, name).get_short_help_str()))
+    for name, description in BUILTINS.items():
+        click.echo('  {:<12}{}'.format(name, description))
+    click.echo('\nRun "<command> --help" for help with a command.')
+
+
+def _run_builtin(root, ctx, name):
+    """
+    Run one of the shell's own commands
+
+    :returns: False if the shell should exit, True otherwise
+    """
+
+    if name in ('exit', 'quit'):
+        return False
+
+    if name == 'help':
+        _show_help(root, ctx)
+    elif name == 'clear-cache':
+        client = ctx.obj['get_fl33t_client']()
+        if client.cache is not None:
+            client.cache.clear()
+    return True
+
+
+def _run_command(command, words, obj):
+    """Run a fl33t command, showing any error it ends with and its time"""
+
+    started = time.monotonic()
+    try:
+        command.main(args=words[1:],
+                     prog_name=words[0],
+                     obj=obj,
+                     standalone_mode=False)
+    except click.exceptions.Abort:
+        click.echo('Aborted!', err=True)
+    except click.ClickException as exc:
+        exc.show()
+    except SystemExit:
+        pass
+    except Exception as exc:  # pylint: disable=broad-except
+        click.echo('ERROR: {}: {}'.format(exc.__class__.__name__, exc),
+                   err=True)
+
+    click.echo('({:.3f}s)'.format(time.monotonic() - started), err=True)
+
+
+def run_line(root, ctx, line):
+    """
+    Run a single line of input as a fl33t command
+
+    :param root: The click group to run commands from
+    :param ctx: The click context of the shell command
+    :param str line: The line of input
+    :returns: False if the shell should exit, True otherwise
+    """
+
+    try:
+        words = shlex.split(line)
+    except ValueError as exc:
+        click.echo('ERROR: {}'.format(exc), err=True)
+        return True
+
+    if not words:
+        return True
+
+    if words[0] in BUILTINS:
+        return _run_builtin(root, ctx, words[0])
+
+    command = root.get_command(ctx, words[0])
+    if command is None or words[0] in EXCLUDED:
+        click.echo('ERROR: No such command: {}'.format(words[0]), err=True)
+    else:
+        _run_command(command, words, ctx.obj)
+    return True
+
+
+@click.command()
+@click.option('--cache-ttl', type=click.FloatRange(min=0), default=30,
+              show_default=True,
+              help=('The number of seconds fl33t objects are cached for, so '
+                    'changes made elsewhere are seen.'))
+@click.pass_context
+def shell(ctx, cache_ttl):
+    """
+    Run fl33t commands interactively
+
+    Commands are entered without the leading `fl33t`, for example
+    `fleets list`. A single API client, with its open connections and cache
+    of fl33t objects, is used for every command, and the time each command
+    takes is shown after it. Cached objects expire after --cache-ttl
+    seconds, and "clear-cache" forgets them at once.
+    """
+
+    from fl33t.cli import cli  # pylint: disable=import-outside-toplevel
+
+    root = cli
+    client = ctx.obj['get_fl33t_client']()
+    # The client lives as long as the shell, so objects changed from
+    # elsewhere must not be trusted forever
+    client.enable_cache().ttl = cache_ttl
+
+    interactive = sys.stdin.isatty()
+    if interactive:
+        _setup_readline(ShellCompleter(root, ctx, lambda: client))
+        click.echo('fl33t shell for team {}. Type "help" for commands, and '
+                   '"exit" to leave.'.format(client.team_id))
+
+    while True:
+        try:
+            line = input('fl33t> ' if interactive else '')
+        except EOFError:
+            break
+        except KeyboardInterrupt:
+            click.echo()
+            continue
+
+        if not run_line(root, ctx, line):
+            break
+
+    if interactive:
+        click.echo()
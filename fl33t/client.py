@@ -4,36 +4,97 @@ fl33t Client
 
 The main client class that is used to interact with fl33t.
 """
+# pylint: disable=too-many-lines
 
+import collections
+import copy
+import functools
+import hashlib
 import json
 import logging
 import random
 import string
+import time
+
+from urllib.parse import urlsplit, urlunsplit
 
 import requests
 
 from fl33t.exceptions import (
+    BuildDownloadError,
+    BuildUploadError,
     InvalidBuildIdError,
     InvalidDeviceIdError,
     InvalidFleetIdError,
     InvalidSessionIdError,
-    InvalidTrainIdError,
-    UnprivilegedToken,
-    Fl33tApiException
+    InvalidTrainIdError
 )
 
-from fl33t.models.base import BaseModel
-from fl33t.models import (
-    Build,
-    Device,
-    Fleet,
-    Train,
-    Session
+from fl33t.build_index import BuildIndex
+from fl33t.cache import ModelCache
+from fl33t.protocol import (
+    build_request,
+    check_response,
+    parse_object,
+    parse_page
 )
+from fl33t.transfer import ThrottledReader, TokenBucket, throttled_reader
+from fl33t.transports import RequestsTransport, Transport, get_transport
+from fl33t.utils import backoff_delay
+from fl33t.models.build import Build
+from fl33t.models.device import Device
+from fl33t.models.fleet import Fleet
+from fl33t.models.session import Session
+from fl33t.models.train import Train
 
 API_HOST = 'https://api.fl33t.com'
 
-ENDPOINT_FAILED_MSG = 'The fl33t endpoint for {} returned an invalid response'
+TRANSFER_CHUNK_SIZE = 65536
+
+# Path segments followed by the ID of an object, which are replaced with a
+# placeholder in the URL templates reported by the `request` event
+ID_SEGMENTS = ['team', 'build', 'device', 'fleet', 'session', 'train']
+
+
+def url_template(url):
+    """
+    The path of an API URL, with the IDs in it replaced by placeholders
+
+    :param str url: The URL
+    :returns: str, e.g. `/team/{team_id}/fleet/{fleet_id}`
+    """
+
+    segments = urlsplit(url).path.split('/')
+    for index in range(1, len(segments)):
+        if segments[index - 1] in ID_SEGMENTS and segments[index]:
+            segments[index] = '{{{}_id}}'.format(segments[index - 1])
+
+    return '/'.join(segments)
+
+
+def cached_lookup(model_name):
+    """
+    Serve a `get_*` method from :py:attr:`Fl33tClient.cache`, when enabled
+
+    Each call gets its own copy of the cached object, so that changes made
+    to it are not seen by other lookups before they are saved to fl33t.
+
+    :param str model_name: The name of the model the method returns
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, object_id):
+            if self.cache is None:
+                return func(self, object_id)
+
+            return copy.copy(self.cache.get_or_fetch(
+                (model_name, object_id),
+                lambda: func(self, object_id)))
+
+        return wrapper
+
+    return decorator
 
 
 class Fl33tClient:  # pylint: disable=too-many-public-methods
@@ -45,14 +106,19 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
     REST API docs: https://www.fl33t.com/docs/rest
     """
 
-    # pylint: disable=too-many-arguments
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
     def __init__(self,
                  team_id,
                  session_token,
                  *,
                  base_uri=None,
                  generated_id_length=None,
-                 default_query_limit=None):
+                 default_query_limit=None,
+                 build_index_ttl=300,
+                 transfer_rate_limit=None,
+                 transfer_retries=0,
+                 pool_size=None,
+                 transport=None):
         """Establish basic service object."""
 
         self.team_id = team_id
@@ -78,6 +144,36 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         else:
             self.default_query_limit = 25
 
+        self.build_index_ttl = build_index_ttl
+        self._build_indexes = {}
+
+        # Shared by all transfers made through this client, so that the limit
+        # applies to their combined bandwidth
+        self.transfer_bucket = None
+        if transfer_rate_limit:
+            self.transfer_bucket = TokenBucket(transfer_rate_limit)
+        self.transfer_retries = max(0, int(transfer_retries or 0))
+
+        self._hooks = collections.defaultdict(list)
+
+        self.cache = None
+
+        # Connections are kept alive and reused by every request made through
+        # this client, including from multiple threads
+        if transport is None:
+            transport = RequestsTransport(pool_size=pool_size)
+        elif not isinstance(transport, Transport):
+            transport = get_transport(transport, pool_size=pool_size)
+        self.transport = transport
+
+        # Build files are streamed to and from pre-signed URLs with
+        # `requests`, whichever transport the API requests use
+        if isinstance(transport, RequestsTransport):
+            self.http = transport.session
+        else:
+            self.http = RequestsTransport(pool_size=pool_size).session
+        transport.attach(self)
+
         self.logger = logging.getLogger(__name__)
 
     def Build(self, **kwargs):  # pylint: disable=invalid-name
@@ -144,6 +240,110 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         """
         return '/'.join((self.base_uri, 'team/{}'.format(self.team_id)))
 
+    def add_hook(self, event, callback):
+        """
+        Register a callback for an instrumentation event
+
+        Callbacks are called as `callback(event, **payload)`. Any exception
+        raised by a callback is logged and otherwise ignored.
+
+        Events currently emitted:
+
+        - `request_start`: before every API request is sent, with `method`,
+          `url`, `template` (the URL's path with IDs replaced by
+          placeholders) and `sent` (bytes in the request body)
+        - `request`: after every API request that gets a response, with
+          `method`, `url`, `template`, `status_code`, `bytes` (of the
+          response body), `sent` and `duration`. API requests are not
+          retried, so unlike `transfer`, it has no `retries`
+        - `error`: after every API request that fails, with `method`, `url`,
+          `template`, `status_code` (None if there was no response),
+          `error` (the exception raised) and `duration`
+        - `page`: after every page of a listing is fetched, with `model`,
+          `template`, `offset`, `limit`, `records` (on the page), `total`
+          (as counted by fl33t, or None) and `duration`
+        - `model`: after every model is constructed, with `model` (its class
+          name) and `duration`
+        - `transfer`: after every build file upload or download, with
+          `direction`, `url`, `build_id`, `bytes`, `duration`, `throughput`
+          (bytes per second), `throttled` (seconds spent waiting on the
+          rate limit), `retries`, `status_code` and `success`
+        - `retry`: before a failed operation is tried again, with
+          `operation` (such as `upload`), `attempt` (the number of the
+          attempt about to be made), `error` (why the last one failed) and
+          operation specific details
+
+        :py:class:`fl33t.metrics.RequestMetrics` collects these into latency
+        histograms and counters.
+
+        :param str event: The name of the event
+        :param callable callback: The function to call
+        """
+
+        self._hooks[event].append(callback)
+
+    def remove_hook(self, event, callback):
+        """
+        Unregister a callback previously added with :py:meth:`add_hook`
+
+        :param str event: The name of the event
+        :param callable callback: The function to remove
+        """
+
+        if callback in self._hooks.get(event, ()):
+            self._hooks[event].remove(callback)
+
+    def _emit(self, event, **payload):
+        """Call every callback registered for an event"""
+
+        for callback in list(self._hooks.get(event, ())):
+            try:
+                callback(event, **payload)
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception('Hook for %s failed', event)
+
+    def _hooked(self, event):
+        """Whether anything is registered for an event, so that its payload
+        is only built when needed"""
+
+        return bool(self._hooks.get(event))
+
+    def enable_cache(self, ttl=None):
+        """
+        Cache objects retrieved by ID through this client, and the builds of
+        each train
+
+        Cached objects are shared by everything using this client, and are
+        dropped when they are updated or deleted through it. Changes made
+        elsewhere are only seen once an entry expires.
+
+        :param ttl: If provided, the number of seconds to cache entries for
+        :type ttl: int, float or None
+        :returns: :py:class:`fl33t.cache.ModelCache`
+        """
+
+        if self.cache is None:
+            self.cache = ModelCache(ttl=ttl)
+
+        return self.cache
+
+    def close(self):
+        """Close all connections held open by this client"""
+
+        self.transport.close()
+        self.http.close()
+
+    def disable_cache(self):
+        """Stop caching, and drop everything cached"""
+
+        self.cache = None
+
+    def _invalidate_cached(self, model_name, object_id):
+        """Drop a cached object, if caching is enabled"""
+
+        if self.cache is not None:
+            self.cache.invalidate((model_name, object_id))
+
     def _build_offset_limit(self, *, offset=None, limit=None):
         """
         Get the offset/limit query params allowing defaults
@@ -189,9 +389,14 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         """
         Send an authenticated GET request to fl33t
 
+        Since 0.7.0, this no longer accepts other `requests` keyword
+        arguments, and returns a :py:class:`fl33t.protocol.Response`
+        instead of a :py:class:`requests.Response`
+
         :param str url: The URL to request
-        :param kwargs: Any keyword args that :py:class:`requests.get` accepts
-        :returns: :py:class:`requests.Response`
+        :param kwargs: `params`, `data` and `headers`, as
+            :py:func:`fl33t.protocol.build_request` accepts
+        :returns: :py:class:`fl33t.protocol.Response`
         :raises UnprivilegedToken: if the session token does not have enough
             privilege to perform this action
         :raises Fl33tApiException: if there was a 5xx error returned by fl33t
@@ -202,9 +407,14 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         """
         Send an authenticated POST request to fl33t
 
+        Since 0.7.0, this no longer accepts other `requests` keyword
+        arguments, and returns a :py:class:`fl33t.protocol.Response`
+        instead of a :py:class:`requests.Response`
+
         :param str url: The URL to request
-        :param kwargs: Any keyword args that :py:class:`requests.post` accepts
-        :returns: :py:class:`requests.Response`
+        :param kwargs: `params`, `data` and `headers`, as
+            :py:func:`fl33t.protocol.build_request` accepts
+        :returns: :py:class:`fl33t.protocol.Response`
         :raises UnprivilegedToken: if the session token does not have enough
             privilege to perform this action
         :raises Fl33tApiException: if there was a 5xx error returned by fl33t
@@ -215,9 +425,14 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         """
         Send an authenticated PUT request to fl33t
 
+        Since 0.7.0, this no longer accepts other `requests` keyword
+        arguments, and returns a :py:class:`fl33t.protocol.Response`
+        instead of a :py:class:`requests.Response`
+
         :param str url: The URL to request
-        :param kwargs: Any keyword args that :py:class:`requests.put` accepts
-        :returns: :py:class:`requests.Response`
+        :param kwargs: `params`, `data` and `headers`, as
+            :py:func:`fl33t.protocol.build_request` accepts
+        :returns: :py:class:`fl33t.protocol.Response`
         :raises UnprivilegedToken: if the session token does not have enough
             privilege to perform this action
         :raises Fl33tApiException: if there was a 5xx error returned by fl33t
@@ -228,83 +443,339 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         """
         Send an authenticated DELETE request to fl33t
 
+        Since 0.7.0, this no longer accepts other `requests` keyword
+        arguments, and returns a :py:class:`fl33t.protocol.Response`
+        instead of a :py:class:`requests.Response`
+
         :param str url: The URL to request
-        :param kwargs: Any keyword args that :py:class:`requests.delete`
-            accepts
-        :returns: :py:class:`requests.Response`
+        :param kwargs: `params`, `data` and `headers`, as
+            :py:func:`fl33t.protocol.build_request` accepts
+        :returns: :py:class:`fl33t.protocol.Response`
         :raises UnprivilegedToken: if the session token does not have enough
             privilege to perform this action
         :raises Fl33tApiException: if there was a 5xx error returned by fl33t
         """
         return self._request('DELETE', url, **kwargs)
 
-    def _request(self, method, url, **kwargs):
+    def _request(self, method, url, *, params=None, data=None,
+                 headers=None):
         """
-        Wrapper for `requests` methods to include the bearer token
-        If you need to make a call without the bearer token, make it
-        directly against `requests`
+        Send a request to fl33t, authenticated with the session token,
+        through :py:attr:`transport`
+
+        If you need to make a call without the bearer token, send it
+        directly through the transport
 
         :param str method: The request method to use
         :param str url: The URL to request
-        :param kwargs: Any keyword args that :py:module:`requests` methods
-            accept
-        :returns: :py:class:`requests.Response`
+        :param params: If provided, the query parameters
+        :type params: dict or None
+        :param data: If provided, the body, as a model or encoded
+        :param headers: If provided, headers to send
+        :type headers: dict or None
+        :returns: :py:class:`fl33t.protocol.Response`
         :raises UnprivilegedToken: if the session token does not have enough
             privilege to perform this action
         :raises Fl33tApiException: if there was a 5xx error returned by fl33t
         """
 
-        headers = kwargs.get('headers') if kwargs.get('headers') else {}
-        if 'Authorization' not in headers:
-            headers['Authorization'] = 'Bearer {}'.format(self.token)
-        if 'Content-Type' not in headers:
-            headers['Content-Type'] = 'application/json'
-        if 'Accept' not in headers:
-            headers['Accept'] = 'application/json'
-        kwargs['headers'] = headers
+        request = build_request(method, url, self.token, params=params,
+                                data=data, headers=headers)
 
-        data = kwargs.pop('data', None)
-        if data and isinstance(data, BaseModel):
-            data = data.to_json()
+        self.logger.debug('Sending %s request with params: %s', method,
+                          params)
+        self.logger.debug('Sending %s request with payload: %s', method,
+                          request.body)
+        started = self._request_started(request)
+        try:
+            response = self.transport.send(request)
+        except Exception as exc:
+            self._request_failed(request, None, exc, started)
+            raise
 
-        params = kwargs.pop('params', None)
+        return self._request_finished(request, response, started)
 
-        self.logger.debug('Sending {} request with params: {}'.format(
-            method, params))
-        self.logger.debug('Sending {} request with payload: {}'.format(
-            method, data))
-        method = getattr(requests, method.lower())
+    async def request_async(self, method, url, *, params=None, data=None,
+                            headers=None):
+        """
+        Send a request to fl33t, authenticated with the session token,
+        without blocking the event loop
+
+        :param str method: The request method to use
+        :param str url: The URL to request
+        :param params: If provided, the query parameters
+        :type params: dict or None
+        :param data: If provided, the body, as a model or encoded
+        :param headers: If provided, headers to send
+        :type headers: dict or None
+        :returns: :py:class:`fl33t.protocol.Response`
+        :raises UnprivilegedToken: if the session token does not have enough
+            privilege to perform this action
+        :raises Fl33tApiException: if there was a 5xx error returned by fl33t
+        """
+
+        request = build_request(method, url, self.token, params=params,
+                                data=data, headers=headers)
+
+        started = self._request_started(request)
+        try:
+            response = await self.transport.send_async(request)
+        except Exception as exc:
+            self._request_failed(request, None, exc, started)
+            raise
+
+        return self._request_finished(request, response, started)
+
+    def _request_started(self, request):
+        """Emit the `request_start` event, returning when the request was
+        sent"""
+
+        if self._hooked('request_start'):
+            self._emit('request_start',
+                       method=request.method,
+                       url=request.url,
+                       template=url_template(request.url),
+                       sent=len(request.body or b''))
+
+        return time.monotonic()
+
+    def _request_finished(self, request, response, started):
+        """Emit the `request` event for an API request that got a
+        response, and check the response"""
+
+        if self._hooked('request'):
+            self._emit(
+                'request',
+                method=request.method,
+                url=request.url,
+                template=url_template(request.url),
+                status_code=response.status_code,
+                bytes=len(response.content),
+                sent=len(request.body or b''),
+                duration=time.monotonic() - started)
 
         try:
-            result = method(url, params=params, data=data, **kwargs)
-            result.raise_for_status()
+            return check_response(request, response)
+        except Exception as exc:
+            self._request_failed(request, response.status_code, exc, started)
+            raise
+
+    def _request_failed(self, request, status_code, exc, started):
+        """Emit the `error` event for a failed API request"""
+
+        if self._hooked('error'):
+            self._emit('error',
+                       method=request.method,
+                       url=request.url,
+                       template=url_template(request.url),
+                       status_code=status_code,
+                       error=exc,
+                       duration=time.monotonic() - started)
+
+    def _transfer_finished(self, direction, url, build_id, reader, started,
+                           retries, status_code, success):
+        """Emit the `transfer` event for a finished upload or download"""
+
+        duration = time.monotonic() - started
+        scheme, netloc, path, _, _ = urlsplit(url)
+        self._emit(
+            'transfer',
+            direction=direction,
+            # Pre-signed URLs carry their credentials in the query string
+            url=urlunsplit((scheme, netloc, path, '', '')),
+            build_id=build_id,
+            bytes=reader.bytes_read if reader is not None else 0,
+            duration=duration,
+            throughput=(reader.bytes_read / duration
+                        if reader is not None and duration > 0 else 0.0),
+            throttled=reader.throttled if reader is not None else 0.0,
+            retries=retries,
+            status_code=status_code,
+            success=success
+        )
+
+    @staticmethod
+    def _transfer_delay(attempt):
+        """The number of seconds to wait before retrying a transfer"""
+
+        return backoff_delay(attempt)
+
+    def _transfer_backoff(self, attempt):
+        """Wait before retrying a failed transfer"""
+
+        time.sleep(self._transfer_delay(attempt))
 
-        except requests.exceptions.HTTPError as exc:
-            if not isinstance(result, requests.Response):
-                # The request failed in a way that we don't handle, give the
-                # user the raised exception directly.
-                raise
+    # pylint: disable=too-many-arguments
+    def _transfer_retry(self, direction, url, build_id, attempt, error):
+        """Emit the `retry` event, and wait before retrying a transfer"""
+
+        if self._hooked('retry'):
+            scheme, netloc, path, _, _ = urlsplit(url)
+            self._emit('retry',
+                       operation=direction,
+                       url=urlunsplit((scheme, netloc, path, '', '')),
+                       build_id=build_id,
+                       attempt=attempt,
+                       delay=self._transfer_delay(attempt),
+                       error=error)
+        self._transfer_backoff(attempt)
 
-            if result.status_code in (401, 403):
-                raise UnprivilegedToken(url)
+    # pylint: disable=too-many-arguments
+    def upload(self, url, open_body, *, size=None, headers=None,
+               build_id=None, retryable=True):
+        """
+        Upload a build file to a pre-signed URL provided by fl33t
+
+        No fl33t API headers are added, as the pre-signed URL has all
+        authentication built-in. The upload is sent with `requests`, through
+        :py:attr:`http`, whichever :py:attr:`transport` API requests use. It
+        is limited by
+        :py:attr:`transfer_bucket`, and retried up to
+        :py:attr:`transfer_retries` times on connection errors and 5xx
+        responses.
+
+        :param str url: The pre-signed upload URL
+        :param open_body: A callable returning a context manager that yields
+            the file-like object to upload, from the start, on each attempt
+        :param size: The number of bytes that will be uploaded. If not
+            provided, the file is uploaded in chunks
+        :type size: int or None
+        :param headers: Any headers to send with the upload
+        :type headers: dict or None
+        :param build_id: The build being uploaded, for instrumentation
+        :type build_id: str or None
+        :param bool retryable: False if the body can only be read once
+        :returns: :py:class:`requests.Response`
+        :raises BuildUploadError: if the upload failed
+        """
 
-            if result.status_code >= 500:
-                # Raise that something went wrong with the fl33t API request
-                message = '{} returned a {} error: {}'.format(
-                    url,
-                    result.status_code,
-                    result.text)
-                raise Fl33tApiException(message)
+        retries = self.transfer_retries if retryable else 0
+        started = time.monotonic()
+        attempt = 0
 
-            if result.status_code not in (400, 404, 409):
-                # Log the exception if the request failed with a status code
-                # that we don't handle gracefully. 400/404 (InvalidIdError) and
-                # 409 (DuplicateIdError) are meant to be handled by the caller.
-                self.logger.exception(exc)
+        while True:
+            reader = None
+            try:
+                with open_body() as body:
+                    reader = throttled_reader(body,
+                                              size,
+                                              self.transfer_bucket,
+                                              chunk_size=TRANSFER_CHUNK_SIZE)
+                    response = self.http.put(url,
+                                             data=reader,
+                                             headers=headers)
+
+            except requests.exceptions.RequestException as exc:
+                if attempt >= retries:
+                    self._transfer_finished('upload', url, build_id, reader,
+                                            started, attempt, None, False)
+                    raise BuildUploadError(str(exc)) from exc
+                error = exc
 
-        return result
+            else:
+                if response.status_code < 500 or attempt >= retries:
+                    break
+                error = '{} error'.format(response.status_code)
+
+            attempt += 1
+            self._transfer_retry('upload', url, build_id, attempt, error)
+
+        # Any non-200 status is an error with the upload.
+        self._transfer_finished('upload', url, build_id, reader, started,
+                                attempt, response.status_code,
+                                response.status_code == 200)
+        if response.status_code != 200:
+            raise BuildUploadError('{} returned a {} error'.format(
+                urlsplit(url).netloc, response.status_code))
 
-    def list_sessions(self, *, offset=None, limit=None):
+        return response
+
+    def download(self, url, open_destination, *, md5sum=None, build_id=None):
+        """
+        Download a build file from a URL provided by fl33t
+
+        The download is streamed with `requests`, through :py:attr:`http`,
+        whichever :py:attr:`transport` API requests use. It is limited by
+        :py:attr:`transfer_bucket`, and retried up to
+        :py:attr:`transfer_retries` times on connection errors and 5xx
+        responses.
+
+        :param str url: The download URL
+        :param open_destination: A callable returning a context manager that
+            yields an empty, writable file-like object on each attempt
+        :param md5sum: If provided, the expected MD5 hash of the download
+        :type md5sum: str or None
+        :param build_id: The build being downloaded, for instrumentation
+        :type build_id: str or None
+        :returns: int, the number of bytes downloaded
+        :raises BuildDownloadError: if the download failed or did not match
+            the expected hash
+        """
+
+        started = time.monotonic()
+        attempt = 0
+
+        while True:
+            reader = None
+            md5hash = None
+            status_code = None
+            try:
+                with self.http.get(url, stream=True) as response:
+                    status_code = response.status_code
+                    if response.status_code == 200:
+                        reader = ThrottledReader(
+                            response.raw,
+                            bucket=self.transfer_bucket,
+                            chunk_size=TRANSFER_CHUNK_SIZE)
+                        md5hash = self._write_download(response, reader,
+                                                       open_destination)
+
+            except requests.exceptions.RequestException as exc:
+                if attempt >= self.transfer_retries:
+                    self._transfer_finished('download', url, build_id,
+                                            reader, started, attempt,
+                                            status_code, False)
+                    raise BuildDownloadError(str(exc)) from exc
+                error = exc
+
+            else:
+                if status_code < 500 or attempt >= self.transfer_retries:
+                    break
+                error = '{} error'.format(status_code)
+
+            attempt += 1
+            self._transfer_retry('download', url, build_id, attempt, error)
+
+        success = status_code == 200 and (
+            not md5sum or md5hash.hexdigest() == md5sum)
+        self._transfer_finished('download', url, build_id, reader, started,
+                                attempt, status_code, success)
+
+        if status_code != 200:
+            raise BuildDownloadError('{} returned a {} error'.format(
+                urlsplit(url).netloc, status_code))
+        if not success:
+            raise BuildDownloadError(
+                'The downloaded build does not match its MD5 hash')
+
+        return reader.bytes_read
+
+    @staticmethod
+    def _write_download(response, reader, open_destination):
+        """Write a download's body, read through `reader`, to a new
+        destination, returning its MD5 hash"""
+
+        md5hash = hashlib.md5()
+        response.raw.decode_content = True
+        with open_destination() as destination:
+            for chunk in reader:
+                md5hash.update(chunk)
+                destination.write(chunk)
+
+        return md5hash
+
+    def list_sessions(self, *, offset=None, limit=None, page_size=None,
+                      raw=False):
         """
         List API Sessions
 
@@ -316,6 +787,12 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         :param limit: If provided, the number of records to return.
             Defaults to :py:attr:`default_query_limit`
         :type limit: int or None
+        :param page_size: If provided, the number of records to request per
+            page when paginating through all records. Defaults to
+            :py:attr:`default_query_limit`
+        :type page_size: int or None
+        :param bool raw: If True, yield the records as returned by fl33t, as
+            `dict`, instead of constructing models from them
         :yields: generator of `fl33t.models.Session`
         :raises UnprivilegedToken: if the session token does not have enough
             privilege to perform this action
@@ -331,7 +808,9 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
             params,
             'session',
             Session,
-            'listing sessions'
+            'listing sessions',
+            page_size=page_size,
+            raw=raw
         )
 
     def get_own_session(self):
@@ -347,6 +826,7 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
 
         return self.get_session(self.token)
 
+    @cached_lookup('session')
     def get_session(self, session_token):
         """
         Return information about a specific session_token
@@ -363,17 +843,11 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         url = "/".join((self.base_team_url, 'session/{}'.format(
             session_token)))
 
-        result = self.get(url)
-        if result.status_code in (400, 404):
-            raise InvalidSessionIdError()
-
-        if 'session' in result.json():
-            session = result.json()['session']
-            return Session(client=self, **session)
-
-        raise Fl33tApiException(ENDPOINT_FAILED_MSG.format(
-            'session retrieval'))
+        session = parse_object(self.get(url), 'session',
+                               invalid=InvalidSessionIdError())
+        return Session(client=self, **session)
 
+    @cached_lookup('fleet')
     def get_fleet(self, fleet_id):
         """
         Return information about a specific fleet
@@ -388,18 +862,11 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
 
         url = "/".join((self.base_team_url, 'fleet/{}'.format(fleet_id)))
 
-        result = self.get(url)
-
-        if result.status_code in (400, 404):
-            raise InvalidFleetIdError(fleet_id)
-
-        if 'fleet' in result.json():
-            fleet = result.json()['fleet']
-            return Fleet(client=self, **fleet)
-
-        raise Fl33tApiException(ENDPOINT_FAILED_MSG.format(
-            'fleet retrieval'))
+        fleet = parse_object(self.get(url), 'fleet',
+                             invalid=InvalidFleetIdError(fleet_id))
+        return Fleet(client=self, **fleet)
 
+    @cached_lookup('build')
     def get_build(self, build_id):
         """
         Return information about a specific build
@@ -415,18 +882,121 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         url = "/".join((self.base_team_url, 'build/{}'.format(
             build_id)))
 
-        result = self.get(url)
+        build = parse_object(self.get(url), 'build',
+                             invalid=InvalidBuildIdError(build_id))
+        return Build(client=self, **build)
+
+    def get_build_index(self, train_id, *, refresh=False):
+        """
+        Return the index of builds, by MD5 hash, for a train
+
+        The index is cached on this client for :py:attr:`build_index_ttl`
+        seconds, and is kept up to date by builds created or deleted through
+        this client.
+
+        :param str train_id: The train ID to index the builds of
+        :param bool refresh: If True, rebuild the index even if a cached copy
+            is still valid
+        :returns: :py:class:`fl33t.build_index.BuildIndex`
+        :raises UnprivilegedToken: if the session token does not have enough
+            privilege to perform this action
+        :raises Fl33tApiException: if there was a 5xx error returned by fl33t
+        """
+
+        index = self._build_indexes.get(train_id)
+        if refresh or not index or index.expired:
+            index = BuildIndex.from_client(self,
+                                           train_id,
+                                           ttl=self.build_index_ttl)
+            self._build_indexes[train_id] = index
+
+        return index
+
+    def invalidate_build_index(self, train_id=None):
+        """
+        Drop cached build indexes, forcing them to be rebuilt on next use
+
+        :param train_id: If provided, only drop the index for this train
+        :type train_id: str or None
+        """
+
+        if train_id is None:
+            self._build_indexes.clear()
+        else:
+            self._build_indexes.pop(train_id, None)
+            self._invalidate_cached('builds', train_id)
+
+    def add_to_build_index(self, build):
+        """
+        Record a build created through this client in the cached index of its
+        train, if there is one, rather than listing the train again
+
+        :param build: The build that was created
+        :type build: :py:class:`fl33t.models.Build`
+        """
+
+        index = self._build_indexes.get(build.train_id)
+        if index is not None:
+            index.add(build)
+        self._invalidate_cached('builds', build.train_id)
+
+    def remove_from_build_index(self, build):
+        """
+        Remove a build deleted through this client from the cached index of
+        its train, if there is one
+
+        :param build: The build that was deleted
+        :type build: :py:class:`fl33t.models.Build`
+        """
+
+        index = self._build_indexes.get(build.train_id)
+        if index is not None:
+            index.remove(build.build_id)
+        self._invalidate_cached('builds', build.train_id)
+
+    def find_duplicate_build(self, train_id, md5sum):
+        """
+        Find an already uploaded build in a train with the same file hash
+
+        A cached match is confirmed against fl33t before being returned, so
+        a build deleted outside of this client is never reported.
+
+        :param str train_id: The train ID to search
+        :param str md5sum: The MD5 hash of the build file
+        :returns: :py:class:`fl33t.models.Build` or None
+        :raises UnprivilegedToken: if the session token does not have enough
+            privilege to perform this action
+        :raises Fl33tApiException: if there was a 5xx error returned by fl33t
+        """
+
+        if not train_id or not md5sum:
+            return None
+
+        index = self.get_build_index(train_id)
+        build = index.get(md5sum, pending=True)
+        if not build:
+            return None
 
-        if result.status_code in (400, 404):
-            raise InvalidBuildIdError(build_id)
+        self._invalidate_cached('build', build.build_id)
+        try:
+            build = self.get_build(build.build_id)
+        except InvalidBuildIdError:
+            self.invalidate_build_index(train_id)
+            return self.get_build_index(train_id).get(md5sum)
+
+        if build.md5sum != md5sum:
+            self.invalidate_build_index(train_id)
+            return None
 
-        if 'build' in result.json():
-            build = result.json()['build']
-            return Build(client=self, **build)
+        # Builds uploaded through this client are indexed before fl33t has
+        # made them available, so they are kept until it has
+        index.add(build)
+        if build.status != 'available':
+            return None
 
-        raise Fl33tApiException(ENDPOINT_FAILED_MSG.format(
-            'build retrieval'))
+        return build
 
+    @cached_lookup('train')
     def get_train(self, train_id):
         """
         Return information about a specific train
@@ -442,18 +1012,11 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         url = "/".join((self.base_team_url, 'train/{}'.format(
             train_id)))
 
-        result = self.get(url)
-
-        if result.status_code in (400, 404):
-            raise InvalidTrainIdError(train_id)
-
-        if 'train' in result.json():
-            train = result.json()['train']
-            return Train(client=self, **train)
-
-        raise Fl33tApiException(ENDPOINT_FAILED_MSG.format(
-            'train retrieval'))
+        train = parse_object(self.get(url), 'train',
+                             invalid=InvalidTrainIdError(train_id))
+        return Train(client=self, **train)
 
+    @cached_lookup('device')
     def get_device(self, device_id):
         """
         Get a device by ID from fl33t.
@@ -469,17 +1032,9 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         url = "/".join((self.base_team_url, 'device/{}'.format(
             device_id)))
 
-        result = self.get(url)
-
-        if result.status_code in (400, 404):
-            raise InvalidDeviceIdError(device_id)
-
-        if 'device' in result.json():
-            device = result.json()['device']
-            return Device(client=self, **device)
-
-        raise Fl33tApiException(ENDPOINT_FAILED_MSG.format(
-            'device retrieval'))
+        device = parse_object(self.get(url), 'device',
+                              invalid=InvalidDeviceIdError(device_id))
+        return Device(client=self, **device)
 
     def device_checkin(self, device_id, *, currently_installed_id=None):
         """
@@ -512,14 +1067,16 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         if result.status_code == 204:
             return False
 
-        if 'build' in result.json():
-            build = result.json()['build']
-            return self.Build(**build)
-
-        raise Fl33tApiException(ENDPOINT_FAILED_MSG.format(
-            'device firmware check'))
+        return self.Build(**parse_object(result, 'build',
+                                         what='device firmware check'))
 
-    def list_fleets(self, *, train_id=None, offset=None, limit=None):
+    def list_fleets(self,
+                    *,
+                    train_id=None,
+                    offset=None,
+                    limit=None,
+                    page_size=None,
+                    raw=False):
         """
         Get all fleets from fl33t.
 
@@ -534,6 +1091,12 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         :param limit: If provided, the number of records to return.
             Defaults to :py:attr:`default_query_limit`
         :type limit: int or None
+        :param page_size: If provided, the number of records to request per
+            page when paginating through all records. Defaults to
+            :py:attr:`default_query_limit`
+        :type page_size: int or None
+        :param bool raw: If True, yield the records as returned by fl33t, as
+            `dict`, instead of constructing models from them
         :yields: generator of :py:class:`fl33t.models.Fleet`
         :raises UnprivilegedToken: if the session token does not have enough
             privilege to perform this action
@@ -553,10 +1116,13 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
             params,
             'fleet',
             Fleet,
-            'listing fleets'
+            'listing fleets',
+            page_size=page_size,
+            raw=raw
         )
 
-    def list_trains(self, *, offset=None, limit=None):
+    def list_trains(self, *, offset=None, limit=None, page_size=None,
+                    raw=False):
         """
         Get all trains from fl33t.
 
@@ -568,6 +1134,12 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         :param limit: If provided, the number of records to return.
             Defaults to :py:attr:`default_query_limit`
         :type limit: int or None
+        :param page_size: If provided, the number of records to request per
+            page when paginating through all records. Defaults to
+            :py:attr:`default_query_limit`
+        :type page_size: int or None
+        :param bool raw: If True, yield the records as returned by fl33t, as
+            `dict`, instead of constructing models from them
         :yields: generator of :py:class:`fl33t.models.Train`
         :raises UnprivilegedToken: if the session token does not have enough
             privilege to perform this action
@@ -584,10 +1156,18 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
             params,
             'train',
             Train,
-            'listing trains'
+            'listing trains',
+            page_size=page_size,
+            raw=raw
         )
 
-    def list_devices(self, *, fleet_id=None, offset=None, limit=None):
+    def list_devices(self,
+                     *,
+                     fleet_id=None,
+                     offset=None,
+                     limit=None,
+                     page_size=None,
+                     raw=False):
         """
         Get all devices from fl33t.
 
@@ -602,6 +1182,12 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         :param limit: If provided, the number of records to return.
             Defaults to :py:attr:`default_query_limit`
         :type limit: int or None
+        :param page_size: If provided, the number of records to request per
+            page when paginating through all records. Defaults to
+            :py:attr:`default_query_limit`
+        :type page_size: int or None
+        :param bool raw: If True, yield the records as returned by fl33t, as
+            `dict`, instead of constructing models from them
         :yields: generator of :py:class:`fl33t.models.Device`
         :raises UnprivilegedToken: if the session token does not have enough
             privilege to perform this action
@@ -620,7 +1206,9 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
             params,
             'device',
             Device,
-            'listing devices'
+            'listing devices',
+            page_size=page_size,
+            raw=raw
         )
 
     def list_builds(self,
@@ -628,7 +1216,9 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
                     train_id=None,
                     version=None,
                     offset=None,
-                    limit=None):
+                    limit=None,
+                    page_size=None,
+                    raw=False):
         """
         Get all builds from fl33t by train id.
 
@@ -641,6 +1231,12 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         :param limit: If provided, the number of records to return.
             Defaults to :py:attr:`default_query_limit`
         :type limit: int or None
+        :param page_size: If provided, the number of records to request per
+            page when paginating through all records. Defaults to
+            :py:attr:`default_query_limit`
+        :type page_size: int or None
+        :param bool raw: If True, yield the records as returned by fl33t, as
+            `dict`, instead of constructing models from them
         :yields: generator of :py:class:`fl33t.models.Build`
         :raises UnprivilegedToken: if the session token does not have enough
             privilege to perform this action
@@ -661,9 +1257,105 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
             params,
             'build',
             Build,
-            'listing builds for train {}'.format(train_id)
+            'listing builds for train {}'.format(train_id),
+            page_size=page_size,
+            raw=raw
         )
 
+    # pylint: disable=too-many-arguments
+    def watch(self, collection, *, fields=None, kinds=None, interval=30,
+              min_interval=5, max_interval=300, **scope):
+        """
+        Poll a collection for changes, yielding each one as it is found
+
+        This never returns on its own: break out of the loop to stop
+        watching. See :py:class:`fl33t.watch.Watcher` for how often fl33t is
+        polled, and to share polling between several subscribers.
+
+        :param str collection: One of `builds`, `devices`, `fleets`,
+            `sessions` or `trains`
+        :param fields: If provided, only report changes to these fields, and
+            records being added or removed
+        :type fields: list of str or None
+        :param kinds: If provided, only report these kinds of change, from
+            `added`, `removed` and `changed`
+        :type kinds: list of str or None
+        :param interval: The initial number of seconds between listings
+        :param min_interval: The number of seconds between count checks
+        :param max_interval: The longest interval between listings
+        :param scope: Filters for the collection's `list_*` method, such as
+            `fleet_id` for devices
+        :yields: :py:class:`fl33t.snapshot.Change`
+        """
+
+        # pylint: disable=import-outside-toplevel
+        from fl33t.watch import Watcher
+
+        watcher = Watcher(self, interval=interval, min_interval=min_interval,
+                          max_interval=max_interval)
+        changes = collections.deque()
+        watcher.subscribe(collection, changes.append, fields=fields,
+                          kinds=kinds, **scope)
+
+        while True:
+            watcher.poll()
+            while changes:
+                yield changes.popleft()
+            time.sleep(watcher.next_poll())
+
+    # pylint: disable=too-many-arguments
+    async def watch_async(self, collection, *, fields=None, kinds=None,
+                          interval=30, min_interval=5, max_interval=300,
+                          **scope):
+        """
+        Poll a collection for changes, without blocking the event loop
+
+        Takes the same arguments as :py:meth:`watch`, and is used with
+        `async for`. Requests are made in the event loop's default executor.
+
+        :yields: :py:class:`fl33t.snapshot.Change`
+        """
+
+        # pylint: disable=import-outside-toplevel
+        import asyncio
+        from fl33t.watch import Watcher
+
+        watcher = Watcher(self, interval=interval, min_interval=min_interval,
+                          max_interval=max_interval)
+        changes = collections.deque()
+        watcher.subscribe(collection, changes.append, fields=fields,
+                          kinds=kinds, **scope)
+
+        loop = asyncio.get_event_loop()
+        while True:
+            await loop.run_in_executor(None, watcher.poll)
+            while changes:
+                yield changes.popleft()
+            await asyncio.sleep(watcher.next_poll())
+
+    def count(self, collection, **filters):
+        """
+        Get the number of records in a collection, without listing them
+
+        :param str collection: One of `builds`, `devices`, `fleets`,
+            `sessions` or `trains`
+        :param filters: Any filters the collection's `list_*` method accepts,
+            such as `fleet_id` for `devices`
+        :returns: int
+        :raises UnprivilegedToken: if the session token does not have enough
+            privilege to perform this action
+        :raises Fl33tApiException: if there was a 5xx error returned by fl33t
+        """
+
+        model_name = collection.rstrip('s')
+        params = {key: value for key, value in filters.items() if value}
+        params.update(self._build_offset_limit(offset=0, limit=1))
+
+        result = self.get('/'.join((self.base_team_url, collection)),
+                          params=params)
+        return parse_object(result, '{}_count'.format(model_name),
+                            what='counting {}'.format(collection))
+
     # pylint: disable=too-many-locals
     def _paginator(self,
                    offset,
@@ -672,7 +1364,10 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
                    params,
                    model_name,
                    model,
-                   error_msg):
+                   error_msg,
+                   *,
+                   page_size=None,
+                   raw=False):
 
         """
         Paginate through a specific listing endpoint.
@@ -694,7 +1389,13 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
         :type model: Any subclass of :py:class:`fl33t.models.Base`
         :param str error_msg: The error message to return in the case of an
             API communication exception
-        :yields: generator of the provided `model` type
+        :param page_size: If provided, the number of records to request per
+            page when paginating through all records. Defaults to
+            :py:attr:`default_query_limit`
+        :type page_size: int or None
+        :param bool raw: If True, yield each record's `dict` as returned by
+            fl33t instead of constructing a `model` from it
+        :yields: generator of the provided `model` type, or `dict`
         :raises UnprivilegedToken: if the session token does not have enough
             privilege to perform this action
         :raises Fl33tApiException: if there was a 5xx error returned by fl33t
@@ -702,22 +1403,31 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
 
         total_count = None
 
-        plural_model = '{}s'.format(model_name)
-        params.update(self._build_offset_limit(offset=offset, limit=limit))
+        params.update(self._build_offset_limit(offset=offset,
+                                               limit=limit or page_size))
 
         single_page_only = not (offset is None and limit is None)
 
         while True:
-            result = self.get(url, params=params)
-            data = result.json()
-            if plural_model not in data:
-                raise Fl33tApiException(ENDPOINT_FAILED_MSG.format(error_msg))
-
-            record_count = 0
-
-            for item in data[plural_model]:
-                record_count += 1
-                yield model(client=self, **item)
+            started = time.monotonic()
+            records, count = parse_page(self.get(url, params=params),
+                                        model_name, error_msg)
+            record_count = len(records)
+            if self._hooked('page'):
+                self._emit('page',
+                           model=model_name,
+                           template=url_template(url),
+                           offset=params['offset'],
+                           limit=params['limit'],
+                           records=record_count,
+                           total=count,
+                           duration=time.monotonic() - started)
+
+            if raw:
+                yield from records
+            else:
+                for item in records:
+                    yield model(client=self, **item)
 
             if single_page_only:
                 break
@@ -725,10 +1435,7 @@ class Fl33tClient:  # pylint: disable=too-many-public-methods
             total_returned = params['offset'] + record_count
 
             if total_count is None:
-                if '{}_count'.format(model_name) in data:
-                    total_count = data['{}_count'.format(model_name)]
-                else:
-                    total_count = 0
+                total_count = count or 0
 
             if total_count > total_returned:
                 params['offset'] = params['offset'] + params['limit']
@@ -0,0 +1,150 @@
+"""
+Convergence
+
+Tracks how quickly the devices in a fleet move over to its build, sampling
+the fleet repeatedly and keeping streaming statistics in bounded memory
+"""
+
+import collections
+import logging
+import threading
+import time
+
+from fl33t.utils import concurrent_pages
+
+Sample = collections.namedtuple(
+    'Sample', ['time', 'total', 'converged', 'builds', 'fraction', 'rate',
+               'eta'])
+Sample.__doc__ = """
+A single sample of a fleet
+
+`time` is when it was taken, in seconds since the epoch. `total` is the
+number of devices in the fleet, `converged` the number on the target build,
+and `builds` maps each build ID to its number of devices. `rate` is the
+estimated number of devices converging per second, and `eta` the estimated
+number of seconds until every device has, or None if that cannot be
+estimated.
+"""
+
+
+class ConvergenceTracker:
+    """
+    Samples the devices of a fleet, to follow them converging on a build
+
+    Each :py:meth:`sample` requests every page of the fleet's devices
+    concurrently, `workers` at a time, and only counts them, so memory use
+    does not grow with the size of the fleet. The convergence rate is an
+    exponentially weighted moving average of the rate between samples, and
+    only the last `window` samples are kept.
+
+    :param client: The client to sample the fleet with
+    :type client: :py:class:`fl33t.Fl33tClient`
+    :param str fleet_id: The fleet to track
+    :param build_id: The build devices converge on. Defaults to the fleet's
+        build when the first sample is taken
+    :type build_id: str or None
+    :param int window: The number of samples kept in :py:attr:`history`
+    :param float smoothing: The weight given to the latest rate, between 0
+        and 1
+    :param int workers: The number of pages to request at once
+    :param page_size: If provided, the number of records to request per page
+    :type page_size: int or None
+    :raises ValueError: if `smoothing` is not between 0 and 1
+    """
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    def __init__(self, client, fleet_id, *, build_id=None, window=60,
+                 smoothing=0.3, workers=4, page_size=None):
+        if not 0 < smoothing <= 1:
+            raise ValueError('smoothing must be between 0 and 1')
+
+        self.client = client
+        self.fleet_id = fleet_id
+        self.build_id = build_id
+        self.smoothing = smoothing
+        self.workers = workers
+        self.page_size = page_size or client.default_query_limit
+        self.history = collections.deque(maxlen=window)
+        self.rate = None
+        self.samples = 0
+        self.logger = logging.getLogger(__name__)
+
+        self._stopped = threading.Event()
+
+    def sample(self):
+        """
+        Sample the fleet, and update the statistics
+
+        :returns: :py:class:`Sample`
+        :raises ValueError: if the fleet has no build to converge on
+        """
+
+        if self.build_id is None:
+            fleet = self.client.get_fleet(self.fleet_id)
+            if not fleet.build_id:
+                raise ValueError('Fleet {} has no build'.format(
+                    self.fleet_id))
+            self.build_id = fleet.build_id
+
+        builds = collections.Counter()
+        for records in concurrent_pages(
+                self.client, 'devices', page_size=self.page_size,
+                workers=self.workers, fleet_id=self.fleet_id):
+            builds.update(record.get('build_id') for record in records)
+
+        now = time.time()
+        total = sum(builds.values())
+        converged = builds.get(self.build_id, 0)
+
+        if self.history:
+            previous = self.history[-1]
+            elapsed = now - previous.time
+            if elapsed > 0:
+                latest = (converged - previous.converged) / elapsed
+                self.rate = latest if self.rate is None else (
+                    self.smoothing * latest
+                    + (1 - self.smoothing) * self.rate)
+
+        remaining = total - converged
+        if not remaining:
+            eta = 0.0
+        elif self.rate and self.rate > 0:
+            eta = remaining / self.rate
+        else:
+            eta = None
+
+        sample = Sample(now, total, converged, dict(builds),
+                        converged / total if total else 1.0, self.rate, eta)
+        self.history.append(sample)
+        self.samples += 1
+        return sample
+
+    def run(self, callback, *, interval=30, until=1.0):
+        """
+        Sample the fleet every `interval` seconds until enough of it has
+        converged, or :py:meth:`stop` is called
+
+        :param callable callback: Called with each :py:class:`Sample`
+        :param interval: The number of seconds between samples
+        :type interval: int or float
+        :param float until: Stop once this fraction of the fleet has
+            converged. Give more than 1 to never stop
+        :returns: :py:class:`Sample`, the last sample taken
+        """
+
+        self._stopped.clear()
+        while True:
+            sample = self.sample()
+            try:
+                callback(sample)
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception('Convergence callback failed')
+
+            if sample.fraction >= until \
+                    or self._stopped.wait(interval):
+                return sample
+
+    def stop(self):
+        """Stop :py:meth:`run` before its next sample"""
+
+        self._stopped.set()
@@ -17,6 +17,16 @@ class BuildUploadError(Exception):
     pass
 
 
+class BuildDownloadError(Exception):
+    """An error occured downloading the firmware file for a build."""
+    pass
+
+
+class DuplicateBuildError(Exception):
+    """An identical build exists in fl33t, with another version or release."""
+    pass
+
+
 class DuplicateDeviceIdError(Exception):
     """A device by that ID already exists in fl33t."""
     pass
@@ -69,3 +79,8 @@ class Fl33tApiException(Exception):
 class Fl33tClientException(Exception):
     """A model has been instantiated without providing an API client"""
     pass
+
+
+class TransportError(IOError):
+    """A transport failed to send a request, or to receive its response"""
+    pass
@@ -0,0 +1,418 @@
+"""
+Exporter
+
+Serves a client's request metrics, its cache hit rate and gauges of a team's
+fleets in the Prometheus text exposition format. Fleet gauges come from
+periodic background scans, so scrapes never wait on fl33t
+"""
+
+import collections
+import logging
+import threading
+import time
+
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fl33t.metrics import RequestMetrics
+from fl33t.utils import concurrent_pages, timestamp_before
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# How fl33t formats timestamps, and how the mirror stores them
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+FleetGauges = collections.namedtuple(
+    'FleetGauges', ['time', 'duration', 'devices', 'builds', 'fleets',
+                    'stale'])
+FleetGauges.__doc__ = """
+The result of a scan of a team's devices
+
+`time` is when the scan finished, in seconds since the epoch, and `duration`
+how many seconds it took. `devices` is the number of devices, `builds` and
+`fleets` map each build and fleet ID to its number of devices, and `stale`
+maps each fleet ID to its number of devices that have not checked in since
+the cutoff.
+"""
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n') \
+        .replace('"', '\\"')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() \
+            and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class Exposition:
+    """
+    Builds a page in the Prometheus text exposition format
+
+    :param str prefix: Prepended to the name of every metric
+    """
+
+    def __init__(self, prefix='fl33t_'):
+        self.prefix = prefix
+        self.lines = []
+
+    def family(self, name, kind, description):
+        """
+        Start a metric family, which its samples must follow
+
+        :param str name: The metric's name, without the prefix
+        :param str kind: `counter`, `gauge` or `histogram`
+        :param str description: The metric's help text
+        """
+
+        name = self.prefix + name
+        self.lines.append('# HELP {} {}'.format(
+            name, description.replace('\\', '\\\\').replace('\n', '\\n')))
+        self.lines.append('# TYPE {} {}'.format(name, kind))
+
+    def sample(self, name, value, labels=None):
+        """
+        Add a sample
+
+        :param str name: The sample's name, without the prefix
+        :param value: The sample's value
+        :type value: int or float
+        :param labels: If provided, the sample's labels
+        :type labels: dict or None
+        """
+
+        label_text = ''
+        if labels:
+            label_text = '{{{}}}'.format(','.join(
+                '{}="{}"'.format(key, _escape(label))
+                for key, label in labels.items()))
+        self.lines.append('{}{}{} {}'.format(self.prefix, name, label_text,
+                                             _number(value)))
+
+    def text(self):
+        """
+        The page
+
+        :returns: str
+        """
+
+        return '\n'.join(self.lines) + '\n'
+
+
+class FleetScanner:
+    """
+    Counts a team's devices by build and by fleet, and those that have not
+    checked in for longer than `stale_after`, every `interval` seconds
+
+    Each scan requests every page of the team's devices concurrently,
+    `workers` at a time, and only counts them, so memory use does not grow
+    with the number of devices. With a `mirror`, each scan instead syncs the
+    devices of a :py:class:`fl33t.mirror.Mirror`, and counts them with SQL.
+    The devices are listed on every scan, as their count does not change
+    when they check in or are upgraded, but only changed rows are written.
+
+    :param client: The client to scan with
+    :type client: :py:class:`fl33t.Fl33tClient`
+    :param interval: The number of seconds between scans
+    :type interval: int or float
+    :param stale_after: Devices that have not checked in for this long are
+        stale
+    :type stale_after: :py:class:`datetime.timedelta`
+    :param int workers: The number of pages to request at once
+    :param page_size: If provided, the number of records to request per page
+    :type page_size: int or None
+    :param mirror: If provided, the mirror's SQLite file. It is opened by
+        the thread scanning
+    :type mirror: str or None
+    """
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    def __init__(self, client, *, interval=300,
+                 stale_after=timedelta(days=30), workers=8, page_size=None,
+                 mirror=None):
+        self.client = client
+        self.interval = interval
+        self.stale_after = stale_after
+        self.workers = workers
+        self.page_size = page_size or client.default_query_limit
+        self.mirror_path = mirror
+        self.mirror = None
+        self.latest = None
+        self.scans = 0
+        self.failures = 0
+        self.logger = logging.getLogger(__name__)
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _count_pages(self, cutoff):
+        builds = collections.Counter()
+        fleets = collections.Counter()
+        stale = collections.Counter()
+        for records in concurrent_pages(self.client, 'devices',
+                                        page_size=self.page_size,
+                                        workers=self.workers):
+            for record in records:
+                builds[record.get('build_id') or ''] += 1
+                fleets[record.get('fleet_id') or ''] += 1
+                checkin = record.get('checkin_tstamp')
+                if checkin and timestamp_before(checkin, cutoff):
+                    stale[record.get('fleet_id') or ''] += 1
+        return builds, fleets, stale
+
+    def _count_mirror(self, cutoff):
+        if self.mirror is None:
+            # pylint: disable=import-outside-toplevel
+            from fl33t.mirror import Mirror
+            self.mirror = Mirror(self.client, self.mirror_path,
+                                 page_size=self.page_size)
+        self.mirror.sync(['devices'], force=True)
+
+        def grouped(column, where='', params=()):
+            return collections.Counter({
+                row[0] or '': row[1] for row in self.mirror.sql(
+                    'SELECT {0}, COUNT(*) FROM devices {1} '
+                    'GROUP BY {0}'.format(column, where), params)})
+
+        return (grouped('build_id'),
+                grouped('fleet_id'),
+                grouped('fleet_id', 'WHERE checkin_tstamp < ?',
+                        (cutoff.strftime(TIMESTAMP_FORMAT),)))
+
+    def scan(self):
+        """
+        Scan the team's devices, keeping the result as :py:attr:`latest`
+
+        :returns: :py:class:`FleetGauges`
+        """
+
+        started = time.monotonic()
+        cutoff = datetime.now(timezone.utc) - self.stale_after
+        if self.mirror_path:
+            builds, fleets, stale = self._count_mirror(cutoff)
+        else:
+            builds, fleets, stale = self._count_pages(cutoff)
+
+        self.latest = FleetGauges(time.time(), time.monotonic() - started,
+                                  sum(fleets.values()), dict(builds),
+                                  dict(fleets), dict(stale))
+        self.scans += 1
+        return self.latest
+
+    def run(self):
+        """Scan every `interval` seconds until :py:meth:`stop` is called"""
+
+        self._stopped.clear()
+        self._scan_until_stopped()
+
+    def _scan_until_stopped(self):
+        while True:
+            try:
+                self.scan()
+            except Exception:  # pylint: disable=broad-except
+                self.failures += 1
+                self.logger.exception('Fleet scan failed')
+
+            if self._stopped.wait(self.interval):
+                break
+
+        if self.mirror is not None:
+            self.mirror.close()
+            self.mirror = None
+
+    def start(self):
+        """Run the scans in a background thread"""
+
+        if self._thread is None or not self._thread.is_alive():
+            # Cleared here, so that stopping straight away is not missed
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._scan_until_stopped,
+                                            name='fl33t-fleet-scanner',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop scanning, waiting for a scan in progress to finish"""
+
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class Exporter:
+    """
+    Renders the metrics of a client, and of a team's fleets, for Prometheus
+
+    The client's requests are collected by a
+    :py:class:`fl33t.metrics.RequestMetrics`, attached to it unless one is
+    given. Fleet gauges are only rendered once the `scanner` has finished a
+    scan, and are as old as its last scan.
+
+    :param client: The client to export the metrics of
+    :type client: :py:class:`fl33t.Fl33tClient`
+    :param metrics: If provided, the collector attached to the client
+    :type metrics: :py:class:`fl33t.metrics.RequestMetrics` or None
+    :param scanner: If provided, the scanner of the team's fleets
+    :type scanner: :py:class:`FleetScanner` or None
+    """
+
+    def __init__(self, client, *, metrics=None, scanner=None):
+        self.client = client
+        self.metrics = metrics or RequestMetrics(client)
+        self.scanner = scanner
+
+    def _requests(self, page):
+        snapshot = self.metrics.snapshot()
+
+        page.family('request_duration_seconds', 'histogram',
+                    'Latency of fl33t API requests')
+        for (method, template), histogram in sorted(
+                snapshot['latencies'].items()):
+            labels = {'method': method, 'template': template}
+            for bound, count in histogram['buckets']:
+                page.sample('request_duration_seconds_bucket', count,
+                            dict(labels, le=_number(float(bound))))
+            page.sample('request_duration_seconds_sum', histogram['sum'],
+                        labels)
+            page.sample('request_duration_seconds_count',
+                        histogram['count'], labels)
+
+        page.family('requests_total', 'counter',
+                    'fl33t API requests that got a response, by status')
+        for (method, template, status), count in sorted(
+                snapshot['statuses'].items()):
+            page.sample('requests_total', count, {
+                'method': method, 'template': template, 'status': status})
+
+        page.family('request_errors_total', 'counter',
+                    'fl33t API requests that failed, by exception')
+        for (method, template, error), count in sorted(
+                snapshot['errors'].items()):
+            page.sample('request_errors_total', count, {
+                'method': method, 'template': template, 'error': error})
+
+        page.family('response_bytes_total', 'counter',
+                    'Bytes received in fl33t API responses')
+        for (method, template), count in sorted(
+                snapshot['received'].items()):
+            page.sample('response_bytes_total', count,
+                        {'method': method, 'template': template})
+
+        page.family('retries_total', 'counter',
+                    'Operations tried again after failing')
+        for operation, count in sorted(snapshot['retries'].items()):
+            page.sample('retries_total', count, {'operation': operation})
+
+        page.family('transfers_total', 'counter',
+                    'Build file uploads and downloads')
+        for (direction, success), count in sorted(
+                snapshot['transfers'].items()):
+            page.sample('transfers_total', count, {
+                'direction': direction,
+                'success': 'true' if success else 'false'})
+
+    def _cache(self, page):
+        cache = self.client.cache
+        if cache is None:
+            return
+
+        page.family('cache_hits_total', 'counter',
+                    'Lookups served from the client cache')
+        page.sample('cache_hits_total', cache.hits)
+        page.family('cache_misses_total', 'counter',
+                    'Lookups fetched from fl33t by the client cache')
+        page.sample('cache_misses_total', cache.misses)
+        page.family('cache_hit_ratio', 'gauge',
+                    'The fraction of lookups served from the client cache')
+        page.sample('cache_hit_ratio', cache.hit_rate)
+
+    def _fleets(self, page):
+        page.family('fleet_scans_total', 'counter',
+                    'Scans of the devices of the team')
+        page.sample('fleet_scans_total', self.scanner.scans)
+        page.family('fleet_scan_failures_total', 'counter',
+                    'Scans of the devices of the team that failed')
+        page.sample('fleet_scan_failures_total', self.scanner.failures)
+
+        gauges = self.scanner.latest
+        if gauges is None:
+            return
+
+        page.family('fleet_scan_timestamp_seconds', 'gauge',
+                    'When the last scan finished')
+        page.sample('fleet_scan_timestamp_seconds', gauges.time)
+        page.family('fleet_scan_duration_seconds', 'gauge',
+                    'How long the last scan took')
+        page.sample('fleet_scan_duration_seconds', gauges.duration)
+        page.family('devices', 'gauge', 'Devices in the team')
+        page.sample('devices', gauges.devices)
+
+        page.family('devices_per_build', 'gauge', 'Devices on each build')
+        for build_id, count in sorted(gauges.builds.items()):
+            page.sample('devices_per_build', count, {'build_id': build_id})
+        page.family('devices_per_fleet', 'gauge', 'Devices in each fleet')
+        for fleet_id, count in sorted(gauges.fleets.items()):
+            page.sample('devices_per_fleet', count, {'fleet_id': fleet_id})
+        page.family('stale_devices', 'gauge',
+                    'Devices in each fleet that have not checked in since '
+                    'the cutoff')
+        for fleet_id in sorted(gauges.fleets):
+            page.sample('stale_devices', gauges.stale.get(fleet_id, 0),
+                        {'fleet_id': fleet_id})
+
+    def render(self):
+        """
+        The metrics, in the Prometheus text exposition format
+
+        :returns: str
+        """
+
+        page = Exposition()
+        self._requests(page)
+        self._cache(page)
+        if self.scanner is not None:
+            self._fleets(page)
+        return page.text()
+
+    def server(self, host='127.0.0.1', port=9331):
+        """
+        Create an HTTP server answering `GET /metrics`
+
+        :param str host: The address to listen on
+        :param int port: The port to listen on, or 0 for any free port
+        :returns: :py:class:`http.server.ThreadingHTTPServer`, to run with
+            `serve_forever()`
+        """
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Serves the exporter's metrics"""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Answer a scrape"""
+
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+
+                body = exporter.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # pylint: disable=redefined-builtin
+                logging.getLogger(__name__).debug(format, *args)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        return server
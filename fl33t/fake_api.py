@@ -0,0 +1,947 @@
+"""
+Fake API
+
+A stateful, in-process stand-in for the team scoped fl33t API, for tests and
+benchmarks. It answers requests in memory through
+:py:class:`fl33t.transports.FakeTransport`, or is served on localhost as a
+WSGI application or by an asyncio server, with added latency and errors, and
+can be seeded with millions of devices.
+
+    python -m fl33t.fake_api --devices 1000000 --port 8080
+"""
+
+import argparse
+import array
+import asyncio
+import collections
+import hashlib
+import json
+import random
+import threading
+import time
+
+from datetime import datetime, timezone
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+# The fields of each model's records, with their defaults
+DEFAULTS = {
+    'session': {
+        'name': '', 'admin': False, 'device': False, 'provisioning': False,
+        'readonly': False, 'type': 'api', 'upload': False,
+    },
+    'train': {'name': '', 'upload_tstamp': None},
+    'build': {
+        'download_url': '', 'filename': '', 'md5sum': '', 'released': False,
+        'size': 0, 'status': 'created', 'train_id': '',
+        'upload_tstamp': None, 'upload_url': '', 'version': '',
+    },
+    'fleet': {
+        'build_id': None, 'name': '', 'size': 0, 'train_id': '',
+        'unreleased': True,
+    },
+    'device': {
+        'build_id': '', 'checkin_tstamp': None, 'fleet_id': '', 'name': '',
+        'session_token': '',
+    },
+}
+
+ID_FIELDS = {
+    'session': 'session_token',
+    'train': 'train_id',
+    'build': 'build_id',
+    'fleet': 'fleet_id',
+    'device': 'device_id',
+}
+
+# The query parameters each listing filters on
+FILTERS = {
+    'session': [],
+    'train': [],
+    'build': ['train_id', 'version'],
+    'fleet': ['train_id'],
+    'device': ['fleet_id'],
+}
+
+# The host pre-signed URLs point to when the API is not served
+OFFLINE_BASE = 'http://fake-fl33t.invalid'
+
+SEEDED_PREFIX = 'device-'
+
+JSON_HEADERS = [('Content-Type', 'application/json')]
+
+
+def timestamp(seconds):
+    """
+    Format a time as fl33t does
+
+    :param float seconds: Seconds since the epoch
+    :returns: str
+    """
+
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime(
+        '%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class HttpError(Exception):
+    """An error response, raised while handling a request"""
+
+    def __init__(self, status, message=None):
+        super().__init__(message or HTTPStatus(status).phrase)
+        self.status = status
+
+
+class Devices:
+    """
+    The devices of the fake team
+
+    Seeded devices are stored column by column in arrays, so that millions of
+    them fit in memory, and are only turned into records when requested.
+    Devices created through the API are kept as records.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self):
+        self.seeded = 0
+        self.alive = bytearray()
+        self.fleet_of = array.array('l')
+        self.build_of = array.array('l')
+        self.checkins = array.array('d')
+        self.names = {}
+        self.created = {}
+
+        self.values = ['']
+        self.value_index = {'': 0}
+        self.fleet_sizes = collections.Counter()
+        self._listings = {}
+
+    def _intern(self, value):
+        value = value or ''
+        if value not in self.value_index:
+            self.value_index[value] = len(self.values)
+            self.values.append(value)
+        return self.value_index[value]
+
+    def seed(self, count, fleet_ids, build_ids, *, rng, checkin_spread):
+        """
+        Add `count` devices spread over the fleets, each on one of
+        `build_ids` or on none, having checked in over the last
+        `checkin_spread` seconds
+        """
+
+        now = time.time()
+        fleets = [self._intern(fleet_id) for fleet_id in fleet_ids]
+        builds = [self._intern(build_id) for build_id in build_ids]
+        start = self.seeded
+
+        self.alive.extend(b'\x01' * count)
+        self.fleet_of.extend(fleets[index % len(fleets)]
+                             for index in range(start, start + count))
+        self.build_of.extend(builds[int(rng.random() * len(builds))]
+                             for _ in range(count))
+        self.checkins.extend(now - rng.random() * checkin_spread
+                             for _ in range(count))
+        self.seeded += count
+
+        for index, fleet_id in enumerate(fleet_ids):
+            self.fleet_sizes[fleet_id] += len(range(
+                (index - start) % len(fleets), count, len(fleets)))
+        self._listings.clear()
+
+    def _index(self, device_id):
+        """The index of a seeded device, or None"""
+
+        if not device_id.startswith(SEEDED_PREFIX):
+            return None
+        try:
+            index = int(device_id[len(SEEDED_PREFIX):])
+        except ValueError:
+            return None
+        if 0 <= index < self.seeded and self.alive[index] \
+                and device_id == self._seeded_id(index):
+            return index
+        return None
+
+    @staticmethod
+    def _seeded_id(index):
+        return '{}{:08d}'.format(SEEDED_PREFIX, index)
+
+    def _seeded_record(self, index):
+        checkin = self.checkins[index]
+        return {
+            'device_id': self._seeded_id(index),
+            'name': self.names.get(index, 'Device {}'.format(index)),
+            'fleet_id': self.values[self.fleet_of[index]],
+            'build_id': self.values[self.build_of[index]],
+            'checkin_tstamp': timestamp(checkin) if checkin else None,
+            'session_token': '',
+        }
+
+    def __len__(self):
+        return sum(self.fleet_sizes.values())
+
+    def __contains__(self, device_id):
+        return device_id in self.created or self._index(device_id) is not None
+
+    def get(self, device_id):
+        """The record of a device, or None"""
+
+        if device_id in self.created:
+            return dict(self.created[device_id])
+        index = self._index(device_id)
+        return None if index is None else self._seeded_record(index)
+
+    def add(self, record):
+        """Add a device created through the API"""
+
+        self.created[record['device_id']] = record
+        self.fleet_sizes[record['fleet_id']] += 1
+        self._listings.clear()
+
+    def update(self, device_id, changes):
+        """Change the fields of a device, which must exist"""
+
+        before = self.get(device_id)
+        if changes.get('fleet_id', before['fleet_id']) != before['fleet_id']:
+            self.fleet_sizes[before['fleet_id']] -= 1
+            self.fleet_sizes[changes['fleet_id']] += 1
+            self._listings.clear()
+
+        if device_id in self.created:
+            self.created[device_id].update(changes)
+            return
+
+        index = self._index(device_id)
+        for key, value in changes.items():
+            if key == 'fleet_id':
+                self.fleet_of[index] = self._intern(value)
+            elif key == 'build_id':
+                self.build_of[index] = self._intern(value)
+            elif key == 'name':
+                self.names[index] = value
+
+    def check_in(self, device_id, build_id=None):
+        """Record a device checking in, which must exist, and the build it
+        has installed, if given"""
+
+        now = time.time()
+        if device_id in self.created:
+            self.created[device_id]['checkin_tstamp'] = timestamp(now)
+            if build_id:
+                self.created[device_id]['build_id'] = build_id
+            return
+
+        index = self._index(device_id)
+        self.checkins[index] = now
+        if build_id:
+            self.build_of[index] = self._intern(build_id)
+
+    def remove(self, device_id):
+        """Delete a device, which must exist"""
+
+        record = self.get(device_id)
+        self.fleet_sizes[record['fleet_id']] -= 1
+        if self.created.pop(device_id, None) is None:
+            index = self._index(device_id)
+            self.alive[index] = 0
+            self.names.pop(index, None)
+        self._listings.clear()
+
+    def listing(self, fleet_id=None):
+        """
+        The devices, in order, or only those in a fleet, as a tuple of an
+        array of seeded indexes and a list of created device IDs
+
+        Listings are kept until devices are added, removed or moved, so that
+        paginating through them is quick.
+        """
+
+        if fleet_id not in self._listings:
+            if fleet_id is None:
+                seeded = array.array('l', (
+                    index for index in range(self.seeded)
+                    if self.alive[index]))
+                created = list(self.created)
+            else:
+                wanted = self.value_index.get(fleet_id)
+                seeded = array.array('l', (
+                    index for index in range(self.seeded)
+                    if self.alive[index] and self.fleet_of[index] == wanted))
+                created = [device_id
+                           for device_id, record in self.created.items()
+                           if record['fleet_id'] == fleet_id]
+            self._listings[fleet_id] = (seeded, created)
+
+        return self._listings[fleet_id]
+
+    def page(self, fleet_id, offset, limit):
+        """A page of device records, and the number of devices listed"""
+
+        seeded, created = self.listing(fleet_id)
+        records = [self._seeded_record(index)
+                   for index in seeded[offset:offset + limit]]
+        start = max(0, offset - len(seeded))
+        records.extend(dict(self.created[device_id]) for device_id in
+                       created[start:start + limit - len(records)])
+        return records, len(seeded) + len(created)
+
+
+class FakeApi:
+    """
+    A stateful stand-in for the fl33t API of a single team
+
+    It implements the endpoints the client uses: sessions, trains, builds,
+    fleets, devices and device check ins, with pagination and filters,
+    pre-signed build upload and download URLs, and fl33t's error codes:
+
+    - 401 for an unknown session token, and 403 for a read only session
+      making changes
+    - 400 for an invalid body, and 404 for unknown IDs
+    - 409 for creating a device whose ID already exists
+
+    Every request is first delayed by `latency` seconds, or a random number
+    of seconds between the two given, and answered with `error_status`
+    instead at the `error_rate`. The delay is only made by the ways of serving
+    the API, so that :py:meth:`respond` stays quick.
+
+    :param str team_id: The team whose endpoints are served
+    :param str token: The token of the admin session created with the API
+    :param latency: The seconds each request is delayed by, or a tuple of the
+        least and most seconds
+    :type latency: int, float or tuple
+    :param float error_rate: The fraction of requests answered with an error
+    :param int error_status: The status code of the errors injected
+    :param seed: If provided, the seed for generated IDs, seeded data and
+        injected errors
+    :type seed: int or None
+    """
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    def __init__(self, team_id='team', token='token', *, latency=0.0,
+                 error_rate=0.0, error_status=503, seed=None):
+        self.team_id = team_id
+        self.token = token
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+
+        self.tables = {model: {} for model in DEFAULTS if model != 'device'}
+        self.devices = Devices()
+        self.files = {}
+        self.requests = collections.Counter()
+        self.lock = threading.RLock()
+
+        self.tables['session'][token] = self._record('session', {
+            'session_token': token, 'name': 'Fake admin', 'admin': True})
+
+    def _record(self, model, values):
+        record = dict(DEFAULTS[model])
+        record.update((key, value) for key, value in values.items()
+                      if key in record or key == ID_FIELDS[model])
+        return record
+
+    def _generate_id(self):
+        return '{:012x}'.format(self.random.getrandbits(48))
+
+    # pylint: disable=too-many-locals
+    def seed_data(self, *, trains=1, builds=3, fleets=10, devices=1000,
+                  checkin_spread=90 * 86400):
+        """
+        Fill the team with generated objects
+
+        Each train gets `builds` available builds, all but the newest
+        released, and the fleets are spread over the trains, on their newest
+        build. Devices are spread over the fleets, each on one of its
+        train's builds, and are named `device-00000000` onwards.
+
+        :param int trains: The number of trains
+        :param int builds: The number of builds in each train
+        :param int fleets: The number of fleets
+        :param int devices: The number of devices
+        :param checkin_spread: The devices last checked in at random times
+            over this many seconds
+        :type checkin_spread: int or float
+        :returns: :py:class:`FakeApi`, this API
+        """
+
+        now = time.time()
+        with self.lock:
+            train_builds = []
+            for train in range(trains):
+                train_id = self._generate_id()
+                self.tables['train'][train_id] = self._record('train', {
+                    'train_id': train_id,
+                    'name': 'Train {}'.format(train),
+                    'upload_tstamp': timestamp(now)})
+
+                build_ids = []
+                for build in range(builds):
+                    build_id = self._generate_id()
+                    self.tables['build'][build_id] = self._record('build', {
+                        'build_id': build_id,
+                        'train_id': train_id,
+                        'version': '1.0.{}'.format(build),
+                        'filename': 'firmware-{}.bin'.format(build),
+                        'md5sum': hashlib.md5(build_id.encode()).hexdigest(),
+                        'size': 1024,
+                        'status': 'available',
+                        'released': build < builds - 1,
+                        'upload_tstamp': timestamp(now)})
+                    build_ids.append(build_id)
+                train_builds.append((train_id, build_ids))
+
+            fleet_ids = []
+            for fleet in range(fleets):
+                train_id, build_ids = train_builds[fleet % len(train_builds)]
+                fleet_id = self._generate_id()
+                self.tables['fleet'][fleet_id] = self._record('fleet', {
+                    'fleet_id': fleet_id,
+                    'name': 'Fleet {}'.format(fleet),
+                    'train_id': train_id,
+                    'build_id': build_ids[-1] if build_ids else None,
+                    'unreleased': True})
+                fleet_ids.append(fleet_id)
+
+            if devices and fleet_ids:
+                every_build = [build_id for _, build_ids in train_builds
+                               for build_id in build_ids]
+                self.devices.seed(devices, fleet_ids, every_build or [''],
+                                  rng=self.random,
+                                  checkin_spread=checkin_spread)
+
+        return self
+
+    def delay(self):
+        """
+        The number of seconds to delay the next request by
+
+        :returns: float
+        """
+
+        if isinstance(self.latency, (tuple, list)):
+            with self.lock:
+                return self.random.uniform(*self.latency)
+        return self.latency
+
+    # pylint: disable=too-many-arguments
+    def respond(self, method, url, headers, body=b'', *, base=None):
+        """
+        Handle a request
+
+        :param str method: The request method
+        :param str url: The requested path, or URL, with its query string
+        :param headers: The request headers
+        :type headers: dict
+        :param bytes body: The request body
+        :param base: If provided, the scheme and host the API is served on,
+            for pre-signed URLs
+        :type base: str or None
+        :returns: tuple of the status code, a list of header tuples, and the
+            body as `bytes`
+        """
+
+        parts = urlsplit(url)
+        path = [segment for segment in parts.path.split('/') if segment]
+        query = dict(parse_qsl(parts.query))
+        base = (base or OFFLINE_BASE).rstrip('/')
+
+        with self.lock:
+            self.requests[method] += 1
+            try:
+                if self.error_rate and self.random.random() < self.error_rate:
+                    raise HttpError(self.error_status, 'Injected error')
+
+                if len(path) == 2 and path[0] in ('upload', 'download'):
+                    return self._transfer(method, path[0], path[1], body,
+                                          base)
+
+                if len(path) < 3 or path[0] != 'team' \
+                        or path[1] != self.team_id:
+                    raise HttpError(404)
+
+                self._authorize(method, headers)
+                status, data = self._dispatch(method, path[2:], query, body,
+                                              base)
+                if data is None:
+                    return status, [], b''
+                # Encoded while locked, as the records may be shared
+                return (status, list(JSON_HEADERS),
+                        json.dumps(data).encode('utf-8'))
+            except HttpError as exc:
+                return (exc.status, [('Content-Type', 'text/plain')],
+                        str(exc).encode('utf-8'))
+
+    def _authorize(self, method, headers):
+        authorization = headers.get('Authorization') \
+            or headers.get('authorization') or ''
+        session = self.tables['session'].get(
+            authorization[len('Bearer '):]
+            if authorization.startswith('Bearer ') else None)
+        if session is None:
+            raise HttpError(401)
+        if method != 'GET' and session['readonly'] and not session['admin']:
+            raise HttpError(403)
+
+    # pylint: disable=too-many-return-statements,too-many-branches
+    def _dispatch(self, method, path, query, body, base):
+        """Route a team scoped request, returning its status and data"""
+
+        name = path[0]
+        if len(path) == 1 and name.endswith('s') and name[:-1] in DEFAULTS:
+            if method != 'GET':
+                raise HttpError(405)
+            return 200, self._list(name[:-1], query)
+
+        if name not in DEFAULTS:
+            raise HttpError(404)
+
+        if len(path) == 1:
+            if method != 'POST':
+                raise HttpError(405)
+            return 200, {name: self._create(name, self._body(name, body),
+                                            base)}
+
+        object_id = path[1]
+        if len(path) == 3 and name == 'device' and path[2] == 'checkin':
+            if method != 'POST':
+                raise HttpError(405)
+            build = self._checkin(object_id, body)
+            return (200, {'build': build}) if build else (204, None)
+
+        if len(path) != 2:
+            raise HttpError(404)
+
+        if method == 'GET':
+            return 200, {name: self._get(name, object_id)}
+        if method == 'PUT':
+            self._update(name, object_id, self._body(name, body))
+            return 204, None
+        if method == 'DELETE':
+            self._delete(name, object_id)
+            return 204, None
+
+        raise HttpError(405)
+
+    @staticmethod
+    def _body(model, body):
+        try:
+            values = json.loads(body.decode('utf-8'))[model]
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            raise HttpError(400, 'Expected a JSON {}'.format(model)) from exc
+        if not isinstance(values, dict):
+            raise HttpError(400, 'Expected a JSON {}'.format(model))
+        return values
+
+    def _render(self, model, record):
+        if model == 'fleet':
+            record = dict(record,
+                          size=self.devices.fleet_sizes[record['fleet_id']])
+        return record
+
+    def _get(self, model, object_id):
+        record = self.devices.get(object_id) if model == 'device' \
+            else self.tables[model].get(object_id)
+        if record is None:
+            raise HttpError(404)
+        return self._render(model, dict(record))
+
+    def _list(self, model, query):
+        try:
+            offset = max(0, int(query.get('offset', 0)))
+            limit = max(1, int(query.get('limit', 25)))
+        except ValueError as exc:
+            raise HttpError(400, 'Invalid offset or limit') from exc
+
+        if model == 'device':
+            records, count = self.devices.page(query.get('fleet_id') or None,
+                                               offset, limit)
+        else:
+            filters = {key: query[key] for key in FILTERS[model]
+                       if query.get(key)}
+            matching = [record for record in self.tables[model].values()
+                        if all(record.get(key) == value
+                               for key, value in filters.items())]
+            records = [self._render(model, dict(record))
+                       for record in matching[offset:offset + limit]]
+            count = len(matching)
+
+        return {'{}s'.format(model): records, '{}_count'.format(model): count}
+
+    def _create(self, model, values, base):
+        id_field = ID_FIELDS[model]
+        if model == 'device':
+            device_id = values.get(id_field) or self._generate_id()
+            if device_id in self.devices:
+                raise HttpError(409, 'Device {} already exists'.format(
+                    device_id))
+            record = self._record(model, dict(values, device_id=device_id))
+            self.devices.add(record)
+            return dict(record)
+
+        record = self._record(model, dict(values, **{
+            id_field: self._generate_id()}))
+        if model == 'build':
+            record.update(status='created', size=0,
+                          upload_url='{}/upload/{}?signature={}'.format(
+                              base, record['build_id'], self._generate_id()),
+                          download_url='')
+        elif model == 'train':
+            record['upload_tstamp'] = timestamp(time.time())
+        self.tables[model][record[id_field]] = record
+        return self._render(model, dict(record))
+
+    def _update(self, model, object_id, values):
+        self._get(model, object_id)
+        changes = {key: value for key, value in values.items()
+                   if key in DEFAULTS[model] and key != 'size'}
+        if model == 'device':
+            # Only check ins move the check in time
+            changes.pop('checkin_tstamp', None)
+            self.devices.update(object_id, changes)
+        else:
+            self.tables[model][object_id].update(changes)
+
+    def _delete(self, model, object_id):
+        self._get(model, object_id)
+        if model == 'device':
+            self.devices.remove(object_id)
+        else:
+            del self.tables[model][object_id]
+            self.files.pop(object_id, None)
+
+    def _checkin(self, device_id, body):
+        device = self._get('device', device_id)
+        try:
+            checkin = json.loads(body.decode('utf-8') or '{}').get(
+                'checkin') or {}
+        except (ValueError, AttributeError) as exc:
+            raise HttpError(400, 'Expected a JSON checkin') from exc
+
+        installed = checkin.get('build_id') or device['build_id']
+        self.devices.check_in(device_id, checkin.get('build_id'))
+
+        fleet = self.tables['fleet'].get(device['fleet_id'])
+        build_id = fleet and fleet['build_id']
+        if not build_id or build_id == installed:
+            return None
+        return self.tables['build'].get(build_id)
+
+    def _transfer(self, method, direction, build_id, body, base):
+        """Handle a request to a pre-signed upload or download URL"""
+
+        build = self.tables['build'].get(build_id)
+        if build is None:
+            raise HttpError(404)
+
+        if direction == 'upload' and method == 'PUT':
+            self.files[build_id] = bytes(body)
+            build.update(status='available', size=len(body),
+                         md5sum=hashlib.md5(body).hexdigest(),
+                         upload_tstamp=timestamp(time.time()),
+                         download_url='{}/download/{}'.format(base,
+                                                              build_id))
+            return 200, [], b''
+
+        if direction == 'download' and method == 'GET' \
+                and build_id in self.files:
+            return (200, [('Content-Type', 'application/octet-stream')],
+                    self.files[build_id])
+
+        raise HttpError(404)
+
+    def handler(self, request):
+        """
+        Answer a request in memory, for use as the handler of a
+        :py:class:`fl33t.transports.FakeTransport`
+
+        :param request: The request
+        :type request: :py:class:`fl33t.protocol.Request`
+        :returns: :py:class:`fl33t.protocol.Response`
+        """
+
+        # pylint: disable=import-outside-toplevel
+        from fl33t.protocol import Response, full_url
+
+        delay = self.delay()
+        if delay:
+            time.sleep(delay)
+
+        url = full_url(request)
+        status, headers, body = self.respond(request.method, url,
+                                             request.headers,
+                                             request.body or b'')
+        return Response(status, dict(headers), body, url)
+
+    def transport(self):
+        """
+        A transport answering requests in memory, for a client's `transport`
+        option
+
+        :returns: :py:class:`fl33t.transports.FakeTransport`
+        """
+
+        # pylint: disable=import-outside-toplevel
+        from fl33t.transports import FakeTransport
+
+        return FakeTransport(self.handler)
+
+    def __call__(self, environ, start_response):
+        """Serve the API as a WSGI application"""
+
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        body = environ['wsgi.input'].read(length) if length else b''
+
+        url = environ.get('PATH_INFO', '')
+        if environ.get('QUERY_STRING'):
+            url = '{}?{}'.format(url, environ['QUERY_STRING'])
+        headers = {key[5:].replace('_', '-').title(): value
+                   for key, value in environ.items()
+                   if key.startswith('HTTP_')}
+        base = '{}://{}'.format(environ.get('wsgi.url_scheme', 'http'),
+                                environ.get('HTTP_HOST', 'localhost'))
+
+        delay = self.delay()
+        if delay:
+            time.sleep(delay)
+
+        status, response_headers, content = self.respond(
+            environ['REQUEST_METHOD'], url, headers, body, base=base)
+        response_headers.append(('Content-Length', str(len(content))))
+        start_response('{} {}'.format(status, HTTPStatus(status).phrase),
+                       response_headers)
+        return [content]
+
+
+class FakeServer:
+    """
+    Serves a :py:class:`FakeApi` on localhost from a background thread
+
+    The `asyncio` server keeps connections alive, and handles many at once
+    in a single thread. The `wsgi` server uses :py:mod:`wsgiref`, with a
+    thread per connection.
+
+    :param api: The API to serve
+    :type api: :py:class:`FakeApi`
+    :param str host: The address to listen on
+    :param int port: The port to listen on, or 0 for any free port
+    :param str mode: `asyncio` or `wsgi`
+    :raises ValueError: if the mode is not known
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, api, *, host='127.0.0.1', port=0, mode='asyncio'):
+        if mode not in ('asyncio', 'wsgi'):
+            raise ValueError('Unknown server mode {}'.format(mode))
+
+        self.api = api
+        self.host = host
+        self.port = port
+        self.mode = mode
+
+        self._thread = None
+        self._started = threading.Event()
+        self._loop = None
+        self._server = None
+        self._connections = {}
+
+    @property
+    def url(self):
+        """The URL the API is served on, for a client's `base_uri`"""
+
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    def start(self):
+        """
+        Start serving
+
+        :returns: :py:class:`FakeServer`, this server
+        """
+
+        target = self._serve_asyncio if self.mode == 'asyncio' \
+            else self._serve_wsgi
+        self._thread = threading.Thread(target=target, daemon=True,
+                                        name='fake-fl33t')
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        """Stop serving, and wait for the server's thread to finish"""
+
+        if self._thread is None:
+            return
+
+        if self.mode == 'asyncio':
+            self._loop.call_soon_threadsafe(self._close)
+        else:
+            self._server.shutdown()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _serve_wsgi(self):
+        # pylint: disable=import-outside-toplevel
+        import socketserver
+        from wsgiref import simple_server
+
+        class Server(socketserver.ThreadingMixIn, simple_server.WSGIServer):
+            """A WSGI server handling each request in its own thread"""
+
+            daemon_threads = True
+
+        class Handler(simple_server.WSGIRequestHandler):
+            """A WSGI request handler that does not log each request"""
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        self._server = simple_server.make_server(
+            self.host, self.port, self.api, server_class=Server,
+            handler_class=Handler)
+        self.port = self._server.server_address[1]
+        self._started.set()
+        self._server.serve_forever(poll_interval=0.05)
+        self._server.server_close()
+
+    def _serve_asyncio(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._run_asyncio())
+        finally:
+            self._loop.close()
+
+    async def _run_asyncio(self):
+        self._server = await asyncio.start_server(self._connection,
+                                                  self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        try:
+            await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        # Connections kept alive are closed by _close, and finish here
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    def _close(self):
+        self._server.close()
+        for writer in self._connections.values():
+            writer.close()
+
+    async def _connection(self, reader, writer):
+        """Answer the requests on a connection until it is closed"""
+
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, url, headers, body = request
+
+                delay = self.api.delay()
+                if delay:
+                    await asyncio.sleep(delay)
+
+                status, response_headers, content = self.api.respond(
+                    method, url, headers, body, base=self.url)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                lines = ['HTTP/1.1 {} {}'.format(status,
+                                                 HTTPStatus(status).phrase)]
+                lines.extend('{}: {}'.format(*header)
+                             for header in response_headers)
+                lines.append('Content-Length: {}'.format(len(content)))
+                if not keep_alive:
+                    lines.append('Connection: close')
+                writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode(
+                    'latin-1') + content)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            del self._connections[task]
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        """Read a request, or return None once the connection is closed"""
+
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        method, url, _ = line.decode('latin-1').split(' ', 2)
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if not size:
+                    break
+                chunks.append(chunk[:-2])
+            body = b''.join(chunks)
+        else:
+            body = await reader.readexactly(
+                int(headers.get('content-length') or 0))
+
+        return method, url, headers, body
+
+
+def main():
+    """Serve a seeded fake API from the command line"""
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--mode', choices=['asyncio', 'wsgi'],
+                        default='asyncio')
+    parser.add_argument('--team', default='team')
+    parser.add_argument('--token', default='token')
+    parser.add_argument('--trains', type=int, default=1)
+    parser.add_argument('--builds', type=int, default=3)
+    parser.add_argument('--fleets', type=int, default=10)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds to delay each request by')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='The fraction of requests to fail')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    api = FakeApi(args.team, args.token, latency=args.latency,
+                  error_rate=args.error_rate, seed=args.seed).seed_data(
+                      trains=args.trains, builds=args.builds,
+                      fleets=args.fleets, devices=args.devices)
+    server = FakeServer(api, host=args.host, port=args.port,
+                        mode=args.mode).start()
+    print('Serving team {} on {} with token {}'.format(
+        args.team, server.url, args.token))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
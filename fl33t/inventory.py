@@ -0,0 +1,291 @@
+"""
+Inventory
+
+An in-memory, indexed copy of a team's trains, builds, fleets and devices,
+for answering questions that join them without listing everything again
+"""
+
+from fl33t.utils import gather
+
+# For each collection, the attribute holding its ID and the attributes, or
+# pairs of attributes, that it is indexed by. Pairs are indexed by the first
+# attribute, then the second, so that every value of the second for one
+# value of the first can be read on its own
+COLLECTIONS = {
+    'trains': ('train_id', []),
+    'builds': ('build_id', ['train_id', 'released', ('train_id', 'version')]),
+    'fleets': ('fleet_id', ['train_id', 'build_id']),
+    'devices': ('device_id', ['fleet_id', 'build_id',
+                              ('fleet_id', 'build_id')]),
+}
+
+# The `list_*` arguments that limit a listing to part of a collection
+SCOPES = {
+    'builds': ['train_id'],
+    'fleets': ['train_id'],
+    'devices': ['fleet_id'],
+}
+
+
+def _key(obj, attributes):
+    if isinstance(attributes, tuple):
+        return tuple(getattr(obj, attribute) for attribute in attributes)
+    return getattr(obj, attributes)
+
+
+def _path(attributes, key):
+    """The keys of the nested dicts an object is kept in, in an index"""
+
+    return key if isinstance(attributes, tuple) else (key,)
+
+
+def _lookup(index, path):
+    """The objects kept under a path in an index, by ID"""
+
+    for part in path:
+        index = index.get(part, {})
+    return index
+
+
+class Inventory:
+    """
+    An in-memory copy of a team's trains, builds, fleets and devices,
+    indexed so that lookups take time proportional to what they return
+
+    Devices are indexed by fleet and build, fleets by train and build, and
+    builds by train, release status and version. :py:meth:`refresh` lists a
+    collection, or the part of it in one fleet or train, again.
+
+    :param client: The client to list objects with
+    :type client: :py:class:`fl33t.Fl33tClient`
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._objects = {collection: {} for collection in COLLECTIONS}
+        # The index keys each object was added under, so that it can be
+        # removed from the indexes even if it has been changed since
+        self._keys = {collection: {} for collection in COLLECTIONS}
+        self._indexes = {
+            collection: {attributes: {} for attributes in indexed}
+            for collection, (_, indexed) in COLLECTIONS.items()
+        }
+
+    @classmethod
+    def from_client(cls, client, *, page_size=None):
+        """
+        Load an inventory, listing every collection concurrently
+
+        :param client: The client to list objects with
+        :type client: :py:class:`fl33t.Fl33tClient`
+        :param page_size: If provided, the number of records to request per
+            page
+        :type page_size: int or None
+        :returns: :py:class:`Inventory`
+        """
+
+        inventory = cls(client)
+        inventory.refresh(page_size=page_size)
+        return inventory
+
+    def _collection(self, obj):
+        collection = '{}s'.format(obj.__class__.__name__.lower())
+        if collection not in COLLECTIONS:
+            raise TypeError('{} objects cannot be added to an inventory'
+                            .format(obj.__class__.__name__))
+        return collection
+
+    def add(self, obj):
+        """
+        Add an object to the inventory, or replace the copy already in it
+
+        :param obj: A train, build, fleet or device
+        """
+
+        collection = self._collection(obj)
+        id_attribute, indexed = COLLECTIONS[collection]
+        object_id = getattr(obj, id_attribute)
+
+        self.discard(self._objects[collection].get(object_id))
+        self._objects[collection][object_id] = obj
+        keys = self._keys[collection][object_id] = {}
+        for attributes in indexed:
+            keys[attributes] = _key(obj, attributes)
+            node = self._indexes[collection][attributes]
+            for part in _path(attributes, keys[attributes]):
+                node = node.setdefault(part, {})
+            node[object_id] = obj
+
+    def discard(self, obj):
+        """
+        Remove an object from the inventory, if it is in it
+
+        :param obj: A train, build, fleet or device, or None
+        """
+
+        if obj is None:
+            return
+
+        collection = self._collection(obj)
+        object_id = getattr(obj, COLLECTIONS[collection][0])
+
+        if self._objects[collection].pop(object_id, None) is None:
+            return
+
+        keys = self._keys[collection].pop(object_id)
+        for attributes, key in keys.items():
+            nodes = [self._indexes[collection][attributes]]
+            path = _path(attributes, key)
+            for part in path:
+                nodes.append(nodes[-1][part])
+            nodes[-1].pop(object_id, None)
+            # Drop the dicts left empty, innermost first
+            for node, part in zip(reversed(nodes[:-1]), reversed(path)):
+                if node[part]:
+                    break
+                del node[part]
+
+    def refresh(self, collections=None, *, page_size=None, **scope):
+        """
+        List collections from fl33t again, replacing what the inventory
+        holds for them
+
+        Giving a `fleet_id` only lists the devices in that fleet, and giving
+        a `train_id` only lists the builds and fleets in that train.
+
+        :param collections: The collections to list. Defaults to all of them
+        :type collections: list of str or None
+        :param page_size: If provided, the number of records to request per
+            page
+        :type page_size: int or None
+        :param scope: `fleet_id` or `train_id`, limiting what is listed
+        :returns: dict mapping each collection to the number of objects
+            listed
+        :raises ValueError: if a collection is not known, or cannot be
+            limited to the given scope
+        """
+
+        collections = list(collections or COLLECTIONS)
+        unknown = set(collections) - set(COLLECTIONS)
+        if unknown:
+            raise ValueError('Unknown collections: {}'.format(
+                ', '.join(sorted(unknown))))
+
+        for collection in collections:
+            unscoped = set(scope) - set(SCOPES.get(collection, []))
+            if unscoped:
+                raise ValueError('{} cannot be limited by {}'.format(
+                    collection, ', '.join(sorted(unscoped))))
+
+        def lister(collection):
+            method = getattr(self.client, 'list_{}'.format(collection))
+            return lambda: list(method(page_size=page_size, **scope))
+
+        listings = gather({collection: lister(collection)
+                           for collection in collections})
+
+        counts = {}
+        for collection, objects in listings.items():
+            if scope:
+                stale = list(self.find(collection, **scope))
+            else:
+                stale = list(self._objects[collection].values())
+
+            for obj in stale:
+                self.discard(obj)
+            for obj in objects:
+                self.add(obj)
+            counts[collection] = len(objects)
+
+        return counts
+
+    def get(self, collection, object_id):
+        """
+        Get a single object by its ID
+
+        :param str collection: The name of the collection
+        :param str object_id: The object's ID
+        :returns: The object, or None if it is not in the inventory
+        """
+
+        return self._objects[collection].get(object_id)
+
+    def all(self, collection):
+        """
+        Every object in a collection
+
+        :param str collection: The name of the collection
+        :returns: list
+        """
+
+        return list(self._objects[collection].values())
+
+    def find(self, collection, **attributes):
+        """
+        Get the objects in a collection with the given attribute values
+
+        :param str collection: The name of the collection
+        :param attributes: The values of indexed attributes to match, e.g.
+            `fleet_id='abc'`, or `fleet_id='abc', build_id='def'`
+        :returns: list
+        :raises ValueError: if the attributes are not indexed
+        """
+
+        if not attributes:
+            return self.all(collection)
+
+        for index_key, index in self._indexes[collection].items():
+            names = index_key if isinstance(index_key, tuple) \
+                else (index_key,)
+            if set(names) == set(attributes):
+                return list(_lookup(
+                    index, [attributes[name] for name in names]).values())
+
+        raise ValueError('{} are not indexed by {}'.format(
+            collection, ', '.join(sorted(attributes))))
+
+    def __len__(self):
+        return sum(len(objects) for objects in self._objects.values())
+
+    def __repr__(self):
+        return '<Inventory {}>'.format(', '.join(
+            '{}={}'.format(collection, len(objects))
+            for collection, objects in self._objects.items()))
+
+    def devices_off_fleet_build(self, fleet_id=None):
+        """
+        Devices that are not on their fleet's build
+
+        This takes time proportional to the devices returned and the number
+        of different builds that devices in the fleets looked at are on.
+
+        :param fleet_id: If provided, only look at the devices in this fleet
+        :type fleet_id: str or None
+        :returns: list of :py:class:`fl33t.models.Device`
+        """
+
+        fleets = ([self.get('fleets', fleet_id)] if fleet_id
+                  else self.all('fleets'))
+        by_fleet_build = self._indexes['devices'][('fleet_id', 'build_id')]
+
+        devices = []
+        for fleet in fleets:
+            if fleet is None:
+                continue
+            for build_id, by_id in by_fleet_build.get(fleet.fleet_id,
+                                                      {}).items():
+                if build_id != fleet.build_id:
+                    devices.extend(by_id.values())
+
+        return devices
+
+    def fleets_on_unreleased_builds(self):
+        """
+        Fleets whose build is not released
+
+        :returns: list of :py:class:`fl33t.models.Fleet`
+        """
+
+        return [fleet
+                for build in self.find('builds', released=False)
+                for fleet in self.find('fleets', build_id=build.build_id)]
@@ -0,0 +1,281 @@
+"""
+Metrics
+
+Collects a client's `request`, `error`, `retry`, `page`, `model` and
+`transfer` events into latency histograms per endpoint template and
+counters, cheaply enough to stay attached for a client's whole life
+"""
+
+import bisect
+import collections
+import threading
+
+EVENTS = ['request', 'error', 'retry', 'page', 'model', 'transfer']
+
+# Upper bounds of the latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+
+class Histogram:
+    """
+    Counts observations into buckets, keeping their sum and count
+
+    Buckets are counted separately, not cumulatively, and the last bucket
+    counts the observations above every bound.
+
+    :param buckets: The upper bounds of the buckets, in increasing order
+    :type buckets: tuple of float
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        if list(buckets) != sorted(buckets) or not buckets:
+            raise ValueError('Buckets must be given in increasing order')
+
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Count an observation
+
+        :param float value: The observed value
+        """
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        The number of observations at or below each bound
+
+        :returns: list of tuples of each bound, ending with `inf`, and the
+            number of observations up to it
+        """
+
+        total = 0
+        rows = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            rows.append((bound, total))
+        return rows
+
+    def quantile(self, fraction):
+        """
+        Estimate a quantile, interpolating linearly within its bucket
+
+        Quantiles in the last bucket are reported as its lower bound.
+
+        :param float fraction: The quantile, between 0 and 1
+        :returns: float, or None if nothing was observed
+        :raises ValueError: if `fraction` is not between 0 and 1
+        """
+
+        if not 0 <= fraction <= 1:
+            raise ValueError('Quantiles must be between 0 and 1')
+        if not self.count:
+            return None
+
+        rank = fraction * self.count
+        lower = 0.0
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+
+        return self.buckets[-1]
+
+    @property
+    def mean(self):
+        """The mean observation, or None if nothing was observed"""
+
+        return self.sum / self.count if self.count else None
+
+
+class RequestMetrics:
+    """
+    Collects the latencies, statuses, errors and retries of the API
+    requests made through clients, along with pages listed, models built and
+    build files transferred
+
+    Each hook only updates counters under a lock, so a collector can stay
+    attached in production.
+
+    :param client: The client to collect from. Can also be given later with
+        :py:meth:`attach`
+    :type client: :py:class:`fl33t.Fl33tClient` or None
+    :param buckets: The upper bounds of the latency buckets, in seconds
+    :type buckets: tuple of float
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, client=None, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.clients = []
+
+        self.latencies = {}
+        self.statuses = collections.Counter()
+        self.errors = collections.Counter()
+        self.retries = collections.Counter()
+        self.received = collections.Counter()
+        self.sent = collections.Counter()
+        self.pages = collections.Counter()
+        self.records = collections.Counter()
+        self.models = collections.Counter()
+        self.model_time = collections.Counter()
+        self.transfers = collections.Counter()
+        self.transferred = collections.Counter()
+
+        self._lock = threading.Lock()
+        self._handlers = {
+            'request': self._request,
+            'error': self._error,
+            'retry': self._retry,
+            'page': self._page,
+            'model': self._model,
+            'transfer': self._transfer,
+        }
+
+        if client is not None:
+            self.attach(client)
+
+    def attach(self, client):
+        """
+        Start collecting the events of a client
+
+        :param client: The client to collect from
+        :type client: :py:class:`fl33t.Fl33tClient`
+        """
+
+        if client in self.clients:
+            return
+
+        for event in EVENTS:
+            client.add_hook(event, self.record)
+        self.clients.append(client)
+
+    def detach(self):
+        """Stop collecting events from every client"""
+
+        for client in self.clients:
+            for event in EVENTS:
+                client.remove_hook(event, self.record)
+        self.clients = []
+
+    def record(self, event, **payload):
+        """
+        Record a single event. This is the hook registered with each client
+
+        :param str event: The name of the event
+        :param payload: The event's details
+        """
+
+        handler = self._handlers.get(event)
+        if handler is None:
+            return
+
+        with self._lock:
+            handler(payload)
+
+    def _request(self, payload):
+        key = (payload['method'], payload['template'])
+        histogram = self.latencies.get(key)
+        if histogram is None:
+            histogram = self.latencies[key] = Histogram(self.buckets)
+        histogram.observe(payload['duration'])
+
+        self.statuses[key + (payload['status_code'],)] += 1
+        self.received[key] += payload['bytes']
+        self.sent[key] += payload.get('sent', 0)
+
+    def _error(self, payload):
+        self.errors[(payload['method'], payload['template'],
+                     type(payload['error']).__name__)] += 1
+
+    def _retry(self, payload):
+        self.retries[payload['operation']] += 1
+
+    def _page(self, payload):
+        self.pages[payload['model']] += 1
+        self.records[payload['model']] += payload['records']
+
+    def _model(self, payload):
+        self.models[payload['model']] += 1
+        self.model_time[payload['model']] += payload['duration']
+
+    def _transfer(self, payload):
+        key = (payload['direction'], payload['success'])
+        self.transfers[key] += 1
+        self.transferred[payload['direction']] += payload['bytes']
+
+    def reset(self):
+        """Forget everything collected so far"""
+
+        with self._lock:
+            self.latencies = {}
+            for counter in (self.statuses, self.errors, self.retries,
+                            self.received, self.sent, self.pages,
+                            self.records, self.models, self.model_time,
+                            self.transfers, self.transferred):
+                counter.clear()
+
+    def snapshot(self):
+        """
+        A consistent copy of everything collected so far
+
+        :returns: dict of `latencies`, mapping each method and URL template
+            to the `buckets` (as :py:meth:`Histogram.cumulative` returns
+            them), `sum` and `count` of its latencies, and copies of the
+            counters, keyed as they are on this collector
+        """
+
+        with self._lock:
+            snapshot = {
+                name: dict(getattr(self, name))
+                for name in ('statuses', 'errors', 'retries', 'received',
+                             'sent', 'pages', 'records', 'models',
+                             'model_time', 'transfers', 'transferred')
+            }
+            snapshot['latencies'] = {
+                key: {'buckets': histogram.cumulative(),
+                      'sum': histogram.sum,
+                      'count': histogram.count}
+                for key, histogram in self.latencies.items()
+            }
+
+        return snapshot
+
+    def summary(self):
+        """
+        A summary of the API requests, grouped by method and URL template
+
+        :returns: list of dicts with the `method`, `template`, `count`,
+            `errors`, `mean`, `p50`, `p95` and `p99` seconds, and `statuses`
+            counts of each group, slowest `p95` first
+        """
+
+        with self._lock:
+            rows = []
+            for (method, template), histogram in self.latencies.items():
+                rows.append({
+                    'method': method,
+                    'template': template,
+                    'count': histogram.count,
+                    'errors': sum(
+                        count for key, count in self.errors.items()
+                        if key[:2] == (method, template)),
+                    'mean': histogram.mean,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                    'p99': histogram.quantile(0.99),
+                    'statuses': {
+                        key[2]: count for key, count in self.statuses.items()
+                        if key[:2] == (method, template)},
+                })
+
+        return sorted(rows, key=lambda row: -row['p95'])
@@ -0,0 +1,342 @@
+"""
+Mirror
+
+A local SQLite copy of a team's trains, builds, fleets, devices and sessions,
+refreshed incrementally, for answering queries without listing everything
+from fl33t
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import time
+
+from fl33t.utils import ExtendedEncoder
+
+# For each collection, the column holding its ID, the columns that are
+# indexed for queries, and the timestamp column `since` queries compare
+COLLECTIONS = {
+    'trains': ('train_id', ['upload_tstamp'], 'upload_tstamp'),
+    'builds': ('build_id', ['train_id', 'version', 'status',
+                            'upload_tstamp'], 'upload_tstamp'),
+    'fleets': ('fleet_id', ['train_id', 'build_id'], None),
+    'devices': ('device_id', ['fleet_id', 'build_id', 'checkin_tstamp'],
+                'checkin_tstamp'),
+    'sessions': ('session_token', ['type'], None),
+}
+
+# Records are stored canonically encoded, so unchanged ones can be skipped
+ENCODER = ExtendedEncoder(sort_keys=True, separators=(',', ':'))
+
+
+class Mirror:
+    """
+    A local SQLite copy of a team's fl33t objects
+
+    :py:meth:`sync` refreshes the mirror. fl33t cannot list only the records
+    changed since a point in time, so each collection's count is checked
+    first, and a collection whose count has not changed since it was last
+    synced, less than `max_age` seconds ago, is skipped. Collections that are
+    listed again only have their new, changed and removed rows written.
+
+    Timestamps such as `checkin_tstamp` are not used to decide what to sync,
+    as they cannot be checked without listing the collection. Changes that
+    keep a collection's count, such as devices checking in or a fleet's
+    build changing, are only seen once it is older than `max_age`, or when
+    syncing with `force`.
+
+    Queries return the records as returned by fl33t, as `dict`, or as models
+    with :py:meth:`models`.
+
+    :param client: The client to sync the mirror with
+    :type client: :py:class:`fl33t.Fl33tClient`
+    :param str path: The SQLite database file. Defaults to an in-memory
+        database
+    :param max_age: The number of seconds after which a collection is listed
+        again even if its count has not changed. Defaults to one hour
+    :type max_age: int or float
+    :param page_size: If provided, the number of records to request per page
+        when listing a collection
+    :type page_size: int or None
+    """
+
+    def __init__(self, client, path=':memory:', *, max_age=3600,
+                 page_size=None):
+        self.client = client
+        self.path = path
+        self.max_age = max_age
+        self.page_size = page_size
+
+        if path != ':memory:' and not os.path.exists(path):
+            # The mirror holds session tokens, so only its owner can read it
+            os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self._create_tables()
+
+    def _create_tables(self):
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS sync_state ('
+                            'collection TEXT PRIMARY KEY, count INTEGER, '
+                            'synced_at REAL)')
+
+            for collection, (id_column, columns, _) in COLLECTIONS.items():
+                self.db.execute(
+                    'CREATE TABLE IF NOT EXISTS {} ({} TEXT PRIMARY KEY, {}, '
+                    'record TEXT NOT NULL)'.format(
+                        collection,
+                        id_column,
+                        ', '.join('{} TEXT'.format(column)
+                                  for column in columns)))
+                for column in columns:
+                    self.db.execute(
+                        'CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})'
+                        .format(collection, column))
+
+    def close(self):
+        """Close the database"""
+
+        self.db.close()
+
+    def sync_state(self, collection):
+        """
+        When a collection was last synced, and what it held
+
+        :param str collection: The name of the collection
+        :returns: dict of `count` and `synced_at` (a UNIX timestamp), or
+            None if it was never synced
+        """
+
+        row = self.db.execute('SELECT count, synced_at '
+                              'FROM sync_state WHERE collection = ?',
+                              (collection,)).fetchone()
+        return dict(row) if row else None
+
+    def _stale(self, collection, count):
+        """Whether a collection must be listed again"""
+
+        state = self.sync_state(collection)
+        return (state is None
+                or state['count'] != count
+                or time.time() - state['synced_at'] >= self.max_age)
+
+    def sync(self, collections=None, *, force=False):
+        """
+        Bring the mirror up to date with fl33t
+
+        :param collections: The collections to sync. Defaults to all of them
+        :type collections: list of str or None
+        :param bool force: If True, list every collection again even if its
+            count has not changed
+        :returns: dict mapping each collection to a `dict` of its `count`,
+            and the number of rows `inserted`, `updated` and `deleted`, or
+            None if it was skipped
+        :raises ValueError: if a collection is not known
+        """
+
+        collections = list(collections or COLLECTIONS)
+        unknown = set(collections) - set(COLLECTIONS)
+        if unknown:
+            raise ValueError('Unknown collections: {}'.format(
+                ', '.join(sorted(unknown))))
+
+        results = {}
+        for collection in collections:
+            count = self.client.count(collection)
+            if force or self._stale(collection, count):
+                results[collection] = self._sync_collection(collection)
+            else:
+                results[collection] = None
+
+        return results
+
+    def _sync_collection(self, collection):
+        """List a collection from fl33t, and write what changed"""
+
+        id_column, columns, _ = COLLECTIONS[collection]
+        existing = dict(self.db.execute(
+            'SELECT {}, record FROM {}'.format(id_column, collection)))
+
+        records = getattr(self.client, 'list_{}'.format(collection))(
+            page_size=self.page_size, raw=True)
+
+        changed = []
+        inserted = 0
+        seen = set()
+        for record in records:
+            record_id = record[id_column]
+            seen.add(record_id)
+
+            encoded = ENCODER.encode(record)
+            if existing.get(record_id) == encoded:
+                continue
+            if record_id not in existing:
+                inserted += 1
+            changed.append([record_id]
+                           + [_column(record.get(column))
+                              for column in columns]
+                           + [encoded])
+
+        deleted = [(record_id,) for record_id in existing
+                   if record_id not in seen]
+        self._write(collection, changed, deleted, len(seen))
+
+        return {
+            'count': len(seen),
+            'inserted': inserted,
+            'updated': len(changed) - inserted,
+            'deleted': len(deleted),
+        }
+
+    def _write(self, collection, changed, deleted, count):
+        """Write the changed and deleted records of a collection, and when
+        it was synced, in one transaction"""
+
+        id_column, columns, _ = COLLECTIONS[collection]
+        with self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO {} ({}, {}, record) '
+                'VALUES ({})'.format(collection,
+                                     id_column,
+                                     ', '.join(columns),
+                                     ', '.join('?' * (len(columns) + 2))),
+                changed)
+            self.db.executemany(
+                'DELETE FROM {} WHERE {} = ?'.format(collection, id_column),
+                deleted)
+            self.db.execute(
+                'INSERT OR REPLACE INTO sync_state '
+                '(collection, count, synced_at) VALUES (?, ?, ?)',
+                (collection, count, time.time()))
+
+    def _where(self, collection, filters, since):
+        """Build the WHERE clause for a query"""
+
+        id_column, columns, tstamp_column = COLLECTIONS[collection]
+        clauses = []
+        params = []
+        for column, value in filters.items():
+            if column != id_column and column not in columns:
+                raise ValueError('{} can only be filtered by: {}'.format(
+                    collection, ', '.join([id_column] + columns)))
+            if value is None:
+                clauses.append('{} IS NULL'.format(column))
+            else:
+                clauses.append('{} = ?'.format(column))
+                params.append(_column(value))
+
+        if since is not None:
+            if not tstamp_column:
+                raise ValueError('{} have no timestamp'.format(collection))
+            clauses.append('{} > ?'.format(tstamp_column))
+            params.append(_column(since))
+
+        where = ' WHERE {}'.format(' AND '.join(clauses)) if clauses else ''
+        return where, params
+
+    def query(self, collection, *, since=None, order_by=None, limit=None,
+              **filters):
+        """
+        Get records from the mirror
+
+        :param str collection: The name of the collection
+        :param since: If provided, only return records whose timestamp, the
+            `upload_tstamp` of trains and builds or the `checkin_tstamp` of
+            devices, is after this
+        :type since: str, :py:class:`datetime.datetime` or None
+        :param order_by: If provided, the indexed column to order by,
+            prefixed with `-` for descending order
+        :type order_by: str or None
+        :param limit: If provided, the number of records to return
+        :type limit: int or None
+        :param filters: Values that indexed columns must equal, e.g.
+            `fleet_id='abc'`
+        :returns: list of dict
+        :raises ValueError: if a filter or order is not on an indexed column
+        """
+
+        where, params = self._where(collection, filters, since)
+
+        order = ''
+        if order_by:
+            column = order_by.lstrip('-')
+            id_column, columns, _ = COLLECTIONS[collection]
+            if column != id_column and column not in columns:
+                raise ValueError('{} can only be ordered by: {}'.format(
+                    collection, ', '.join([id_column] + columns)))
+            order = ' ORDER BY {} {}'.format(
+                column, 'DESC' if order_by.startswith('-') else 'ASC')
+
+        if limit is not None:
+            order += ' LIMIT {:d}'.format(limit)
+
+        return [json.loads(row['record']) for row in self.db.execute(
+            'SELECT record FROM {}{}{}'.format(collection, where, order),
+            params)]
+
+    def models(self, collection, **kwargs):
+        """
+        Get records from the mirror as models
+
+        Accepts the same arguments as :py:meth:`query`.
+
+        :returns: list of the collection's model
+        """
+
+        model = getattr(self.client, collection[:-1].title())
+        return [model(**record) for record in self.query(collection,
+                                                         **kwargs)]
+
+    def get(self, collection, record_id):
+        """
+        Get a single record from the mirror
+
+        :param str collection: The name of the collection
+        :param str record_id: The record's ID
+        :returns: dict or None
+        """
+
+        records = self.query(collection,
+                             **{COLLECTIONS[collection][0]: record_id})
+        return records[0] if records else None
+
+    def count(self, collection, *, since=None, **filters):
+        """
+        Count records in the mirror
+
+        Accepts the same `since` and filters as :py:meth:`query`.
+
+        :param str collection: The name of the collection
+        :returns: int
+        """
+
+        where, params = self._where(collection, filters, since)
+        return self.db.execute('SELECT COUNT(*) FROM {}{}'.format(
+            collection, where), params).fetchone()[0]
+
+    def sql(self, query, params=()):
+        """
+        Run an SQL query against the mirror's tables
+
+        Each table has its ID column, its indexed columns, and a `record`
+        column holding the record as JSON.
+
+        :param str query: The SQL query
+        :param params: The query's parameters
+        :returns: list of :py:class:`sqlite3.Row`
+        """
+
+        return self.db.execute(query, params).fetchall()
+
+
+def _column(value):
+    """Format timestamps the way fl33t returns them, so that they compare
+    correctly with the stored ones"""
+
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc)
+        return value.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return value
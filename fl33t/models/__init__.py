@@ -6,8 +6,33 @@ All the models in use by Fl33t
 
 """
 
-from fl33t.models.build import Build # noqa
-from fl33t.models.device import Device # noqa
-from fl33t.models.fleet import Fleet # noqa
-from fl33t.models.session import Session # noqa
-from fl33t.models.train import Train # noqa
+import importlib
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # pragma: no cover
+    # Only for linters and type checkers, the models are loaded lazily below
+    from fl33t.models.build import Build
+    from fl33t.models.device import Device
+    from fl33t.models.fleet import Fleet
+    from fl33t.models.session import Session
+    from fl33t.models.train import Train
+
+_MODELS = {
+    'Build': 'fl33t.models.build',
+    'Device': 'fl33t.models.device',
+    'Fleet': 'fl33t.models.fleet',
+    'Session': 'fl33t.models.session',
+    'Train': 'fl33t.models.train',
+}
+
+__all__ = ['Build', 'Device', 'Fleet', 'Session', 'Train']
+
+
+def __getattr__(name):
+    # Each model is only imported when first used
+    if name in _MODELS:
+        return getattr(importlib.import_module(_MODELS[name]), name)
+
+    raise AttributeError('module {} has no attribute {}'.format(
+        __name__, name))
@@ -7,9 +7,9 @@ Has all common methods for fl33t models
 import datetime
 import json
 import logging
+import time
 
 from abc import ABC, abstractmethod, abstractproperty
-from dateutil import parser
 
 from fl33t.exceptions import (
     Fl33tApiException,
@@ -19,6 +19,21 @@ from fl33t.exceptions import (
 from fl33t.utils import ExtendedEncoder
 
 
+def parse_timestamp(value):
+    """
+    Parse a timestamp returned by fl33t
+
+    `dateutil` is only imported the first time a timestamp is parsed, so
+    that it does not slow down importing the models.
+
+    :param str value: The timestamp to parse
+    :returns: :py:class:`datetime.datetime`
+    """
+
+    from dateutil import parser  # pylint: disable=import-outside-toplevel
+    return parser.parse(value)
+
+
 class BaseModel(ABC):
     """The base model from which all fl33t models should be extended"""
 
@@ -31,10 +46,13 @@ class BaseModel(ABC):
     _enums = {}
     _client = None
 
+    # Shared by every model, rather than looked up for each one constructed
+    logger = logging.getLogger(__name__)
+
     def __init__(self, client=None, **kwargs):
+        started = time.monotonic()
         self._client = client
 
-        self.logger = logging.getLogger(__name__)
         for key, default in self._defaults.items():
             if key not in kwargs:
                 setattr(self, key, default)
@@ -47,6 +65,22 @@ class BaseModel(ABC):
             raise AttributeError('{} is not a valid attribute of {}'.format(
                 key, self.__class__.__name__))
 
+        if client is not None:
+            client._emit(  # pylint: disable=protected-access
+                'model',
+                model=self.__class__.__name__,
+                duration=time.monotonic() - started)
+
+    @classmethod
+    def fields(cls):
+        """
+        The names of every field of this model, as fl33t returns them
+
+        :returns: list of str
+        """
+
+        return list(cls._defaults)
+
     def to_json(self):
         """Dumps this model as JSON for use in API calls"""
 
@@ -86,7 +120,7 @@ class BaseModel(ABC):
                 elif isinstance(value, datetime.datetime):
                     setattr(self, key, value)
                 else:
-                    setattr(self, key, parser.parse(value))
+                    setattr(self, key, parse_timestamp(value))
             except Exception:
                 raise ValueError('{} MUST be an instance of'
                                  ' datetime.datetime or be machine'
@@ -153,13 +187,21 @@ class BaseModel(ABC):
         if not self._client:
             raise Fl33tClientException()
 
-        result = self._client.put(self.self_url, data=self)
+        try:
+            result = self._client.put(self.self_url, data=self)
+        finally:
+            # Whether or not the update succeeded, what is cached may no
+            # longer match fl33t
+            # pylint: disable=protected-access
+            self._client._invalidate_cached(self.__class__.__name__.lower(),
+                                            self.id)
+
         if result.status_code in (400, 404):
             raise self._invalid_id(self.id)
 
         if result.status_code != 204:
-            self.logger.warning('Received {}: {}'.format(
-                result.status_code, result.text))
+            self.logger.warning('Received %s: %s', result.status_code,
+                                result.text)
             return False
 
         return self
@@ -185,10 +227,13 @@ class BaseModel(ABC):
             raise self._invalid_id(self.id)
 
         if result.status_code != 204:
-            self.logger.warning('Received {}: {}'.format(
-                result.status_code, result.text))
+            self.logger.warning('Received %s: %s', result.status_code,
+                                result.text)
             return False
 
+        self._client._invalidate_cached(  # pylint: disable=protected-access
+            self.__class__.__name__.lower(), self.id)
+
         return True
 
     def create(self):
@@ -216,7 +261,7 @@ class BaseModel(ABC):
             raise Fl33tApiException(result.text)
 
         if class_name not in result.json():
-            self.logger.exception('Could not create {}'.format(class_name))
+            self.logger.exception('Could not create %s', class_name)
             return False
 
         data = result.json()[class_name]
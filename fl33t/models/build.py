@@ -4,20 +4,25 @@ Build model
 
 """
 
+import contextlib
 import datetime
 import os
-
-import requests
+import tempfile
 
 from fl33t.exceptions import (
     Fl33tClientException,
-    BuildUploadError,
+    BuildDownloadError,
+    DuplicateBuildError,
     InvalidBuildIdError,
     NoUploadUrlProvidedError
 )
 from fl33t.models.base import BaseModel
 from fl33t.models.mixins import OneTrainMixin
-from fl33t.utils import md5
+from fl33t.utils import BufferReader, md5, md5_buffer, md5_stream
+
+# Non-seekable build streams are held in memory up to this size while being
+# hashed, and spooled to a temporary file beyond it
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
 
 
 # pylint: disable=no-member
@@ -50,20 +55,129 @@ class Build(BaseModel, OneTrainMixin):
     }
 
     fullpath = None
+    fileobj = None
+    duplicate = False
+    _fileobj_start = 0
+    _spool = None
 
     def __init__(self, client=None, **kwargs):
+        fileobj = kwargs.pop('fileobj', None)
+        if fileobj is not None:
+            self._set_fileobj(fileobj, kwargs)
+
         # need to have both the full path, if provided and the basename to
         # the build file
-        if 'filename' in kwargs and kwargs['filename']:
+        elif 'filename' in kwargs and kwargs['filename']:
             self.fullpath = kwargs.get('filename')
             kwargs['filename'] = os.path.basename(self.fullpath)
-            if 'md5sum' not in kwargs:
+            if not kwargs.get('md5sum'):
                 kwargs['md5sum'] = md5(self.fullpath)
             if 'size' not in kwargs:
                 kwargs['size'] = os.path.getsize(self.fullpath)
 
         super().__init__(client=client, **kwargs)
 
+    def _set_fileobj(self, fileobj, kwargs):
+        """
+        Use an in-memory buffer or file-like object as the build file
+
+        Buffers are hashed in place. Seekable streams are hashed and then
+        rewound, and other streams are spooled while being hashed so that
+        they can be read again for the upload.
+        """
+
+        filename = kwargs.get('filename') or getattr(fileobj, 'name', None)
+        if not filename or not isinstance(filename, str):
+            raise ValueError('filename MUST be set when creating a build '
+                             'from a buffer or stream')
+        kwargs['filename'] = os.path.basename(filename)
+
+        if isinstance(fileobj, (bytes, bytearray, memoryview)):
+            self.fileobj = memoryview(fileobj).cast('B')
+            if not kwargs.get('md5sum'):
+                kwargs['md5sum'] = md5_buffer(self.fileobj)
+            kwargs.setdefault('size', self.fileobj.nbytes)
+            return
+
+        seekable = getattr(fileobj, 'seekable', None)
+        if seekable and seekable():
+            self.fileobj = fileobj
+            self._fileobj_start = fileobj.tell()
+            if not kwargs.get('md5sum') or 'size' not in kwargs:
+                md5sum, size = md5_stream(fileobj)
+                fileobj.seek(self._fileobj_start)
+                if not kwargs.get('md5sum'):
+                    kwargs['md5sum'] = md5sum
+                kwargs.setdefault('size', size)
+            return
+
+        if kwargs.get('md5sum') and 'size' in kwargs:
+            # Everything is already known, so the stream can be passed
+            # straight through to the upload, which may only happen once
+            self.fileobj = fileobj
+            return
+
+        # The spool is kept open for the upload, and closed by close(), or
+        # here if hashing the stream fails
+        with contextlib.ExitStack() as stack:
+            spool = stack.enter_context(
+                tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE))
+            md5sum, size = md5_stream(fileobj, spool=spool)
+            spool.seek(0)
+            stack.pop_all()
+        self.fileobj = self._spool = spool
+        if not kwargs.get('md5sum'):
+            kwargs['md5sum'] = md5sum
+        kwargs.setdefault('size', size)
+
+    @contextlib.contextmanager
+    def _open_build_file(self):
+        """Open the build file contents for reading, from the start"""
+
+        if self.fileobj is None:
+            with open(self.fullpath, 'rb') as build_file:
+                yield build_file
+
+        elif isinstance(self.fileobj, memoryview):
+            yield BufferReader(self.fileobj)
+
+        else:
+            seekable = getattr(self.fileobj, 'seekable', None)
+            if seekable and seekable():
+                self.fileobj.seek(self._fileobj_start)
+            yield self.fileobj
+
+    def close(self):
+        """
+        Release the temporary copy of a build file that was streamed in
+
+        The copy is kept until the build is created, or this is called, so
+        that a failed upload can be retried with :py:meth:`create`. Files
+        and streams passed in are left open. A build can also be used as a
+        context manager, which calls this on exit.
+        """
+
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+            self.fileobj = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def _rewindable(self):
+        """Can the build file be read more than once?"""
+
+        if self.fileobj is None or isinstance(self.fileobj, memoryview):
+            return True
+
+        seekable = getattr(self.fileobj, 'seekable', None)
+        return bool(seekable and seekable())
+
     def __str__(self):
         return ('Build {}: {} (Status: {}, Released: {}, Train: {}, Size: {},'
                 ' Uploaded: {})'.format(
@@ -121,10 +235,24 @@ class Build(BaseModel, OneTrainMixin):
             'build'
         ))
 
-    def create(self):
+    def _link_to(self, build):
+        """Take on the state of an identical build already in fl33t"""
+
+        for key in self._defaults:
+            if key == 'filename':
+                continue
+            setattr(self, key, getattr(build, key))
+
+        self.duplicate = True
+
+    def create(self, *, skip_duplicate=False):
         """
         Create this build record in fl33t and upload the new build file
 
+        :param bool skip_duplicate: If True, and a build with the same MD5
+            hash is already available in this build's train, no build is
+            created or uploaded. Instead, this object is linked to the
+            existing build and :py:attr:`duplicate` is set.
         :returns: :py:class:`self` on success, or False on failure
         :raises UnprivilegedToken: if the session token does not have enough
             privilege to perform this action
@@ -135,15 +263,37 @@ class Build(BaseModel, OneTrainMixin):
             API did not include an upload URL
         :raises BuildUploadError: if an error occurred when uploading the
             firmware file to the fl33t provided upload URL
+        :raises DuplicateBuildError: if `skip_duplicate` is True, and the
+            identical build has another version or release than this one
         """
 
         if not self._client:
             raise Fl33tClientException()
 
+        if skip_duplicate:
+            existing = self._client.find_duplicate_build(self.train_id,
+                                                         self.md5sum)
+            if existing:
+                # Linking would silently drop the version and release asked
+                # for
+                if (existing.version, bool(existing.released)) != (
+                        self.version, bool(self.released)):
+                    raise DuplicateBuildError(
+                        'An identical build already exists as {}, with '
+                        'version {} and {}'.format(
+                            existing.build_id, existing.version,
+                            'released' if existing.released
+                            else 'unreleased'))
+                self.logger.info('Build %s already exists as %s',
+                                 self.version, existing.build_id)
+                self._link_to(existing)
+                self.close()
+                return self
+
         result = self._client.post(self.base_url, data=self)
         if 'build' not in result.json():
-            self.logger.exception(
-                'Could not create build for: {}'.format(self.version))
+            self.logger.exception('Could not create build for: %s',
+                                  self.version)
             return False
 
         data = result.json()['build']
@@ -164,17 +314,110 @@ class Build(BaseModel, OneTrainMixin):
             'Content-Disposition': 'attachment; filename="{}"'.format(
                 self.filename)
         }
-        with open(self.fullpath, 'rb') as build_file:
-            # Must use requests directly as we do not want the normal fl33t
-            # API headers to be added to the upload request. The upload_url is
-            # a pre-signed URL and as such has all authentication built-in.
-            response = requests.put(
-                self.upload_url,
-                data=build_file.read(),
-                headers=headers)
-
-            # Any non-200 status is an error with the upload.
-            if not response or response.status_code != 200:
-                raise BuildUploadError()
+        # The upload_url is a pre-signed URL and as such has all
+        # authentication built-in, so the upload does not go through the
+        # normal fl33t API request handling. The file is streamed, rather than
+        # read into memory first.
+        self._client.upload(
+            self.upload_url,
+            self._open_build_file,
+            size=self.size,
+            headers=headers,
+            build_id=self.build_id,
+            retryable=self._rewindable)
+        self.close()
+
+        self._client.add_to_build_index(self)
 
         return self
+
+    def download(self, destination):
+        """
+        Download this build's file from fl33t
+
+        The download is checked against this build's MD5 hash. When
+        downloading to a path, the file is only moved into place once it has
+        been completely downloaded and verified.
+
+        :param destination: The path to save the build file to, or a
+            writable binary file-like object
+        :type destination: str or file-like object
+        :returns: int, the number of bytes downloaded
+        :raises BuildDownloadError: if the download failed, or did not match
+            this build's MD5 hash
+        :raises UnprivilegedToken: if the session token does not have enough
+            privilege to perform this action
+        :raises Fl33tApiException: if there was a 5xx error returned by fl33t
+        :raises Fl33tClientException: if the model was instantiated without a
+            :py:class:`fl33t.Fl33tClient`
+        """
+
+        if not self._client:
+            raise Fl33tClientException()
+
+        # Download URLs are only valid for a few minutes, so always use a
+        # fresh one
+        build = self._client.get_build(self.build_id)
+        if not build.download_url:
+            raise BuildDownloadError(
+                'Build {} has no file available to download'.format(
+                    self.build_id))
+
+        if isinstance(destination, str):
+            partial = '{}.part'.format(destination)
+
+            @contextlib.contextmanager
+            def open_destination():
+                with open(partial, 'wb') as partial_file:
+                    yield partial_file
+
+            try:
+                size = self._client.download(build.download_url,
+                                             open_destination,
+                                             md5sum=build.md5sum,
+                                             build_id=self.build_id)
+            except BuildDownloadError:
+                if os.path.exists(partial):
+                    os.remove(partial)
+                raise
+
+            os.replace(partial, destination)
+            return size
+
+        start = destination.tell() if destination.seekable() else None
+        attempts = []
+
+        @contextlib.contextmanager
+        def rewind_destination():
+            if start is not None:
+                destination.seek(start)
+                destination.truncate()
+            elif attempts:
+                raise BuildDownloadError(
+                    'The download failed part way through, and the '
+                    'destination cannot be rewound to retry it')
+            attempts.append(True)
+            yield destination
+
+        return self._client.download(build.download_url,
+                                     rewind_destination,
+                                     md5sum=build.md5sum,
+                                     build_id=self.build_id)
+
+    def delete(self):
+        """
+        Delete this build from fl33t
+
+        :returns: True on success, or False on failure
+        :raises UnprivilegedToken: if the session token does not have enough
+            privilege to perform this action
+        :raises Fl33tApiException: if there was a 5xx error returned by fl33t
+        :raises Fl33tClientException: if the model was instantiated without a
+            :py:class:`fl33t.Fl33tClient`
+        """
+
+        result = super().delete()
+        if result:
+            self._client.remove_from_build_index(self)
+
+        return result
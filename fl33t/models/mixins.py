@@ -19,7 +19,19 @@ class ManyBuildsMixin:  # pylint: disable=too-few-public-methods
     """For models with child builds"""
 
     def builds(self, *, offset=None, limit=None):
-        """Return the child builds"""
+        """
+        Return the child builds
+
+        When the client's cache is enabled, and neither `offset` nor `limit`
+        are given, the complete list of builds is fetched once and cached.
+        """
+        cache = self._client.cache
+        if cache is not None and offset is None and limit is None:
+            return cache.get_or_fetch(
+                ('builds', self.train_id),
+                lambda: list(self._client.list_builds(
+                    train_id=self.train_id)))
+
         return self._client.list_builds(train_id=self.train_id,
                                         offset=offset,
                                         limit=limit)
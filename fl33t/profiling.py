@@ -0,0 +1,230 @@
+"""
+Profiling
+
+Records where the time goes in a series of client calls, from the client's
+`request`, `transfer` and `model` events
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+EVENTS = ['request', 'transfer', 'model']
+
+
+class Profiler:
+    """
+    Collects the timings of the API requests, build transfers and model
+    construction made through a client
+
+    :param client: The client to profile. Can also be given later with
+        :py:meth:`attach`
+    :type client: :py:class:`fl33t.Fl33tClient` or None
+    """
+
+    def __init__(self, client=None):
+        self.started = time.monotonic()
+        self.finished = None
+        self.events = []
+        self.clients = []
+        self._lock = threading.Lock()
+
+        if client is not None:
+            self.attach(client)
+
+    def attach(self, client):
+        """
+        Start recording the events of a client
+
+        :param client: The client to profile
+        :type client: :py:class:`fl33t.Fl33tClient`
+        """
+
+        if client in self.clients:
+            return
+
+        for event in EVENTS:
+            client.add_hook(event, self.record)
+        self.clients.append(client)
+
+    def detach(self):
+        """Stop recording events from every client"""
+
+        for client in self.clients:
+            for event in EVENTS:
+                client.remove_hook(event, self.record)
+        self.clients = []
+
+    def stop(self):
+        """Stop recording, and mark the end of the profiled time"""
+
+        self.detach()
+        self.finished = time.monotonic()
+
+    def record(self, event, **payload):
+        """
+        Record a single event. This is the hook registered with each client
+
+        :param str event: The name of the event
+        :param payload: The event's details, including its `duration`
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            self.events.append((event, now - payload['duration'],
+                                threading.get_ident(), payload))
+
+    @property
+    def wall_time(self):
+        """The number of seconds between starting and stopping profiling"""
+
+        return (self.finished or time.monotonic()) - self.started
+
+    def _total(self, event):
+        return sum(payload['duration']
+                   for name, _, _, payload in self.events
+                   if name == event)
+
+    def summary(self):
+        """
+        A summary of the recorded timings
+
+        :returns: dict with `requests` rows, of the API requests and build
+            transfers grouped by method and URL template, `models` rows,
+            grouped by model, and
+            the `network`, `model_time` and `wall` total seconds
+        """
+
+        requests = collections.OrderedDict()
+        models = collections.OrderedDict()
+        for event, _, _, payload in self.events:
+            if event == 'model':
+                row = models.setdefault(payload['model'], {
+                    'model': payload['model'], 'count': 0, 'total': 0.0})
+            else:
+                if event == 'request':
+                    key = (payload['method'], payload['template'])
+                else:
+                    key = (payload['direction'].upper(), '(build file)')
+                row = requests.setdefault(key, {
+                    'method': key[0], 'template': key[1], 'count': 0,
+                    'total': 0.0, 'max': 0.0, 'bytes': 0, 'retries': 0,
+                    'statuses': collections.Counter()})
+                row['max'] = max(row['max'], payload['duration'])
+                row['bytes'] += payload['bytes']
+                # Only build transfers are retried
+                row['retries'] += payload.get('retries', 0)
+                row['statuses'][payload['status_code']] += 1
+
+            row['count'] += 1
+            row['total'] += payload['duration']
+
+        return {
+            'requests': list(requests.values()),
+            'models': list(models.values()),
+            'network': self._total('request') + self._total('transfer'),
+            'model_time': self._total('model'),
+            'wall': self.wall_time,
+        }
+
+    def format_summary(self):
+        """
+        The summary of the recorded timings, as a table
+
+        :returns: str
+        """
+
+        summary = self.summary()
+        lines = ['{:<7} {:<40} {:>6} {:>10} {:>10} {:>10} {:>8}  {}'.format(
+            'METHOD', 'URL', 'COUNT', 'TOTAL ms', 'MEAN ms', 'MAX ms',
+            'KB', 'STATUS')]
+        for row in summary['requests']:
+            lines.append(
+                '{:<7} {:<40} {:>6} {:>10.1f} {:>10.1f} {:>10.1f} {:>8.1f}  '
+                '{}{}'.format(
+                    row['method'], row['template'], row['count'],
+                    row['total'] * 1000, row['total'] * 1000 / row['count'],
+                    row['max'] * 1000, row['bytes'] / 1024,
+                    ','.join('{}x{}'.format(count, status) for status, count
+                             in sorted(row['statuses'].items(),
+                                       key=lambda item: str(item[0]))),
+                    ' ({} retries)'.format(row['retries'])
+                    if row['retries'] else ''))
+
+        lines.append('')
+        for row in summary['models']:
+            lines.append('{:<48} {:>6} {:>10.1f}'.format(
+                '{} models'.format(row['model']), row['count'],
+                row['total'] * 1000))
+
+        # Concurrent requests overlap, so their total can exceed wall time
+        other = max(summary['wall'] - summary['network']
+                    - summary['model_time'], 0.0)
+        lines.extend([
+            '',
+            'Network: {:.1f} ms, models: {:.1f} ms, other: {:.1f} ms, '
+            'total: {:.1f} ms'.format(summary['network'] * 1000,
+                                      summary['model_time'] * 1000,
+                                      other * 1000,
+                                      summary['wall'] * 1000),
+        ])
+
+        return '\n'.join(lines)
+
+    def chrome_trace(self, name='fl33t'):
+        """
+        The recorded events in the Chrome trace event format, which can be
+        loaded in `chrome://tracing` or Perfetto
+
+        :param str name: The name of the event spanning the whole profile
+        :returns: dict
+        """
+
+        pid = os.getpid()
+        trace = [{
+            'name': name,
+            'cat': 'command',
+            'ph': 'X',
+            'ts': 0,
+            'dur': round(self.wall_time * 1e6, 3),
+            'pid': pid,
+            'tid': threading.main_thread().ident,
+        }]
+
+        for event, started, thread, payload in self.events:
+            if event == 'request':
+                label = '{} {}'.format(payload['method'], payload['template'])
+            elif event == 'transfer':
+                label = 'build {}'.format(payload['direction'])
+            else:
+                label = payload['model']
+
+            trace.append({
+                'name': label,
+                'cat': event,
+                'ph': 'X',
+                'ts': round((started - self.started) * 1e6, 3),
+                'dur': round(payload['duration'] * 1e6, 3),
+                'pid': pid,
+                'tid': thread,
+                'args': {
+                    # Build file URLs are signed, so their query is left out
+                    key: value.split('?')[0] if key == 'url' else value
+                    for key, value in payload.items() if key != 'duration'
+                },
+            })
+
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path, name='fl33t'):
+        """
+        Write the recorded events to a Chrome trace JSON file
+
+        :param str path: The file to write
+        :param str name: The name of the event spanning the whole profile
+        """
+
+        with open(path, 'w', encoding='utf-8') as trace_file:
+            json.dump(self.chrome_trace(name), trace_file)
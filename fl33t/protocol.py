@@ -0,0 +1,238 @@
+"""
+Protocol
+
+The fl33t API protocol without any I/O: building the requests the client
+sends, and turning the responses received into records or exceptions, so
+that any :py:mod:`fl33t.transports` transport can carry them
+"""
+
+import collections
+import json
+import logging
+
+from urllib.parse import urlencode, urlsplit, urlunsplit
+
+from fl33t.exceptions import Fl33tApiException, UnprivilegedToken
+
+ENDPOINT_FAILED_MSG = 'The fl33t endpoint for {} returned an invalid response'
+
+# Client errors that callers handle themselves: 400 and 404 for invalid IDs,
+# and 409 for duplicate IDs
+HANDLED_STATUSES = (400, 404, 409)
+
+Request = collections.namedtuple(
+    'Request', ['method', 'url', 'params', 'headers', 'body'])
+Request.__doc__ = """
+A request to send to fl33t
+
+`params` is a `dict` of query parameters, kept apart from the `url` so that
+transports can encode them as they need, and `body` is the encoded body, or
+None.
+"""
+
+
+class Response:
+    """
+    A response received from fl33t, or from a pre-signed URL
+
+    :param int status_code: The HTTP status code
+    :param headers: The response headers, ideally case insensitive
+    :type headers: dict or None
+    :param bytes content: The response body
+    :param url: The URL that was requested
+    :type url: str or None
+    """
+
+    def __init__(self, status_code, headers=None, content=b'', url=None):
+        self.status_code = status_code
+        self.headers = headers if headers is not None else {}
+        self.content = content or b''
+        self.url = url
+        self._json = None
+
+    def __repr__(self):
+        return '<Response [{}]>'.format(self.status_code)
+
+    @property
+    def ok(self):  # pylint: disable=invalid-name
+        """True if the status code is not an error"""
+
+        return self.status_code < 400
+
+    @property
+    def encoding(self):
+        """The charset of the body, from its `Content-Type`, or UTF-8"""
+
+        content_type = self.headers.get('Content-Type') \
+            or self.headers.get('content-type') or ''
+        for parameter in content_type.split(';')[1:]:
+            name, _, value = parameter.strip().partition('=')
+            if name.lower() == 'charset' and value:
+                return value.strip('"\'')
+        return 'utf-8'
+
+    @property
+    def text(self):
+        """The body, decoded"""
+
+        return self.content.decode(self.encoding, errors='replace')
+
+    def json(self):
+        """
+        The body, decoded from JSON. The result is kept, so calling this again
+        does not decode the body again
+
+        :raises ValueError: if the body is not JSON
+        """
+
+        if self._json is None:
+            self._json = json.loads(self.text)
+        return self._json
+
+
+# pylint: disable=too-many-arguments
+def build_request(method, url, token, *, params=None, data=None,
+                  headers=None):
+    """
+    Build an authenticated request to the fl33t API
+
+    :param str method: The request method
+    :param str url: The URL to request
+    :param str token: The session token to authenticate with
+    :param params: If provided, the query parameters
+    :type params: dict or None
+    :param data: If provided, the body, as a model, a `str` or `bytes`
+    :type data: :py:class:`fl33t.models.base.BaseModel`, str, bytes or None
+    :param headers: If provided, headers to send, which take precedence over
+        the default ones
+    :type headers: dict or None
+    :returns: :py:class:`Request`
+    """
+
+    request_headers = {
+        'Authorization': 'Bearer {}'.format(token),
+        'Content-Type': 'application/json',
+        'Accept': 'application/json',
+    }
+    request_headers.update(headers or {})
+
+    if hasattr(data, 'to_json'):
+        data = data.to_json()
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    return Request(method.upper(), url, dict(params or {}), request_headers,
+                   data or None)
+
+
+def full_url(request):
+    """
+    The URL of a request, with its query parameters encoded into it
+
+    :param request: The request
+    :type request: :py:class:`Request`
+    :returns: str
+    """
+
+    if not request.params:
+        return request.url
+
+    scheme, netloc, path, query, fragment = urlsplit(request.url)
+    params = urlencode([(key, value)
+                        for key, value in request.params.items()
+                        if value is not None], doseq=True)
+    return urlunsplit((scheme, netloc, path,
+                       '&'.join(part for part in (query, params) if part),
+                       fragment))
+
+
+def check_response(request, response):
+    """
+    Raise the exception matching an error response from fl33t
+
+    Responses with a 400, 404 or 409 status are returned, for the caller to
+    raise the error that fits, and other client errors are logged.
+
+    :param request: The request that was sent
+    :type request: :py:class:`Request`
+    :param response: The response received
+    :type response: :py:class:`Response`
+    :returns: :py:class:`Response`, the response
+    :raises UnprivilegedToken: if the session token does not have enough
+        privilege to perform the request
+    :raises Fl33tApiException: if there was a 5xx error returned by fl33t
+    """
+
+    status_code = response.status_code
+    if status_code < 400 or status_code in HANDLED_STATUSES:
+        return response
+
+    if status_code in (401, 403):
+        raise UnprivilegedToken(request.url)
+
+    if status_code >= 500:
+        raise Fl33tApiException('{} returned a {} error: {}'.format(
+            request.url, status_code, response.text))
+
+    logging.getLogger(__name__).error(
+        '%s %s returned an unexpected %s error: %s', request.method,
+        request.url, status_code, response.text)
+    return response
+
+
+def parse_object(response, key, *, invalid=None, what=None):
+    """
+    Get the record of a single object from a response
+
+    :param response: The response received
+    :type response: :py:class:`Response`
+    :param str key: The key the record is under, such as `fleet`
+    :param invalid: If provided, the exception to raise if the object does
+        not exist
+    :type invalid: Exception or None
+    :param what: If provided, what was requested, for the error message.
+        Defaults to the `key`'s retrieval
+    :type what: str or None
+    :returns: dict
+    :raises Fl33tApiException: if the response does not hold the record
+    """
+
+    if invalid is not None and response.status_code in (400, 404):
+        raise invalid
+
+    try:
+        data = response.json()
+    except ValueError:
+        data = None
+
+    if not isinstance(data, dict) or key not in data:
+        raise Fl33tApiException(ENDPOINT_FAILED_MSG.format(
+            what or '{} retrieval'.format(key)))
+
+    return data[key]
+
+
+def parse_page(response, model_name, what):
+    """
+    Get the records, and the total number of records, from a page of a
+    listing
+
+    :param response: The response received
+    :type response: :py:class:`Response`
+    :param str model_name: The name of the listed model, such as `fleet`
+    :param str what: What was requested, for the error message
+    :returns: tuple of the `list` of records, and the total number of records
+        as an `int`, or None if fl33t did not count them
+    :raises Fl33tApiException: if the response does not hold the records
+    """
+
+    try:
+        data = response.json()
+    except ValueError:
+        data = None
+
+    plural_model = '{}s'.format(model_name)
+    if not isinstance(data, dict) or plural_model not in data:
+        raise Fl33tApiException(ENDPOINT_FAILED_MSG.format(what))
+
+    return data[plural_model], data.get('{}_count'.format(model_name))
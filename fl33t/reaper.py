@@ -0,0 +1,372 @@
+"""
+Reaper
+
+Finds devices that have not checked in to fl33t for a long time, and deletes
+them concurrently, at a limited rate, keeping a journal so that an
+interrupted run can resume without scanning every device again
+"""
+
+import collections
+import json
+import logging
+import os
+import re
+
+from datetime import datetime, timedelta, timezone
+
+from fl33t.exceptions import InvalidIdError
+from fl33t.transfer import TokenBucket
+from fl33t.utils import concurrent_map, timestamp_before
+
+JOURNAL_VERSION = 1
+
+DURATION_UNITS = {
+    '': 1,
+    's': 1,
+    'm': 60,
+    'h': 3600,
+    'd': 86400,
+    'w': 604800,
+}
+
+StaleDevice = collections.namedtuple(
+    'StaleDevice', ['device_id', 'fleet_id', 'checkin_tstamp'])
+StaleDevice.__doc__ = """
+A device that has not checked in since the cutoff, with its last check in as
+returned by fl33t
+"""
+
+
+def parse_duration(value):
+    """
+    Parse a human readable duration, such as `90d`, `12h` or `3600`
+
+    :param str value: The duration, in seconds, or with an `s`, `m`, `h`,
+        `d` or `w` suffix
+    :returns: :py:class:`datetime.timedelta`
+    :raises ValueError: if the duration cannot be parsed
+    """
+
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*$', str(value),
+                     re.IGNORECASE)
+    if not match:
+        raise ValueError('{} is not a valid duration'.format(value))
+
+    return timedelta(seconds=float(match.group(1))
+                     * DURATION_UNITS[match.group(2).lower()])
+
+
+def _describe_thresholds(thresholds):
+    parts = ['older than {:g}s'.format(thresholds['older_than'])]
+    for fleet_id, seconds in sorted(
+            thresholds.get('fleet_thresholds', {}).items()):
+        parts.append('{:g}s for fleet {}'.format(seconds, fleet_id))
+    return ', '.join(parts)
+
+
+class Reaper:
+    """
+    Deletes devices that have not checked in for longer than a threshold
+
+    :py:meth:`scan` streams the devices of the team, or of the given fleets,
+    and yields those whose `checkin_tstamp` is older than `older_than`, or
+    than the fleet's own threshold in `fleet_thresholds`. Devices that have
+    never checked in are left alone.
+
+    :py:meth:`run` writes every stale device to the `journal`, a JSON lines
+    file, before deleting them `workers` at a time and no more than `rate`
+    per second, recording each deletion in the journal. Running again with
+    the same journal resumes the deletions without scanning again, using the
+    cutoffs of the first run. As the journal may be old by then, each device
+    is looked up again before it is deleted, and kept if it has checked in
+    since. A journal written with other thresholds, or for other fleets, is
+    refused. Once every
+    stale device has been deleted, the journal is removed.
+
+    :param client: The client to list and delete devices with
+    :type client: :py:class:`fl33t.Fl33tClient`
+    :param older_than: Devices that have not checked in for this long are
+        stale
+    :type older_than: :py:class:`datetime.timedelta`
+    :param fleet_ids: If provided, only look at the devices in these fleets
+    :type fleet_ids: list of str or None
+    :param fleet_thresholds: If provided, a mapping of fleet IDs to the
+        :py:class:`datetime.timedelta` used for their devices instead of
+        `older_than`
+    :type fleet_thresholds: dict or None
+    :param journal: If provided, the journal file
+    :type journal: str or None
+    :param rate: If provided, the most devices deleted per second
+    :type rate: int, float or None
+    :param int workers: The number of devices to delete at once
+    :param page_size: If provided, the number of records to request per page
+    :type page_size: int or None
+    """
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    def __init__(self, client, older_than, *, fleet_ids=None,
+                 fleet_thresholds=None, journal=None, rate=None, workers=8,
+                 page_size=None):
+        self.client = client
+        self.older_than = older_than
+        self.fleet_ids = list(fleet_ids or [])
+        self.fleet_thresholds = dict(fleet_thresholds or {})
+        self.journal = journal
+        self.bucket = TokenBucket(rate) if rate else None
+        self.workers = workers
+        self.page_size = page_size
+        self.logger = logging.getLogger(__name__)
+
+        now = datetime.now(timezone.utc)
+        self.cutoffs = {
+            fleet_id: now - threshold
+            for fleet_id, threshold in self.fleet_thresholds.items()
+        }
+        self.cutoff = now - older_than
+        self._recheck = False
+
+    def _cutoff(self, fleet_id):
+        return self.cutoffs.get(fleet_id, self.cutoff)
+
+    def scan(self):
+        """
+        Stream the stale devices
+
+        :yields: :py:class:`StaleDevice`
+        """
+
+        for fleet_id in self.fleet_ids or [None]:
+            for record in self.client.list_devices(
+                    fleet_id=fleet_id, page_size=self.page_size, raw=True):
+                checkin = record.get('checkin_tstamp')
+                if checkin and timestamp_before(
+                        checkin, self._cutoff(record.get('fleet_id'))):
+                    yield StaleDevice(record['device_id'],
+                                      record.get('fleet_id'), checkin)
+
+    def _header(self):
+        return {
+            'reaper': JOURNAL_VERSION,
+            'team_id': self.client.team_id,
+            'cutoff': self.cutoff.isoformat(),
+            'cutoffs': {fleet_id: cutoff.isoformat()
+                        for fleet_id, cutoff in self.cutoffs.items()},
+            'fleet_ids': self.fleet_ids,
+            'thresholds': self._thresholds(),
+        }
+
+    def _thresholds(self):
+        return {
+            'older_than': self.older_than.total_seconds(),
+            'fleet_thresholds': {
+                fleet_id: threshold.total_seconds()
+                for fleet_id, threshold in self.fleet_thresholds.items()},
+        }
+
+    def _resume(self, header):
+        """Take the cutoffs of the run that wrote a journal, if it used the
+        same thresholds and fleets
+
+        :raises ValueError: if the journal's thresholds or fleets differ
+        """
+
+        fleet_ids = header.get('fleet_ids') or []
+        if sorted(fleet_ids) != sorted(self.fleet_ids):
+            raise ValueError(
+                '{} was written for other fleets ({}). Run with the same '
+                'fleets to resume, or remove it to scan again'.format(
+                    self.journal, ', '.join(fleet_ids) or 'every fleet'))
+
+        thresholds = header.get('thresholds')
+        if thresholds is None:
+            self.logger.warning('%s does not record the thresholds it was '
+                                'written with, so they cannot be checked',
+                                self.journal)
+        elif thresholds != self._thresholds():
+            raise ValueError(
+                '{} was written with other thresholds ({}). Run with the '
+                'same thresholds to resume, or remove it to scan again'
+                .format(self.journal, _describe_thresholds(thresholds)))
+
+        self.cutoff = datetime.fromisoformat(header['cutoff'])
+        self.cutoffs = {
+            fleet_id: datetime.fromisoformat(cutoff)
+            for fleet_id, cutoff in header.get('cutoffs', {}).items()
+        }
+        self._recheck = True
+
+    def _read_journal(self):
+        """Read a journal left by an interrupted run
+
+        :returns: tuple of the header, whether the scan finished, and the
+            set of device IDs that are done with, or None if there is no
+            usable journal
+        """
+
+        if not self.journal or not os.path.exists(self.journal):
+            return None
+
+        header = None
+        scanned = False
+        done = set()
+        with open(self.journal, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line may have been cut short by a crash
+                    break
+                if header is None:
+                    header = entry
+                elif 'scanned' in entry:
+                    scanned = True
+                elif 'deleted' in entry:
+                    done.add(entry['deleted'])
+                elif 'kept' in entry:
+                    done.add(entry['kept'])
+
+        if not isinstance(header, dict) \
+                or header.get('reaper') != JOURNAL_VERSION \
+                or header.get('team_id') != self.client.team_id:
+            raise ValueError('{} is not a reaper journal for team {}'.format(
+                self.journal, self.client.team_id))
+
+        return header, scanned, done
+
+    def _journaled(self, done):
+        """Stream the stale devices recorded in the journal, skipping those
+        that are done with"""
+
+        with open(self.journal, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if 'stale' in entry and entry['stale'] not in done:
+                    yield StaleDevice(entry['stale'], entry.get('fleet_id'),
+                                      entry.get('checkin_tstamp'))
+
+    def _still_stale(self, stale):
+        """Whether a device has still not checked in since the cutoff, as
+        fl33t has it now"""
+
+        if self.client.cache is not None:
+            self.client.cache.invalidate(('device', stale.device_id))
+
+        device = self.client.get_device(stale.device_id)
+        return bool(device.checkin_tstamp) and timestamp_before(
+            device.checkin_tstamp, self._cutoff(device.fleet_id))
+
+    def _delete(self, stale):
+        """Delete a stale device
+
+        :returns: True if it was deleted, False if it could not be, and None
+            if it was kept, having checked in since the journal was written
+        """
+
+        try:
+            if self._recheck and not self._still_stale(stale):
+                return None
+
+            if self.bucket:
+                self.bucket.consume(1)
+            return bool(self.client.Device(device_id=stale.device_id)
+                        .delete())
+        except InvalidIdError:
+            # Already deleted
+            return True
+
+    def run(self, *, dry_run=False, callback=None):
+        """
+        Scan for stale devices, or resume from the journal, and delete them
+
+        :param bool dry_run: If True, only scan, without deleting anything or
+            writing the journal
+        :param callback: If provided, called with each stale device and
+            whether it was deleted (None when `dry_run` is set)
+        :type callback: callable or None
+        :returns: dict of the number of devices found `stale`, `deleted`,
+            `failed` and `kept` (when resuming, those that had checked in
+            since the journal was written), and whether the run was
+            `resumed` from a journal
+        :raises ValueError: if the journal is not for this team, or was
+            written with other thresholds or for other fleets
+        """
+
+        summary = {'stale': 0, 'deleted': 0, 'failed': 0, 'kept': 0,
+                   'resumed': False}
+
+        def report(stale, deleted):
+            if callback:
+                callback(stale, deleted)
+
+        if dry_run:
+            for stale in self.scan():
+                summary['stale'] += 1
+                report(stale, None)
+            return summary
+
+        if not self.journal:
+            return self._reap(self.scan(), summary, report, None)
+
+        existing = self._read_journal()
+        if existing and existing[1]:
+            header, _, done = existing
+            self._resume(header)
+            summary['resumed'] = True
+            self.logger.info('Resuming the reaping of devices that had not '
+                             'checked in since %s', header['cutoff'])
+            with open(self.journal, 'a', encoding='utf-8') as journal:
+                summary = self._reap(self._journaled(done), summary, report,
+                                     journal)
+        else:
+            # A scan that did not finish cannot be resumed, as the pages it
+            # read may have shifted since
+            with open(self.journal, 'w', encoding='utf-8') as journal:
+                journal.write(json.dumps(self._header()) + '\n')
+                for stale in self.scan():
+                    journal.write(json.dumps({
+                        'stale': stale.device_id,
+                        'fleet_id': stale.fleet_id,
+                        'checkin_tstamp': stale.checkin_tstamp}) + '\n')
+                journal.write(json.dumps({'scanned': True}) + '\n')
+                journal.flush()
+                summary = self._reap(self._journaled(set()), summary,
+                                     report, journal)
+
+        if not summary['failed']:
+            os.remove(self.journal)
+        return summary
+
+    def _reap(self, devices, summary, report, journal):
+        """Delete stale devices concurrently, recording each in the
+        journal"""
+
+        for stale, deleted, exc in concurrent_map(self._delete, devices,
+                                                  workers=self.workers):
+            if deleted is None and not exc:
+                self.logger.info('Keeping device %s, which has checked in '
+                                 'since', stale.device_id)
+                summary['kept'] += 1
+                if journal:
+                    journal.write(json.dumps({'kept': stale.device_id})
+                                  + '\n')
+                    journal.flush()
+                continue
+
+            summary['stale'] += 1
+            if exc or not deleted:
+                self.logger.warning('Could not delete device %s: %s',
+                                    stale.device_id, exc or 'delete failed')
+                summary['failed'] += 1
+                report(stale, False)
+                continue
+
+            summary['deleted'] += 1
+            if journal:
+                journal.write(json.dumps({'deleted': stale.device_id}) + '\n')
+                journal.flush()
+            report(stale, True)
+
+        return summary
@@ -0,0 +1,642 @@
+"""
+Reconcile
+
+Brings a team's trains, fleets, device assignments and build release flags
+in line with a desired state, described in YAML or JSON, through a minimal,
+ordered plan of creates, updates and deletes
+"""
+
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+from fl33t.exceptions import Fl33tApiException
+from fl33t.inventory import Inventory
+from fl33t.utils import backoff_delay, concurrent_map
+
+# For each collection in a desired state, the field holding its ID, the
+# fields that can be set, and the model that holds it
+FIELDS = collections.OrderedDict([
+    ('trains', ('train_id', ['name'], 'Train')),
+    ('builds', ('build_id', ['released'], 'Build')),
+    ('fleets', ('fleet_id', ['name', 'train_id', 'build_id', 'unreleased'],
+                'Fleet')),
+    ('devices', ('device_id', ['fleet_id', 'name'], 'Device')),
+])
+
+# Fields referring to an object of another collection by its name, instead
+# of its ID, and the ID field they resolve to
+REFERENCES = {
+    'fleets': {'train': ('trains', 'train_id')},
+    'devices': {'fleet': ('fleets', 'fleet_id')},
+}
+
+# The collections whose objects can be deleted when they are not in the
+# desired state, in the order they are deleted
+PRUNABLE = ['devices', 'fleets', 'trains']
+
+# The order steps are applied in. Every step in a phase only depends on the
+# steps of earlier phases, so a phase's steps are applied concurrently
+PHASES = [
+    [('create', 'trains'), ('update', 'trains'), ('update', 'builds')],
+    [('create', 'fleets'), ('update', 'fleets')],
+    [('create', 'devices'), ('update', 'devices')],
+    [('delete', 'devices')],
+    [('delete', 'fleets')],
+    [('delete', 'trains')],
+]
+
+# The actions retried after a server or connection error. Creates are not
+# retried, as fl33t generates the IDs of trains and fleets, so a create that
+# succeeded before its response was lost would make a duplicate
+RETRIED_ACTIONS = ['update', 'delete']
+
+Ref = collections.namedtuple('Ref', ['collection', 'name'])
+Ref.__doc__ = """
+The ID of an object that an earlier step of the same plan creates
+"""
+
+Step = collections.namedtuple(
+    'Step', ['action', 'collection', 'id', 'name', 'changes'])
+Step.__doc__ = """
+A single create, update or delete call of a plan
+
+`id` is None for trains and fleets that are yet to be created. `changes`
+maps each field that is set to a tuple of its current and desired values.
+"""
+
+Result = collections.namedtuple('Result', ['step', 'status', 'error'])
+Result.__doc__ = """
+The outcome of applying a step
+
+`status` is `applied`, `failed`, or `skipped` when an earlier phase failed.
+"""
+
+
+def load_state(source):
+    """
+    Read a desired state
+
+    JSON is read with the standard library. Anything else is read as YAML,
+    which needs `PyYAML` to be installed.
+
+    :param source: The file, or its path
+    :type source: str or file-like object
+    :returns: dict
+    :raises ValueError: if the desired state cannot be read, or is invalid
+    """
+
+    if isinstance(source, str):
+        with open(source, encoding='utf-8') as state_file:
+            return load_state(state_file)
+
+    text = source.read()
+    extension = os.path.splitext(getattr(source, 'name', '') or '')[1]
+    try:
+        state = json.loads(text)
+    except ValueError as exc:
+        if extension.lower() == '.json':
+            raise ValueError('{} is not valid JSON'.format(
+                source.name)) from exc
+        try:
+            import yaml  # pylint: disable=import-outside-toplevel
+        except ImportError as import_exc:
+            raise ValueError('PyYAML must be installed to read YAML '
+                             'desired states') from import_exc
+        try:
+            state = yaml.safe_load(text)
+        except yaml.YAMLError as yaml_exc:
+            raise ValueError('Invalid YAML: {}'.format(
+                yaml_exc)) from yaml_exc
+
+    validate_state(state)
+    return state
+
+
+def validate_state(state):
+    """
+    Check that a desired state is well formed
+
+    :param dict state: The desired state
+    :raises ValueError: describing the first problem found
+    """
+
+    if not isinstance(state, dict):
+        raise ValueError('The desired state must be a mapping')
+
+    unknown = set(state) - set(FIELDS) - {'prune'}
+    if unknown:
+        raise ValueError('Unknown sections: {}'.format(
+            ', '.join(sorted(unknown))))
+
+    _prune_set(state)
+
+    for collection, (id_field, fields, _) in FIELDS.items():
+        entries = state.get(collection) or []
+        if not isinstance(entries, list):
+            raise ValueError('{} must be a list'.format(collection))
+
+        references = REFERENCES.get(collection, {})
+        allowed = {id_field} | set(fields) | set(references)
+        for index, entry in enumerate(entries):
+            where = '{}[{}]'.format(collection, index)
+            if not isinstance(entry, dict):
+                raise ValueError('{} must be a mapping'.format(where))
+
+            unknown = set(entry) - allowed
+            if unknown:
+                raise ValueError('{}: unknown fields: {}'.format(
+                    where, ', '.join(sorted(unknown))))
+
+            for reference, (_, ref_field) in references.items():
+                if reference in entry and ref_field in entry:
+                    raise ValueError('{}: give {} or {}, not both'.format(
+                        where, reference, ref_field))
+
+            if collection in ('builds', 'devices'):
+                if not entry.get(id_field):
+                    raise ValueError('{}: {} is required'.format(
+                        where, id_field))
+            elif not entry.get(id_field) and not entry.get('name'):
+                raise ValueError('{}: {} or name is required'.format(
+                    where, id_field))
+
+
+def _prune_set(state):
+    prune = state.get('prune', False)
+    if prune is True:
+        return set(PRUNABLE)
+    if not prune:
+        return set()
+    if not isinstance(prune, list) or set(prune) - set(PRUNABLE):
+        raise ValueError('prune must be true, or a list of: {}'.format(
+            ', '.join(PRUNABLE)))
+    return set(prune)
+
+
+def _create_step(collection, entry, desired):
+    """The step creating an object that is not in fl33t yet
+
+    :raises ValueError: if the object cannot be created
+    """
+
+    object_id = entry.get('device_id') if collection == 'devices' else None
+    if collection == 'builds':
+        raise ValueError('Build {} does not exist'.format(entry['build_id']))
+    if collection == 'devices' and not desired.get('fleet_id'):
+        raise ValueError('Device {} does not exist, and has no fleet'.format(
+            object_id))
+    if collection == 'fleets' and not desired.get('train_id'):
+        raise ValueError('Fleet {!r} does not exist, and has no train'.format(
+            entry['name']))
+
+    return Step('create', collection, object_id, entry.get('name'),
+                collections.OrderedDict((field, (None, value))
+                                        for field, value in desired.items()))
+
+
+def _format_value(value):
+    if isinstance(value, Ref):
+        return '(new {} {!r})'.format(value.collection[:-1], value.name)
+    return repr(value)
+
+
+def describe(step):
+    """
+    Describe a step as a line of text
+
+    :param step: The step
+    :type step: :py:class:`Step`
+    :returns: str
+    """
+
+    label = ' '.join(part for part in (
+        step.collection[:-1],
+        step.id,
+        repr(step.name) if step.name else None,
+    ) if part)
+    line = '{} {} {}'.format(
+        {'create': '+', 'update': '~', 'delete': '-'}[step.action],
+        step.action,
+        label)
+
+    if step.changes:
+        line += ': {}'.format(', '.join(
+            '{}: {} -> {}'.format(field, _format_value(old),
+                                  _format_value(new))
+            if step.action == 'update'
+            else '{}={}'.format(field, _format_value(new))
+            for field, (old, new) in step.changes.items()))
+
+    return line
+
+
+def step_record(step):
+    """
+    A step as a `dict` that can be encoded as JSON
+
+    :param step: The step
+    :type step: :py:class:`Step`
+    :returns: dict
+    """
+
+    def encode(value):
+        if isinstance(value, Ref):
+            return {'new': value.collection, 'name': value.name}
+        return value
+
+    return {
+        'action': step.action,
+        'collection': step.collection,
+        'id': step.id,
+        'name': step.name,
+        'changes': {field: [encode(old), encode(new)]
+                    for field, (old, new) in step.changes.items()},
+    }
+
+
+class Plan:
+    """
+    The steps that bring fl33t to a desired state, in the order they are
+    applied
+
+    :param steps: The steps
+    :type steps: list of :py:class:`Step`
+    """
+
+    def __init__(self, steps):
+        order = {key: index for index, key in enumerate(
+            key for phase in PHASES for key in phase)}
+        self.steps = sorted(
+            steps, key=lambda step: order[(step.action, step.collection)])
+
+    def phases(self):
+        """
+        The steps grouped into phases, which are applied one after another
+
+        :returns: list of lists of :py:class:`Step`
+        """
+
+        phases = []
+        for phase in PHASES:
+            steps = [step for step in self.steps
+                     if (step.action, step.collection) in phase]
+            if steps:
+                phases.append(steps)
+        return phases
+
+    def summary(self):
+        """
+        Count the steps by action
+
+        :returns: dict of the number of steps that `create`, `update` and
+            `delete`
+        """
+
+        counts = {'create': 0, 'update': 0, 'delete': 0}
+        for step in self.steps:
+            counts[step.action] += 1
+        return counts
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __repr__(self):
+        return '<Plan {create} to create, {update} to update, {delete} to ' \
+            'delete>'.format(**self.summary())
+
+
+class Reconciler:
+    """
+    Compares a desired state with what is in fl33t, and applies the
+    difference
+
+    The desired state is a mapping of `trains`, `fleets`, `builds`, `devices`
+    and `prune`. Trains and fleets are matched by their ID if it is given,
+    and otherwise by name, and are created when no match is found. Fleets
+    refer to their train by `train_id` or by `train` name, and devices to
+    their fleet by `fleet_id` or by `fleet` name. Builds are matched by ID,
+    and only their `released` flag can be set. Only the fields given are
+    compared, and objects missing from the desired state are only deleted
+    for the collections listed in `prune`, or all of them if `prune` is
+    true::
+
+        trains:
+          - name: Widget
+        fleets:
+          - name: Canary
+            train: Widget
+            build_id: abc123
+            unreleased: true
+        builds:
+          - build_id: abc123
+            released: false
+        devices:
+          - device_id: kitchen
+            fleet: Canary
+        prune: [devices]
+
+    :param client: The client to query and change fl33t with
+    :type client: :py:class:`fl33t.Fl33tClient`
+    :param dict state: The desired state, as returned by
+        :py:func:`load_state`
+    :param int workers: The number of steps to apply at once
+    :param int retries: The number of times an update or delete step that
+        fails with a server or connection error is retried
+    :param page_size: If provided, the number of records to request per page
+        when fetching the live state
+    :type page_size: int or None
+    :raises ValueError: if the desired state is invalid
+    """
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    def __init__(self, client, state, *, workers=8, retries=2,
+                 page_size=None):
+        validate_state(state)
+        self.client = client
+        self.state = state
+        self.workers = workers
+        self.retries = retries
+        self.page_size = page_size
+        self.inventory = Inventory(client)
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def _collections(self):
+        """The collections that must be fetched to plan the desired state"""
+
+        prune = _prune_set(self.state)
+        needed = set()
+        for collection in FIELDS:
+            if self.state.get(collection) or collection in prune:
+                needed.add(collection)
+            for _, (referenced, _) in REFERENCES.get(collection, {}).items():
+                if self.state.get(collection):
+                    needed.add(referenced)
+        return [collection for collection in FIELDS if collection in needed]
+
+    def fetch(self):
+        """
+        Fetch the live state of every collection the desired state
+        mentions, concurrently
+
+        :returns: dict mapping each collection to the number of objects
+            fetched
+        """
+
+        return self.inventory.refresh(self._collections(),
+                                      page_size=self.page_size)
+
+    def _match(self, collection, entry, by_name):
+        """Find the live object a desired entry refers to, or None"""
+
+        id_field = FIELDS[collection][0]
+        if entry.get(id_field):
+            obj = self.inventory.get(collection, entry[id_field])
+            if obj is None and collection in ('trains', 'fleets'):
+                raise ValueError('{} {} does not exist'.format(
+                    collection[:-1].title(), entry[id_field]))
+            return obj
+
+        matches = by_name.get(entry['name'], [])
+        if len(matches) > 1:
+            raise ValueError('{} {} are named {!r}: give the {} instead'
+                             .format(len(matches), collection, entry['name'],
+                                     id_field))
+        return matches[0] if matches else None
+
+    def plan(self):
+        """
+        Work out the steps that bring fl33t to the desired state
+
+        The live state is fetched first, if it has not been.
+
+        :returns: :py:class:`Plan`
+        :raises ValueError: if the desired state refers to objects that do
+            not exist, or names that are ambiguous
+        """
+
+        if not len(self.inventory):  # pylint: disable=len-as-condition
+            self.fetch()
+
+        steps = []
+        # The ID, or reference to the creating step, of each named object
+        named = {'trains': {}, 'fleets': {}}
+        matched = {collection: set() for collection in FIELDS}
+
+        for collection, (id_field, fields, _) in FIELDS.items():
+            by_name = {}
+            if collection in named:
+                for obj in self.inventory.all(collection):
+                    by_name.setdefault(obj.name, []).append(obj)
+
+            for entry in self.state.get(collection) or []:
+                desired = self._desired(collection, entry, named, matched)
+                obj = self._match(collection, entry, by_name)
+
+                if obj is None:
+                    steps.append(_create_step(collection, entry, desired))
+                    if collection in named:
+                        named[collection][entry['name']] = Ref(
+                            collection, entry['name'])
+                    continue
+
+                object_id = getattr(obj, id_field)
+                matched[collection].add(object_id)
+                if collection in named:
+                    named[collection][obj.name] = object_id
+                    if entry.get('name'):
+                        named[collection][entry['name']] = object_id
+
+                changes = collections.OrderedDict(
+                    (field, (getattr(obj, field), value))
+                    for field, value in desired.items()
+                    if field in fields and getattr(obj, field) != value)
+                if changes:
+                    steps.append(Step('update', collection, object_id,
+                                      getattr(obj, 'name', None), changes))
+
+        return Plan(steps + self._delete_steps(matched))
+
+    def _delete_steps(self, matched):
+        """The steps deleting the objects of pruned collections that the
+        desired state did not match"""
+
+        steps = []
+        for collection in _prune_set(self.state):
+            id_field = FIELDS[collection][0]
+            for obj in self.inventory.all(collection):
+                object_id = getattr(obj, id_field)
+                if object_id not in matched[collection]:
+                    steps.append(Step('delete', collection, object_id,
+                                      obj.name, collections.OrderedDict()))
+        return steps
+
+    def _desired(self, collection, entry, named, matched):
+        """The fields a desired entry sets, with references resolved
+
+        Objects referred to are recorded in `matched`, so that they are not
+        pruned.
+        """
+
+        id_field, fields, _ = FIELDS[collection]
+        desired = collections.OrderedDict(
+            (field, entry[field]) for field in fields if field in entry)
+
+        if collection == 'builds' and 'released' in desired:
+            desired['released'] = bool(desired['released'])
+        if collection == 'fleets' and 'unreleased' in desired:
+            desired['unreleased'] = bool(desired['unreleased'])
+
+        for reference, (referenced, ref_field) in REFERENCES.get(
+                collection, {}).items():
+            if reference in entry:
+                desired[ref_field] = self._resolve(
+                    referenced, entry[reference], named)
+            elif ref_field in entry and self.inventory.get(
+                    referenced, entry[ref_field]) is None:
+                raise ValueError('{} {}: {} {} does not exist'.format(
+                    collection[:-1].title(),
+                    entry.get(id_field) or entry.get('name'),
+                    referenced[:-1], entry[ref_field]))
+
+            if ref_field in desired \
+                    and not isinstance(desired[ref_field], Ref):
+                matched[referenced].add(desired[ref_field])
+
+        return desired
+
+    def _resolve(self, collection, name, named):
+        """The ID of the object with a name, or a reference to the step that
+        creates it"""
+
+        if name in named[collection]:
+            return named[collection][name]
+
+        matches = [obj for obj in self.inventory.all(collection)
+                   if obj.name == name]
+        if len(matches) != 1:
+            raise ValueError('{} {} named {!r}'.format(
+                'No' if not matches else len(matches), collection, name))
+
+        object_id = matches[0].id
+        named[collection][name] = object_id
+        return object_id
+
+    def apply(self, plan=None, *, callback=None):
+        """
+        Apply a plan
+
+        Each phase's steps are applied concurrently, and a step failing with
+        a server or connection error is retried, unless it is a create. If
+        any step of a phase fails, the later phases, which may depend on it,
+        are skipped.
+
+        :param plan: The plan to apply. Defaults to a new :py:meth:`plan`
+        :type plan: :py:class:`Plan` or None
+        :param callback: If provided, called with each :py:class:`Result` as
+            it is known
+        :type callback: callable or None
+        :returns: list of :py:class:`Result`, in the plan's order
+        """
+
+        if plan is None:
+            plan = self.plan()
+
+        created = {}
+        results = []
+        failed = False
+        for phase in plan.phases():
+            if failed:
+                phase_results = [Result(step, 'skipped', None)
+                                 for step in phase]
+            else:
+                phase_results = []
+                for step, _, exc in concurrent_map(
+                        lambda step: self._apply_step(step, created),
+                        phase, workers=self.workers):
+                    if exc:
+                        failed = True
+                        phase_results.append(Result(
+                            step, 'failed',
+                            str(exc) or exc.__class__.__name__))
+                    else:
+                        phase_results.append(Result(step, 'applied', None))
+
+            for result in phase_results:
+                if callback:
+                    callback(result)
+            results.extend(phase_results)
+
+        return results
+
+    def _apply_step(self, step, created):
+        """Apply a step, retrying server and connection errors of the
+        actions that can safely be repeated"""
+
+        attempt = 0
+        while True:
+            try:
+                if self._call(step, created):
+                    return
+                error = Fl33tApiException('fl33t did not {} {} {}'.format(
+                    step.action, step.collection[:-1],
+                    step.id or step.name))
+            # Connection errors from requests are all OSErrors
+            except (Fl33tApiException, OSError) as exc:
+                error = exc
+
+            if attempt >= self.retries \
+                    or step.action not in RETRIED_ACTIONS:
+                raise error
+            self.logger.warning('Retrying %s of %s %s: %s', step.action,
+                                step.collection[:-1], step.id or step.name,
+                                error)
+            delay = backoff_delay(attempt)
+            attempt += 1
+            self.client._emit(  # pylint: disable=protected-access
+                'retry', operation=step.action,
+                collection=step.collection, id=step.id or step.name,
+                attempt=attempt, delay=delay, error=error)
+            time.sleep(delay)
+
+    def _call(self, step, created):
+        """Make the create, update or delete call of a step"""
+
+        values = {field: created[new] if isinstance(new, Ref) else new
+                  for field, (_, new) in step.changes.items()}
+        id_field, _, model = FIELDS[step.collection]
+
+        if step.action == 'create':
+            if step.id:
+                values[id_field] = step.id
+            obj = getattr(self.client, model)(**values)
+            if not obj.create():
+                return False
+            with self._lock:
+                self.inventory.add(obj)
+            if step.collection in ('trains', 'fleets'):
+                created[Ref(step.collection, step.name)] = obj.id
+            return True
+
+        obj = self.inventory.get(step.collection, step.id)
+        if step.action == 'delete':
+            if not obj.delete():
+                return False
+            with self._lock:
+                self.inventory.discard(obj)
+            return True
+
+        for field, value in values.items():
+            setattr(obj, field, value)
+        if not obj.update():
+            return False
+        with self._lock:
+            self.inventory.add(obj)
+        return True
@@ -0,0 +1,346 @@
+"""
+Rollout
+
+Moves the devices of a stable fleet into a canary fleet in waves, waiting
+between waves for the moved devices to converge on the canary fleet's build,
+and checkpointing its progress so that an interrupted rollout can resume
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from datetime import datetime, timezone
+
+from fl33t.exceptions import InvalidDeviceIdError
+from fl33t.utils import concurrent_map
+
+CHECKPOINT_VERSION = 1
+
+# The fraction of the source fleet's devices moved by the end of each wave
+WAVES = [0.01, 0.1, 0.5, 1.0]
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _spread(device_id):
+    """Order devices by a hash of their ID, so that each wave is spread
+    across however the IDs were assigned"""
+
+    return hashlib.md5(device_id.encode('utf-8')).hexdigest(), device_id
+
+
+class Rollout:
+    """
+    Moves the devices of a fleet into another fleet in waves
+
+    When it starts, the rollout records the devices in the source fleet. Each
+    wave moves more of them, by the fraction given in `waves`, to the target
+    fleet, `workers` at a time. The devices then check in to fl33t on their
+    own schedule, and the target fleet is listed every `poll_interval`
+    seconds until at least `threshold` of the devices moved so far are on
+    its build, before the next wave starts.
+
+    The rollout's state, including the devices yet to be moved, is saved to
+    the `checkpoint` file after every step. Running a rollout whose
+    checkpoint exists resumes it: a wave's moves are repeated for the
+    devices that were not moved, so no device is moved twice. Each device is
+    looked up just before it is moved, and skipped if it has left the source
+    fleet in the meantime.
+
+    :param client: The client to move devices with
+    :type client: :py:class:`fl33t.Fl33tClient`
+    :param str source_fleet_id: The fleet devices are moved from
+    :param str target_fleet_id: The fleet devices are moved to
+    :param checkpoint: If provided, the JSON file the rollout's state is
+        saved to, and resumed from
+    :type checkpoint: str or None
+    :param waves: The fraction of the devices moved by the end of each wave,
+        in increasing order and ending with 1
+    :type waves: list of float
+    :param float threshold: The fraction of moved devices that must be on
+        the target fleet's build before the next wave
+    :param poll_interval: The number of seconds between convergence checks
+    :type poll_interval: int or float
+    :param timeout: The number of seconds to wait for a wave to converge
+        before the rollout stalls
+    :type timeout: int or float
+    :param int workers: The number of devices to move at once
+    :param page_size: If provided, the number of records to request per page
+    :type page_size: int or None
+    :raises ValueError: if the waves are not valid
+    """
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    def __init__(self, client, source_fleet_id, target_fleet_id, *,
+                 checkpoint=None, waves=None, threshold=0.95,
+                 poll_interval=60, timeout=3600, workers=8, page_size=None):
+        waves = list(WAVES if waves is None else waves)
+        if not waves or waves != sorted(waves) or waves[-1] != 1 \
+                or waves[0] <= 0:
+            raise ValueError('Waves must be increasing fractions ending '
+                             'with 1')
+        if source_fleet_id == target_fleet_id:
+            raise ValueError('The source and target fleets must differ')
+
+        self.client = client
+        self.source_fleet_id = source_fleet_id
+        self.target_fleet_id = target_fleet_id
+        self.checkpoint = checkpoint
+        self.waves = waves
+        self.threshold = threshold
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.workers = workers
+        self.page_size = page_size
+        self.logger = logging.getLogger(__name__)
+
+        self.state = None
+        self._stopped = threading.Event()
+
+    def load(self):
+        """
+        Load the rollout's state from its checkpoint, or start a new one by
+        recording the devices in the source fleet
+
+        :returns: dict, the rollout's state
+        :raises ValueError: if the checkpoint is for other fleets, or the
+            target fleet has no build
+        """
+
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint, encoding='utf-8') as checkpoint:
+                state = json.load(checkpoint)
+            if state.get('rollout') != CHECKPOINT_VERSION \
+                    or state['source_fleet_id'] != self.source_fleet_id \
+                    or state['target_fleet_id'] != self.target_fleet_id:
+                raise ValueError('{} is not a checkpoint of a rollout from '
+                                 '{} to {}'.format(self.checkpoint,
+                                                   self.source_fleet_id,
+                                                   self.target_fleet_id))
+            # Checkpoints written before the devices left to move were kept
+            # have every device still to move, and the moved ones are skipped
+            state.setdefault('pending', list(state['device_ids']))
+            self.state = state
+            return state
+
+        target = self.client.get_fleet(self.target_fleet_id)
+        if not target.build_id:
+            raise ValueError('Fleet {} has no build to roll out'.format(
+                self.target_fleet_id))
+
+        device_ids = sorted(
+            (record['device_id'] for record in self.client.list_devices(
+                fleet_id=self.source_fleet_id, page_size=self.page_size,
+                raw=True)),
+            key=_spread)
+
+        self.state = {
+            'rollout': CHECKPOINT_VERSION,
+            'source_fleet_id': self.source_fleet_id,
+            'target_fleet_id': self.target_fleet_id,
+            'build_id': target.build_id,
+            'waves': self.waves,
+            'device_ids': device_ids,
+            'pending': list(device_ids),
+            'wave': 0,
+            'phase': 'moving',
+            'history': [],
+        }
+        self._save()
+        return self.state
+
+    def _save(self):
+        """Write the state to the checkpoint, atomically"""
+
+        if not self.checkpoint:
+            return
+
+        partial = '{}.part'.format(self.checkpoint)
+        with open(partial, 'w', encoding='utf-8') as checkpoint:
+            json.dump(self.state, checkpoint)
+        os.replace(partial, self.checkpoint)
+
+    def wave_size(self, wave):
+        """
+        The number of devices moved by the end of a wave
+
+        :param int wave: The wave's index
+        :returns: int
+        """
+
+        # Rounded first, so that e.g. 7% of 100 devices is 7, not 8
+        return int(math.ceil(round(
+            self.state['waves'][wave] * len(self.state['device_ids']), 6)))
+
+    def _wave_ids(self, wave):
+        return set(self.state['device_ids'][:self.wave_size(wave)])
+
+    def move(self, wave):
+        """
+        Move a wave's devices that have not been moved yet, and are still in
+        the source fleet
+
+        The devices that are moved, or have left the source fleet, are
+        removed from the state's `pending` devices.
+
+        :param int wave: The wave's index
+        :returns: tuple of the number of devices moved, and a list of the
+            IDs of those that could not be
+        """
+
+        wanted = self._wave_ids(wave)
+        device_ids = [device_id for device_id in self.state['pending']
+                      if device_id in wanted]
+
+        def move_device(device_id):
+            try:
+                device = self.client.get_device(device_id)
+            except InvalidDeviceIdError:
+                return None
+            if device.fleet_id != self.source_fleet_id:
+                return None
+            device.fleet_id = self.target_fleet_id
+            return bool(device.update())
+
+        moved = 0
+        failed = []
+        for device_id, result, exc in concurrent_map(move_device, device_ids,
+                                                     workers=self.workers):
+            if exc or result is False:
+                self.logger.warning('Could not move device %s: %s',
+                                    device_id, exc or 'update failed')
+                failed.append(device_id)
+            elif result:
+                moved += 1
+
+        done = set(device_ids).difference(failed)
+        self.state['pending'] = [device_id
+                                 for device_id in self.state['pending']
+                                 if device_id not in done]
+        return moved, failed
+
+    def convergence(self, wave):
+        """
+        How many of the devices moved by a wave are on the target fleet's
+        build
+
+        :param int wave: The wave's index
+        :returns: dict of the number of devices moved to the target fleet
+            (`moved`), those on its build (`converged`), those that have
+            checked in since the wave's moves (`checked_in`), and the
+            `fraction` converged
+        """
+
+        # pylint: disable=import-outside-toplevel
+        from fl33t.models.base import parse_timestamp
+
+        wanted = self._wave_ids(wave)
+        history = self.state['history']
+        moved_at = parse_timestamp(history[-1]['moved_at']) \
+            if history and history[-1].get('moved_at') else None
+
+        counts = {'moved': 0, 'converged': 0, 'checked_in': 0}
+        for record in self.client.list_devices(
+                fleet_id=self.target_fleet_id, page_size=self.page_size,
+                raw=True):
+            if record['device_id'] not in wanted:
+                continue
+            counts['moved'] += 1
+            if record.get('build_id') == self.state['build_id']:
+                counts['converged'] += 1
+            if moved_at and record.get('checkin_tstamp') \
+                    and parse_timestamp(record['checkin_tstamp']) >= moved_at:
+                counts['checked_in'] += 1
+
+        counts['fraction'] = (counts['converged'] / counts['moved']
+                              if counts['moved'] else 1.0)
+        return counts
+
+    def run(self, callback=None):
+        """
+        Run, or resume, the rollout until it finishes, a wave fails to move
+        or converge, or :py:meth:`stop` is called
+
+        :param callback: If provided, called with an event `dict` after
+            each wave's moves and each convergence check. Every event has the
+            `event` (`moved` or `converging`), `wave` and `size` of the wave
+        :type callback: callable or None
+        :returns: str, one of `done`, `failed` (some devices could not be
+            moved), `stalled` (a wave did not converge in time) or `stopped`
+        """
+
+        if self.state is None:
+            self.load()
+        self._stopped.clear()
+
+        state = self.state
+        while state['phase'] != 'done':
+            wave = state['wave']
+            size = self.wave_size(wave)
+
+            if state['phase'] == 'moving':
+                moved, failed = self.move(wave)
+                state['history'].append({
+                    'wave': wave,
+                    'size': size,
+                    'moved': moved,
+                    'failed': failed,
+                    'moved_at': _now().isoformat(),
+                })
+                if not failed:
+                    state['phase'] = 'converging'
+                self._save()
+                self._report(callback, event='moved', wave=wave, size=size,
+                             moved=moved, failed=len(failed))
+                if failed:
+                    return 'failed'
+
+            outcome = self._converge(wave, size, callback)
+            if outcome:
+                return outcome
+
+            state['history'][-1]['converged_at'] = _now().isoformat()
+            if wave + 1 == len(state['waves']):
+                state['phase'] = 'done'
+            else:
+                state['wave'] = wave + 1
+                state['phase'] = 'moving'
+            self._save()
+
+        return 'done'
+
+    def _converge(self, wave, size, callback):
+        """Wait for a wave to converge, returning the outcome if it does
+        not"""
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            counts = self.convergence(wave)
+            self._report(callback, event='converging', wave=wave, size=size,
+                         **counts)
+            if counts['fraction'] >= self.threshold:
+                return None
+            if time.monotonic() >= deadline:
+                return 'stalled'
+            if self._stopped.wait(self.poll_interval):
+                return 'stopped'
+
+    def _report(self, callback, **event):
+        if not callback:
+            return
+        try:
+            callback(event)
+        except Exception:  # pylint: disable=broad-except
+            self.logger.exception('Rollout callback failed')
+
+    def stop(self):
+        """Stop :py:meth:`run` at its next convergence check"""
+
+        self._stopped.set()
@@ -0,0 +1,314 @@
+"""
+Snapshot
+
+Compressed snapshots of everything a team has in fl33t, and a streaming diff
+between two of them that works in bounded memory however large they are
+"""
+
+import contextlib
+import gzip
+import hashlib
+import heapq
+import json
+import os
+import tempfile
+
+from collections import namedtuple
+from datetime import datetime, timezone
+
+SNAPSHOT_VERSION = 1
+
+# The collections a snapshot can hold, and the field holding each one's ID
+COLLECTIONS = {
+    'builds': 'build_id',
+    'devices': 'device_id',
+    'fleets': 'fleet_id',
+    'sessions': 'session_token',
+    'trains': 'train_id',
+}
+
+# The number of records sorted in memory at once while writing a snapshot
+CHUNK_SIZE = 100000
+
+Change = namedtuple(
+    'Change', ['kind', 'collection', 'id', 'old', 'new', 'fields'])
+Change.__doc__ = """
+A difference between two snapshots
+
+`kind` is `added`, `removed` or `changed`. `old` and `new` are the record
+before and after, or None, and `fields` lists the fields that changed.
+"""
+
+
+def _encode(record):
+    return json.dumps(record, sort_keys=True, separators=(',', ':'))
+
+
+def _digest(encoded):
+    return hashlib.md5(encoded.encode('utf-8')).hexdigest()
+
+
+def fingerprint(record):
+    """
+    A hash of a record's contents, as written to snapshots
+
+    :param dict record: The record, as returned by fl33t
+    :returns: str
+    """
+
+    return _digest(_encode(record))
+
+
+def _line(collection, record):
+    """Encode a record as a snapshot line"""
+
+    encoded = _encode(record)
+    return '{}\t{}\t{}\t{}\n'.format(
+        collection,
+        record[COLLECTIONS[collection]],
+        _digest(encoded),
+        encoded)
+
+
+def _sort_key(line):
+    return line.split('\t', 2)[:2]
+
+
+def _write_chunk(lines, directory):
+    """Sort a chunk of lines and spill it to a temporary file"""
+
+    lines.sort(key=_sort_key)
+    handle, path = tempfile.mkstemp(suffix='.gz', dir=directory)
+    os.close(handle)
+    with gzip.open(path, 'wt', compresslevel=1, encoding='utf-8') as chunk:
+        chunk.writelines(lines)
+    return path
+
+
+def write_snapshot(client, path, *, collections=None, page_size=None,
+                   chunk_size=CHUNK_SIZE):
+    """
+    Write a snapshot of a team's objects to a file
+
+    The snapshot is a gzip compressed text file. Its first line is a JSON
+    header, and every other line is a tab separated record of its
+    collection, ID, the MD5 hash of its JSON and its JSON, sorted by
+    collection and ID. Records are sorted `chunk_size` at a time, with the
+    sorted chunks spilled to temporary files and merged, so that memory use
+    does not grow with the number of records.
+
+    :param client: The client to list objects with
+    :type client: :py:class:`fl33t.Fl33tClient`
+    :param str path: The file to write
+    :param collections: The collections to include. Defaults to all of them
+    :type collections: list of str or None
+    :param page_size: If provided, the number of records to request per page
+    :type page_size: int or None
+    :param int chunk_size: The number of records to sort in memory at once
+    :returns: dict mapping each collection to the number of records written
+    :raises ValueError: if a collection is not known
+    """
+
+    collections = sorted(collections or COLLECTIONS)
+    unknown = set(collections) - set(COLLECTIONS)
+    if unknown:
+        raise ValueError('Unknown collections: {}'.format(
+            ', '.join(sorted(unknown))))
+
+    header = {
+        'fl33t_snapshot': SNAPSHOT_VERSION,
+        'team_id': client.team_id,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'collections': collections,
+    }
+    counts = {collection: 0 for collection in collections}
+
+    with tempfile.TemporaryDirectory(
+            dir=os.path.dirname(os.path.abspath(path))) as directory:
+        chunks = _write_chunks(client, collections, directory,
+                               page_size=page_size, chunk_size=chunk_size)
+
+        partial = '{}.part'.format(path)
+        with gzip.open(partial, 'wt', encoding='utf-8') as snapshot:
+            snapshot.write(json.dumps(header) + '\n')
+            _merge_chunks(chunks, snapshot, counts)
+
+        os.replace(partial, path)
+
+    return counts
+
+
+def _write_chunks(client, collections, directory, *, page_size, chunk_size):
+    """List the records of each collection into sorted chunk files,
+    returning their paths"""
+
+    chunks = []
+    lines = []
+    for collection in collections:
+        list_method = getattr(client, 'list_{}'.format(collection))
+        for record in list_method(page_size=page_size, raw=True):
+            lines.append(_line(collection, record))
+            if len(lines) >= chunk_size:
+                chunks.append(_write_chunk(lines, directory))
+                lines = []
+    chunks.append(_write_chunk(lines, directory))
+    return chunks
+
+
+def _merge_chunks(chunks, snapshot, counts):
+    """Merge sorted chunk files into a snapshot, counting the records of
+    each collection into `counts`"""
+
+    with contextlib.ExitStack() as stack:
+        chunk_files = [
+            stack.enter_context(gzip.open(chunk, 'rt', encoding='utf-8'))
+            for chunk in chunks
+        ]
+        previous = None
+        for line in heapq.merge(*chunk_files, key=_sort_key):
+            key = _sort_key(line)
+            # Records can be listed twice if they move while paginating
+            if key == previous:
+                continue
+            previous = key
+            counts[key[0]] += 1
+            snapshot.write(line)
+
+
+class Snapshot:
+    """
+    A snapshot written by :py:func:`write_snapshot`, read as a stream
+
+    :param str path: The snapshot file
+    :raises ValueError: if the file is not a snapshot
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with gzip.open(path, 'rt', encoding='utf-8') as snapshot:
+            try:
+                self.header = json.loads(snapshot.readline())
+            except (OSError, ValueError):
+                self.header = None
+
+        if not isinstance(self.header, dict) \
+                or 'fl33t_snapshot' not in self.header:
+            raise ValueError('{} is not a fl33t snapshot'.format(path))
+
+    @property
+    def team_id(self):
+        """The team the snapshot was taken of"""
+
+        return self.header['team_id']
+
+    @property
+    def created(self):
+        """When the snapshot was taken, as an ISO 8601 timestamp"""
+
+        return self.header['created']
+
+    def lines(self):
+        """
+        Stream the snapshot's records, without decoding their JSON
+
+        :yields: tuples of `(collection, id, hash, json)`
+        """
+
+        with gzip.open(self.path, 'rt', encoding='utf-8') as snapshot:
+            snapshot.readline()
+            for line in snapshot:
+                yield tuple(line.rstrip('\n').split('\t', 3))
+
+    def records(self, collection=None):
+        """
+        Stream the snapshot's records
+
+        :param collection: If provided, only yield this collection's records
+        :type collection: str or None
+        :yields: tuples of `(collection, record)`
+        """
+
+        for record_collection, _, _, encoded in self.lines():
+            if collection is None or record_collection == collection:
+                yield record_collection, json.loads(encoded)
+
+
+def changed_fields(old, new):
+    """
+    The fields that differ between two versions of a record
+
+    :param dict old: The earlier record
+    :param dict new: The later record
+    :returns: sorted list of str
+    """
+
+    return sorted(key for key in set(old) | set(new)
+                  if old.get(key) != new.get(key))
+
+
+def diff(old, new):
+    """
+    Stream the differences between two snapshots
+
+    Both snapshots are read in a single sorted pass, so memory use does not
+    grow with their size, and only the records whose hashes differ are
+    decoded.
+
+    :param old: The earlier snapshot, or its path
+    :type old: :py:class:`Snapshot` or str
+    :param new: The later snapshot, or its path
+    :type new: :py:class:`Snapshot` or str
+    :yields: :py:class:`Change`, ordered by collection and ID
+    """
+
+    if not isinstance(old, Snapshot):
+        old = Snapshot(old)
+    if not isinstance(new, Snapshot):
+        new = Snapshot(new)
+
+    old_lines = old.lines()
+    new_lines = new.lines()
+    old_line = next(old_lines, None)
+    new_line = next(new_lines, None)
+
+    while old_line or new_line:
+        old_key = old_line[:2] if old_line else None
+        new_key = new_line[:2] if new_line else None
+
+        if new_key is None or (old_key is not None and old_key < new_key):
+            yield Change('removed', old_key[0], old_key[1],
+                         json.loads(old_line[3]), None, [])
+            old_line = next(old_lines, None)
+
+        elif old_key is None or new_key < old_key:
+            yield Change('added', new_key[0], new_key[1],
+                         None, json.loads(new_line[3]), [])
+            new_line = next(new_lines, None)
+
+        else:
+            if old_line[2] != new_line[2]:
+                old_record = json.loads(old_line[3])
+                new_record = json.loads(new_line[3])
+                yield Change('changed', old_key[0], old_key[1], old_record,
+                             new_record,
+                             changed_fields(old_record, new_record))
+            old_line = next(old_lines, None)
+            new_line = next(new_lines, None)
+
+
+def summarize(changes):
+    """
+    Count changes by collection and kind
+
+    :param changes: The changes, as yielded by :py:func:`diff`
+    :returns: dict mapping each collection to a `dict` of the number of
+        records `added`, `removed` and `changed`
+    """
+
+    summary = {}
+    for change in changes:
+        counts = summary.setdefault(change.collection, {
+            'added': 0, 'removed': 0, 'changed': 0})
+        counts[change.kind] += 1
+
+    return summary
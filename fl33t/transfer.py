@@ -0,0 +1,164 @@
+"""
+Transfers
+
+Bandwidth limiting for build file uploads and downloads
+"""
+
+import re
+import threading
+import time
+
+RATE_UNITS = {
+    '': 1,
+    'K': 1024,
+    'M': 1024 ** 2,
+    'G': 1024 ** 3,
+}
+
+
+def parse_rate(value):
+    """
+    Parse a human readable transfer rate, such as `512K` or `2M`
+
+    :param str value: The rate, in bytes per second, with an optional
+        binary unit suffix
+    :returns: int
+    :raises ValueError: if the rate cannot be parsed
+    """
+
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?(?:/s)?\s*$',
+                     str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError('{} is not a valid transfer rate'.format(value))
+
+    return int(float(match.group(1)) * RATE_UNITS[match.group(2).upper()])
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket, where each token is one byte
+
+    :param rate: The number of bytes per second to allow
+    :type rate: int or float
+    :param capacity: The largest burst of bytes allowed. Defaults to one
+        second's worth of `rate`
+    :type capacity: int, float or None
+    """
+
+    def __init__(self, rate, capacity=None):
+        if not rate or rate <= 0:
+            raise ValueError('rate MUST be a positive number')
+
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else self.rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def consume(self, amount):
+        """
+        Take `amount` tokens from the bucket, blocking until they are
+        available
+
+        :param int amount: The number of bytes about to be transferred
+        :returns: float, the number of seconds spent waiting
+        """
+
+        waited = 0.0
+        while amount > 0:
+            take = min(amount, self.capacity)
+            with self._lock:
+                self._refill()
+                if self._tokens >= take:
+                    self._tokens -= take
+                    amount -= take
+                    continue
+                wait = (take - self._tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
+
+        return waited
+
+    def __repr__(self):
+        return '<TokenBucket rate={} capacity={}>'.format(
+            self.rate,
+            self.capacity
+        )
+
+
+class ThrottledReader:
+    """
+    Wraps a readable file-like object so that reads are limited by a
+    :py:class:`TokenBucket` and counted
+
+    It has no length, so `requests` uploads it in chunks. Use
+    :py:func:`throttled_reader` to get a reader with a length when the size
+    is known.
+
+    :param fileobj: The file-like object to read from
+    :param size: The number of bytes that will be read, if known
+    :type size: int or None
+    :param bucket: The bucket to take tokens from, if the transfer should be
+        limited
+    :type bucket: :py:class:`TokenBucket` or None
+    :param int chunk_size: The largest number of bytes returned by a single
+        read
+    """
+
+    def __init__(self, fileobj, size=None, bucket=None, *, chunk_size=65536):
+        self._fileobj = fileobj
+        self._size = size
+        self._bucket = bucket
+        self._chunk_size = chunk_size
+        self.bytes_read = 0
+        self.throttled = 0.0
+
+    def read(self, size=-1):
+        """Read up to `size` bytes, or everything that remains"""
+
+        if size is None or size < 0:
+            return b''.join(iter(self))
+
+        size = min(size, self._chunk_size)
+
+        data = self._fileobj.read(size)
+        if data and self._bucket:
+            self.throttled += self._bucket.consume(len(data))
+        self.bytes_read += len(data)
+
+        return data
+
+    def __iter__(self):
+        return iter(lambda: self.read(self._chunk_size), b'')
+
+
+class SizedThrottledReader(ThrottledReader):
+    """
+    A :py:class:`ThrottledReader` of a known number of bytes, which
+    `requests` sends with a `Content-Length`
+    """
+
+    def __len__(self):
+        return self._size
+
+
+def throttled_reader(fileobj, size=None, bucket=None, *, chunk_size=65536):
+    """
+    Wrap a file-like object so that reads are limited and counted, with a
+    length if its size is known
+
+    Takes the same arguments as :py:class:`ThrottledReader`.
+
+    :returns: :py:class:`SizedThrottledReader` if `size` is known, otherwise
+        :py:class:`ThrottledReader`
+    """
+
+    reader_class = ThrottledReader if size is None else SizedThrottledReader
+    return reader_class(fileobj, size, bucket, chunk_size=chunk_size)
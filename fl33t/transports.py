@@ -0,0 +1,329 @@
+"""
+Transports
+
+Send the requests built by :py:mod:`fl33t.protocol` over HTTP. The client
+uses :py:class:`RequestsTransport` by default, and any other transport can be
+given as its `transport` option
+"""
+
+import asyncio
+import re
+import threading
+
+from json import dumps as json_dumps
+
+from fl33t.exceptions import TransportError
+from fl33t.protocol import Response, full_url
+
+TRANSPORTS = {
+    'requests': 'RequestsTransport',
+    'urllib3': 'Urllib3Transport',
+    'httpx': 'HttpxTransport',
+    'fake': 'FakeTransport',
+}
+
+
+def get_transport(name, **kwargs):
+    """
+    Create a transport by name
+
+    :param str name: One of `requests`, `urllib3`, `httpx` or `fake`
+    :param kwargs: Any keyword args the transport accepts
+    :returns: :py:class:`Transport`
+    :raises ValueError: if there is no transport by that name
+    """
+
+    if name not in TRANSPORTS:
+        raise ValueError('Unknown transport {}, expected one of {}'.format(
+            name, ', '.join(sorted(TRANSPORTS))))
+
+    return globals()[TRANSPORTS[name]](**kwargs)
+
+
+class Transport:
+    """
+    Sends requests, and returns their responses
+
+    Transports must be safe to use from several threads at once. Those that
+    cannot send requests asynchronously send them from the event loop's
+    default executor in :py:meth:`send_async`.
+    """
+
+    def send(self, request):
+        """
+        Send a request
+
+        :param request: The request to send
+        :type request: :py:class:`fl33t.protocol.Request`
+        :returns: :py:class:`fl33t.protocol.Response`
+        :raises OSError: if no response was received
+        """
+
+        raise NotImplementedError
+
+    async def send_async(self, request):
+        """
+        Send a request, without blocking the event loop
+
+        :param request: The request to send
+        :type request: :py:class:`fl33t.protocol.Request`
+        :returns: :py:class:`fl33t.protocol.Response`
+        :raises OSError: if no response was received
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.send, request)
+
+    def attach(self, client):
+        """
+        Called once by the client this transport is given to
+
+        :param client: The client
+        :type client: :py:class:`fl33t.Fl33tClient`
+        """
+
+    def close(self):
+        """Close any connections held open by this transport"""
+
+
+class RequestsTransport(Transport):
+    """
+    Sends requests with a :py:class:`requests.Session`, keeping connections
+    alive and reusing them
+
+    Errors are raised as `requests` raises them, all of which are
+    :py:class:`OSError`.
+
+    :param session: If provided, the session to send requests with
+    :type session: :py:class:`requests.Session` or None
+    :param pool_size: If provided, the number of connections kept open to
+        each host
+    :type pool_size: int or None
+    """
+
+    def __init__(self, *, session=None, pool_size=None):
+        # pylint: disable=import-outside-toplevel
+        import requests
+
+        self.session = session if session is not None else requests.Session()
+        if pool_size:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=int(pool_size),
+                pool_maxsize=int(pool_size))
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+
+    def send(self, request):
+        result = self.session.request(request.method,
+                                      request.url,
+                                      params=request.params,
+                                      data=request.body,
+                                      headers=request.headers)
+        return Response(result.status_code, result.headers, result.content,
+                        result.url)
+
+    def close(self):
+        self.session.close()
+
+
+class Urllib3Transport(Transport):
+    """
+    Sends requests with a :py:class:`urllib3.PoolManager`
+
+    :param pool_size: If provided, the number of connections kept open to
+        each host
+    :type pool_size: int or None
+    :param kwargs: Any other keyword args :py:class:`urllib3.PoolManager`
+        accepts
+    """
+
+    def __init__(self, *, pool_size=None, **kwargs):
+        # pylint: disable=import-outside-toplevel
+        import urllib3
+
+        if pool_size:
+            kwargs['maxsize'] = int(pool_size)
+        self.pool = urllib3.PoolManager(**kwargs)
+        self._errors = urllib3.exceptions.HTTPError
+
+    def send(self, request):
+        url = full_url(request)
+        try:
+            result = self.pool.request(request.method,
+                                       url,
+                                       body=request.body,
+                                       headers=request.headers)
+        except self._errors as exc:
+            raise TransportError(str(exc)) from exc
+
+        return Response(result.status, result.headers, result.data, url)
+
+    def close(self):
+        self.pool.clear()
+
+
+class HttpxTransport(Transport):
+    """
+    Sends requests with :py:mod:`httpx`, asynchronously from
+    :py:meth:`send_async`
+
+    :param pool_size: If provided, the most connections kept open
+    :type pool_size: int or None
+    :param kwargs: Any other keyword args :py:class:`httpx.Client` accepts
+    """
+
+    def __init__(self, *, pool_size=None, **kwargs):
+        # pylint: disable=import-outside-toplevel,import-error
+        import httpx
+
+        if pool_size:
+            kwargs['limits'] = httpx.Limits(
+                max_connections=int(pool_size),
+                max_keepalive_connections=int(pool_size))
+        self._httpx = httpx
+        self._kwargs = kwargs
+        self.client = httpx.Client(**kwargs)
+        self.async_client = None
+
+    def _response(self, result, request):
+        return Response(result.status_code, result.headers, result.content,
+                        str(result.url) or request.url)
+
+    def send(self, request):
+        try:
+            result = self.client.request(request.method,
+                                         request.url,
+                                         params=request.params,
+                                         content=request.body,
+                                         headers=request.headers)
+        except self._httpx.HTTPError as exc:
+            raise TransportError(str(exc)) from exc
+
+        return self._response(result, request)
+
+    async def send_async(self, request):
+        # Created on first use, as it belongs to the running event loop
+        if self.async_client is None:
+            self.async_client = self._httpx.AsyncClient(**self._kwargs)
+
+        try:
+            result = await self.async_client.request(
+                request.method,
+                request.url,
+                params=request.params,
+                content=request.body,
+                headers=request.headers)
+        except self._httpx.HTTPError as exc:
+            raise TransportError(str(exc)) from exc
+
+        return self._response(result, request)
+
+    def close(self):
+        self.client.close()
+        if self.async_client is None:
+            return
+
+        closing = self.async_client.aclose()
+        self.async_client = None
+        try:
+            asyncio.get_running_loop().create_task(closing)
+        except RuntimeError:
+            asyncio.run(closing)
+
+
+class FakeTransport(Transport):
+    """
+    Answers requests in memory, without any network, for tests and for
+    trying out code against a made up team
+
+    Each route matches a method and a regular expression, searched for in the
+    request's URL. The first matching route, from the most recently added,
+    answers with a :py:class:`fl33t.protocol.Response`, or by calling its
+    handler with the request. Requests that match no route, or whose handler
+    is None, are answered by the `handler` given, if any, or with a 404.
+
+    Every request sent is appended to :py:attr:`history`.
+
+    :param handler: If provided, called with each request that matches no
+        route, returning the response
+    :type handler: callable or None
+    """
+
+    def __init__(self, handler=None):
+        self.handler = handler
+        self.routes = []
+        self.history = []
+        self._lock = threading.Lock()
+
+    # pylint: disable=too-many-arguments
+    def add(self, method, pattern, response=None, *, status_code=200,
+            json=None, text=None, headers=None):
+        """
+        Answer matching requests
+
+        :param str method: The request method to match, or `*` for any
+        :param str pattern: The regular expression searched for in the URL
+        :param response: If provided, a response, or a callable called with
+            the request returning one. Otherwise, the response is built from
+            the other arguments
+        :type response: :py:class:`fl33t.protocol.Response`, callable or None
+        :param int status_code: The status code to answer with
+        :param json: If provided, the body to answer with, encoded as JSON
+        :param text: If provided, the body to answer with
+        :type text: str or None
+        :param headers: If provided, the headers to answer with
+        :type headers: dict or None
+        """
+
+        if response is None:
+            response = fake_response(status_code, json=json, text=text,
+                                     headers=headers)
+
+        with self._lock:
+            self.routes.insert(0, (method.upper(), re.compile(pattern),
+                                   response))
+
+    def send(self, request):
+        with self._lock:
+            self.history.append(request)
+            routes = list(self.routes)
+
+        for method, pattern, response in routes:
+            if method in ('*', request.method) \
+                    and pattern.search(request.url):
+                break
+        else:
+            response = self.handler
+
+        if response is None:
+            return fake_response(404, text='Not Found', url=request.url)
+        if callable(response):
+            response = response(request)
+        if response.url is None:
+            response.url = request.url
+        return response
+
+
+def fake_response(status_code=200, *, json=None, text=None, headers=None,
+                  url=None):
+    """
+    Build a response, as :py:class:`FakeTransport` answers with
+
+    :param int status_code: The status code
+    :param json: If provided, the body, encoded as JSON
+    :param text: If provided, the body
+    :type text: str or None
+    :param headers: If provided, the headers
+    :type headers: dict or None
+    :param url: If provided, the URL that was requested
+    :type url: str or None
+    :returns: :py:class:`fl33t.protocol.Response`
+    """
+
+    headers = dict(headers or {})
+    if json is not None:
+        text = json_dumps(json)
+        headers.setdefault('Content-Type', 'application/json')
+
+    return Response(status_code, headers,
+                    text.encode('utf-8') if text else b'', url)
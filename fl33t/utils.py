@@ -4,14 +4,14 @@ Utilities
 Any utilities in use by the fl33t client
 """
 
+import collections
 import enum
 import hashlib
+import io
 import json
 import uuid
 
-from datetime import datetime, timedelta
-
-import pytz
+from datetime import datetime, timedelta, timezone
 
 
 class ExtendedEncoder(json.JSONEncoder):
@@ -20,7 +20,7 @@ class ExtendedEncoder(json.JSONEncoder):
     # pylint: disable=too-many-return-statements,arguments-differ,method-hidden
     def default(self, obj):
         if isinstance(obj, datetime):
-            return obj.replace(tzinfo=pytz.UTC).isoformat('T')
+            return obj.replace(tzinfo=timezone.utc).isoformat('T')
         if isinstance(obj, timedelta):
             return str(obj)
         if isinstance(obj, uuid.UUID):
@@ -38,8 +38,254 @@ class ExtendedEncoder(json.JSONEncoder):
 def md5(filename):
     """Hash function for files to be uploaded to Fl33t"""
 
-    md5hash = hashlib.md5()
     with open(filename, "rb") as filehandle:
-        for chunk in iter(lambda: filehandle.read(4096), b""):
-            md5hash.update(chunk)
-    return md5hash.hexdigest()
+        return md5_stream(filehandle)[0]
+
+
+def md5_buffer(buffer):
+    """
+    Hash an in-memory buffer to be uploaded to Fl33t, without copying it
+
+    :param buffer: Any object supporting the buffer protocol, such as
+        `bytes`, `bytearray` or `memoryview`
+    :returns: str
+    """
+
+    return hashlib.md5(memoryview(buffer).cast('B')).hexdigest()
+
+
+def md5_stream(stream, *, chunk_size=65536, spool=None):
+    """
+    Hash a stream to be uploaded to Fl33t, from its current position
+
+    Chunks are read into a single reusable buffer, rather than allocating a
+    new one for every read, where the stream supports it.
+
+    :param stream: A readable binary file-like object
+    :param int chunk_size: The number of bytes to read at a time
+    :param spool: If provided, a writable file-like object that every chunk
+        read is also written to
+    :returns: tuple of `(md5sum, size)`
+    """
+
+    md5hash = hashlib.md5()
+    size = 0
+    readinto = getattr(stream, 'readinto', None)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+
+    while True:
+        if readinto:
+            chunk = view[:readinto(buffer) or 0]
+        else:
+            chunk = stream.read(chunk_size)
+
+        if not chunk:
+            break
+
+        md5hash.update(chunk)
+        if spool is not None:
+            spool.write(chunk)
+        size += len(chunk)
+
+    return md5hash.hexdigest(), size
+
+
+class BufferReader(io.RawIOBase):
+    """
+    A read-only, seekable file-like view over an in-memory buffer
+
+    Unlike :py:class:`io.BytesIO`, the buffer is never copied as a whole, so
+    this can be used to stream a `memoryview` or `bytearray` as a request
+    body.
+
+    :param buffer: Any object supporting the buffer protocol
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        count = min(len(b), len(self._view) - self._position)
+        if count <= 0:
+            return 0
+        b[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def backoff_delay(attempt, *, base=0.5, limit=30):
+    """
+    The number of seconds to wait before retrying after a failure, doubling
+    with each attempt
+
+    :param int attempt: The number of attempts that have failed, less one
+    :param base: The delay after the first failure
+    :type base: int or float
+    :param limit: The longest delay
+    :type limit: int or float
+    :returns: float
+    """
+
+    return min(limit, base * 2 ** attempt)
+
+
+def timestamp_before(value, cutoff):
+    """
+    Whether a timestamp returned by fl33t, such as a device's
+    `checkin_tstamp`, is earlier than a cutoff
+
+    fl33t's own format is parsed quickly, and anything else with `dateutil`.
+    Timestamps without a timezone are taken to be in UTC.
+
+    :param value: The timestamp, as returned by fl33t or already parsed
+    :type value: str or :py:class:`datetime.datetime`
+    :param cutoff: The cutoff, with a timezone
+    :type cutoff: :py:class:`datetime.datetime`
+    :returns: bool
+    """
+
+    if isinstance(value, datetime):
+        timestamp = value
+    else:
+        try:
+            timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            # pylint: disable=import-outside-toplevel
+            from dateutil import parser
+            timestamp = parser.parse(value)
+
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp < cutoff
+
+
+def concurrent_map(func, iterable, *, workers=4):
+    """
+    Call `func` on every item of `iterable` using a bounded pool of threads
+
+    Results are yielded in the same order as the items were provided, and no
+    more than twice the number of workers are ever in flight, so that
+    `iterable` can be an unbounded generator.
+
+    :param func: The callable to run for each item
+    :param iterable: The items to process
+    :param int workers: The number of threads to use
+    :yields: tuples of `(item, result, exception)`, where exactly one of
+        `result` or `exception` is meaningful
+    """
+
+    # Imported here, as it is comparatively slow to import and most uses of
+    # this module do not need it
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = max(1, int(workers))
+    pending = collections.deque()
+
+    def _result(item, future):
+        try:
+            return item, future.result(), None
+        except Exception as exc:  # pylint: disable=broad-except
+            return item, None, exc
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for item in iterable:
+            pending.append((item, executor.submit(func, item)))
+            if len(pending) >= workers * 2:
+                yield _result(*pending.popleft())
+
+        while pending:
+            yield _result(*pending.popleft())
+
+
+def concurrent_pages(client, collection, *, page_size=None, workers=4,
+                     **filters):
+    """
+    Stream the pages of a collection, requesting them concurrently
+
+    The collection is counted first, and its pages are requested `workers`
+    at a time. Pages past the count are then requested one at a time, until
+    one is short, in case records were added in the meantime.
+
+    :param client: The client to list the collection with
+    :type client: :py:class:`fl33t.Fl33tClient`
+    :param str collection: One of `builds`, `devices`, `fleets`, `sessions`
+        or `trains`
+    :param page_size: If provided, the number of records to request per page
+    :type page_size: int or None
+    :param int workers: The number of pages to request at once
+    :param filters: Any filters the collection's `list_*` method accepts,
+        such as `fleet_id` for `devices`
+    :yields: list of the raw records of each page
+    :raises Exception: the first exception raised listing a page
+    """
+
+    page_size = page_size or client.default_query_limit
+    list_method = getattr(client, 'list_{}'.format(collection))
+
+    def page(offset):
+        return list(list_method(offset=offset, limit=page_size, raw=True,
+                                **filters))
+
+    offsets = range(0, client.count(collection, **filters), page_size)
+    records = []
+    for _, records, exc in concurrent_map(page, offsets, workers=workers):
+        if exc:
+            raise exc
+        yield records
+
+    offset = len(offsets) * page_size
+    while len(records) == page_size or not offsets:
+        records = page(offset)
+        if not records:
+            break
+        yield records
+        offset += page_size
+
+
+def gather(tasks, *, workers=None):
+    """
+    Call several functions concurrently and collect their results
+
+    :param dict tasks: A mapping of names to the callables to run. Falsy
+        values are skipped, and their result is `None`
+    :param workers: The number of threads to use. Defaults to one per task
+    :type workers: int or None
+    :returns: dict mapping each name to the result of its callable
+    :raises Exception: the first exception raised by any of the callables
+    """
+
+    results = {name: None for name in tasks}
+    calls = [(name, func) for name, func in tasks.items() if func]
+    if len(calls) == 1:
+        name, func = calls[0]
+        results[name] = func()
+        return results
+
+    for (name, _), result, exc in concurrent_map(
+            lambda call: call[1](), calls, workers=workers or len(calls)):
+        if exc:
+            raise exc
+        results[name] = result
+
+    return results
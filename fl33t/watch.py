@@ -0,0 +1,326 @@
+"""
+Watch
+
+Polls fl33t for changes to builds, devices, fleets, sessions or trains, and
+calls subscribers with an event for each record that really changed
+"""
+
+import collections
+import logging
+import threading
+import time
+
+from fl33t.exceptions import Fl33tApiException
+from fl33t.snapshot import COLLECTIONS, Change, changed_fields, fingerprint
+from fl33t.utils import backoff_delay
+
+KINDS = ['added', 'removed', 'changed']
+
+
+class Subscription:  # pylint: disable=too-few-public-methods
+    """
+    A callback for the changes to one collection
+
+    :param str collection: The collection watched
+    :param callable callback: Called with each :py:class:`Change`
+    :param fields: If provided, only report changes to these fields, and
+        records being added or removed
+    :type fields: list of str or None
+    :param kinds: If provided, only report these kinds of change, from
+        `added`, `removed` and `changed`
+    :type kinds: list of str or None
+    :param dict scope: The `list_*` filters limiting what is watched
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, collection, callback, fields=None, kinds=None,
+                 scope=None):
+        self.collection = collection
+        self.callback = callback
+        self.fields = set(fields) if fields else None
+        self.kinds = set(kinds or KINDS)
+        self.scope = dict(scope or {})
+
+    def wants(self, change):
+        """
+        Whether a change should be reported to this subscription
+
+        :param change: The change
+        :type change: :py:class:`Change`
+        :returns: bool
+        """
+
+        if change.kind not in self.kinds:
+            return False
+        if change.kind == 'changed' and self.fields is not None:
+            return bool(self.fields.intersection(change.fields))
+        return True
+
+
+class _Target:  # pylint: disable=too-few-public-methods
+    """The polling state of one collection and scope, shared by every
+    subscription to it"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, collection, scope, interval):
+        self.collection = collection
+        self.scope = scope
+        self.interval = interval
+        self.records = None
+        self.next_list = 0.0
+        self.next_count = 0.0
+        self.failures = 0
+        self.subscriptions = []
+
+
+class Watcher:
+    """
+    Polls fl33t for changes, and reports them to subscribers
+
+    Each collection is listed every `interval` seconds. Between listings,
+    its count is checked every `min_interval` seconds, and it is listed
+    straight away when the count changes. The listing interval halves,
+    down to `min_interval`, whenever a listing finds changes, and doubles,
+    up to `max_interval`, whenever it does not. Records are fingerprinted,
+    so that only records whose contents changed are reported.
+
+    A collection that fails to be polled, because fl33t returned an error or
+    could not be reached, is logged and tried again after a delay that
+    doubles with each failure, up to `max_interval`.
+
+    Subscriptions to the same collection and scope share a single listing.
+
+    :param client: The client to poll with
+    :type client: :py:class:`fl33t.Fl33tClient`
+    :param interval: The initial number of seconds between listings
+    :type interval: int or float
+    :param min_interval: The number of seconds between count checks, and the
+        shortest interval between listings
+    :type min_interval: int or float
+    :param max_interval: The longest interval between listings
+    :type max_interval: int or float
+    :param page_size: If provided, the number of records to request per page
+    :type page_size: int or None
+    """
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    def __init__(self, client, *, interval=30, min_interval=5,
+                 max_interval=300, page_size=None):
+        self.client = client
+        self.interval = interval
+        self.min_interval = min(min_interval, interval)
+        self.max_interval = max(max_interval, interval)
+        self.page_size = page_size
+        self.logger = logging.getLogger(__name__)
+
+        self._targets = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def subscribe(self, collection, callback, *, fields=None, kinds=None,
+                  **scope):
+        """
+        Report changes to a collection
+
+        The first poll of a collection records its current state, and only
+        later polls report changes.
+
+        :param str collection: One of `builds`, `devices`, `fleets`,
+            `sessions` or `trains`
+        :param callable callback: Called with each :py:class:`Change`
+        :param fields: If provided, only report changes to these fields, and
+            records being added or removed
+        :type fields: list of str or None
+        :param kinds: If provided, only report these kinds of change, from
+            `added`, `removed` and `changed`
+        :type kinds: list of str or None
+        :param scope: Filters for the collection's `list_*` method, such as
+            `fleet_id` for devices
+        :returns: :py:class:`Subscription`
+        :raises ValueError: if the collection is not known
+        """
+
+        if collection not in COLLECTIONS:
+            raise ValueError('Unknown collection: {}'.format(collection))
+
+        subscription = Subscription(collection, callback, fields, kinds,
+                                    scope)
+        key = (collection, tuple(sorted(scope.items())))
+        with self._lock:
+            if key not in self._targets:
+                self._targets[key] = _Target(collection, scope, self.interval)
+            self._targets[key].subscriptions.append(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Stop reporting changes to a subscription
+
+        :param subscription: The subscription to remove
+        :type subscription: :py:class:`Subscription`
+        """
+
+        key = (subscription.collection,
+               tuple(sorted(subscription.scope.items())))
+        with self._lock:
+            target = self._targets.get(key)
+            if target and subscription in target.subscriptions:
+                target.subscriptions.remove(subscription)
+                if not target.subscriptions:
+                    del self._targets[key]
+
+    def next_poll(self):
+        """
+        The number of seconds until a collection is next due to be polled
+
+        :returns: float
+        """
+
+        with self._lock:
+            targets = list(self._targets.values())
+        if not targets:
+            return self.min_interval
+
+        now = time.monotonic()
+        return max(0.0, min(min(target.next_list, target.next_count) - now
+                            for target in targets))
+
+    def poll(self):
+        """
+        Poll every collection that is due, and report its changes
+
+        :returns: int, the number of changes found
+        """
+
+        with self._lock:
+            targets = list(self._targets.values())
+
+        found = 0
+        for target in targets:
+            try:
+                found += self._poll_target(target)
+            except (Fl33tApiException, OSError) as exc:
+                self._failed(target, exc)
+
+        return found
+
+    def _poll_target(self, target):
+        """Check a collection's count, or list it, if either is due"""
+
+        now = time.monotonic()
+        if now < target.next_list:
+            if target.records is None or now < target.next_count:
+                return 0
+
+            target.next_count = now + self.min_interval
+            count = self.client.count(target.collection, **target.scope)
+            target.failures = 0
+            if count == len(target.records):
+                return 0
+
+        return self._list(target)
+
+    def _failed(self, target, exc):
+        """Log a failed poll, and wait longer before the next one with each
+        failure in a row"""
+
+        delay = min(backoff_delay(target.failures), self.max_interval)
+        target.failures += 1
+        self.logger.warning('Polling %s failed, retrying in %.1fs: %s',
+                            target.collection, delay, exc)
+
+        retry_at = time.monotonic() + delay
+        target.next_count = retry_at
+        target.next_list = max(target.next_list, retry_at)
+
+    def _list(self, target):
+        """List a collection, report what changed, and schedule its next
+        listing"""
+
+        id_field = COLLECTIONS[target.collection]
+        list_method = getattr(self.client,
+                              'list_{}'.format(target.collection))
+
+        records = {}
+        for record in list_method(page_size=self.page_size, raw=True,
+                                  **target.scope):
+            records[record[id_field]] = (fingerprint(record), record)
+
+        changes = []
+        if target.records is not None:
+            changes = list(self._changes(target, records))
+            if changes:
+                target.interval = max(target.interval / 2, self.min_interval)
+            else:
+                target.interval = min(target.interval * 2, self.max_interval)
+
+        target.records = records
+        target.failures = 0
+        now = time.monotonic()
+        target.next_list = now + target.interval
+        target.next_count = now + self.min_interval
+
+        for change in changes:
+            for subscription in list(target.subscriptions):
+                if subscription.wants(change):
+                    try:
+                        subscription.callback(change)
+                    except Exception:  # pylint: disable=broad-except
+                        self.logger.exception('Watch callback for %s failed',
+                                              target.collection)
+
+        return len(changes)
+
+    @staticmethod
+    def _changes(target, records):
+        previous = target.records
+        for record_id, (record_hash, record) in records.items():
+            if record_id not in previous:
+                yield Change('added', target.collection, record_id, None,
+                             record, [])
+                continue
+
+            old_hash, old = previous[record_id]
+            if old_hash != record_hash:
+                yield Change('changed', target.collection, record_id, old,
+                             record, changed_fields(old, record))
+
+        for record_id, (_, old) in previous.items():
+            if record_id not in records:
+                yield Change('removed', target.collection, record_id, old,
+                             None, [])
+
+    def run(self):
+        """Poll for changes until :py:meth:`stop` is called"""
+
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            self.poll()
+            self._stopped.wait(self.next_poll())
+
+    async def run_async(self):
+        """
+        Poll for changes until :py:meth:`stop` is called, without blocking
+        the event loop
+
+        Requests are made in the event loop's default executor.
+        """
+
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        loop = asyncio.get_event_loop()
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            delay = self.next_poll()
+            if delay > 0:
+                # Wake up regularly, to notice being stopped
+                await asyncio.sleep(min(delay, 1.0))
+                continue
+            await loop.run_in_executor(None, self.poll)
+
+    def stop(self):
+        """Stop :py:meth:`run` or :py:meth:`run_async`"""
+
+        self._stopped.set()
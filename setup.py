@@ -9,15 +9,12 @@ def readme():
 
 name = 'fl33t'
 description = 'Fl33t API Client'
-version = '0.6.2'
+version = '0.7.0'
 author = 'Fictive Kin LLC'
 email = 'hello@fictivekin.com'
 classifiers = [
     'Development Status :: 3 - Alpha',
     'License :: OSI Approved :: MIT License',
-    'Programming Language :: Python :: 3.4',
-    'Programming Language :: Python :: 3.5',
-    'Programming Language :: Python :: 3.6',
     'Programming Language :: Python :: 3.7',
     'Topic :: Software Development',
 ]
@@ -35,7 +32,7 @@ if __name__ == "__main__":
         maintainer=author,
         maintainer_email=email,
         license='MIT',
-        python_requires=">=3.4",
+        python_requires=">=3.7",
         packages=[
             'fl33t',
             'fl33t.cli',
@@ -45,9 +42,12 @@ if __name__ == "__main__":
         install_requires=[
             'click',
             'python-dateutil',
-            'pytz',
             'requests',
         ],
+        extras_require={
+            'httpx': ['httpx'],
+            'yaml': ['PyYAML'],
+        },
         scripts=[
             'bin/fl33t',
         ],
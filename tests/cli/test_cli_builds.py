@@ -0,0 +1,113 @@
+
+import json
+
+import requests_mock
+
+from click.testing import CliRunner
+
+from fl33t.cli.commands.builds import cli
+
+
+def test_create_many(fl33t_client, cli_obj, train_id, tmpdir):
+    upload_url = 'https://builds.example.com/upload'
+    for name in ('a.bin', 'b.bin', 'notes.txt'):
+        tmpdir.join(name).write(name)
+
+    def create_callback(request, context):
+        build = request.json()['build']
+        build.update({
+            'build_id': 'id-{}'.format(build['filename']),
+            'upload_url': upload_url,
+        })
+        return {'build': build}
+
+    create_url = '/'.join((fl33t_client.base_team_url, 'build'))
+    list_url = '/'.join((fl33t_client.base_team_url, 'builds'))
+
+    with requests_mock.Mocker() as mock:
+        mock.get(list_url, text=json.dumps({'build_count': 0, 'builds': []}))
+        mock.post(create_url, json=create_callback)
+        mock.put(upload_url, status_code=200)
+
+        result = CliRunner().invoke(
+            cli,
+            ['create-many', str(tmpdir), '-p', '*.bin', '-v', '1.0',
+             '-t', train_id],
+            obj=cli_obj)
+
+    assert result.exit_code == 0, result.output
+    assert 'CREATED  {}: id-a.bin'.format(tmpdir.join('a.bin')) \
+        in result.output
+    assert 'notes.txt' not in result.output
+    assert '2 created, 0 skipped, 0 failed' in result.output
+
+
+def test_create_many_manifest_failure(fl33t_client, cli_obj, train_id,
+                                      tmpdir):
+    tmpdir.join('a.bin').write('a')
+    manifest = tmpdir.join('manifest.csv')
+    manifest.write('filename,version,train_id\n'
+                   'a.bin,1.0,{}\n'
+                   'missing.bin,1.0,{}\n'.format(train_id, train_id))
+
+    create_url = '/'.join((fl33t_client.base_team_url, 'build'))
+
+    with requests_mock.Mocker() as mock:
+        mock.post(create_url, text=json.dumps({}))
+
+        result = CliRunner().invoke(
+            cli,
+            ['create-many', str(manifest), '--allow-duplicate'],
+            obj=cli_obj)
+
+    assert result.exit_code == 1
+    assert 'FAILED   {}'.format(tmpdir.join('a.bin')) in result.output
+    assert 'FAILED   {}'.format(tmpdir.join('missing.bin')) in result.output
+    assert '0 created, 0 skipped, 2 failed' in result.output
+
+
+def test_create_many_manifest_duplicate_rows(fl33t_client, cli_obj,
+                                             train_id, tmpdir):
+    upload_url = 'https://builds.example.com/upload'
+    tmpdir.join('a.bin').write('a')
+    manifest = tmpdir.join('manifest.csv')
+    manifest.write('filename,version,train_id\n'
+                   'a.bin,1.0,{0}\n'
+                   'a.bin,1.1,{0}\n'.format(train_id))
+
+    def create_callback(request, context):
+        build = request.json()['build']
+        build.update({
+            'build_id': 'id-{}'.format(build['version']),
+            'upload_url': upload_url,
+        })
+        return {'build': build}
+
+    create_url = '/'.join((fl33t_client.base_team_url, 'build'))
+
+    with requests_mock.Mocker() as mock:
+        mock.post(create_url, json=create_callback)
+        mock.put(upload_url, status_code=200)
+
+        result = CliRunner().invoke(
+            cli,
+            ['create-many', str(manifest), '--allow-duplicate'],
+            obj=cli_obj)
+
+    assert result.exit_code == 0, result.output
+    assert 'CREATED  {}: id-1.0'.format(tmpdir.join('a.bin')) \
+        in result.output
+    assert 'CREATED  {}: id-1.1'.format(tmpdir.join('a.bin')) \
+        in result.output
+    assert '2 created, 0 skipped, 0 failed' in result.output
+
+
+def test_create_many_manifest_no_filename(cli_obj, tmpdir):
+    manifest = tmpdir.join('manifest.csv')
+    manifest.write('file,version\na.bin,1.0\n')
+
+    result = CliRunner().invoke(cli, ['create-many', str(manifest)],
+                                obj=cli_obj)
+
+    assert result.exit_code == 2
+    assert 'filename column' in result.output
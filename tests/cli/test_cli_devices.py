@@ -0,0 +1,239 @@
+
+import csv
+import io
+import json
+
+import requests_mock
+
+from click.testing import CliRunner
+
+from fl33t.cli.commands.devices import cli
+
+
+def _device(index, fleet_id):
+    return {
+        'build_id': 'build-{}'.format(index % 2),
+        'checkin_tstamp': '2018-05-30T22:31:08.836406Z',
+        'device_id': 'device-{}'.format(index),
+        'fleet_id': fleet_id,
+        'name': 'Device, number {}'.format(index),
+        'session_token': 'secret-{}'.format(index),
+    }
+
+
+def _register_devices(mock, fl33t_client, fleet_id, count, page_size):
+    url = '/'.join((fl33t_client.base_team_url, 'devices'))
+    devices = [_device(index, fleet_id) for index in range(count)]
+
+    def callback(request, context):
+        offset = int(request.qs['offset'][0])
+        limit = int(request.qs['limit'][0])
+        assert limit == page_size
+        return {
+            'device_count': count,
+            'devices': devices[offset:offset + limit],
+        }
+
+    mock.get(url, json=callback)
+    return devices
+
+
+def test_list_jsonl(fl33t_client, cli_obj, fleet_id):
+    with requests_mock.Mocker() as mock:
+        devices = _register_devices(mock, fl33t_client, fleet_id, 7, 3)
+
+        result = CliRunner().invoke(
+            cli, ['list', '--format', 'jsonl', '--page-size', '3'],
+            obj=cli_obj)
+
+    assert result.exit_code == 0, result.output
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert len(records) == 7
+    assert records[0] == {
+        key: devices[0][key]
+        for key in ('device_id', 'name', 'fleet_id', 'build_id',
+                    'checkin_tstamp')
+    }
+    assert mock.call_count == 3
+
+
+def test_list_csv_columns(fl33t_client, cli_obj, fleet_id):
+    with requests_mock.Mocker() as mock:
+        _register_devices(mock, fl33t_client, fleet_id, 2, 25)
+
+        result = CliRunner().invoke(
+            cli, ['list', '-o', 'csv', '-c', 'device_id,name,session_token'],
+            obj=cli_obj)
+
+    assert result.exit_code == 0, result.output
+    rows = list(csv.reader(io.StringIO(result.output)))
+    assert rows == [
+        ['device_id', 'name', 'session_token'],
+        ['device-0', 'Device, number 0', 'secret-0'],
+        ['device-1', 'Device, number 1', 'secret-1'],
+    ]
+
+
+def test_list_tsv_offset_limit(fl33t_client, cli_obj, fleet_id):
+    with requests_mock.Mocker() as mock:
+        _register_devices(mock, fl33t_client, fleet_id, 10, 2)
+
+        result = CliRunner().invoke(
+            cli, ['list', '-o', 'tsv', '-c', 'device_id', '--offset', '4',
+                  '--limit', '2'],
+            obj=cli_obj)
+
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines() == ['device_id', 'device-4', 'device-5']
+    assert mock.call_count == 1
+
+
+def test_list_unknown_column(cli_obj):
+    result = CliRunner().invoke(
+        cli, ['list', '-o', 'csv', '-c', 'device_id,colour'], obj=cli_obj)
+
+    assert result.exit_code == 2
+    assert 'Unknown columns: colour' in result.output
+
+
+def test_list_columns_text_format(cli_obj):
+    result = CliRunner().invoke(cli, ['list', '-c', 'device_id'],
+                                obj=cli_obj)
+
+    assert result.exit_code == 2
+    assert 'Invalid value for --columns' in result.output.replace("'", '')
+    assert 'jsonl, csv and tsv' in result.output
+
+
+def _batch_mocks(mock, fl33t_client, device_get_response):
+    device_url = '/'.join((fl33t_client.base_team_url, 'device'))
+    existing = device_get_response['device']
+
+    mock.get('{}/{}'.format(device_url, existing['device_id']),
+             json=device_get_response)
+    mock.get('{}/gone'.format(device_url), status_code=404)
+    mock.put('{}/{}'.format(device_url, existing['device_id']),
+             status_code=204)
+    mock.delete('{}/{}'.format(device_url, existing['device_id']),
+                status_code=204)
+    mock.post(device_url, json=lambda request, context: {
+        'device': request.json()['device']})
+
+
+def test_batch(fl33t_client, cli_obj, device_get_response):
+    device_id = device_get_response['device']['device_id']
+    source = '\n'.join([
+        'action,device_id,fleet_id,name',
+        'create,new-device,fleet-a,New Device',
+        'update,{},fleet-b,'.format(device_id),
+        'update,{},,My Device'.format(device_id),
+        'delete,gone,,',
+        'explode,{},,'.format(device_id),
+    ])
+
+    with requests_mock.Mocker() as mock:
+        _batch_mocks(mock, fl33t_client, device_get_response)
+
+        result = CliRunner().invoke(
+            cli, ['batch', '-', '-j', '3'], input=source, obj=cli_obj)
+
+        writes = [request.method for request in mock.request_history
+                  if request.method != 'GET']
+
+    assert result.exit_code == 1
+    rows = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [row['line'] for row in rows] == [2, 3, 4, 5, 6]
+    assert [row['status'] for row in rows] == [
+        'created', 'updated', 'unchanged', 'missing', 'failed']
+    assert rows[1]['changes'] == {'fleet_id': ['fake-fleet-id', 'fleet-b']}
+    assert rows[4]['error'] == "Unknown action: 'explode'"
+    assert sorted(writes) == ['POST', 'PUT']
+    assert '5 rows processed, 1 failed' in result.stderr
+
+
+def test_batch_dry_run(fl33t_client, cli_obj, device_get_response):
+    device_id = device_get_response['device']['device_id']
+    source = '\n'.join([
+        json.dumps({'action': 'create', 'device_id': device_id}),
+        json.dumps({'action': 'update', 'device_id': device_id,
+                    'fleet_id': 'fleet-b'}),
+        json.dumps({'device_id': device_id}),
+    ])
+
+    with requests_mock.Mocker() as mock:
+        _batch_mocks(mock, fl33t_client, device_get_response)
+
+        result = CliRunner().invoke(
+            cli, ['batch', '-', '-i', 'jsonl', '-a', 'delete', '--dry-run',
+                  '-o', 'csv'],
+            input=source, obj=cli_obj)
+
+        methods = {request.method for request in mock.request_history}
+
+    assert result.exit_code == 0, result.output
+    rows = list(csv.DictReader(io.StringIO(result.stdout)))
+    assert [row['status'] for row in rows] == [
+        'exists', 'would-update', 'would-delete']
+    assert methods == {'GET'}
+
+
+def test_batch_dry_run_cached(fl33t_client, cli_obj, device_get_response):
+    device_id = device_get_response['device']['device_id']
+    source = 'action,device_id,fleet_id,name\n' + \
+        'update,{},fleet-b,\n'.format(device_id) * 2
+    fl33t_client.enable_cache()
+
+    with requests_mock.Mocker() as mock:
+        _batch_mocks(mock, fl33t_client, device_get_response)
+
+        result = CliRunner().invoke(
+            cli, ['batch', '-', '-j', '1', '--dry-run'], input=source,
+            obj=cli_obj)
+
+        assert fl33t_client.get_device(device_id).fleet_id == 'fake-fleet-id'
+
+    rows = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [row['status'] for row in rows] == ['would-update'] * 2
+    assert rows[1]['changes'] == {'fleet_id': ['fake-fleet-id', 'fleet-b']}
+
+
+def test_reap(fl33t_client, cli_obj, tmp_path):
+    devices = [{'device_id': 'device-{}'.format(index), 'name': 'Device',
+                'fleet_id': 'fleet', 'build_id': 'build',
+                'session_token': 'token',
+                'checkin_tstamp': '20{}-06-01T00:00:00.000000Z'.format(
+                    index + 18)}
+               for index in range(2)]
+    devices[1]['checkin_tstamp'] = '2999-01-01T00:00:00.000000Z'
+    journal = str(tmp_path / 'reap.jsonl')
+
+    with requests_mock.Mocker() as mock:
+        mock.get('/'.join((fl33t_client.base_team_url, 'devices')),
+                 json={'device_count': 2, 'devices': devices})
+        delete = mock.delete('/'.join((fl33t_client.base_team_url, 'device',
+                                       'device-0')),
+                             status_code=204)
+
+        result = CliRunner().invoke(
+            cli, ['reap', '--older-than', '90d', '--dry-run', '--journal',
+                  journal, '--format', 'jsonl'],
+            obj=cli_obj)
+        assert result.exit_code == 0, result.output
+        assert [json.loads(line) for line in result.stdout.splitlines()] == [
+            {'device_id': 'device-0', 'fleet_id': 'fleet',
+             'checkin_tstamp': '2018-06-01T00:00:00.000000Z',
+             'status': 'stale'}]
+        assert not delete.called
+
+        result = CliRunner().invoke(
+            cli, ['reap', '--older-than', '90d', '--journal', journal],
+            obj=cli_obj)
+        assert result.exit_code == 0, result.output
+        assert result.stdout == ('deleted device-0 (fleet fleet, last '
+                                 'checked in 2018-06-01T00:00:00.000000Z)\n')
+        assert '1 stale devices, 1 deleted, 0 failed' in result.stderr
+        assert delete.call_count == 1
+
+    result = CliRunner().invoke(cli, ['reap', '--older-than', 'soon'],
+                                obj=cli_obj)
+    assert result.exit_code == 2
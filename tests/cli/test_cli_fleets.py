@@ -0,0 +1,130 @@
+
+import json
+
+import requests_mock
+
+from click.testing import CliRunner
+
+from fl33t.cli.commands.fleets import cli
+
+
+def test_list_relations(fl33t_client, cli_obj, train_id,
+                        train_get_response, build_get_response):
+    fleets = [
+        {
+            'build_id': None,
+            'fleet_id': 'fleet-{}'.format(index),
+            'name': 'Fleet {}'.format(index),
+            'size': index,
+            'train_id': train_id,
+            'unreleased': True,
+        }
+        for index in range(6)
+    ]
+
+    fl33t_client.enable_cache()
+
+    with requests_mock.Mocker() as mock:
+        mock.get('/'.join((fl33t_client.base_team_url, 'fleets')),
+                 json={'fleet_count': len(fleets), 'fleets': fleets})
+        mock.get('/'.join((fl33t_client.base_team_url, 'train', train_id)),
+                 json=train_get_response)
+        mock.get('/'.join((fl33t_client.base_team_url, 'builds')),
+                 json={'build_count': 1,
+                       'builds': [build_get_response['build']]})
+        mock.get('/'.join((fl33t_client.base_team_url, 'devices')),
+                 json=lambda request, context: {
+                     'device_count': 0, 'devices': []})
+
+        result = CliRunner().invoke(cli, ['list', '-t', '-b', '-d', '-j', '4'],
+                                    obj=cli_obj)
+
+        paths = [request.path for request in mock.request_history]
+
+    assert result.exit_code == 0, result.output
+
+    fleet_lines = [line for line in result.output.splitlines()
+                   if line.startswith('Fleet ')]
+    assert fleet_lines == [
+        line for line in (
+            'Fleet fleet-{}: Fleet {} (Train: {}, Status: Unreleased, '
+            'Size: {})'.format(index, index, train_id, index)
+            for index in range(6))
+    ]
+
+    assert paths.count('/team/meli/train/{}'.format(train_id)) == 1
+    assert paths.count('/team/meli/builds') == 1
+    assert paths.count('/team/meli/devices') == 6
+
+
+def test_rollout(fl33t_client, cli_obj, fleet_id, fleet_get_response,
+                 build_id, tmp_path):
+    device = {'device_id': 'device-1', 'name': 'Device',
+              'fleet_id': 'stable', 'build_id': 'old-build',
+              'session_token': 'token',
+              'checkin_tstamp': '2018-06-01T00:00:00.000000Z'}
+
+    def list_devices(request, context):
+        devices = [device] if request.qs['fleet_id'][0] == device['fleet_id'] \
+            else []
+        return {'device_count': len(devices), 'devices': devices}
+
+    def update_device(request, context):
+        device['fleet_id'] = json.loads(request.body)['device']['fleet_id']
+        device['build_id'] = build_id
+        context.status_code = 204
+        return ''
+
+    checkpoint = str(tmp_path / 'rollout.json')
+    with requests_mock.Mocker() as mock:
+        mock.get('/'.join((fl33t_client.base_team_url, 'fleet', fleet_id)),
+                 json=fleet_get_response)
+        mock.get('/'.join((fl33t_client.base_team_url, 'devices')),
+                 json=list_devices)
+        mock.get('/'.join((fl33t_client.base_team_url, 'device',
+                           'device-1')),
+                 json=lambda request, context: {'device': device})
+        mock.put('/'.join((fl33t_client.base_team_url, 'device',
+                           'device-1')),
+                 text=update_device)
+
+        result = CliRunner().invoke(
+            cli, ['rollout', 'stable', fleet_id, '--waves', '50,100',
+                  '--checkpoint', checkpoint, '--poll-interval', '1'],
+            obj=cli_obj)
+
+    assert result.exit_code == 0, result.output
+    assert result.stdout.splitlines() == [
+        'Rolling out build {} to 1 devices, checkpointed to {}'.format(
+            build_id, checkpoint),
+        'Wave 1: 1 devices: moved 1, 0 failed',
+        'Wave 1: 1 devices: 1 of 1 on the new build (100%), 0 checked in',
+        'Wave 2: 1 devices: moved 0, 0 failed',
+        'Wave 2: 1 devices: 1 of 1 on the new build (100%), 0 checked in',
+        'Rollout done',
+    ]
+
+    result = CliRunner().invoke(cli, ['rollout', 'stable', fleet_id,
+                                      '--waves', '50,x'], obj=cli_obj)
+    assert result.exit_code == 2
+
+
+def test_converge(fl33t_client, cli_obj, fleet_id, fleet_get_response,
+                  build_id):
+    devices = [{'device_id': 'device-{}'.format(index),
+                'build_id': build_id if index < 3 else 'old-build'}
+               for index in range(4)]
+
+    with requests_mock.Mocker() as mock:
+        mock.get('/'.join((fl33t_client.base_team_url, 'fleet', fleet_id)),
+                 json=fleet_get_response)
+        mock.get('/'.join((fl33t_client.base_team_url, 'devices')),
+                 json={'device_count': 4, 'devices': devices})
+
+        result = CliRunner().invoke(cli, ['converge', fleet_id, '-u', '75'],
+                                    obj=cli_obj)
+
+    assert result.exit_code == 0, result.output
+    assert result.stdout.endswith(
+        ' 3 of 4 devices on build {} (75.0%), rate unknown, ETA unknown\n'
+        .format(build_id))
@@ -0,0 +1,66 @@
+import json
+
+import requests_mock
+
+from click.testing import CliRunner
+
+from fl33t.cli.commands.reconcile import apply
+
+
+def mock_listings(mock, fl33t_client, train_id):
+    fleet = {'fleet_id': 'fleet-1', 'name': 'Canary', 'size': 1,
+             'train_id': train_id, 'build_id': None, 'unreleased': True}
+    mock.get('/'.join((fl33t_client.base_team_url, 'trains')),
+             json={'train_count': 0, 'trains': []})
+    mock.get('/'.join((fl33t_client.base_team_url, 'fleets')),
+             json={'fleet_count': 1, 'fleets': [fleet]})
+
+
+def test_plan_only(fl33t_client, cli_obj, train_id, tmp_path):
+    state = tmp_path / 'state.json'
+    state.write_text(json.dumps({
+        'fleets': [{'name': 'Canary', 'unreleased': False}]}))
+
+    with requests_mock.Mocker() as mock:
+        mock_listings(mock, fl33t_client, train_id)
+
+        result = CliRunner().invoke(apply, [str(state), '--plan-only'],
+                                    obj=cli_obj)
+        assert result.exit_code == 1
+        assert result.stdout == (
+            "~ update fleet fleet-1 'Canary': unreleased: True -> False\n")
+        assert 'Plan: 0 to create, 1 to update, 0 to delete' \
+            in result.stderr
+
+        result = CliRunner().invoke(
+            apply, [str(state), '--plan-only', '--format', 'jsonl'],
+            obj=cli_obj)
+        assert json.loads(result.stdout)['changes'] == {
+            'unreleased': [True, False]}
+
+        assert all(request.method == 'GET'
+                   for request in mock.request_history)
+
+
+def test_apply(fl33t_client, cli_obj, train_id):
+    state = 'fleets:\n  - name: Canary\n    unreleased: false\n'
+
+    with requests_mock.Mocker() as mock:
+        mock_listings(mock, fl33t_client, train_id)
+        mock.put('/'.join((fl33t_client.base_team_url, 'fleet', 'fleet-1')),
+                 status_code=204)
+
+        result = CliRunner().invoke(apply, ['-'], input=state, obj=cli_obj)
+
+        assert result.exit_code == 0, result.output
+        assert '1 of 1 changes applied, 0 failed' in result.stderr
+        assert json.loads(mock.last_request.body)['fleet']['unreleased'] \
+            is False
+
+
+def test_invalid_state(fl33t_client, cli_obj):
+    result = CliRunner().invoke(apply, ['-'], input='{"widgets": []}',
+                                obj=cli_obj)
+
+    assert result.exit_code == 1
+    assert 'Unknown sections: widgets' in result.stderr
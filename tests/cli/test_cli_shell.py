@@ -0,0 +1,87 @@
+import requests_mock
+
+from click.testing import CliRunner
+
+from fl33t.cli import cli as root
+from fl33t.cli.shell import ShellCompleter, shell
+
+
+def test_shell_reuses_client(fl33t_client, cli_obj, train_id,
+                             train_get_response):
+    fl33t_client.enable_cache()
+
+    with requests_mock.Mocker() as mock:
+        mock.get('/'.join((fl33t_client.base_team_url, 'train', train_id)),
+                 json=train_get_response)
+
+        result = CliRunner().invoke(
+            shell,
+            input='trains show {0}\ntrains show {0}\nexit\n'.format(train_id),
+            obj=cli_obj)
+
+        assert mock.call_count == 1
+
+    assert result.exit_code == 0, result.output
+    assert result.stdout.count('Train {}'.format(train_id)) == 2
+    assert result.stderr.count('s)\n') == 2
+
+
+def test_shell_errors_do_not_exit(fl33t_client, cli_obj):
+    result = CliRunner().invoke(
+        shell,
+        input='\n'.join((
+            'nonsense',
+            'fleets frobnicate',
+            'shell',
+            'trains show "unterminated',
+            'help',
+        )),
+        obj=cli_obj)
+
+    assert result.exit_code == 0, result.output
+    assert 'No such command: nonsense' in result.stderr
+    assert "No such command 'frobnicate'" in result.stderr
+    assert 'No such command: shell' in result.stderr
+    assert 'clear-cache' in result.stdout
+
+
+def test_shell_clear_cache(fl33t_client, cli_obj):
+    cache = fl33t_client.enable_cache()
+    cache.set(('train', 'abc'), object())
+
+    result = CliRunner().invoke(shell, input='clear-cache\n', obj=cli_obj)
+
+    assert result.exit_code == 0, result.output
+    assert not cache.keys()
+
+
+def test_completion(fl33t_client):
+    cache = fl33t_client.enable_cache()
+    cache.set(('train', 'train-1'), object())
+    cache.set(('fleet', 'fleet-1'), object())
+    cache.set(('builds', 'train-1'), [])
+
+    completer = ShellCompleter(root, None, lambda: fl33t_client)
+
+    assert 'fleets' in completer.candidates([], '')
+    assert 'clear-cache' in completer.candidates([], '')
+    assert 'shell' not in completer.candidates([], '')
+    assert 'list' in completer.candidates(['fleets'], '')
+    assert '--show-train' in completer.candidates(['fleets', 'list'], '--')
+    assert completer.candidates(['trains', 'show'], '') == ['train-1']
+    assert completer.candidates(
+        ['builds', 'create', '--train-id'], '') == ['train-1']
+
+
+def test_shell_cache_expires(fl33t_client, cli_obj):
+    cache = fl33t_client.enable_cache()
+    assert cache.ttl is None
+
+    result = CliRunner().invoke(shell, input='exit\n', obj=cli_obj)
+    assert result.exit_code == 0, result.output
+    assert cache.ttl == 30
+
+    result = CliRunner().invoke(shell, ['--cache-ttl', '5'], input='',
+                                obj=cli_obj)
+    assert result.exit_code == 0, result.output
+    assert fl33t_client.cache.ttl == 5
@@ -55,3 +55,23 @@ def test_fail_get_device_invalid_id(fl33t_client):
         with pytest.raises(InvalidDeviceIdError):
             fl33t_client.get_device(device_id)
             fl33t_client.get_device(device_id)
+
+
+def test_list_devices_raw(fl33t_client, device_get_response):
+    url = '/'.join((
+        fl33t_client.base_team_url,
+        'devices'
+    ))
+
+    list_response = {
+        'device_count': 1,
+        'devices': [device_get_response['device']]
+    }
+
+    with requests_mock.Mocker() as mock:
+        mock.get(url, text=json.dumps(list_response))
+
+        records = list(fl33t_client.list_devices(raw=True, page_size=50))
+
+        assert records == [device_get_response['device']]
+        assert mock.last_request.qs['limit'] == ['50']
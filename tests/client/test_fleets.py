@@ -3,7 +3,7 @@ import json
 import pytest
 import requests_mock
 
-from fl33t.exceptions import InvalidFleetIdError
+from fl33t.exceptions import Fl33tApiException, InvalidFleetIdError
 from fl33t.models import Fleet
 
 
@@ -55,3 +55,53 @@ def test_fail_get_fleet_invalid_id(fl33t_client):
         with pytest.raises(InvalidFleetIdError):
             fl33t_client.get_fleet(fleet_id)
             fl33t_client.get_fleet(fleet_id)
+
+
+def test_get_fleet_cached(fl33t_client, fleet_id, fleet_get_response):
+    url = '/'.join((
+        fl33t_client.base_team_url,
+        'fleet',
+        fleet_id
+    ))
+
+    fl33t_client.enable_cache()
+
+    with requests_mock.Mocker() as mock:
+        mock.get(url, text=json.dumps(fleet_get_response))
+        mock.put(url, status_code=204)
+
+        fleet = fl33t_client.get_fleet(fleet_id)
+        assert fl33t_client.get_fleet(fleet_id).name == fleet.name
+        assert mock.call_count == 1
+
+        # Local changes are not seen by other lookups until they are saved
+        fleet.name = 'Renamed'
+        assert fl33t_client.get_fleet(fleet_id).name != 'Renamed'
+        assert mock.call_count == 1
+
+        fleet.update()
+        fl33t_client.get_fleet(fleet_id)
+        assert mock.call_count == 3
+
+
+def test_failed_update_evicts_cached(fl33t_client, fleet_id,
+                                     fleet_get_response):
+    url = '/'.join((
+        fl33t_client.base_team_url,
+        'fleet',
+        fleet_id
+    ))
+
+    fl33t_client.enable_cache()
+
+    with requests_mock.Mocker() as mock:
+        mock.get(url, text=json.dumps(fleet_get_response))
+        mock.put(url, status_code=500)
+
+        fleet = fl33t_client.get_fleet(fleet_id)
+        fleet.name = 'Renamed'
+        with pytest.raises(Fl33tApiException):
+            fleet.update()
+
+        assert fl33t_client.get_fleet(fleet_id).name != 'Renamed'
+        assert mock.call_count == 3
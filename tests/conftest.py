@@ -105,3 +105,8 @@ def build_get_response(train_id, build_id):
             "version": "0.1"
         }
     }
+
+
+@pytest.yield_fixture
+def cli_obj(fl33t_client):
+    return {'get_fl33t_client': lambda: fl33t_client}
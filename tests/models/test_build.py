@@ -1,5 +1,7 @@
 
 import copy
+import hashlib
+import io
 import datetime
 import json
 import pytest
@@ -7,7 +9,9 @@ import requests_mock
 
 from fl33t.exceptions import (
     Fl33tClientException,
+    BuildDownloadError,
     BuildUploadError,
+    DuplicateBuildError,
     NoUploadUrlProvidedError
 )
 from fl33t.models import Build, Train
@@ -288,3 +292,362 @@ def test_parent_train(fl33t_client,
 
         assert isinstance(obj.train, Train)
         assert obj.train.train_id == train_id
+
+
+def test_create_skip_duplicate(fl33t_client, build_id, train_id,
+                               build_get_response):
+    build_get_response['build']['md5sum'] = 'abcdef0123456789'
+    list_response = {
+        'build_count': 1,
+        'builds': [build_get_response['build']]
+    }
+
+    list_url = '/'.join((
+        fl33t_client.base_team_url,
+        'builds?train_id={}'.format(train_id)
+    ))
+    get_url = '/'.join((
+        fl33t_client.base_team_url,
+        'build',
+        build_id
+    ))
+    create_url = '/'.join((
+        fl33t_client.base_team_url,
+        'build'
+    ))
+
+    with requests_mock.Mocker() as mock:
+        mock.get(list_url, text=json.dumps(list_response))
+        mock.get(get_url, text=json.dumps(build_get_response))
+        mock.post(create_url, status_code=500)
+
+        obj = fl33t_client.Build(
+            train_id=train_id,
+            version='0.1',
+            filename=__file__,
+            md5sum='abcdef0123456789'
+        )
+
+        response = obj.create(skip_duplicate=True)
+        assert response is obj
+        assert obj.duplicate is True
+        assert obj.build_id == build_id
+        assert obj.filename == 'test_build.py'
+        assert not any(req.method == 'POST' for req in mock.request_history)
+
+
+@pytest.mark.parametrize('changes', [{'version': '0.2.0'},
+                                     {'released': True}])
+def test_create_skip_duplicate_mismatch(fl33t_client, build_id, train_id,
+                                        build_get_response, changes):
+    build_get_response['build']['md5sum'] = 'abcdef0123456789'
+    list_response = {
+        'build_count': 1,
+        'builds': [build_get_response['build']]
+    }
+
+    list_url = '/'.join((
+        fl33t_client.base_team_url,
+        'builds?train_id={}'.format(train_id)
+    ))
+    get_url = '/'.join((
+        fl33t_client.base_team_url,
+        'build',
+        build_id
+    ))
+
+    with requests_mock.Mocker() as mock:
+        mock.get(list_url, text=json.dumps(list_response))
+        mock.get(get_url, text=json.dumps(build_get_response))
+
+        obj = fl33t_client.Build(**dict({
+            'train_id': train_id,
+            'version': build_get_response['build']['version'],
+            'released': build_get_response['build']['released'],
+            'filename': __file__,
+            'md5sum': 'abcdef0123456789'
+        }, **changes))
+
+        with pytest.raises(DuplicateBuildError, match=build_id):
+            obj.create(skip_duplicate=True)
+
+        # The caller's version and release are left alone
+        for key, value in changes.items():
+            assert getattr(obj, key) == value
+        assert obj.duplicate is False
+        assert not any(req.method == 'POST' for req in mock.request_history)
+
+
+def test_create_skip_duplicate_no_match(fl33t_client, build_id, train_id,
+                                        build_get_response):
+    upload_url = "https://builds.example.com/some/build/path"
+
+    list_response = {
+        'build_count': 1,
+        'builds': [build_get_response['build']]
+    }
+    create_response = copy.deepcopy(build_get_response)
+    create_response['build']['status'] = 'created'
+    create_response['build']['upload_url'] = upload_url
+
+    list_url = '/'.join((
+        fl33t_client.base_team_url,
+        'builds?train_id={}'.format(train_id)
+    ))
+    create_url = '/'.join((
+        fl33t_client.base_team_url,
+        'build'
+    ))
+
+    with requests_mock.Mocker() as mock:
+        mock.get(list_url, text=json.dumps(list_response))
+        mock.post(create_url, text=json.dumps(create_response))
+        mock.put(upload_url, [{'status_code': 200}])
+
+        obj = fl33t_client.Build(
+            train_id=train_id,
+            version='0.1.4',
+            filename=__file__
+        )
+
+        response = obj.create(skip_duplicate=True)
+        assert response is obj
+        assert obj.duplicate is False
+
+        # The index is kept up to date, rather than listed again
+        assert train_id in fl33t_client._build_indexes
+        assert mock.call_count == 3
+
+
+def test_build_index(fl33t_client, train_id, build_get_response):
+    list_response = {
+        'build_count': 1,
+        'builds': [build_get_response['build']]
+    }
+    md5sum = build_get_response['build']['md5sum']
+
+    url = '/'.join((
+        fl33t_client.base_team_url,
+        'builds?train_id={}'.format(train_id)
+    ))
+
+    with requests_mock.Mocker() as mock:
+        mock.get(url, text=json.dumps(list_response))
+
+        index = fl33t_client.get_build_index(train_id)
+        assert md5sum in index
+        assert index.get(md5sum).build_id == build_get_response['build'][
+            'build_id']
+        assert 'not-a-hash' not in index
+
+        assert fl33t_client.get_build_index(train_id) is index
+        assert mock.call_count == 1
+
+        fl33t_client.invalidate_build_index(train_id)
+        assert fl33t_client.get_build_index(train_id) is not index
+        assert mock.call_count == 2
+
+        index = fl33t_client.get_build_index(train_id)
+        new_build = fl33t_client.Build(build_id='new-build', train_id=train_id,
+                                       md5sum='new-hash', status='created')
+        fl33t_client.add_to_build_index(new_build)
+        assert index.get('new-hash', pending=True) is new_build
+        assert 'new-hash' not in index
+
+        fl33t_client.remove_from_build_index(new_build)
+        assert index.get('new-hash', pending=True) is None
+        assert fl33t_client.get_build_index(train_id) is index
+        assert mock.call_count == 2
+
+
+class _Pipe:
+    """A stream that can only be read once, like a pipe"""
+
+    def __init__(self, data):
+        self._data = data
+
+    def read(self, size=-1):
+        chunk, self._data = self._data[:size], self._data[size:]
+        return chunk
+
+
+@pytest.mark.parametrize('fileobj', [
+    lambda data: data,
+    lambda data: memoryview(bytearray(data)),
+    lambda data: io.BytesIO(b'skip' + data),
+    lambda data: _Pipe(data),
+])
+def test_create_from_fileobj(fl33t_client, build_id, train_id, fileobj):
+    upload_url = "https://builds.example.com/some/build/path"
+    data = b'firmware' * 10000
+
+    source = fileobj(data)
+    if isinstance(source, io.BytesIO):
+        source.seek(4)
+
+    create_response = {
+        "build": {
+            "build_id": build_id,
+            "status": "created",
+            "train_id": train_id,
+            "upload_url": upload_url,
+            "version": '0.1.4'
+        }
+    }
+
+    url = '/'.join((
+        fl33t_client.base_team_url,
+        'build'
+    ))
+
+    uploaded = []
+
+    def upload_callback(request, context):
+        body = request.body
+        uploaded.append(body if isinstance(body, bytes) else body.read())
+        return ''
+
+    with requests_mock.Mocker() as mock:
+        mock.post(url, text=json.dumps(create_response))
+        mock.put(upload_url, status_code=200, text=upload_callback)
+
+        obj = fl33t_client.Build(
+            train_id=train_id,
+            version='0.1.4',
+            filename='firmware.bin',
+            fileobj=source
+        )
+
+        assert obj.filename == 'firmware.bin'
+        assert obj.size == len(data)
+        assert obj.md5sum == hashlib.md5(data).hexdigest()
+
+        spool = obj._spool
+        assert obj.create() is obj
+        assert uploaded == [data]
+
+    # Streams are spooled for the upload, and the spool closed afterwards
+    assert obj._spool is None
+    if spool is not None:
+        assert spool.closed
+
+
+def test_spool_closed(fl33t_client, monkeypatch):
+    with fl33t_client.Build(filename='firmware.bin',
+                            fileobj=_Pipe(b'firmware')) as obj:
+        spool = obj._spool
+        assert not spool.closed
+    assert spool.closed
+
+    spools = []
+
+    def failing_md5_stream(fileobj, spool=None):
+        spools.append(spool)
+        raise OSError('read failed')
+
+    monkeypatch.setattr('fl33t.models.build.md5_stream', failing_md5_stream)
+    with pytest.raises(OSError):
+        fl33t_client.Build(filename='firmware.bin', fileobj=_Pipe(b'x'))
+    assert spools[0].closed
+
+
+def test_create_from_fileobj_no_filename(fl33t_client):
+    with pytest.raises(ValueError):
+        fl33t_client.Build(fileobj=b'firmware')
+
+
+def test_create_transfer_event(fl33t_client, build_id, train_id):
+    upload_url = "https://builds.example.com/some/build/path?signature=abc"
+
+    create_response = {
+        "build": {
+            "build_id": build_id,
+            "status": "created",
+            "train_id": train_id,
+            "upload_url": upload_url,
+            "version": '0.1.4'
+        }
+    }
+
+    url = '/'.join((
+        fl33t_client.base_team_url,
+        'build'
+    ))
+
+    events = []
+    fl33t_client.add_hook('transfer',
+                          lambda event, **payload: events.append(payload))
+    fl33t_client.transfer_retries = 1
+    fl33t_client._transfer_backoff = lambda attempt: None
+
+    with requests_mock.Mocker() as mock:
+        mock.post(url, text=json.dumps(create_response))
+        mock.put(upload_url, [
+            {'status_code': 503},
+            {'status_code': 200,
+             'text': lambda request, context: request.body.read() and ''}
+        ])
+
+        obj = fl33t_client.Build(
+            train_id=train_id,
+            version='0.1.4',
+            filename='firmware.bin',
+            fileobj=b'firmware'
+        )
+        obj.create()
+
+    assert len(events) == 1
+    assert events[0]['direction'] == 'upload'
+    assert events[0]['url'] == 'https://builds.example.com/some/build/path'
+    assert events[0]['build_id'] == build_id
+    assert events[0]['bytes'] == len(b'firmware')
+    assert events[0]['retries'] == 1
+    assert events[0]['success'] is True
+
+
+def test_download(fl33t_client, build_id, build_get_response, tmpdir):
+    data = b'firmware' * 1000
+    build_get_response['build']['md5sum'] = hashlib.md5(data).hexdigest()
+    download_url = build_get_response['build']['download_url']
+
+    url = '/'.join((
+        fl33t_client.base_team_url,
+        'build',
+        build_id
+    ))
+
+    with requests_mock.Mocker() as mock:
+        mock.get(url, text=json.dumps(build_get_response))
+        mock.get(download_url, content=data)
+
+        obj = fl33t_client.get_build(build_id)
+
+        destination = str(tmpdir.join('build.tgz'))
+        assert obj.download(destination) == len(data)
+        assert tmpdir.join('build.tgz').read_binary() == data
+
+        buffer = io.BytesIO()
+        assert obj.download(buffer) == len(data)
+        assert buffer.getvalue() == data
+
+
+def test_download_hash_mismatch(fl33t_client, build_id, build_get_response,
+                                tmpdir):
+    download_url = build_get_response['build']['download_url']
+
+    url = '/'.join((
+        fl33t_client.base_team_url,
+        'build',
+        build_id
+    ))
+
+    with requests_mock.Mocker() as mock:
+        mock.get(url, text=json.dumps(build_get_response))
+        mock.get(download_url, content=b'corrupted')
+
+        obj = fl33t_client.get_build(build_id)
+
+        with pytest.raises(BuildDownloadError):
+            obj.download(str(tmpdir.join('build.tgz')))
+
+        assert tmpdir.listdir() == []
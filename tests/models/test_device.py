@@ -14,6 +14,12 @@ def test_no_device_id():
         device = Device()
 
 
+def test_fields():
+    fields = Device.fields()
+    assert 'device_id' in fields and 'checkin_tstamp' in fields
+    assert 'device_id' in Device(device_id='abc').to_json()
+
+
 def test_checkin_no_client():
     device = Device(device_id='asdfasd')
     with pytest.raises(Fl33tClientException):
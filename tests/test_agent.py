@@ -0,0 +1,138 @@
+import io
+import threading
+
+import pytest
+import requests_mock
+
+from fl33t import agent
+from fl33t.cli import CLIENTS, cli
+from fl33t.cli.agent import AgentServer
+
+
+@pytest.fixture
+def agent_socket(tmp_path):
+    path = str(tmp_path / 'agent.sock')
+    server = AgentServer(path, cli, cache_ttl=60)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    yield path
+
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    CLIENTS.clear()
+
+
+def run(path, *argv):
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    exit_code = agent.run(list(argv), path=path, stdout=stdout, stderr=stderr)
+    return exit_code, stdout.getvalue(), stderr.getvalue()
+
+
+@pytest.mark.parametrize('argv,name', [
+    (['trains', 'list'], 'trains'),
+    (['-T', 'team', '--session-token', 'token', 'fleets', 'show', 'x'],
+     'fleets'),
+    (['--transfer-retries', '2', 'agent', 'stop'], 'agent'),
+    (['--profile', 'trace.json', 'shell'], 'shell'),
+    (['--help'], None),
+])
+def test_command_name(argv, name):
+    assert agent.command_name(argv) == name
+
+
+def test_command_path():
+    assert agent.command_path(['--timings', 'devices', 'batch', '-n']) == (
+        'devices', 'batch')
+    assert agent.command_path(['apply', 'trains.yaml']) == (
+        'apply', 'trains.yaml')
+    assert agent.command_path(['-T', 'team']) == ()
+
+
+def test_forwardable(monkeypatch):
+    monkeypatch.delenv('FL33T_NO_AGENT', raising=False)
+
+    assert agent.forwardable(['trains', 'list'])
+    assert not agent.forwardable(['devices', 'batch', '-'])
+    assert not agent.forwardable(['devices', 'batch', '-n'])
+    assert not agent.forwardable(['builds', 'create', 'firmware.bin'])
+    assert not agent.forwardable(['--profile', 'trace.json', 'shell'])
+    assert not agent.forwardable(['agent', 'start'])
+    assert not agent.forwardable(['shell'])
+    assert not agent.forwardable([])
+
+    monkeypatch.setenv('FL33T_NO_AGENT', '1')
+    assert not agent.forwardable(['trains', 'list'])
+
+
+def test_input_commands():
+    # Every command that can prompt, or reads stdin by default, must run
+    # in-process
+    expected = []
+    for group_name in cli.list_commands(None):
+        group = cli.get_command(None, group_name)
+        for name in getattr(group, 'commands', {}):
+            params = group.commands[name].params
+            if any(getattr(param, 'prompt', None) or param.default == '-'
+                   for param in params):
+                expected.append((group_name, name))
+
+    assert sorted(agent.INPUT_COMMANDS) == sorted(expected)
+
+
+def test_no_agent(tmp_path):
+    assert agent.run(['trains', 'list'],
+                     path=str(tmp_path / 'missing.sock')) is None
+
+
+def test_run_through_agent(agent_socket, monkeypatch, team_id, session_token,
+                           train_id, train_get_response):
+    monkeypatch.setenv('FL33T_TEAM_ID', team_id)
+    monkeypatch.setenv('FL33T_SESSION_TOKEN', session_token)
+
+    with requests_mock.Mocker() as mock:
+        mock.get('https://api.fl33t.com/team/{}/train/{}'.format(
+            team_id, train_id), json=train_get_response)
+
+        for _ in range(2):
+            exit_code, stdout, stderr = run(agent_socket,
+                                            'trains', 'show', train_id)
+            assert exit_code == 0, stderr
+            assert 'Train {}'.format(train_id) in stdout
+
+        # The agent's client and cache are shared between invocations
+        assert mock.call_count == 1
+
+
+def test_run_failure(agent_socket):
+    exit_code, stdout, stderr = run(agent_socket, 'trains', 'nonsense')
+
+    assert exit_code == 2
+    assert stdout == ''
+    assert "No such command 'nonsense'" in stderr
+
+
+def test_run_with_other_options(agent_socket, monkeypatch, team_id,
+                                session_token, train_id, train_get_response):
+    monkeypatch.setenv('FL33T_TEAM_ID', team_id)
+    monkeypatch.setenv('FL33T_SESSION_TOKEN', session_token)
+
+    with requests_mock.Mocker() as mock:
+        mock.get('https://api.fl33t.com/team/{}/train/{}'.format(
+            team_id, train_id), json=train_get_response)
+
+        for argv in (['trains', 'show', train_id],
+                     ['--max-transfer-rate', '1M', '--transfer-retries', '2',
+                      'trains', 'show', train_id]):
+            exit_code, _, stderr = run(agent_socket, *argv)
+            assert exit_code == 0, stderr
+
+    # The options of a later invocation are not lost to an earlier client
+    clients = sorted(CLIENTS.values(),
+                     key=lambda client: client.transfer_retries)
+    assert len(clients) == 2
+    assert clients[0].transfer_bucket is None
+    assert clients[1].transfer_bucket.rate == 1024 ** 2
+    assert clients[1].transfer_retries == 2
@@ -0,0 +1,67 @@
+
+import threading
+import time
+
+import pytest
+
+from fl33t.cache import ModelCache
+
+
+def test_get_or_fetch():
+    cache = ModelCache()
+
+    assert cache.get_or_fetch('key', lambda: 'value') == 'value'
+    assert cache.get_or_fetch('key', lambda: 'other') == 'value'
+    assert cache.get('key') == 'value'
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.hit_rate == 0.5
+
+    cache.invalidate('key')
+    assert cache.get('key') is None
+    assert cache.get_or_fetch('key', lambda: 'other') == 'other'
+
+
+def test_ttl():
+    cache = ModelCache(ttl=0.01)
+    cache.set('key', 'value')
+    assert cache.keys() == ['key']
+
+    time.sleep(0.02)
+    assert cache.get('key') is None
+    assert cache.keys() == []
+
+
+def test_single_flight():
+    cache = ModelCache()
+    calls = []
+    results = []
+
+    def fetch():
+        calls.append(True)
+        time.sleep(0.05)
+        return 'value'
+
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(cache.get_or_fetch('key', fetch)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ['value'] * 5
+
+
+def test_fetch_errors_not_cached():
+    cache = ModelCache()
+
+    def fail():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        cache.get_or_fetch('key', fail)
+
+    assert cache.get_or_fetch('key', lambda: 'value') == 'value'
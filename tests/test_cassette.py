@@ -0,0 +1,113 @@
+import gzip
+import time
+
+import pytest
+
+from fl33t import Fl33tClient
+from fl33t.cassette import RecordingTransport, ReplayTransport, load
+from fl33t.exceptions import TransportError
+from fl33t.fake_api import FakeApi, FakeServer
+
+TOKEN = 'secret-session-token'
+
+
+def workload(client):
+    train = next(client.list_trains())
+    build = client.Build(train_id=train.train_id, version='2.0.0',
+                         filename='firmware.bin',
+                         fileobj=b'firmware').create()
+    devices = [record['device_id']
+               for record in client.list_devices(page_size=4, raw=True)]
+    session = client.get_own_session()
+    return build.build_id, devices, session.name
+
+
+@pytest.fixture
+def cassette(tmp_path):
+    path = str(tmp_path / 'workload.jsonl.gz')
+    api = FakeApi('meli', TOKEN, latency=0.02, seed=3).seed_data(
+        fleets=2, devices=10)
+
+    with FakeServer(api) as server:
+        client = Fl33tClient('meli', TOKEN, base_uri=server.url,
+                             transport=RecordingTransport(path))
+        recorded = workload(client)
+        client.close()
+        url = server.url
+
+    return path, url, recorded
+
+
+def test_record(cassette):
+    path, url, _ = cassette
+
+    with gzip.open(path, 'rt') as cassette_file:
+        assert TOKEN not in cassette_file.read()
+
+    header, entries = load(path)
+    assert header['cassette'] == 1
+    kinds = [(entry['kind'], entry['method']) for entry in entries]
+    assert kinds.count(('upload', 'PUT')) == 1
+    assert kinds.count(('api', 'GET')) == 5
+    assert all(entry['elapsed'] >= 0.02 for entry in entries
+               if entry['kind'] == 'api')
+
+    upload = next(entry for entry in entries if entry['kind'] == 'upload')
+    assert upload['sent'] == 8 and '?' not in upload['url']
+    created = next(entry for entry in entries if entry['method'] == 'POST')
+    assert '?' not in created['json']['build']['upload_url']
+
+
+def test_replay(cassette):
+    path, url, recorded = cassette
+
+    # The server is gone, so everything is answered from the cassette
+    client = Fl33tClient('meli', TOKEN, base_uri=url,
+                         transport=ReplayTransport(path))
+    started = time.monotonic()
+    assert workload(client) == recorded
+    assert time.monotonic() - started < 0.1
+
+    with pytest.raises(TransportError, match='No recorded response'):
+        client.get_own_session()
+
+
+def test_replay_realtime(cassette):
+    path, url, recorded = cassette
+
+    client = Fl33tClient('meli', TOKEN, base_uri=url,
+                         transport=ReplayTransport(path, realtime=True))
+    started = time.monotonic()
+    assert workload(client) == recorded
+    assert time.monotonic() - started >= 0.1
+
+
+def test_not_a_cassette(tmp_path):
+    path = tmp_path / 'other.gz'
+    with gzip.open(str(path), 'wt') as other:
+        other.write('{"something": "else"}\n')
+
+    with pytest.raises(ValueError, match='is not a fl33t cassette'):
+        ReplayTransport(str(path))
+
+
+def test_record_sessions(tmp_path):
+    path = str(tmp_path / 'sessions.jsonl.gz')
+    api = FakeApi('meli', TOKEN, seed=3)
+    client = Fl33tClient('meli', TOKEN,
+                         transport=RecordingTransport(path, api.transport()))
+
+    session = client.Session(name='Read only', admin=False).create()
+    tokens = [record.session_token for record in client.list_sessions()]
+    assert client.get_session(session.session_token).name == 'Read only'
+    client.close()
+
+    assert session.session_token in tokens
+    with gzip.open(path, 'rt') as cassette_file:
+        recorded = cassette_file.read()
+    for token in tokens:
+        assert token not in recorded
+
+    _, entries = load(path)
+    assert entries[0]['json']['session']['session_token'] == '<redacted>'
+    assert entries[-1]['url'].endswith('/session/<redacted>')
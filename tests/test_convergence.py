@@ -0,0 +1,101 @@
+import pytest
+import requests_mock
+
+from fl33t.convergence import ConvergenceTracker
+
+
+class FakeFleet:
+
+    def __init__(self, count):
+        self.devices = [{'device_id': 'device-{}'.format(index),
+                         'fleet_id': 'fleet',
+                         'build_id': 'old-build'}
+                        for index in range(count)]
+        self.reported = count
+
+    def converge(self, count, build_id):
+        for device in self.devices[:count]:
+            device['build_id'] = build_id
+
+    def list_devices(self, request, context):
+        offset = int(request.qs['offset'][0])
+        limit = int(request.qs['limit'][0])
+        return {'device_count': self.reported,
+                'devices': self.devices[offset:offset + limit]}
+
+
+@pytest.fixture
+def fleet(fl33t_client, fleet_id, fleet_get_response):
+    fake = FakeFleet(10)
+    with requests_mock.Mocker() as mock:
+        mock.get('/'.join((fl33t_client.base_team_url, 'devices')),
+                 json=fake.list_devices)
+        mock.get('/'.join((fl33t_client.base_team_url, 'fleet', fleet_id)),
+                 json=fleet_get_response)
+        fake.mock = mock
+        yield fake
+
+
+def test_sample(fl33t_client, fleet, fleet_id, build_id, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('fl33t.convergence.time.time', lambda: now[0])
+    tracker = ConvergenceTracker(fl33t_client, fleet_id, page_size=3,
+                                 window=2)
+
+    fleet.converge(2, build_id)
+    sample = tracker.sample()
+    assert tracker.build_id == build_id
+    assert (sample.total, sample.converged, sample.fraction) == (10, 2, 0.2)
+    assert sample.builds == {build_id: 2, 'old-build': 8}
+    assert sample.rate is None and sample.eta is None
+
+    # A count, then the four pages of three devices
+    offsets = sorted(int(request.qs['offset'][0])
+                     for request in fleet.mock.request_history
+                     if request.path.endswith('/devices'))
+    assert offsets == [0, 0, 3, 6, 9]
+
+    now[0] += 10
+    fleet.converge(6, build_id)
+    sample = tracker.sample()
+    assert sample.rate == pytest.approx(0.4)
+    assert sample.eta == pytest.approx(10)
+
+    now[0] += 10
+    fleet.converge(8, build_id)
+    sample = tracker.sample()
+    # The latest rate, 0.2, is smoothed with the previous estimate
+    assert sample.rate == pytest.approx(0.3 * 0.2 + 0.7 * 0.4)
+    assert [item.converged for item in tracker.history] == [6, 8]
+    assert tracker.samples == 3
+
+
+def test_sample_finds_new_devices(fl33t_client, fleet, fleet_id, build_id):
+    fleet.reported = 9
+    tracker = ConvergenceTracker(fl33t_client, fleet_id, build_id=build_id,
+                                 page_size=3)
+
+    assert tracker.sample().total == 10
+
+
+def test_run(fl33t_client, fleet, fleet_id, build_id):
+    tracker = ConvergenceTracker(fl33t_client, fleet_id, page_size=4)
+    samples = []
+
+    def callback(sample):
+        samples.append(sample)
+        fleet.converge(len(samples) * 5, build_id)
+
+    last = tracker.run(callback, interval=0)
+    assert [sample.converged for sample in samples] == [0, 5, 10]
+    assert last.fraction == 1.0 and last.eta == 0.0
+
+    tracker.run(lambda sample: tracker.stop(), interval=0, until=2)
+    assert tracker.samples == 4
+
+
+def test_fleet_without_build(fl33t_client, fleet, fleet_id,
+                             fleet_get_response):
+    fleet_get_response['fleet']['build_id'] = None
+    with pytest.raises(ValueError, match='has no build'):
+        ConvergenceTracker(fl33t_client, fleet_id).sample()
@@ -0,0 +1,145 @@
+import threading
+import urllib.error
+import urllib.request
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from fl33t import Fl33tClient
+from fl33t.exceptions import Fl33tApiException
+from fl33t.exporter import CONTENT_TYPE, Exporter, Exposition, FleetScanner
+from fl33t.fake_api import FakeApi
+from fl33t.utils import timestamp_before
+
+
+@pytest.fixture
+def api():
+    return FakeApi('meli', 'token', seed=1).seed_data(
+        fleets=3, devices=90, checkin_spread=60 * 86400)
+
+
+@pytest.fixture
+def client(api):
+    return Fl33tClient('meli', 'token', transport=api.transport())
+
+
+def expected_counts(api):
+    devices = [api.devices.get('device-{:08d}'.format(index))
+               for index in range(90)]
+    builds = {}
+    fleets = {}
+    for device in devices:
+        builds[device['build_id']] = builds.get(device['build_id'], 0) + 1
+        fleets[device['fleet_id']] = fleets.get(device['fleet_id'], 0) + 1
+    return builds, fleets
+
+
+def test_exposition():
+    page = Exposition()
+    page.family('things', 'gauge', 'Some\nthings')
+    page.sample('things', 2.0, {'name': 'a "quoted"\\name'})
+    page.sample('things', 0.25)
+
+    assert page.text() == (
+        '# HELP fl33t_things Some\\nthings\n'
+        '# TYPE fl33t_things gauge\n'
+        'fl33t_things{name="a \\"quoted\\"\\\\name"} 2\n'
+        'fl33t_things 0.25\n')
+
+
+@pytest.mark.parametrize('mirror', [None, ':memory:'])
+def test_fleet_scanner(api, client, mirror):
+    scanner = FleetScanner(client, stale_after=timedelta(days=30),
+                           workers=4, page_size=20, mirror=mirror)
+    gauges = scanner.scan()
+
+    builds, fleets = expected_counts(api)
+    assert gauges.devices == 90
+    assert gauges.builds == builds
+    assert gauges.fleets == fleets
+    assert 0 < sum(gauges.stale.values()) < 90
+    assert set(gauges.stale) <= set(fleets)
+
+    if mirror is None:
+        other = FleetScanner(client, stale_after=timedelta(days=30),
+                             page_size=90, mirror=':memory:').scan()
+        assert other.stale == gauges.stale
+
+    # Upgrades and check ins do not change the number of devices, but are
+    # seen by the next scan
+    upgraded = api.devices.get('device-00000000')
+    build_id = next(build for build in builds
+                    if build != upgraded['build_id'])
+    api.devices.check_in('device-00000000', build_id)
+
+    rescanned = scanner.scan()
+    assert rescanned.builds[build_id] == builds[build_id] + 1
+    assert rescanned.builds[upgraded['build_id']] == \
+        builds[upgraded['build_id']] - 1
+    stale_checked_in = timestamp_before(upgraded['checkin_tstamp'],
+                                        datetime.now(timezone.utc)
+                                        - timedelta(days=30))
+    assert sum(rescanned.stale.values()) == \
+        sum(gauges.stale.values()) - stale_checked_in
+
+
+def test_exporter(api, client):
+    client.enable_cache()
+    scanner = FleetScanner(client, page_size=50)
+    exporter = Exporter(client, scanner=scanner)
+
+    assert 'fl33t_devices_per_build' not in exporter.render()
+    scanner.scan()
+    fleet_id = next(iter(scanner.latest.fleets))
+    client.get_fleet(fleet_id)
+    client.get_fleet(fleet_id)
+
+    api.error_rate = 1
+    with pytest.raises(Fl33tApiException):
+        client.count('trains')
+
+    lines = exporter.render().splitlines()
+    assert '# TYPE fl33t_request_duration_seconds histogram' in lines
+    assert ('fl33t_request_duration_seconds_count{method="GET",'
+            'template="/team/{team_id}/devices"} 3') in lines
+    assert ('fl33t_request_duration_seconds_bucket{method="GET",'
+            'template="/team/{team_id}/devices",le="+Inf"} 3') in lines
+    assert ('fl33t_requests_total{method="GET",'
+            'template="/team/{team_id}/trains",status="503"} 1') in lines
+    assert ('fl33t_request_errors_total{method="GET",'
+            'template="/team/{team_id}/trains",'
+            'error="Fl33tApiException"} 1') in lines
+    assert 'fl33t_cache_hits_total 1' in lines
+    assert 'fl33t_cache_hit_ratio 0.5' in lines
+    assert 'fl33t_devices 90' in lines
+    assert 'fl33t_fleet_scans_total 1' in lines
+
+    _, fleets = expected_counts(api)
+    assert 'fl33t_devices_per_fleet{{fleet_id="{}"}} {}'.format(
+        fleet_id, fleets[fleet_id]) in lines
+
+
+def test_server(api, client):
+    scanner = FleetScanner(client, interval=60, page_size=50)
+    exporter = Exporter(client, scanner=scanner)
+    server = exporter.server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    url = 'http://{}:{}'.format(*server.server_address[:2])
+    try:
+        scanner.start()
+        scanner.stop()
+        assert scanner.scans == 1
+
+        with urllib.request.urlopen(url + '/metrics') as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            assert b'\nfl33t_devices 90\n' in response.read()
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + '/other')
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
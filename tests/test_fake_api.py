@@ -0,0 +1,115 @@
+import io
+
+import pytest
+
+from fl33t import Fl33tClient
+from fl33t.exceptions import (
+    DuplicateDeviceIdError,
+    Fl33tApiException,
+    InvalidDeviceIdError,
+    UnprivilegedToken
+)
+from fl33t.fake_api import FakeApi, FakeServer
+
+
+@pytest.fixture
+def api():
+    return FakeApi('meli', 'token', seed=1).seed_data(
+        trains=2, builds=3, fleets=4, devices=100)
+
+
+@pytest.fixture
+def client(api):
+    return Fl33tClient('meli', 'token', transport=api.transport())
+
+
+def test_seeded_data(client):
+    assert client.count('trains') == 2
+    assert client.count('builds') == 6
+    assert client.count('devices') == 100
+
+    fleets = list(client.list_fleets(page_size=3))
+    assert [fleet.size for fleet in fleets] == [25, 25, 25, 25]
+    assert all(fleet.build_id for fleet in fleets)
+
+    devices = list(client.list_devices(fleet_id=fleets[1].fleet_id,
+                                       page_size=7, raw=True))
+    assert [device['device_id'] for device in devices[:2]] == [
+        'device-00000001', 'device-00000005']
+    assert len(devices) == 25
+
+    train = fleets[0].train_id
+    assert {build.train_id for build in client.list_builds(train_id=train)} \
+        == {train}
+
+
+def test_devices(client, api):
+    fleets = list(client.list_fleets())
+    device = client.Device(device_id='new-device', name='New',
+                           fleet_id=fleets[0].fleet_id).create()
+    assert client.get_device('new-device').name == 'New'
+    with pytest.raises(DuplicateDeviceIdError):
+        client.Device(device_id='new-device',
+                      fleet_id=fleets[0].fleet_id).create()
+
+    device.fleet_id = fleets[1].fleet_id
+    assert device.update()
+    seeded = client.get_device('device-00000000')
+    seeded.fleet_id = fleets[1].fleet_id
+    assert seeded.update()
+    assert [fleet.size for fleet in client.list_fleets()] == [24, 27, 25, 25]
+
+    listed = [record['device_id'] for record in client.list_devices(
+        fleet_id=fleets[1].fleet_id, raw=True)]
+    assert listed[0] == 'device-00000000' and listed[-1] == 'new-device'
+
+    assert seeded.delete()
+    with pytest.raises(InvalidDeviceIdError):
+        client.get_device('device-00000000')
+    assert client.count('devices') == 100
+
+
+def test_checkin(client):
+    fleet = next(client.list_fleets())
+    device = next(client.list_devices(fleet_id=fleet.fleet_id, offset=0,
+                                      limit=1))
+
+    build = client.device_checkin(device.device_id,
+                                  currently_installed_id='old-build')
+    assert build.build_id == fleet.build_id
+    assert client.get_device(device.device_id).build_id == 'old-build'
+
+    assert client.device_checkin(
+        device.device_id, currently_installed_id=fleet.build_id) is False
+
+
+def test_errors(api):
+    client = Fl33tClient('meli', 'wrong', transport=api.transport())
+    with pytest.raises(UnprivilegedToken):
+        client.count('devices')
+
+    api.error_rate = 1
+    client = Fl33tClient('meli', 'token', transport=api.transport())
+    with pytest.raises(Fl33tApiException, match='503'):
+        client.count('devices')
+
+
+@pytest.mark.parametrize('mode', ['asyncio', 'wsgi'])
+def test_server(api, mode):
+    with FakeServer(api, mode=mode) as server:
+        client = Fl33tClient('meli', 'token', base_uri=server.url)
+        train = next(client.list_trains())
+
+        build = client.Build(train_id=train.train_id, version='2.0.0',
+                             filename='firmware.bin',
+                             fileobj=b'firmware').create()
+        assert build.upload_url.startswith(server.url)
+        build = client.get_build(build.build_id)
+        assert (build.status, build.size) == ('available', 8)
+
+        destination = io.BytesIO()
+        assert build.download(destination) == 8
+        assert destination.getvalue() == b'firmware'
+
+        assert len(list(client.list_devices(page_size=30))) == 100
+        client.close()
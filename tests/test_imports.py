@@ -0,0 +1,63 @@
+
+import subprocess
+import sys
+
+import pytest
+
+LAZY_MODULES = ['requests', 'dateutil', 'fl33t.client', 'fl33t.models.base']
+
+CHECK = '''
+import sys
+from fl33t.cli import cli
+
+for args in {args!r}:
+    try:
+        cli.main(args, prog_name='fl33t')
+    except SystemExit:
+        pass
+
+print('LOADED:' + ','.join(name for name in {modules!r} if name in sys.modules))
+'''
+
+
+@pytest.mark.parametrize('args', [
+    [],
+    [['--help']],
+    [['builds', '--help'], ['devices', '--help'], ['fleets', '--help'],
+     ['sessions', '--help'], ['trains', '--help']],
+    [['exporter', '--help']],
+])
+def test_cli_imports_lazily(args):
+    result = subprocess.run(
+        [sys.executable, '-c', CHECK.format(args=args, modules=LAZY_MODULES)],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True)
+
+    assert result.stdout.strip().splitlines()[-1] == 'LOADED:'
+
+
+def test_lazy_attributes():
+    import fl33t
+    import fl33t.models
+
+    from fl33t.client import Fl33tClient
+    from fl33t.models.build import Build
+
+    assert fl33t.Fl33tClient is Fl33tClient
+    assert fl33t.models.Build is Build
+
+    with pytest.raises(AttributeError):
+        fl33t.NotAThing
+
+
+def test_agent_imports_lightly():
+    result = subprocess.run(
+        [sys.executable, '-c', 'import sys, fl33t.agent; print("LOADED:" + '
+         '",".join(name for name in ("click", "requests") '
+         'if name in sys.modules))'],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True)
+
+    assert result.stdout.strip().splitlines()[-1] == 'LOADED:'
@@ -0,0 +1,165 @@
+import pytest
+import requests_mock
+
+from fl33t.inventory import Inventory
+
+
+@pytest.fixture
+def inventory_records(train_id):
+    return {
+        'trains': [{'train_id': train_id, 'name': 'Train',
+                    'upload_tstamp': '2018-05-30T22:31:08.836406Z'}],
+        'builds': [{'build_id': 'build-{}'.format(index),
+                    'train_id': train_id,
+                    'version': '0.{}'.format(index),
+                    'status': 'available',
+                    'released': index < 2,
+                    'md5sum': str(index),
+                    'size': 10,
+                    'filename': 'build.tgz',
+                    'download_url': None,
+                    'upload_url': None,
+                    'upload_tstamp': '2018-05-30T22:31:08.836406Z'}
+                   for index in range(3)],
+        'fleets': [{'fleet_id': 'fleet-{}'.format(index),
+                    'name': 'Fleet',
+                    'size': 2,
+                    'train_id': train_id,
+                    'build_id': 'build-{}'.format(index),
+                    'unreleased': False}
+                   for index in range(3)],
+        'devices': [{'device_id': 'device-{}-{}'.format(fleet, index),
+                     'name': 'Device',
+                     'fleet_id': 'fleet-{}'.format(fleet),
+                     'build_id': 'build-{}'.format(
+                         fleet if index else (fleet + 1) % 3),
+                     'session_token': 'token',
+                     'checkin_tstamp': '2018-06-01T00:00:00.000000Z'}
+                    for fleet in range(3) for index in range(2)],
+    }
+
+
+@pytest.fixture
+def mock_listings(fl33t_client, inventory_records):
+    def listing(collection):
+        def respond(request, context):
+            offset = int(request.qs['offset'][0])
+            limit = int(request.qs['limit'][0])
+            records = [record for record in inventory_records[collection]
+                       if all(record[key] == values[0]
+                              for key, values in request.qs.items()
+                              if key.endswith('_id'))]
+            return {
+                '{}_count'.format(collection[:-1]): len(records),
+                collection: records[offset:offset + limit],
+            }
+        return respond
+
+    with requests_mock.Mocker() as mock:
+        for collection in inventory_records:
+            mock.get('/'.join((fl33t_client.base_team_url, collection)),
+                     json=listing(collection))
+        yield mock
+
+
+def ids(objects, attribute):
+    return sorted(getattr(obj, attribute) for obj in objects)
+
+
+def test_lookups(fl33t_client, mock_listings, train_id):
+    inventory = Inventory.from_client(fl33t_client)
+
+    assert len(inventory) == 1 + 3 + 3 + 6
+    assert inventory.get('fleets', 'fleet-1').build_id == 'build-1'
+    assert ids(inventory.find('devices', fleet_id='fleet-0'),
+               'device_id') == ['device-0-0', 'device-0-1']
+    assert ids(inventory.find('devices', build_id='build-1'),
+               'device_id') == ['device-0-0', 'device-1-1']
+    assert ids(inventory.find('devices', fleet_id='fleet-0',
+                              build_id='build-0'),
+               'device_id') == ['device-0-1']
+    assert ids(inventory.find('builds', train_id=train_id, version='0.2'),
+               'build_id') == ['build-2']
+    assert len(inventory.find('fleets', train_id=train_id)) == 3
+    assert inventory.find('devices', fleet_id='missing') == []
+
+    with pytest.raises(ValueError):
+        inventory.find('devices', name='Device')
+
+
+def test_joins(fl33t_client, mock_listings):
+    inventory = Inventory.from_client(fl33t_client)
+
+    assert ids(inventory.devices_off_fleet_build(), 'device_id') == [
+        'device-0-0', 'device-1-0', 'device-2-0']
+    assert ids(inventory.devices_off_fleet_build('fleet-1'),
+               'device_id') == ['device-1-0']
+    assert ids(inventory.fleets_on_unreleased_builds(),
+               'fleet_id') == ['fleet-2']
+
+
+def test_refresh(fl33t_client, mock_listings, inventory_records):
+    inventory = Inventory.from_client(fl33t_client)
+
+    # device-1-0 moves to the fleet's build, and device-1-1 is deleted
+    inventory_records['devices'][2]['build_id'] = 'build-1'
+    del inventory_records['devices'][3]
+    mock_listings.reset_mock()
+
+    assert inventory.refresh(['devices'], fleet_id='fleet-1') == {
+        'devices': 1}
+    assert mock_listings.call_count == 1
+    assert mock_listings.last_request.qs['fleet_id'] == ['fleet-1']
+
+    assert inventory.get('devices', 'device-1-1') is None
+    assert ids(inventory.find('devices', fleet_id='fleet-1'),
+               'device_id') == ['device-1-0']
+    assert 'device-1-0' not in ids(inventory.devices_off_fleet_build(),
+                                   'device_id')
+    assert len(inventory.find('devices', fleet_id='fleet-0')) == 2
+
+    with pytest.raises(ValueError):
+        inventory.refresh(['trains'], fleet_id='fleet-1')
+
+
+def test_add_and_discard(fl33t_client, mock_listings):
+    inventory = Inventory.from_client(fl33t_client)
+
+    device = inventory.get('devices', 'device-0-0')
+    device.build_id = 'build-0'
+    inventory.add(device)
+    assert inventory.devices_off_fleet_build('fleet-0') == []
+
+    inventory.discard(device)
+    assert inventory.get('devices', 'device-0-0') is None
+    assert ids(inventory.find('devices', fleet_id='fleet-0'),
+               'device_id') == ['device-0-1']
+
+    with pytest.raises(TypeError):
+        inventory.add(fl33t_client.Session(session_token='abc'))
+
+
+def test_devices_off_fleet_build_reads_one_fleet(fl33t_client,
+                                                 mock_listings):
+    inventory = Inventory.from_client(fl33t_client)
+    read = []
+
+    class Index(dict):
+        def get(self, key, default=None):
+            read.append(key)
+            return super().get(key, default)
+
+        def __iter__(self):
+            raise AssertionError('Every fleet was looked at')
+
+    key = ('fleet_id', 'build_id')
+    inventory._indexes['devices'][key] = Index(
+        inventory._indexes['devices'][key])
+    assert ids(inventory.devices_off_fleet_build('fleet-1'),
+               'device_id') == ['device-1-0']
+    assert read == ['fleet-1']
+
+    # Buckets left empty are dropped
+    for device in inventory.find('devices', fleet_id='fleet-1'):
+        inventory.discard(device)
+    assert 'fleet-1' not in inventory._indexes['devices'][key]
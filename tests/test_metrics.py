@@ -0,0 +1,122 @@
+import io
+import logging
+
+import pytest
+import requests_mock
+
+from fl33t import Fl33tClient
+from fl33t.exceptions import Fl33tApiException
+from fl33t.fake_api import FakeApi
+from fl33t.metrics import Histogram, RequestMetrics
+
+
+def test_histogram():
+    histogram = Histogram((0.1, 0.2, 0.4))
+    assert histogram.quantile(0.5) is None
+
+    for value in (0.05, 0.15, 0.15, 0.3, 1.0):
+        histogram.observe(value)
+
+    assert histogram.count == 5
+    assert histogram.mean == pytest.approx(0.33)
+    assert histogram.cumulative() == [(0.1, 1), (0.2, 3), (0.4, 4),
+                                      (float('inf'), 5)]
+    assert histogram.quantile(0.2) == pytest.approx(0.1)
+    assert histogram.quantile(0.5) == pytest.approx(0.175)
+    assert histogram.quantile(0.99) == 0.4
+
+    with pytest.raises(ValueError):
+        histogram.quantile(2)
+    with pytest.raises(ValueError):
+        Histogram((0.2, 0.1))
+
+
+def test_request_metrics():
+    api = FakeApi('meli', 'token', seed=1).seed_data(fleets=2, devices=30)
+    client = Fl33tClient('meli', 'token', transport=api.transport())
+    metrics = RequestMetrics(client)
+    requests = []
+    client.add_hook('request',
+                    lambda event, **payload: requests.append(payload))
+
+    assert len(list(client.list_devices(page_size=10))) == 30
+    # API requests are never retried, so they report no retries
+    assert 'retries' not in requests[0]
+    client.get_fleet(next(client.list_fleets()).fleet_id)
+
+    api.error_rate = 1
+    with pytest.raises(Fl33tApiException):
+        client.count('devices')
+
+    assert metrics.pages == {'device': 3, 'fleet': 1}
+    assert metrics.records == {'device': 30, 'fleet': 2}
+    assert metrics.models['Device'] == 30
+    assert metrics.errors == {
+        ('GET', '/team/{team_id}/devices', 'Fl33tApiException'): 1}
+
+    rows = {row['template']: row for row in metrics.summary()}
+    devices = rows['/team/{team_id}/devices']
+    assert devices['count'] == 4
+    assert devices['errors'] == 1
+    assert devices['statuses'] == {200: 3, 503: 1}
+    assert 0 < devices['p50'] <= devices['p95'] <= devices['p99']
+    assert rows['/team/{team_id}/fleet/{fleet_id}']['count'] == 1
+
+    metrics.detach()
+    api.error_rate = 0
+    client.count('devices')
+    assert rows.keys() == {row['template'] for row in metrics.summary()}
+    assert metrics.pages['device'] == 3
+
+    metrics.reset()
+    assert metrics.summary() == []
+
+
+def test_retry_metrics(fl33t_client):
+    events = []
+    fl33t_client.add_hook('retry',
+                          lambda event, **payload: events.append(payload))
+    metrics = RequestMetrics(fl33t_client)
+    fl33t_client.transfer_retries = 2
+    fl33t_client._transfer_backoff = lambda attempt: None
+
+    upload_url = 'https://builds.example.com/path?Signature=secret'
+    with requests_mock.Mocker() as mock:
+        mock.put(upload_url, [{'status_code': 503}, {'status_code': 200}])
+        assert fl33t_client.upload(upload_url,
+                                   lambda: io.BytesIO(b'firmware'),
+                                   size=8, build_id='build')
+
+    assert len(events) == 1
+    assert events[0]['operation'] == 'upload'
+    assert events[0]['url'] == 'https://builds.example.com/path'
+    assert events[0]['attempt'] == 1
+    assert events[0]['error'] == '503 error'
+    assert metrics.retries == {'upload': 1}
+    assert metrics.transfers == {('upload', True): 1}
+
+
+def test_lazy_debug_logging(fl33t_client, fleet_id, fleet_get_response,
+                            caplog):
+    class Payload:
+        formatted = 0
+
+        def __str__(self):
+            return 'payload'
+
+        # Logging the params formats them with repr, encoding them does not
+        def __repr__(self):
+            Payload.formatted += 1
+            return 'payload'
+
+    url = '/'.join((fl33t_client.base_team_url, 'fleet', fleet_id))
+    with requests_mock.Mocker() as mock:
+        mock.get(url, json=fleet_get_response)
+
+        with caplog.at_level(logging.INFO, logger='fl33t'):
+            fl33t_client.get(url, params={'payload': Payload()})
+        assert Payload.formatted == 0
+
+        with caplog.at_level(logging.DEBUG, logger='fl33t'):
+            fl33t_client.get(url, params={'payload': Payload()})
+        assert Payload.formatted > 0
@@ -0,0 +1,161 @@
+import datetime
+import os
+
+import pytest
+import requests_mock
+
+from click.testing import CliRunner
+
+from fl33t.cli.commands.mirror import cli
+from fl33t.exceptions import Fl33tApiException
+from fl33t.mirror import Mirror
+
+
+@pytest.fixture
+def inventory(train_id, build_id, fleet_id):
+    return {
+        'trains': [{'train_id': train_id, 'name': 'Train',
+                    'upload_tstamp': '2018-05-30T22:31:08.836406Z'}],
+        'builds': [{'build_id': build_id, 'train_id': train_id,
+                    'version': '0.1', 'status': 'available',
+                    'released': True, 'md5sum': 'abc', 'size': 10,
+                    'filename': 'build.tgz', 'download_url': None,
+                    'upload_url': None,
+                    'upload_tstamp': '2018-05-30T22:31:08.836406Z'}],
+        'fleets': [{'fleet_id': fleet_id, 'name': 'Fleet', 'size': 3,
+                    'train_id': train_id, 'build_id': build_id,
+                    'unreleased': False}],
+        'devices': [{'device_id': 'device-{}'.format(index),
+                     'name': 'Device {}'.format(index),
+                     'fleet_id': fleet_id,
+                     'build_id': build_id if index else 'old-build',
+                     'session_token': 'token',
+                     'checkin_tstamp': '2018-06-0{}T00:00:00.000000Z'.format(
+                         index + 1)}
+                    for index in range(3)],
+        'sessions': [],
+    }
+
+
+@pytest.fixture
+def mock_api(fl33t_client, inventory):
+    def listing(collection):
+        def respond(request, context):
+            offset = int(request.qs['offset'][0])
+            limit = int(request.qs['limit'][0])
+            records = inventory[collection]
+            return {
+                '{}_count'.format(collection[:-1]): len(records),
+                collection: records[offset:offset + limit],
+            }
+        return respond
+
+    with requests_mock.Mocker() as mock:
+        for collection in inventory:
+            mock.get('/'.join((fl33t_client.base_team_url, collection)),
+                     json=listing(collection))
+        yield mock
+
+
+def listed(mock):
+    return [request.path.rsplit('/', 1)[1] for request in mock.request_history
+            if request.qs['limit'] != ['1']]
+
+
+def test_count(fl33t_client, mock_api, fleet_id):
+    assert fl33t_client.count('devices') == 3
+    assert fl33t_client.count('devices', fleet_id=fleet_id) == 3
+    assert mock_api.last_request.qs['fleet_id'] == [fleet_id]
+
+
+def test_sync(fl33t_client, mock_api, inventory, fleet_id, build_id):
+    mirror = Mirror(fl33t_client)
+
+    results = mirror.sync()
+    assert results['devices'] == {
+        'count': 3, 'inserted': 3, 'updated': 0, 'deleted': 0}
+    assert results['sessions']['count'] == 0
+    assert sorted(listed(mock_api)) == sorted(inventory)
+
+    # Nothing has changed, so only the counts are requested
+    mock_api.reset_mock()
+    assert set(mirror.sync().values()) == {None}
+    assert listed(mock_api) == []
+
+    inventory['devices'][0]['build_id'] = build_id
+    inventory['devices'].append(dict(inventory['devices'][1],
+                                     device_id='device-new'))
+    del inventory['devices'][1]
+    inventory['devices'].append(dict(inventory['devices'][1],
+                                     device_id='device-newer'))
+
+    results = mirror.sync(['devices', 'fleets'])
+    assert results == {
+        'devices': {'count': 4, 'inserted': 2, 'updated': 1, 'deleted': 1},
+        'fleets': None,
+    }
+
+    assert mirror.sync(['fleets'], force=True)['fleets'] == {
+        'count': 1, 'inserted': 0, 'updated': 0, 'deleted': 0}
+
+    with pytest.raises(ValueError):
+        mirror.sync(['widgets'])
+
+
+def test_query(fl33t_client, mock_api, fleet_id, build_id):
+    mirror = Mirror(fl33t_client)
+    mirror.sync()
+
+    assert mirror.count('devices', fleet_id=fleet_id) == 3
+    assert [device['device_id'] for device in mirror.query(
+        'devices', build_id='old-build')] == ['device-0']
+    assert [device['device_id'] for device in mirror.query(
+        'devices', order_by='-checkin_tstamp', limit=2)] == [
+            'device-2', 'device-1']
+    assert mirror.count('devices', since=datetime.datetime(
+        2018, 6, 1, 12, tzinfo=datetime.timezone.utc)) == 2
+
+    assert mirror.get('builds', build_id)['version'] == '0.1'
+    assert mirror.get('builds', 'missing') is None
+
+    fleet = mirror.models('fleets')[0]
+    assert fleet.fleet_id == fleet_id
+    assert fleet.build_id == build_id
+
+    assert mirror.sql(
+        'SELECT COUNT(*) FROM devices d JOIN fleets f '
+        'ON d.fleet_id = f.fleet_id WHERE d.build_id != f.build_id')[0][0] == 1
+
+    with pytest.raises(ValueError):
+        mirror.query('devices', name='Device 1')
+    with pytest.raises(ValueError):
+        mirror.query('fleets', since='2018-01-01')
+
+
+def test_cli_sync(tmp_path, cli_obj, mock_api):
+    path = str(tmp_path / 'mirror.sqlite3')
+
+    result = CliRunner().invoke(cli, ['sync', '--path', path], obj=cli_obj)
+    assert result.exit_code == 0, result.output
+    assert 'devices    3 records: 3 new, 0 changed, 0 removed' in \
+        result.output
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    result = CliRunner().invoke(cli, ['sync', '--path', path, '-c', 'trains'],
+                                obj=cli_obj)
+    assert result.exit_code == 0, result.output
+    assert result.output == 'trains     unchanged\n'
+
+    result = CliRunner().invoke(cli, ['status', '--path', path], obj=cli_obj)
+    assert result.exit_code == 0, result.output
+    assert 'devices    3 records' in result.output
+
+
+@pytest.mark.parametrize('body', ['not json', '[1]', '{"devices": []}'])
+def test_count_invalid(fl33t_client, body):
+    with requests_mock.Mocker() as mock:
+        mock.get('/'.join((fl33t_client.base_team_url, 'devices')),
+                 text=body)
+
+        with pytest.raises(Fl33tApiException):
+            fl33t_client.count('devices')
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+import requests_mock
+
+from click.testing import CliRunner
+
+from fl33t.cli import CLIENTS, cli
+from fl33t.client import url_template
+from fl33t.exceptions import InvalidFleetIdError
+from fl33t.profiling import Profiler
+
+
+@pytest.mark.parametrize('url,template', [
+    ('https://api.fl33t.com/team/meli/fleets', '/team/{team_id}/fleets'),
+    ('https://api.fl33t.com/team/meli/fleet/abc',
+     '/team/{team_id}/fleet/{fleet_id}'),
+    ('https://api.fl33t.com/team/meli/device/abc/checkin',
+     '/team/{team_id}/device/{device_id}/checkin'),
+])
+def test_url_template(url, template):
+    assert url_template(url) == template
+
+
+def test_profiler(fl33t_client, fleet_id, fleet_get_response):
+    profiler = Profiler(fl33t_client)
+
+    with requests_mock.Mocker() as mock:
+        mock.get('/'.join((fl33t_client.base_team_url, 'fleet', fleet_id)),
+                 json=fleet_get_response)
+        mock.get('/'.join((fl33t_client.base_team_url, 'fleet', 'missing')),
+                 status_code=404)
+
+        fl33t_client.get_fleet(fleet_id)
+        fl33t_client.get_fleet(fleet_id)
+        with pytest.raises(InvalidFleetIdError):
+            fl33t_client.get_fleet('missing')
+
+    profiler.stop()
+    summary = profiler.summary()
+
+    assert len(summary['requests']) == 1
+    row = summary['requests'][0]
+    assert row['method'] == 'GET'
+    assert row['template'] == '/team/{team_id}/fleet/{fleet_id}'
+    assert row['count'] == 3
+    assert row['statuses'] == {200: 2, 404: 1}
+    assert row['bytes'] > 0
+
+    assert summary['models'][0]['model'] == 'Fleet'
+    assert summary['models'][0]['count'] == 2
+    assert summary['wall'] >= summary['network']
+
+    table = profiler.format_summary()
+    assert '/team/{team_id}/fleet/{fleet_id}' in table
+    assert '2x200,1x404' in table
+
+    trace = profiler.chrome_trace()
+    assert [event['cat'] for event in trace['traceEvents']] == [
+        'command', 'request', 'model', 'request', 'model', 'request']
+
+    # Events after stopping are not recorded
+    with requests_mock.Mocker() as mock:
+        mock.get('/'.join((fl33t_client.base_team_url, 'fleet', fleet_id)),
+                 json=fleet_get_response)
+        fl33t_client.get_fleet(fleet_id)
+    assert len(profiler.events) == 5
+
+
+def test_cli_profile(tmp_path, monkeypatch, team_id, session_token, train_id,
+                     train_get_response):
+    monkeypatch.setenv('FL33T_TEAM_ID', team_id)
+    monkeypatch.setenv('FL33T_SESSION_TOKEN', session_token)
+    trace_path = str(tmp_path / 'trace.json')
+
+    with requests_mock.Mocker() as mock:
+        mock.get('https://api.fl33t.com/team/{}/train/{}'.format(
+            team_id, train_id), json=train_get_response)
+
+        result = CliRunner().invoke(
+            cli, ['--profile', trace_path, 'trains', 'show', train_id])
+
+    CLIENTS.clear()
+
+    assert result.exit_code == 0, result.output
+    assert 'Train {}'.format(train_id) in result.stdout
+    assert '/team/{team_id}/train/{train_id}' in result.stderr
+    assert 'Train models' in result.stderr
+
+    with open(trace_path) as trace_file:
+        trace = json.load(trace_file)
+    assert trace['traceEvents'][0]['name'] == 'fl33t trains'
+    assert {event['cat'] for event in trace['traceEvents']} == {
+        'command', 'request', 'model'}
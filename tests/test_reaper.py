@@ -0,0 +1,216 @@
+import datetime
+import os
+import re
+
+import pytest
+import requests_mock
+
+from fl33t.reaper import Reaper, parse_duration
+
+RECENT = (datetime.datetime.utcnow() - datetime.timedelta(days=2)).strftime(
+    '%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class FakeDevices:
+
+    def __init__(self, fl33t_client):
+        self.base = fl33t_client.base_team_url
+        self.failing = set()
+        self.deleted = []
+        self.devices = {}
+        for fleet in ('fleet-a', 'fleet-b'):
+            for index, checkin in enumerate([
+                    '2018-06-01T00:00:00.000000Z',
+                    '2018-07-01T00:00:00.000000Z',
+                    RECENT,
+                    None]):
+                device_id = '{}-{}'.format(fleet, index)
+                self.devices[device_id] = {
+                    'device_id': device_id, 'name': 'Device',
+                    'fleet_id': fleet, 'build_id': 'build',
+                    'session_token': 'token', 'checkin_tstamp': checkin}
+
+    def list_devices(self, request, context):
+        offset = int(request.qs['offset'][0])
+        limit = int(request.qs['limit'][0])
+        records = [record for record in self.devices.values()
+                   if 'fleet_id' not in request.qs
+                   or record['fleet_id'] == request.qs['fleet_id'][0]]
+        return {'device_count': len(records),
+                'devices': records[offset:offset + limit]}
+
+    def get_device(self, request, context):
+        device = self.devices.get(request.path.rsplit('/', 1)[1])
+        if device is None:
+            context.status_code = 404
+            return {}
+        return {'device': device}
+
+    def delete_device(self, request, context):
+        device_id = request.path.rsplit('/', 1)[1]
+        if device_id in self.failing:
+            context.status_code = 500
+        elif self.devices.pop(device_id, None) is None:
+            context.status_code = 404
+        else:
+            self.deleted.append(device_id)
+            context.status_code = 204
+        return ''
+
+
+@pytest.fixture
+def devices(fl33t_client):
+    fake = FakeDevices(fl33t_client)
+    with requests_mock.Mocker() as mock:
+        mock.get('/'.join((fake.base, 'devices')), json=fake.list_devices)
+        mock.get(re.compile('/device/'), json=fake.get_device)
+        mock.delete(re.compile('/device/'), text=fake.delete_device)
+        fake.mock = mock
+        yield fake
+
+
+def listings(devices):
+    return sum(1 for request in devices.mock.request_history
+               if request.path.endswith('/devices'))
+
+
+@pytest.mark.parametrize('value,seconds', [
+    ('3600', 3600), ('90d', 90 * 86400), ('12h', 43200), ('1.5m', 90),
+    ('2W', 1209600),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value).total_seconds() == seconds
+
+
+def test_parse_invalid_duration():
+    with pytest.raises(ValueError):
+        parse_duration('soon')
+
+
+def test_dry_run(fl33t_client, devices, tmp_path):
+    journal = str(tmp_path / 'reap.jsonl')
+    found = []
+    summary = Reaper(fl33t_client, parse_duration('30d'),
+                     journal=journal).run(
+        dry_run=True, callback=lambda stale, deleted: found.append(
+            (stale.device_id, deleted)))
+
+    assert found == [('fleet-a-0', None), ('fleet-a-1', None),
+                     ('fleet-b-0', None), ('fleet-b-1', None)]
+    assert summary == {'stale': 4, 'deleted': 0, 'failed': 0,
+                       'kept': 0, 'resumed': False}
+    assert not devices.deleted
+    assert not os.path.exists(journal)
+
+
+def test_reap(fl33t_client, devices, tmp_path):
+    journal = str(tmp_path / 'reap.jsonl')
+    summary = Reaper(fl33t_client, parse_duration('30d'), journal=journal,
+                     rate=1000).run()
+
+    assert summary == {'stale': 4, 'deleted': 4, 'failed': 0,
+                       'kept': 0, 'resumed': False}
+    assert sorted(devices.deleted) == ['fleet-a-0', 'fleet-a-1',
+                                       'fleet-b-0', 'fleet-b-1']
+    # Devices that checked in recently, or never, are kept
+    assert sorted(devices.devices) == ['fleet-a-2', 'fleet-a-3',
+                                       'fleet-b-2', 'fleet-b-3']
+    assert not os.path.exists(journal)
+
+
+def test_reap_resumes(fl33t_client, devices, tmp_path):
+    journal = str(tmp_path / 'reap.jsonl')
+    devices.failing = {'fleet-a-1'}
+
+    summary = Reaper(fl33t_client, parse_duration('30d'),
+                     journal=journal).run()
+    assert summary['deleted'] == 3 and summary['failed'] == 1
+    assert os.path.exists(journal)
+    scans = listings(devices)
+
+    devices.failing = set()
+    summary = Reaper(fl33t_client, parse_duration('30d'),
+                     journal=journal).run()
+
+    assert summary == {'stale': 1, 'deleted': 1, 'failed': 0,
+                       'kept': 0, 'resumed': True}
+    assert devices.deleted[-1] == 'fleet-a-1'
+    assert listings(devices) == scans
+    assert not os.path.exists(journal)
+
+
+def test_reap_resume_keeps_checked_in(fl33t_client, devices, tmp_path):
+    journal = str(tmp_path / 'reap.jsonl')
+    devices.failing = {'fleet-a-1', 'fleet-b-1'}
+    Reaper(fl33t_client, parse_duration('30d'), journal=journal).run()
+
+    # The journal is stale by the time it is resumed
+    devices.failing = set()
+    devices.devices['fleet-a-1']['checkin_tstamp'] = RECENT
+    summary = Reaper(fl33t_client, parse_duration('30d'),
+                     journal=journal).run()
+
+    assert summary == {'stale': 1, 'deleted': 1, 'failed': 0, 'kept': 1,
+                       'resumed': True}
+    assert 'fleet-a-1' in devices.devices
+    assert 'fleet-b-1' not in devices.devices
+    assert not os.path.exists(journal)
+
+
+def test_reap_resume_other_thresholds(fl33t_client, devices, tmp_path):
+    journal = str(tmp_path / 'reap.jsonl')
+    devices.failing = {'fleet-a-1'}
+    Reaper(fl33t_client, parse_duration('30d'), journal=journal).run()
+
+    devices.failing = set()
+    with pytest.raises(ValueError, match='written with other thresholds'):
+        Reaper(fl33t_client, parse_duration('60d'), journal=journal).run()
+    with pytest.raises(ValueError, match='written with other thresholds'):
+        Reaper(fl33t_client, parse_duration('30d'), journal=journal,
+               fleet_thresholds={'fleet-a': parse_duration('1d')}).run()
+    with pytest.raises(ValueError, match='written for other fleets'):
+        Reaper(fl33t_client, parse_duration('30d'), journal=journal,
+               fleet_ids=['fleet-b']).run()
+
+    assert 'fleet-a-1' in devices.devices
+
+
+def test_reap_after_crash_during_deletes(fl33t_client, devices, tmp_path):
+    journal = str(tmp_path / 'reap.jsonl')
+    reaper = Reaper(fl33t_client, parse_duration('30d'), journal=journal)
+
+    def crash(stale, deleted):
+        if stale.device_id == 'fleet-b-0':
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        reaper.run(callback=crash)
+
+    # A device deleted but not journaled before the crash is already gone
+    summary = Reaper(fl33t_client, parse_duration('30d'),
+                     journal=journal).run()
+    assert summary['resumed']
+    assert summary['failed'] == 0
+    assert sorted(devices.deleted) == ['fleet-a-0', 'fleet-a-1',
+                                       'fleet-b-0', 'fleet-b-1']
+
+
+def test_fleet_thresholds(fl33t_client, devices):
+    found = []
+    Reaper(fl33t_client, parse_duration('30d'), fleet_ids=['fleet-a'],
+           fleet_thresholds={'fleet-a': parse_duration('1d')}).run(
+        dry_run=True, callback=lambda stale, deleted: found.append(
+            stale.device_id))
+
+    assert found == ['fleet-a-0', 'fleet-a-1', 'fleet-a-2']
+    assert {request.qs['fleet_id'][0]
+            for request in devices.mock.request_history} == {'fleet-a'}
+
+
+def test_foreign_journal(fl33t_client, devices, tmp_path):
+    journal = tmp_path / 'reap.jsonl'
+    journal.write_text('{"something": "else"}\n')
+
+    with pytest.raises(ValueError, match='is not a reaper journal'):
+        Reaper(fl33t_client, parse_duration('30d'),
+               journal=str(journal)).run()
@@ -0,0 +1,244 @@
+import io
+import json
+
+import pytest
+import requests_mock
+
+from fl33t.reconcile import Reconciler, describe, load_state
+
+
+@pytest.fixture
+def live_records():
+    return {
+        'trains': [{'train_id': 'train-1', 'name': 'Widget',
+                    'upload_tstamp': '2018-05-30T22:31:08.836406Z'}],
+        'builds': [{'build_id': 'build-1', 'train_id': 'train-1',
+                    'version': '1.0', 'status': 'available',
+                    'released': False, 'md5sum': 'abc', 'size': 10,
+                    'filename': 'build.tgz', 'download_url': None,
+                    'upload_url': None,
+                    'upload_tstamp': '2018-05-30T22:31:08.836406Z'}],
+        'fleets': [{'fleet_id': 'fleet-{}'.format(index),
+                    'name': name,
+                    'size': 1,
+                    'train_id': 'train-1',
+                    'build_id': 'build-1',
+                    'unreleased': True}
+                   for index, name in enumerate(['Canary', 'Old'])],
+        'devices': [{'device_id': 'device-{}'.format(index),
+                     'name': 'Device',
+                     'fleet_id': 'fleet-{}'.format(index),
+                     'build_id': 'build-1',
+                     'session_token': 'token',
+                     'checkin_tstamp': '2018-06-01T00:00:00.000000Z'}
+                    for index in range(2)],
+    }
+
+
+@pytest.fixture
+def desired_state():
+    return {
+        'trains': [{'name': 'Widget'}, {'name': 'Gadget'}],
+        'builds': [{'build_id': 'build-1', 'released': True}],
+        'fleets': [
+            {'name': 'Canary', 'build_id': 'build-1', 'unreleased': False},
+            {'name': 'Beta', 'train': 'Gadget'},
+        ],
+        'devices': [
+            {'device_id': 'device-0', 'fleet': 'Beta'},
+            {'device_id': 'device-2', 'fleet': 'Canary', 'name': 'New'},
+        ],
+        'prune': ['devices'],
+    }
+
+
+@pytest.fixture
+def mock_fl33t(fl33t_client, live_records):
+    def listing(collection):
+        def respond(request, context):
+            offset = int(request.qs['offset'][0])
+            limit = int(request.qs['limit'][0])
+            return {
+                '{}_count'.format(collection[:-1]): len(
+                    live_records[collection]),
+                collection: live_records[collection][offset:offset + limit],
+            }
+        return respond
+
+    def created(model, record):
+        def respond(request, context):
+            body = json.loads(request.body)[model]
+            return {model: dict(body, **record)}
+        return respond
+
+    base = fl33t_client.base_team_url
+    with requests_mock.Mocker() as mock:
+        for collection in live_records:
+            mock.get('/'.join((base, collection)), json=listing(collection))
+        mock.post('/'.join((base, 'train')),
+                  json=created('train', {'train_id': 'train-2'}))
+        mock.post('/'.join((base, 'fleet')),
+                  json=created('fleet', {'fleet_id': 'fleet-2'}))
+        mock.post('/'.join((base, 'device')),
+                  json=created('device', {}))
+        mock.put(requests_mock.ANY, status_code=204)
+        mock.delete(requests_mock.ANY, status_code=204)
+        yield mock
+
+
+def test_plan(fl33t_client, mock_fl33t, desired_state):
+    plan = Reconciler(fl33t_client, desired_state).plan()
+
+    assert [describe(step) for step in plan] == [
+        "+ create train 'Gadget': name='Gadget'",
+        "~ update build build-1: released: False -> True",
+        "+ create fleet 'Beta': name='Beta', "
+        "train_id=(new train 'Gadget')",
+        "~ update fleet fleet-0 'Canary': unreleased: True -> False",
+        "+ create device device-2 'New': name='New', fleet_id='fleet-0'",
+        "~ update device device-0 'Device': fleet_id: 'fleet-0' -> "
+        "(new fleet 'Beta')",
+        "- delete device device-1 'Device'",
+    ]
+    assert plan.summary() == {'create': 3, 'update': 3, 'delete': 1}
+    assert [len(phase) for phase in plan.phases()] == [2, 2, 2, 1]
+
+    # Nothing is changed while planning
+    assert {request.method for request in mock_fl33t.request_history} \
+        == {'GET'}
+
+
+def test_plan_in_sync(fl33t_client, mock_fl33t):
+    plan = Reconciler(fl33t_client, {
+        'fleets': [{'fleet_id': 'fleet-1', 'name': 'Old',
+                    'train_id': 'train-1', 'unreleased': True}],
+        'devices': [{'device_id': 'device-1', 'fleet': 'Old'}],
+    }).plan()
+
+    assert not len(plan)
+
+    # Only what the desired state mentions is listed
+    assert {request.path.rsplit('/', 1)[1]
+            for request in mock_fl33t.request_history} \
+        == {'trains', 'fleets', 'devices'}
+
+
+def test_prune_keeps_referenced(fl33t_client, mock_fl33t):
+    plan = Reconciler(fl33t_client, {
+        'fleets': [{'name': 'Canary', 'train_id': 'train-1'}],
+        'prune': True,
+    }).plan()
+
+    assert [(step.action, step.collection, step.id) for step in plan] == [
+        ('delete', 'devices', 'device-0'),
+        ('delete', 'devices', 'device-1'),
+        ('delete', 'fleets', 'fleet-1'),
+    ]
+
+
+def test_apply(fl33t_client, mock_fl33t, desired_state):
+    reconciler = Reconciler(fl33t_client, desired_state, retries=0)
+    seen = []
+    results = reconciler.apply(callback=seen.append)
+
+    assert [result.status for result in results] == ['applied'] * 7
+    assert seen == results
+
+    changes = [(request.method, request.path.split('/', 3)[-1],
+                json.loads(request.body) if request.body else None)
+               for request in mock_fl33t.request_history
+               if request.method != 'GET']
+
+    # Later phases use the IDs of the objects created before them
+    fleet_create = [body for method, path, body in changes
+                    if method == 'POST' and path == 'fleet'][0]
+    assert fleet_create['fleet']['train_id'] == 'train-2'
+    device_update = [body for method, path, body in changes
+                     if method == 'PUT' and path == 'device/device-0'][0]
+    assert device_update['device']['fleet_id'] == 'fleet-2'
+    assert changes[-1][:2] == ('DELETE', 'device/device-1')
+
+    # Once applied, there is nothing left to do
+    assert not len(reconciler.plan())
+
+
+def test_apply_retries(fl33t_client, mock_fl33t, monkeypatch):
+    monkeypatch.setattr('fl33t.reconcile.time.sleep', lambda delay: None)
+    mock_fl33t.put('/'.join((fl33t_client.base_team_url, 'build',
+                             'build-1')),
+                   [{'status_code': 500}, {'status_code': 204}])
+
+    state = {'builds': [{'build_id': 'build-1', 'released': True}],
+             'devices': [{'device_id': 'device-0', 'fleet_id': 'fleet-1'}]}
+    results = Reconciler(fl33t_client, state, retries=1).apply()
+    assert [result.status for result in results] == ['applied', 'applied']
+
+    mock_fl33t.put('/'.join((fl33t_client.base_team_url, 'build',
+                             'build-1')), status_code=500)
+    results = Reconciler(fl33t_client, state, retries=1).apply()
+
+    # The devices' phase is skipped, as it could depend on the build
+    assert [result.status for result in results] == ['failed', 'skipped']
+    assert '500' in results[0].error
+
+
+def test_apply_does_not_retry_creates(fl33t_client, mock_fl33t,
+                                      monkeypatch):
+    monkeypatch.setattr('fl33t.reconcile.time.sleep', lambda delay: None)
+    mock_fl33t.post('/'.join((fl33t_client.base_team_url, 'train')),
+                    status_code=500)
+
+    results = Reconciler(fl33t_client, {'trains': [{'name': 'Gadget'}]},
+                         retries=2).apply()
+
+    # The create may have succeeded, so repeating it could add a duplicate
+    assert [result.status for result in results] == ['failed']
+    assert [request.method for request in mock_fl33t.request_history
+            ].count('POST') == 1
+
+
+@pytest.mark.parametrize('state,message', [
+    ([], 'must be a mapping'),
+    ({'fleets': [{'name': 'Canary', 'size': 3}]}, 'unknown fields: size'),
+    ({'devices': [{'fleet': 'Canary'}]}, 'device_id is required'),
+    ({'prune': ['builds']}, 'prune must be'),
+    ({'devices': [{'device_id': 'x', 'fleet': 'A', 'fleet_id': 'b'}]},
+     'not both'),
+])
+def test_invalid_state(fl33t_client, state, message):
+    with pytest.raises(ValueError, match=message):
+        Reconciler(fl33t_client, state)
+
+
+def test_unresolvable_state(fl33t_client, mock_fl33t, live_records):
+    with pytest.raises(ValueError, match="'New' does not exist, and has no"):
+        Reconciler(fl33t_client, {'fleets': [{'name': 'New'}]}).plan()
+
+    with pytest.raises(ValueError, match='No fleets named'):
+        Reconciler(fl33t_client, {
+            'devices': [{'device_id': 'device-0', 'fleet': 'Missing'}]
+        }).plan()
+
+    live_records['fleets'][1]['name'] = 'Canary'
+    with pytest.raises(ValueError, match='2 fleets are named'):
+        Reconciler(fl33t_client, {
+            'fleets': [{'name': 'Canary', 'unreleased': False}]
+        }).plan()
+
+
+def test_load_state():
+    yaml_state = io.StringIO(
+        'fleets:\n'
+        '  - name: Canary\n'
+        '    train: Widget\n'
+        'prune: [devices]\n')
+    assert load_state(yaml_state) == {
+        'fleets': [{'name': 'Canary', 'train': 'Widget'}],
+        'prune': ['devices'],
+    }
+
+    json_state = io.StringIO('{"trains": [{"name": "Widget"}]}')
+    assert load_state(json_state) == {'trains': [{'name': 'Widget'}]}
+
+    with pytest.raises(ValueError, match='Unknown sections'):
+        load_state(io.StringIO('{"widgets": []}'))
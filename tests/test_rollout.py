@@ -0,0 +1,173 @@
+import collections
+import json
+import re
+
+import pytest
+import requests_mock
+
+from fl33t.rollout import Rollout
+
+
+class FakeFleets:
+    """Devices that move between fleets when updated, and take up their
+    fleet's build when listed, if `converge` is set"""
+
+    def __init__(self, fl33t_client, fleet_id, build_id, count):
+        self.base = fl33t_client.base_team_url
+        self.fleet_id = fleet_id
+        self.build_id = build_id
+        self.converge = True
+        self.failing = set()
+        self.updates = collections.Counter()
+        self.devices = {
+            'device-{:03d}'.format(index): {
+                'device_id': 'device-{:03d}'.format(index),
+                'name': 'Device',
+                'fleet_id': 'stable',
+                'build_id': 'old-build',
+                'session_token': 'token',
+                'checkin_tstamp': '2018-06-01T00:00:00.000000Z',
+            }
+            for index in range(count)
+        }
+
+    def list_devices(self, request, context):
+        fleet_id = request.qs['fleet_id'][0]
+        offset = int(request.qs['offset'][0])
+        limit = int(request.qs['limit'][0])
+        records = [record for record in self.devices.values()
+                   if record['fleet_id'] == fleet_id]
+        if fleet_id == self.fleet_id and self.converge:
+            for record in records:
+                record['build_id'] = self.build_id
+                record['checkin_tstamp'] = '2099-01-01T00:00:00.000000Z'
+        return {'device_count': len(records),
+                'devices': records[offset:offset + limit]}
+
+    def get_device(self, request, context):
+        return {'device': self.devices[request.path.rsplit('/', 1)[1]]}
+
+    def update_device(self, request, context):
+        device = json.loads(request.body)['device']
+        if device['device_id'] in self.failing:
+            context.status_code = 500
+            return ''
+        self.updates[device['device_id']] += 1
+        self.devices[device['device_id']]['fleet_id'] = device['fleet_id']
+        context.status_code = 204
+        return ''
+
+    def mock(self, mock, fleet_get_response):
+        mock.get('/'.join((self.base, 'fleet', self.fleet_id)),
+                 json=fleet_get_response)
+        mock.get('/'.join((self.base, 'devices')), json=self.list_devices)
+        mock.get(re.compile(re.escape(self.base + '/device/')),
+                 json=self.get_device)
+        mock.put(requests_mock.ANY, text=self.update_device)
+
+
+@pytest.fixture
+def fleets(fl33t_client, fleet_id, build_id, fleet_get_response):
+    fake = FakeFleets(fl33t_client, fleet_id, build_id, 200)
+    with requests_mock.Mocker() as mock:
+        fake.mock(mock, fleet_get_response)
+        fake.requests = mock
+        yield fake
+
+
+def source_listings(mock):
+    return sum(1 for request in mock.request_history
+               if request.qs.get('fleet_id') == ['stable']
+               and request.qs['offset'] == ['0'])
+
+
+def in_fleet(fleets, fleet_id):
+    return sum(1 for record in fleets.devices.values()
+               if record['fleet_id'] == fleet_id)
+
+
+def test_rollout(fl33t_client, fleets, fleet_id, tmp_path):
+    checkpoint = str(tmp_path / 'rollout.json')
+    events = []
+    sizes = []
+
+    def callback(event):
+        events.append(event)
+        if event['event'] == 'moved':
+            sizes.append(in_fleet(fleets, fleet_id))
+
+    rollout = Rollout(fl33t_client, 'stable', fleet_id,
+                      checkpoint=checkpoint, poll_interval=0)
+    assert rollout.run(callback=callback) == 'done'
+
+    # 1%, 10%, 50% and 100% of 200 devices
+    assert sizes == [2, 20, 100, 200]
+    assert set(fleets.updates.values()) == {1}
+
+    # The source fleet is only listed when the rollout starts
+    assert source_listings(fleets.requests) == 1
+    assert [event['event'] for event in events] \
+        == ['moved', 'converging'] * 4
+    assert events[1]['fraction'] == 1.0
+    assert events[1]['checked_in'] == 2
+
+    with open(checkpoint) as state_file:
+        state = json.load(state_file)
+    assert state['phase'] == 'done'
+    assert state['pending'] == []
+    assert [wave['moved'] for wave in state['history']] == [2, 18, 80, 100]
+
+
+def test_rollout_stalls(fl33t_client, fleets, fleet_id):
+    fleets.converge = False
+
+    rollout = Rollout(fl33t_client, 'stable', fleet_id, poll_interval=0,
+                      timeout=0)
+    assert rollout.run() == 'stalled'
+    assert in_fleet(fleets, fleet_id) == 2
+    assert rollout.state['phase'] == 'converging'
+
+    # Resuming waits for the same wave again, without moving more devices
+    fleets.converge = True
+    assert rollout.run() == 'done'
+    assert in_fleet(fleets, fleet_id) == 200
+
+
+def test_rollout_resumes(fl33t_client, fleets, fleet_id, tmp_path):
+    checkpoint = str(tmp_path / 'rollout.json')
+    rollout = Rollout(fl33t_client, 'stable', fleet_id, waves=[0.25, 1],
+                      checkpoint=checkpoint, poll_interval=0)
+    rollout.load()
+    fleets.failing = set(rollout.state['device_ids'][100:105])
+
+    assert rollout.run() == 'failed'
+    assert in_fleet(fleets, fleet_id) == 195
+    assert set(rollout.state['pending']) == fleets.failing
+
+    # A new run, from the checkpoint, only moves the devices left behind
+    fleets.failing = set()
+    resumed = Rollout(fl33t_client, 'stable', fleet_id, waves=[0.25, 1],
+                      checkpoint=checkpoint, poll_interval=0)
+    assert resumed.run() == 'done'
+    assert in_fleet(fleets, fleet_id) == 200
+    assert set(fleets.updates.values()) == {1}
+
+    with pytest.raises(ValueError, match='is not a checkpoint'):
+        Rollout(fl33t_client, 'other', fleet_id,
+                checkpoint=checkpoint).load()
+
+
+def test_rollout_skips_departed(fl33t_client, fleets, fleet_id):
+    rollout = Rollout(fl33t_client, 'stable', fleet_id, waves=[1])
+    rollout.load()
+    fleets.devices[rollout.state['device_ids'][0]]['fleet_id'] = 'other'
+
+    assert rollout.move(0) == (199, [])
+    assert rollout.state['pending'] == []
+    assert in_fleet(fleets, 'other') == 1
+
+
+@pytest.mark.parametrize('waves', [[], [0.5], [0.5, 0.1, 1], [0, 1]])
+def test_invalid_waves(fl33t_client, fleet_id, waves):
+    with pytest.raises(ValueError):
+        Rollout(fl33t_client, 'stable', fleet_id, waves=waves)
@@ -0,0 +1,133 @@
+import gzip
+
+import pytest
+import requests_mock
+
+from click.testing import CliRunner
+
+from fl33t.cli.commands.snapshot import cli
+from fl33t.snapshot import Snapshot, diff, summarize, write_snapshot
+
+
+@pytest.fixture
+def records(fleet_id, build_id):
+    return {
+        'devices': [{'device_id': 'device-{:02d}'.format(index),
+                     'name': 'Device {}'.format(index),
+                     'fleet_id': fleet_id,
+                     'build_id': build_id,
+                     'session_token': 'token',
+                     'checkin_tstamp': '2018-06-01T00:00:00.000000Z'}
+                    for index in reversed(range(7))],
+        'fleets': [{'fleet_id': fleet_id, 'name': 'Fleet', 'size': 7,
+                    'train_id': 'train', 'build_id': build_id,
+                    'unreleased': False}],
+    }
+
+
+@pytest.fixture
+def mock_listings(fl33t_client, records):
+    def listing(collection):
+        def respond(request, context):
+            offset = int(request.qs['offset'][0])
+            limit = int(request.qs['limit'][0])
+            return {
+                '{}_count'.format(collection[:-1]): len(records[collection]),
+                collection: records[collection][offset:offset + limit],
+            }
+        return respond
+
+    with requests_mock.Mocker() as mock:
+        for collection in records:
+            mock.get('/'.join((fl33t_client.base_team_url, collection)),
+                     json=listing(collection))
+        yield mock
+
+
+def snapshot(fl33t_client, path):
+    return write_snapshot(fl33t_client, str(path),
+                          collections=['devices', 'fleets'],
+                          page_size=3,
+                          chunk_size=2)
+
+
+def test_write_snapshot(fl33t_client, mock_listings, records, tmp_path):
+    # A device listed twice, as if it moved while paginating
+    records['devices'].insert(3, records['devices'][2])
+
+    counts = snapshot(fl33t_client, tmp_path / 'snapshot.gz')
+    assert counts == {'devices': 7, 'fleets': 1}
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'snapshot.gz']
+
+    loaded = Snapshot(str(tmp_path / 'snapshot.gz'))
+    assert loaded.team_id == fl33t_client.team_id
+    assert [record['device_id'] for _, record in loaded.records('devices')] \
+        == ['device-{:02d}'.format(index) for index in range(7)]
+    assert [collection for collection, _ in loaded.records()] == \
+        ['devices'] * 7 + ['fleets']
+
+
+def test_diff(fl33t_client, mock_listings, records, tmp_path, build_id):
+    snapshot(fl33t_client, tmp_path / 'old.gz')
+
+    records['devices'][0]['build_id'] = 'new-build'
+    records['devices'][0]['name'] = 'Renamed'
+    del records['devices'][3]
+    records['devices'].append(dict(records['devices'][0],
+                                   device_id='device-new'))
+    snapshot(fl33t_client, tmp_path / 'new.gz')
+
+    changes = list(diff(str(tmp_path / 'old.gz'), str(tmp_path / 'new.gz')))
+    assert [(change.kind, change.id) for change in changes] == [
+        ('removed', 'device-03'),
+        ('changed', 'device-06'),
+        ('added', 'device-new'),
+    ]
+    assert changes[1].fields == ['build_id', 'name']
+    assert changes[1].old['build_id'] == build_id
+    assert changes[1].new['build_id'] == 'new-build'
+
+    assert summarize(changes) == {
+        'devices': {'added': 1, 'removed': 1, 'changed': 1}}
+
+    assert list(diff(str(tmp_path / 'old.gz'), str(tmp_path / 'old.gz'))) \
+        == []
+
+
+def test_not_a_snapshot(tmp_path):
+    path = tmp_path / 'other.gz'
+    with gzip.open(str(path), 'wt') as other:
+        other.write('hello\n')
+
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
+
+    path.write_text('not gzip')
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
+
+
+def test_cli(fl33t_client, cli_obj, mock_listings, records, tmp_path):
+    old = str(tmp_path / 'old.gz')
+    new = str(tmp_path / 'new.gz')
+
+    result = CliRunner().invoke(cli, ['create', old, '-c', 'devices'],
+                                obj=cli_obj)
+    assert result.exit_code == 0, result.output
+    assert result.output == 'Snapshot written to {}: 7 devices\n'.format(old)
+
+    records['devices'][0]['name'] = 'Renamed'
+    CliRunner().invoke(cli, ['create', new, '-c', 'devices'], obj=cli_obj)
+
+    result = CliRunner().invoke(cli, ['diff', old, old])
+    assert result.exit_code == 0
+    assert result.output == ''
+
+    result = CliRunner().invoke(cli, ['diff', old, new])
+    assert result.exit_code == 1
+    assert result.output == \
+        '~ devices device-06: name: Device 6 -> Renamed\n'
+
+    result = CliRunner().invoke(cli, ['diff', '--summary', old, new])
+    assert result.output == 'devices    0 added, 0 removed, 1 changed\n'
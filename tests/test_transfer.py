@@ -0,0 +1,71 @@
+
+import io
+import time
+
+import pytest
+import requests_mock
+
+from fl33t.transfer import (
+    SizedThrottledReader,
+    ThrottledReader,
+    TokenBucket,
+    parse_rate,
+    throttled_reader
+)
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('100', 100),
+    ('512K', 512 * 1024),
+    ('2M', 2 * 1024 ** 2),
+    ('1.5mib/s', int(1.5 * 1024 ** 2)),
+])
+def test_parse_rate(value, expected):
+    assert parse_rate(value) == expected
+
+
+def test_parse_rate_invalid():
+    with pytest.raises(ValueError):
+        parse_rate('fast')
+
+
+def test_token_bucket_limits():
+    bucket = TokenBucket(1000000, capacity=100000)
+
+    started = time.monotonic()
+    bucket.consume(100000)
+    bucket.consume(200000)
+
+    assert time.monotonic() - started >= 0.19
+
+
+def test_throttled_reader():
+    bucket = TokenBucket(10 ** 9)
+    reader = throttled_reader(io.BytesIO(b'x' * 1000), 1000, bucket,
+                              chunk_size=300)
+
+    assert isinstance(reader, SizedThrottledReader)
+    assert len(reader) == 1000
+    assert [len(chunk) for chunk in reader] == [300, 300, 300, 100]
+    assert reader.bytes_read == 1000
+
+
+def test_throttled_reader_unknown_size(fl33t_client):
+    reader = throttled_reader(io.BytesIO(b'firmware'))
+    assert type(reader) is ThrottledReader
+    assert not hasattr(reader, '__len__')
+
+    # Without a size, the upload is sent in chunks
+    upload_url = 'https://builds.example.com/upload'
+    uploaded = []
+
+    def upload_callback(request, context):
+        uploaded.append(b''.join(request.body))
+        return ''
+
+    with requests_mock.Mocker() as mock:
+        mock.put(upload_url, text=upload_callback)
+        fl33t_client.upload(upload_url, lambda: io.BytesIO(b'firmware'))
+
+    assert uploaded == [b'firmware']
+    assert 'Content-Length' not in mock.last_request.headers
@@ -0,0 +1,163 @@
+import asyncio
+import http.server
+import json
+import threading
+
+import pytest
+
+from fl33t import Fl33tClient
+from fl33t.exceptions import (
+    Fl33tApiException,
+    InvalidFleetIdError,
+    TransportError,
+    UnprivilegedToken
+)
+from fl33t.protocol import Request, Response, build_request, full_url
+from fl33t.transports import (
+    FakeTransport,
+    Urllib3Transport,
+    fake_response,
+    get_transport
+)
+
+
+@pytest.fixture
+def fake():
+    return FakeTransport()
+
+
+@pytest.fixture
+def client(team_id, session_token, api_host, fake):
+    return Fl33tClient(team_id, session_token, base_uri=api_host,
+                       transport=fake)
+
+
+def test_build_request(fl33t_client):
+    fleet = fl33t_client.Fleet(fleet_id='fleet', name='Fleet')
+    request = build_request('put', 'https://api.example.com/fleet', 'token',
+                            params={'offset': 0}, data=fleet,
+                            headers={'Accept': 'text/plain'})
+
+    assert request.method == 'PUT'
+    assert request.headers == {'Authorization': 'Bearer token',
+                               'Content-Type': 'application/json',
+                               'Accept': 'text/plain'}
+    assert json.loads(request.body.decode())['fleet']['name'] == 'Fleet'
+    assert full_url(request) == 'https://api.example.com/fleet?offset=0'
+
+
+def test_response():
+    response = Response(200, {'Content-Type': 'text/plain; charset=latin-1'},
+                        'caf\xe9'.encode('latin-1'))
+    assert response.ok and response.text == 'caf\xe9'
+
+    response = fake_response(404, json={'error': 'missing'})
+    assert not response.ok and response.json() == {'error': 'missing'}
+
+
+def test_fake_transport(client, fake, fleet_get_response, fleet_id):
+    fake.add('GET', '/fleet/{}$'.format(fleet_id), json=fleet_get_response)
+
+    fleet = client.get_fleet(fleet_id)
+    assert fleet.name == 'My Devices'
+
+    request = fake.history[-1]
+    assert request.url.endswith('/team/meli/fleet/{}'.format(fleet_id))
+    assert request.headers['Authorization'] == 'Bearer {}'.format(
+        client.token)
+
+    with pytest.raises(InvalidFleetIdError):
+        client.get_fleet('missing')
+
+
+@pytest.mark.parametrize('status_code,exception', [
+    (403, UnprivilegedToken), (503, Fl33tApiException),
+    (200, Fl33tApiException),
+])
+def test_error_responses(client, fake, status_code, exception):
+    fake.add('*', '/fleet/', status_code=status_code, text='Nope')
+
+    with pytest.raises(exception):
+        client.get_fleet('fleet')
+
+
+def test_paginate(client, fake, fleet_get_response):
+    fleets = [dict(fleet_get_response['fleet'], fleet_id=str(index))
+              for index in range(5)]
+
+    def list_fleets(request):
+        offset = request.params['offset']
+        limit = request.params['limit']
+        return fake_response(json={'fleet_count': len(fleets),
+                                   'fleets': fleets[offset:offset + limit]})
+
+    fake.add('GET', '/fleets$', list_fleets)
+
+    assert [fleet.fleet_id for fleet in client.list_fleets(page_size=2)] \
+        == ['0', '1', '2', '3', '4']
+    assert len(fake.history) == 3
+
+
+def test_request_async(client, fake, fleet_get_response):
+    fake.add('GET', '/fleet/', json=fleet_get_response)
+
+    response = asyncio.run(client.request_async(
+        'GET', '/'.join((client.base_team_url, 'fleet', 'fleet'))))
+    assert response.json() == fleet_get_response
+
+
+def test_unknown_transport(team_id, session_token):
+    with pytest.raises(ValueError, match='Unknown transport'):
+        Fl33tClient(team_id, session_token, transport='pigeon')
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = json.dumps({'fleet': {'fleet_id': 'fleet', 'name': self.path,
+                                     'size': 0}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_urllib3_transport(team_id, session_token, server):
+    client = Fl33tClient(team_id, session_token, base_uri=server,
+                         transport='urllib3', pool_size=2)
+    assert isinstance(client.transport, Urllib3Transport)
+
+    assert client.get_fleet('fleet').name == '/team/meli/fleet/fleet'
+    client.close()
+
+
+def test_urllib3_transport_error():
+    transport = Urllib3Transport(retries=False)
+    with pytest.raises(TransportError):
+        transport.send(Request('GET', 'http://127.0.0.1:9/', {}, {}, None))
+
+
+def test_httpx_transport(team_id, session_token, server):
+    pytest.importorskip('httpx')
+    client = Fl33tClient(team_id, session_token, base_uri=server,
+                         transport=get_transport('httpx'))
+
+    assert client.get_fleet('fleet').name == '/team/meli/fleet/fleet'
+    response = asyncio.run(client.request_async(
+        'GET', '/'.join((client.base_team_url, 'fleet', 'other'))))
+    assert response.json()['fleet']['name'] == '/team/meli/fleet/other'
+    client.close()
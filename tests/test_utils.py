@@ -0,0 +1,71 @@
+
+import time
+
+from datetime import datetime, timezone
+
+import pytest
+
+from fl33t import Fl33tClient
+from fl33t.fake_api import FakeApi
+from fl33t.utils import concurrent_map, concurrent_pages, timestamp_before
+
+
+def test_concurrent_map_ordered():
+
+    def slow_square(value):
+        time.sleep(0.01 * (5 - value))
+        return value * value
+
+    results = list(concurrent_map(slow_square, range(5), workers=3))
+
+    assert [item for item, _, _ in results] == list(range(5))
+    assert [result for _, result, _ in results] == [0, 1, 4, 9, 16]
+
+
+def test_concurrent_map_errors():
+
+    def fail_on_odd(value):
+        if value % 2:
+            raise ValueError(value)
+        return value
+
+    results = list(concurrent_map(fail_on_odd, range(4), workers=2))
+
+    assert results[0] == (0, 0, None)
+    assert isinstance(results[1][2], ValueError)
+    assert results[2] == (2, 2, None)
+
+
+def test_concurrent_pages(monkeypatch):
+    api = FakeApi('meli', 'token', seed=1).seed_data(fleets=2, devices=25)
+    client = Fl33tClient('meli', 'token', transport=api.transport())
+    fleet_id = next(client.list_fleets()).fleet_id
+
+    pages = list(concurrent_pages(client, 'devices', page_size=10,
+                                  workers=2))
+    assert [len(records) for records in pages] == [10, 10, 5]
+    assert len({record['device_id'] for records in pages
+                for record in records}) == 25
+
+    in_fleet = [record for records in concurrent_pages(
+        client, 'devices', page_size=10, fleet_id=fleet_id)
+        for record in records]
+    assert in_fleet
+    assert {record['fleet_id'] for record in in_fleet} == {fleet_id}
+
+    # Records added after the collection was counted are still listed
+    monkeypatch.setattr(client, 'count', lambda collection, **filters: 12)
+    pages = list(concurrent_pages(client, 'devices', page_size=10))
+    assert [len(records) for records in pages] == [10, 10, 5]
+
+
+@pytest.mark.parametrize('value,before', [
+    ('2018-05-31T23:59:59.999999Z', True),
+    ('2018-06-01T00:00:00.000000Z', False),
+    ('2018-06-01T01:00:00+02:00', True),
+    ('2018-06-01T00:00:01', False),
+    ('Thu, 31 May 2018 23:00:00 GMT', True),
+])
+def test_timestamp_before(value, before):
+    cutoff = datetime(2018, 6, 1, tzinfo=timezone.utc)
+    assert timestamp_before(value, cutoff) is before
@@ -0,0 +1,182 @@
+import asyncio
+
+import pytest
+import requests
+import requests_mock
+
+from fl33t.watch import Watcher
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('fl33t.watch.time.monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def fleets(train_id, build_id):
+    return [{'fleet_id': 'fleet-{}'.format(index), 'name': 'Fleet',
+             'size': 2, 'train_id': train_id, 'build_id': build_id,
+             'unreleased': False}
+            for index in range(3)]
+
+
+@pytest.fixture
+def mock_fleets(fl33t_client, fleets):
+    def respond(request, context):
+        offset = int(request.qs['offset'][0])
+        limit = int(request.qs['limit'][0])
+        return {'fleet_count': len(fleets),
+                'fleets': fleets[offset:offset + limit]}
+
+    with requests_mock.Mocker() as mock:
+        mock.get('/'.join((fl33t_client.base_team_url, 'fleets')),
+                 json=respond)
+        yield mock
+
+
+def listings(mock):
+    return sum(1 for request in mock.request_history
+               if request.qs['limit'] != ['1'])
+
+
+def test_changes(fl33t_client, clock, mock_fleets, fleets):
+    watcher = Watcher(fl33t_client, interval=30, min_interval=5)
+    builds = []
+    names = []
+    everything = []
+    watcher.subscribe('fleets', builds.append, fields=['build_id'])
+    watcher.subscribe('fleets', names.append, fields=['name'])
+    watcher.subscribe('fleets', everything.append)
+
+    assert watcher.poll() == 0
+    assert listings(mock_fleets) == 1
+
+    fleets[1]['build_id'] = 'new-build'
+    clock.now += 30
+    assert watcher.poll() == 1
+
+    # Every subscription shares a single listing
+    assert listings(mock_fleets) == 2
+    assert [(change.kind, change.id, change.fields) for change in builds] \
+        == [('changed', 'fleet-1', ['build_id'])]
+    assert names == []
+    assert everything == builds
+
+    del fleets[0]
+    clock.now += 5
+    assert watcher.poll() == 1
+    assert everything[-1].kind == 'removed'
+    assert everything[-1].old['fleet_id'] == 'fleet-0'
+    assert builds[-1] == everything[-1]
+
+    with pytest.raises(ValueError):
+        watcher.subscribe('widgets', print)
+
+
+def test_count_checks(fl33t_client, clock, mock_fleets, fleets):
+    watcher = Watcher(fl33t_client, interval=30, min_interval=5,
+                      max_interval=120)
+    added = []
+    watcher.subscribe('fleets', added.append, kinds=['added'])
+    watcher.poll()
+
+    # Nothing is due yet
+    clock.now += 1
+    watcher.poll()
+    assert mock_fleets.call_count == 1
+    assert watcher.next_poll() == 4
+
+    # The count has not changed, so the fleets are not listed
+    clock.now += 4
+    watcher.poll()
+    assert mock_fleets.call_count == 2
+    assert listings(mock_fleets) == 1
+
+    fleets.append(dict(fleets[0], fleet_id='fleet-new'))
+    clock.now += 5
+    assert watcher.poll() == 1
+    assert [change.id for change in added] == ['fleet-new']
+
+    # Listings that find nothing back off
+    target = list(watcher._targets.values())[0]
+    interval = target.interval
+    clock.now = target.next_list
+    assert watcher.poll() == 0
+    assert target.interval == interval * 2
+
+
+def test_poll_failures(fl33t_client, clock, fleets, caplog):
+    watcher = Watcher(fl33t_client, interval=30, min_interval=5)
+    watcher.subscribe('fleets', print)
+    target = list(watcher._targets.values())[0]
+
+    with requests_mock.Mocker() as mock:
+        mock.get('/'.join((fl33t_client.base_team_url, 'fleets')), [
+            {'status_code': 503},
+            {'exc': requests.exceptions.ConnectionError},
+            {'json': {'fleet_count': len(fleets), 'fleets': fleets}},
+        ])
+
+        assert watcher.poll() == 0
+        assert target.failures == 1
+        assert watcher.next_poll() == 0.5
+
+        clock.now += 0.5
+        assert watcher.poll() == 0
+        assert target.failures == 2
+        assert watcher.next_poll() == 1
+
+        # Nothing is requested until the delay is up
+        watcher.poll()
+        assert mock.call_count == 2
+
+        clock.now += 1
+        assert watcher.poll() == 0
+        assert target.failures == 0
+        assert len(target.records) == len(fleets)
+
+    assert caplog.text.count('Polling fleets failed') == 2
+
+
+def test_client_watch(fl33t_client, clock, monkeypatch, mock_fleets, fleets):
+    def sleep(seconds):
+        clock.now += max(seconds, 1)
+        fleets[2]['name'] = 'Renamed at {}'.format(clock.now)
+
+    monkeypatch.setattr('fl33t.client.time.sleep', sleep)
+
+    changes = fl33t_client.watch('fleets', fields=['name'], interval=10,
+                                 min_interval=10)
+    change = next(changes)
+    assert change.id == 'fleet-2'
+    assert change.new['name'] == 'Renamed at 1010.0'
+
+
+def test_client_watch_async(fl33t_client, fleets):
+    responses = [
+        {'fleet_count': 1, 'fleets': [fleets[0]]},
+        {'fleet_count': 1, 'fleets': [dict(fleets[0], build_id='new')]},
+    ]
+
+    async def first_change():
+        async for change in fl33t_client.watch_async(
+                'fleets', interval=0.01, min_interval=0.01):
+            return change
+
+    with requests_mock.Mocker() as mock:
+        mock.get('/'.join((fl33t_client.base_team_url, 'fleets')),
+                 [{'json': response} for response in responses])
+        change = asyncio.run(asyncio.wait_for(first_change(), 5))
+
+    assert change.id == 'fleet-0'
+    assert change.fields == ['build_id']